@@ -6,7 +6,10 @@ Date: 2025-03-19
 Author: Wenxia Ren
 
 Description:
-    This script reads an tab_delimited variant_summary.txt file as input. ClinVar variant summary file contains information about genetic variants and their clinical significance. 
+    This script reads an tab_delimited variant_summary.txt file (or the compressed variant_summary.txt.gz) as input. ClinVar variant summary file contains information about genetic variants and their clinical significance. 
+    The file is read chunk by chunk and only the needed columns are kept, so the memory usage does not depend on the size of the ClinVar release.
+    The parsed columns are cached on disk (keyed by the hash of the file), so the same release is only parsed once, also across sessions.
+    Assembly, ClinicalSignificance and ReviewStatus are stored as integer codes, the options and their counts are taken from the summary saved with the cache.
     The script applies various filters to extract high-confidence single nucleotide polymorphisms (SNPs) based on user-defined criteria.
     Based on the specified criterias: 
     1) variant type: Only "single nucleotide variant" is considered 
@@ -21,15 +24,31 @@ Description:
 Imported modules:
     - pandas: used for data manipulation and analysis.
     - streamlit: interactive web-based filtering and data preview
+    - ClinVar_Reader: chunked reading and filtering of variant_summary.txt(.gz)
+    - ClinVar_Cache: disk-backed columnar cache of the parsed ClinVar release, keyed by the hash of the file
+    - ClinVar_Resource: the cached table is memory-mapped once per process and shared by all sessions, instead of one copy per session
+    - Stage_Metrics: the time, the rows and the memory of loading, filtering and writing, shown in the expander "Performance"
 
 Procedures:
     1. perform error checks before continuing next steps.
-    2. filter the DataFrame based on the specified criterias, thenn select and reord the expected columns from the input_file.
-    3. save the filtered dataset in tab-delimited format for download.
+    2. read the option columns chunk by chunk to collect the Assembly, ClinicalSignificance and ReviewStatus options.
+    3. filter every chunk based on the specified criterias, thenn select and reord the expected columns from the input_file.
+    4. save the filtered dataset in tab-delimited format for download.
 
 """
+import os
+import sys
 import streamlit as st
 import pandas as pd
+# the shared ClinVar-SMART modules are in the src directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+import ClinVar_Cache
+import Stage_Metrics
+from ClinVar_Reader import OPTION_COLUMNS, iter_variant_summary, summarize_options, summarize_metadata, write_filtered_clinvar
+from ClinVar_Resource import shared_table, shared_variant_summary, source_hash
+
+# the number of ClinVar releases whose options are kept by load_data
+LOAD_DATA_ENTRIES = 4
 
 st.set_page_config(layout="wide")
 content_container = st.container()
@@ -37,61 +56,63 @@ with content_container:
     col1, col2, col3 = st.columns([1, 7, 1])
     with col2:
         st.title("Filter ClinVar Dataset")
+        # the time, the rows and the memory of every stage of this run
+        metrics = Stage_Metrics.begin("Filter ClinVar Dataset")
         st.markdown("") 
         st.markdown("""**Need To Know: This step may take some time, prepare your 🍵 and 🍰**""")
         # Provide information about the ClinVar dataset and where to download it
         st.write("""
         You can download the ClinVar database from this website (https://ftp.ncbi.nlm.nih.gov/pub/clinvar/tab_delimited/).
                   The file name is **variant_summary.txt.gz**""")
-        # Instructions for extracting the dataset
+        # Instructions for the dataset
         st.write("""
-        After downloading the file, you can use file archiver like WinRAR, 7-Zip in your local computer
-                  or you can use bash command **gunzip variant_summary.txt.gz** on your terminal to uncompress the file. 
-                 Keep the uncompressed name as **variant_summary.txt**
+        The file can be uploaded as it is (**variant_summary.txt.gz**), it is read chunk by chunk without uncompressing it first.
+                  The uncompressed **variant_summary.txt** is also accepted. For very large files, you can give the path of the file on the server instead of uploading it.
         """)
         st.markdown("") 
         # File upload section
         st.markdown("""**Please Upload the File**""")
-        # Function to load the dataset using Streamlit caching for optimization and perform error checks for the input files
-        # set expected_columns
-        expected_columns = ['Type','#AlleleID', 'GeneID', 'ClinicalSignificance', 'RS# (dbSNP)', 'Chromosome',
-                                        'ReferenceAlleleVCF', 'AlternateAlleleVCF', 'NumberSubmitters',
-                                        'ClinSigSimple', 'PhenotypeList', 'ReviewStatus']
-        @st.cache_data
-        def load_data(uploaded_file):
-            # Error checks
+        # Function to collect the filtering options using Streamlit caching for optimization
+        # the file is identified by its hash (computed once per file), a few releases are kept and every session gets its own copy of the small summary
+        # an error is raised and not returned, so a failed file is not cached and is read again on the next try
+        @st.cache_data(max_entries=LOAD_DATA_ENTRIES, show_spinner=False)
+        def load_data(_uploaded_file, key):
+            if ClinVar_Cache.HAS_ARROW:
+                # the release is parsed once and cached on disk, the next load is a memory-mapped open shared by all sessions
+                table, cache_path = shared_variant_summary(_uploaded_file)
+                row_count, summary = summarize_metadata(table, ClinVar_Cache.read_metadata(cache_path))
+            else:
+                # without pyarrow, only the option columns are read, chunk by chunk
+                cache_path = None
+                row_count, summary = summarize_options(iter_variant_summary(_uploaded_file, columns=OPTION_COLUMNS))
+            # Check if file is empty
+            if row_count == 0:
+                raise ValueError("The uploaded file is EMPTY!")
+            return cache_path, row_count, summary
+
+        # Function to perform error checks for the input files, the errors are shown on the page
+        def check_data(uploaded_file):
             try:
-                if uploaded_file is None:
-                    st.error("Error: No file uploaded.")
-                    return None
-                # The inputfile should be seperated by tab, assign the first row as header or column name
-                df = pd.read_csv(uploaded_file, sep='\t', header=0)
-            
-                # Check if file is empty
-                if df.empty:
-                    st.error("Error: The uploaded file is EMPTY!")
-                    return None
-                
-                # Check for missing columns
-                missing_columns = [col for col in expected_columns if col not in df.columns]
-                if missing_columns:
-                    st.error(f"Error: The uploaded file is missing the following required columns: {', '.join(missing_columns)}")
-                    return None
-                # Rename columns for easier reference in the future
-                df = df.rename(columns={'RS# (dbSNP)': 'rsID', '#AlleleID': 'AlleleID'})
-                return df
+                return load_data(uploaded_file, source_hash(uploaded_file))
             except pd.errors.EmptyDataError:
                 st.error("Error: The uploaded file exists but is EMPTY!")
-                return None
             except pd.errors.ParserError as e:
                 st.error(f"Error: ParserError while reading the file: {e}")
-                return None
+            except ValueError as e:
+                st.error(f"Error: {e}")
             except Exception as e:
                 st.error(f"Error: An unexpected issue occurred: {e}")
-                return None
-            
-        # File uploader widget, accepts only .txt files
-        uploaded_file = st.file_uploader("Upload variant_summary.txt", type="txt")
+            return None
+
+        # File uploader widget, accepts .txt and .gz files
+        uploaded_file = st.file_uploader("Upload variant_summary.txt or variant_summary.txt.gz", type=["txt", "gz"])
+        # the path of variant_summary.txt(.gz) on the server, used instead of uploading the file
+        server_path = st.text_input("Or enter the path of variant_summary.txt(.gz) on the server", value="")
+        if uploaded_file is None and server_path:
+            if os.path.isfile(server_path):
+                uploaded_file = server_path
+            else:
+                st.error(f"Error: The input file {server_path} is NOT FOUND !")
 
         st.markdown("") 
         st.markdown("""**Default Filtering Criteria**: variant type is **single nucleotide variant** and **rsID != 1**, because rsID is integer that would be reported as -1 if missing.""")
@@ -100,19 +121,29 @@ with content_container:
         
         # If a file is uploaded and no errors raised, then proceed with data processing
         if uploaded_file is not None:
-            df = load_data(uploaded_file)
-            # Display dataset columns and rows
-            st.write(f"Loaded {df.shape[0]} rows and {df.shape[1]} columns.")
+            # a cached result of load_data is returned without running its stages
+            with Stage_Metrics.stage("load_data") as record:
+                data = check_data(uploaded_file)
+                record["Rows"] = None if data is None else data[1]
+            if data is None:
+                st.stop()
+            cache_path, row_count, summary = data
+            # Display dataset rows
+            st.write(f"Scanned {row_count} rows.")
             # Expandable section for filtering options
             with st.expander("Filter Options", expanded=True):
                 # Dropdown to select genome assembly
-                assembly = st.selectbox("Select Assembly", df["Assembly"].unique(), index=0)
+                # the number of rows of every option is shown next to it
+                assembly = st.selectbox("Select Assembly", summary["Assembly"].index, index=0,
+                                        format_func=lambda value: f"{value} ({summary['Assembly'][value]})")
                 # Multiselect options for clinical significance
-                clin_significance_options = df["ClinicalSignificance"].unique()
-                clin_significance = st.multiselect("Select Clinical Significance", clin_significance_options, default=["Pathogenic"])
+                clin_significance_options = summary["ClinicalSignificance"].index
+                clin_significance = st.multiselect("Select Clinical Significance", clin_significance_options, default=["Pathogenic"],
+                                                   format_func=lambda value: f"{value} ({summary['ClinicalSignificance'][value]})")
                 # Multiselect options for review status
-                review_status_options = df["ReviewStatus"].unique()
-                review_status = st.multiselect("Select Review Status", review_status_options, default=[
+                review_status_options = summary["ReviewStatus"].index
+                review_status = st.multiselect("Select Review Status", review_status_options,
+                                               format_func=lambda value: f"{value} ({summary['ReviewStatus'][value]})", default=[
                     'criteria provided, multiple submitters, no conflicts',
                     'criteria provided, single submitter',
                     'criteria provided, conflicting classifications',
@@ -122,47 +153,30 @@ with content_container:
                 # Checkbox to exclude rows with "not provided" phenotype information
                 phenotype_list_required = st.checkbox("Exclude 'not provided' Phenotypes", value=True)
 
-            # Function to filter the ClinVar dataset based on user input
-            def filter_clinvar_data(df, assembly, clin_significance, review_status, phenotype_list_required):
-                """
-                Function: 
-                    to filter the txt file based on the filtering parameters and select and reord the information, write them to the output_file.
-                Input: 
-                    file_path: the path for the input_file and assembly, clin_significance, review_status, phenotype_list_required
-                Output: 
-                    file_path: the path for the output_file
-                """
-                filtered_df = df[
-                    # Keep only single nucleotide variants
-                    (df['Type'] == 'single nucleotide variant') &
-                    # Assembly - GRCh37. The data for the variant are reported for each assembly, so most variants have a line for GRCh37 (hg19) and another line for GRCh38 (hg38)
-                    (df['Assembly'] == assembly) &
-                    # rsID is integer that would be reported as -1 if missing
-                    (df['rsID'] != '-1') &
-                    (df['ClinicalSignificance'].isin(clin_significance)) &
-                    (df['ReviewStatus'].isin(review_status))
-                ]
-                if phenotype_list_required:
-                    # Exclude missing phenotype info
-                    filtered_df = filtered_df[filtered_df["PhenotypeList"] != "not provided"]
-                return filtered_df
-
             # Button to start the filtering proces
             if st.button("Filter Data"):
                 # Show a spinner while filtering
                 with st.spinner("Filtering data..."):
-                    filtered_df = filter_clinvar_data(df, assembly, clin_significance, review_status, phenotype_list_required)
-                    # Select relevant columns for output
-                    output_columns = ['AlleleID', 'GeneID', 'ClinicalSignificance', 'rsID', 'Chromosome',
-                                        'ReferenceAlleleVCF', 'AlternateAlleleVCF', 'NumberSubmitters',
-                                        'ClinSigSimple', 'PhenotypeList', 'ReviewStatus']
-                    SNP_df = filtered_df[output_columns]
-                    st.write(f"Filtered dataset contains {SNP_df.shape[0]} rows and {SNP_df.shape[1]} columns.")
-                    # Display the first 10 rows of the filtered dataset for preview
-                    st.dataframe(SNP_df.head(10))
-                    # Save the filtered dataset as a text file
+                    # Save the filtered dataset as a text file, the file is read, filtered and written chunk by chunk
                     output_file = "ClinVar_to_SNP.txt"
-                    SNP_df.to_csv(output_file, sep='\t', index=False)
+                    try:
+                        # the cached table can be evicted in the meantime, then the file is read again
+                        if cache_path is not None and os.path.isfile(cache_path):
+                            chunks = ClinVar_Cache.iter_table_chunks(shared_table(cache_path),
+                                                                     ClinVar_Cache.read_metadata(cache_path)["categories"])
+                        else:
+                            chunks = iter_variant_summary(uploaded_file)
+                        SNP_count, SNP_preview = write_filtered_clinvar(chunks, output_file, assembly,
+                                                                        clin_significance, review_status, phenotype_list_required)
+                    except Exception as e:
+                        st.error(f"Error: An unexpected issue occurred: {e}")
+                        st.stop()
+                    st.write(f"Filtered dataset contains {SNP_count} rows and {SNP_preview.shape[1]} columns.")
+                    # Display the first 10 rows of the filtered dataset for preview
+                    st.dataframe(SNP_preview)
                     # Provide a download button for the filtered dataset
                     with open(output_file, "rb") as f:
-                        st.download_button("Download Filtered Data", f, file_name=output_file)
\ No newline at end of file
+                        st.download_button("Download Filtered Data", f, file_name=output_file)
+            if metrics.records:
+                with st.expander("Performance"):
+                    st.dataframe(metrics.table(), hide_index=True)
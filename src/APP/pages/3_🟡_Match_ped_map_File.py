@@ -9,20 +9,38 @@ Description:
     This script extracts the genotype information from ped file, convert them into the corrsponding nucleotides, then map them to the map_file to get the corrspondind rsID.
 
 Imported modules:
-    - pandas: used for data manipulation and analysis.
     - streamlit: interactive web-based filtering and data preview
+    - tempfile: every session writes its output file to its own temporary directory
+    - PLINK_Reader: vectorized decoding of the .ped file, a chunk of samples at a time is decoded as one 2D array of allele codes, the chunks are decoded by a pool of CLINVAR_SMART_APP_JOBS processes
+    - Genotype_Matrix: to save the genotypes as a compact binary genotype matrix (.geno.gz) instead of the text table
+    - Stage_Metrics: the time, the rows and the memory of every stage, shown in the expander "Performance"
 
 Procedures:
     1. Verifies the correctness and integrity of the uploaded .ped and .map files.
     2. Extracts genotype data from the .ped file, ensuring it contains valid values.
     3. Converts the numeric genotypes into their respective nucleotide representations (A, T, C, G).
     4. Matches the genotypes with their corresponding SNPs from the .map file using their index position.
-    5. Outputs the matched rsID values along with the associated information (e.g., chromosome, position, genotype) to a downloadable file.
+    5. Outputs the matched rsID values along with the associated information (e.g., chromosome, position, genotype) to a downloadable file, written chunk by chunk.
+       Or outputs the genotypes as a genotype matrix, one byte per genotype, that the pages "Identify Ancients" and "Find Shared" read directly.
+
+Environment variables:
+    CLINVAR_SMART_APP_JOBS: the number of worker processes decoding the .ped file of one session, default is 1 (no pool),
+    every session starts its own pool, so a large value multiplies the processes by the number of sessions
    
 """
 
+import os
+import sys
+import tempfile
 import streamlit as st
-import pandas as pd
+# the shared ClinVar-SMART modules are in the src directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from PLINK_Reader import read_map, write_ped_table
+from Genotype_Matrix import open_matrix, ped_to_matrix
+import Stage_Metrics
+
+# the worker processes of one session, small by default because the sessions share the CPUs of the server
+APP_JOBS = max(1, int(os.environ.get("CLINVAR_SMART_APP_JOBS", "1")))
 
 st.set_page_config(layout="wide")  
 content_container = st.container()
@@ -30,6 +48,8 @@ with content_container:
     col1, col2, col3 = st.columns([1, 7, 1]) 
     with col2:
         st.title("Convert .ped and .map File to Extract rsID")
+        # the time, the rows and the memory of every stage of this run
+        metrics = Stage_Metrics.begin("Convert .ped and .map File to Extract rsID")
         st.markdown("") 
         st.markdown("""**Need To Know: There are some self-study needed to be finished before you upload files**""")
         st.markdown("") 
@@ -47,12 +67,18 @@ with content_container:
                     plink --bfile v54.1_1240K_public --keep Ancient_samples.txt --recode --out Ancient_samples
                     # the output is Ancient_samples.map and Ancient_samples.ped files
                     # extract the common rsID between the .map file and the filtered variant_summary.txt file
-                    # Please go to github and download rsID_Parser.py script and run it. https://github.com/WenxiaRen0751/ClinVar-SMART.git
+                    # Please go to github and download the src directory (rsID_Parser.py needs ClinVar_Reader.py and ClinVar_Cache.py next to it) and run it. https://github.com/WenxiaRen0751/ClinVar-SMART.git
                     python rsID_Parser.py Ancient_samples.map ClinVar_to_SNP.txt
                     # the output is Ancient_rsID_Filtered.txt Ancient_rsID_Filtered_Annotation.txt
                     # filter Ancient_samples.map and  Ancient_samples.ped
                     plink --file Ancient_samples --extract Ancient_rsID_Filtered.txt --recode --out Ancient_samples_filtered
                     # the output are Ancient_samples_filtered.ped Ancient_samples_filtered.map
+                    # OR without plink and the big text .ped file: PLINK_Reader.py reads the binary .bed/.bim/.fam files directly
+                    # and keeps the SNPs in ClinVar_to_SNP.txt and the samples in Ancient_samples.txt
+                    python PLINK_Reader.py v54.1_1240K_public ClinVar_to_SNP.txt --keep Ancient_samples.txt
+                    # the output is Ancient_samples_filtered_rsID.txt, the same as the output of this page, go to the step "Identify Ancients" directly
+                    # OR save the genotypes as a genotype matrix, much smaller than the text table
+                    python Genotype_Matrix.py bed v54.1_1240K_public ClinVar_to_SNP.txt Ancient_samples_filtered.geno.gz --keep Ancient_samples.txt
                     ```
                     """)
         st.markdown("""**🎉 Ancient_samples_filtered.ped** and **🎉 Ancient_samples_filtered.map** are the input files in the following step !""")
@@ -77,6 +103,8 @@ with content_container:
 
         map_file = st.file_uploader("Upload .map file", type=["map", "txt"])
         ped_file = st.file_uploader("Upload .ped file", type=["ped", "txt"])
+        # the text table has one row per genotype, the genotype matrix stores one byte per genotype and is read by the next steps directly
+        output_format = st.radio("Output format", ["Text table (.txt)", "Genotype matrix (.geno.gz)"], horizontal=True)
         # Perform basic validation checks on the uploaded files
         if map_file and ped_file:
             def check_files(map_file, ped_file):
@@ -84,9 +112,9 @@ with content_container:
                 if not map_file or not ped_file:
                     st.error("Error: Both .map and .ped files are required.")
                     return False
-                # Check if files are empty by reading their content and checking length
-                map_file_content = map_file.read()
-                ped_file_content = ped_file.read()
+                # Check if files are empty by reading their first bytes and checking length
+                map_file_content = map_file.read(4)
+                ped_file_content = ped_file.read(6)
                 if len(map_file_content) < 4:
                     st.error("Error: The .map file is empty or incomplete !!! ")
                     return False
@@ -100,67 +128,56 @@ with content_container:
             
             # If the input files pass the basic validation, then proceed
             if check_files(map_file, ped_file):
-                def ped_map_parser(map_file, ped_file):
+                def ped_map_parser(map_file, ped_file, output_file):
                     '''
                     Function:
                     extract the genotype information from ped file, convert them intothe corrsponding nucleotides, then map them to the map_file to get the corrspondind rsID.
                     
                     '''
                     try:
-                        # Assign column names for .map file
-                        column_names = ["Chromosome", "rsID", "Genetic distance", "Position"]
-                        map_df = pd.read_csv(map_file, sep="\t", header=None, names=column_names)
-                        if not all(map_df["rsID"].str.startswith("rs")):
-                            st.error("The .map file is not in the correct format. rsID should start with 'rs'.")
-                            return None
-                        ped_df = pd.read_csv(ped_file, sep=" ", header=None)
-                        # Assign column names for .ped file
-                        ped_columns = ["Family_ID", "Master_ID", "Paternal_ID", "Maternal_ID", "Sex", "Phenotype"] + [f"rs{i}" for i in range(len(ped_df.columns) - 6)]
-                        ped_df.columns = ped_columns
-                        output_data = []
-                        nucleotides = ["0", "A", "T", "C", "G"]
-        
-                        for index, row in ped_df.iterrows():
-                            Master_ID = row["Master_ID"]
-                            # the genotype data in ped file starts from the 7th colum
-                            genotypes = row[6:].values
-                            # Define valid nucleotide codes
-                            valid_nucleotides = {"0", "1", "2", "3", "4"}
-                            # Check if all genotypes contain only valid values
-                            if not all(str(g) in valid_nucleotides for g in genotypes):
-                                st.error(f"Error: Invalid genotype values detected in row {index}. Allowed values are: 0, 1, 2, 3, 4.")  
-                                # Terminate processing if invalid values are found
-                                return None  
-                            for i in range(0, len(genotypes), 2):
-                                genotype_allele1 = int(genotypes[i])
-                                allele1 = nucleotides[genotype_allele1]
-                                genotype_allele2 = int(genotypes[i + 1])
-                                allele2 = nucleotides[genotype_allele2]
-                                # Allele combination
-                                genotype = allele1 + allele2
-                                if genotype != "00":
-                                    SNP = map_df.iloc[i // 2]
-                                    output_data.append([Master_ID, SNP["rsID"], SNP["Chromosome"], SNP["Position"], genotype])
-
-                        output_df = pd.DataFrame(output_data, columns=["Master_ID", "rsID", "Chromosome", "Position", "Genotype"])
-                        return output_df
+                        # the rsID in the .map file should start with "rs"
+                        map_df = read_map(map_file)
+                        # the genotype data in ped file starts from the 7th colum, the allele codes of a chunk of samples are read into one 2D array
+                        # the allowed allele codes are 0, 1, 2, 3, 4
+                        # convert the allele codes to nucleotides with a lookup table, leave out the missing genotypes "00",
+                        # match the nth pair of alleles to the nth SNP in the .map file, and write the rows of every chunk to the output file
+                        # the chunks of samples are decoded by APP_JOBS processes and written in the order of the .ped file
+                        if output_file.endswith(".txt"):
+                            return write_ped_table(map_df, ped_file, output_file, jobs=APP_JOBS)
+                        # the genotype matrix: the codes of every chunk are appended to the matrix, the preview is read back from the matrix
+                        ped_to_matrix(map_df, ped_file, output_file)
+                        matrix = open_matrix(output_file)
+                        return matrix.genotype_count(), matrix.head()
+                    except ValueError as e:
+                        st.error(f"Error: {e}")
+                        return None
                     except Exception as e:
                         st.error(f"Error: An error occurred while processing the files: {e}")
                         return None
                     
-                # Call ped_map_parse function
-                output_df = ped_map_parser(map_file, ped_file)
-                if output_df is not None:
-                    st.write(f" The output file contains {output_df.shape[0]} rows and {output_df.shape[1]} columns.")
-                    output_file_name = "Ancient_samples_filtered_rsID.txt"
-                    st.dataframe(output_df.head(10))
-                    output_csv = output_df.to_csv(index=False, sep="\t").encode("utf-8")
-                    st.download_button(
-                        label="Download the rsID Output File",
-                        data=output_csv,
-                        file_name=output_file_name,
-                        mime="text/csv",
-                    )
+                # Call ped_map_parse function, the output file is written to disk chunk by chunk
+                # the sessions run in the same process and directory, so every session has its own temporary output directory, removed when the session ends
+                if "output_dir" not in st.session_state:
+                    st.session_state["output_dir"] = tempfile.TemporaryDirectory(prefix="ClinVar_SMART_")
+                output_name = "Ancient_samples_filtered_rsID.txt" if output_format.endswith("(.txt)") else "Ancient_samples_filtered_rsID.geno.gz"
+                output_file = os.path.join(st.session_state["output_dir"].name, output_name)
+                with Stage_Metrics.stage("ped_map_parser") as record:
+                    result = ped_map_parser(map_file, ped_file, output_file)
+                    record["Rows"] = None if result is None else result[0]
+                if result is not None:
+                    row_count, preview_df = result
+                    st.write(f" The output file contains {row_count} rows and {preview_df.shape[1]} columns.")
+                    st.dataframe(preview_df)
+                    with open(output_file, "rb") as f:
+                        st.download_button(
+                            label="Download the rsID Output File",
+                            data=f,
+                            file_name=output_name,
+                            mime="text/csv" if output_file.endswith(".txt") else "application/gzip",
+                        )
+                if metrics.records:
+                    with st.expander("Performance"):
+                        st.dataframe(metrics.table(), hide_index=True)
 
 
                     
\ No newline at end of file
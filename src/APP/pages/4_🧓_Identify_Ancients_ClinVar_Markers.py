@@ -12,16 +12,41 @@ Description:
 Imported modules:
     - pandas: used for data manipulation and analysis.
     - streamlit: interactive web-based filtering and data preview
+    - Pipeline_Steps: the logic of the page, shared with ClinVar_Pipeline.py. It opens the indexed store of ClinVar_to_SNP.txt (built the first time the file is uploaded),
+      reads the genotype matrix (.geno or .geno.gz) or a .vcf or .vcf.gz file (only the SNPs in ClinVar are converted to rows),
+      and calls Marker_Caller to join the genotypes to ClinVar, count the mutated alleles and check the alleles against the reference, large files are split into shards of samples called by a pool of CLINVAR_SMART_APP_JOBS processes
+    - Carrier_Matrix: saves the output as a sparse samples x ClinVar variants matrix and aggregates the carriers per sample, per variant or per gene
+    - ClinVar_Resource: the hash of the uploaded files (computed once per file), the markers, the output file and the carrier matrix are kept in the session
+      for the same files and options, so a click on a checkbox or a filter does not call the markers again
+    - Stage_Metrics: the time, the rows and the memory of every stage (opening the store, reading, checking, calling, writing), shown in the expander "Performance"
 
 Procedures:
     1. Check if both input files are uploaded. Validate the format and contents of the input files (rsID, Genotype).
-    2. Merge the datasets based on matching rsID values.
+       A genotype matrix or a VCF file is converted to the same table as Ancient_samples_filtered_rsID.txt, only for the SNPs in ClinVar.
+    2. Look up the rsID values in the indexed ClinVar store and join the matching ClinVar rows.
     3. Filter out rows based on mutation status: only individuals with mutations (heterozygous or homozygous) are included.
+       Warn about the genotypes that only match the ClinVar alleles on the opposite strand (strand flip) or on neither strand.
     4. Display a preview of the results and provide a downloadable output file.
+    5. Optional: build the sparse carrier matrix of the output, download it and aggregate the carriers filtered by ClinicalSignificance and ReviewStatus.
+
+Environment variables:
+    CLINVAR_SMART_APP_JOBS: the number of worker processes calling the markers of one session, default is 1 (no pool),
+    every session starts its own pool, so a large value multiplies the processes by the number of sessions
 
 """
+import os
+import sys
 import streamlit as st
 import pandas as pd
+# the shared ClinVar-SMART modules are in the src directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from Pipeline_Steps import ancient_markers
+from Carrier_Matrix import build_carrier_matrix, carrier_matrix_bytes
+from ClinVar_Resource import source_hash
+import Stage_Metrics
+
+# the worker processes of one session, every session starts its own pool
+APP_JOBS = max(1, int(os.environ.get("CLINVAR_SMART_APP_JOBS", "1")))
 
 st.set_page_config(layout="wide")
 content_container = st.container()
@@ -29,6 +54,8 @@ with content_container:
     col1, col2, col3 = st.columns([1, 7, 1])
     with col2:
         st.title("Identify Which Ancient People have ClinVar Markers")
+        # the time, the rows and the memory of every stage of this run
+        metrics = Stage_Metrics.begin("Identify Which Ancient People have ClinVar Markers")
         st.markdown("") 
         st.markdown("""**Need To Know: The reference database is the output file from "Filter ClinVar Dataset", a lighter version of variant_summary.txt**""")
         st.markdown("""
@@ -36,7 +63,7 @@ with content_container:
                     
                     📗ClinVar_to_SNP.txt, **from the step "Filter ClinVar Dataset"**
                     
-                    📗Ancient_samples_filtered_rsID.txt, **from the step "Convert .ped and .map File to Extract rsID"**
+                    📗Ancient_samples_filtered_rsID.txt, **from the step "Convert .ped and .map File to Extract rsID"**, or the genotype matrix Ancient_samples_filtered_rsID.geno.gz, or a VCF file (.vcf or .vcf.gz)
         """)
         st.markdown("""
                     **Filtering Criteria**:
@@ -56,8 +83,10 @@ with content_container:
                         """)
         st.success("Please upload the two files Ancient_samples_filtered_rsID.txt & ClinVar_to_SNP.txt")
 
-        ancient_file = st.file_uploader("Upload Ancient_samples_filtered_rsID.txt", type=["txt"])
+        ancient_file = st.file_uploader("Upload Ancient_samples_filtered_rsID.txt", type=["txt", "geno", "gz", "vcf"])
         clinvar_file = st.file_uploader("Upload ClinVar_to_SNP.txt", type=["txt"])
+        # a genotype on the opposite strand, like CT for ReferenceAlleleVCF G and AlternateAlleleVCF A, can be counted as AG
+        correct_flips = st.checkbox("Count the alternate alleles of strand-flipped genotypes on the opposite strand", value=False)
         # File check function
         def file_check(file):
                 if not file:
@@ -71,100 +100,22 @@ with content_container:
                 # Stop execution of the script
                 st.stop() 
 
-            def Filtering_Ancient_from_ClinVar(ancient_file, clinvar_file):
+            def Filtering_Ancient_from_ClinVar(ancient_file, clinvar_file, correct_flips=False):
                 """
                 Function:
                     Identify which ancient people have ClinVar markers and output that to a table.
                 """
                 try:
-                    Ancient_Filtered_rsID_df = pd.read_csv(ancient_file, sep="\t", header=0)
-                    ClinVar_Filtered_rsID_df = pd.read_csv(clinvar_file, sep="\t", header=0)
-                    
-                    # Check if file is empty
-                    if Ancient_Filtered_rsID_df.empty:
-                        st.error("Error: The uploaded file is EMPTY!")
+                    # the ClinVar file is opened as a store sorted by rsID, the columns and the empty file are checked when the store is built
+                    # the rows with a missing value, an invalid genotype or an invalid rsID are removed, then the rsID is stripped of the prefix "rs"
+                    # look up the rsIDs in the ClinVar store (an rsID can match several ClinVar rows), count the alternate alleles of every genotype
+                    # and only keep the Mutation_Status is 1 and 2, the samples are split into shards called by APP_JOBS processes for large files
+                    # the alleles are checked against ReferenceAlleleVCF and AlternateAlleleVCF in the same pass
+                    try:
+                        return ancient_markers(ancient_file, clinvar_file, correct_flips=correct_flips, jobs=APP_JOBS)
+                    except ValueError as e:
+                        st.error(f"Error: {e}")
                         return None
-                    if ClinVar_Filtered_rsID_df.empty:
-                        st.error("Error: The uploaded file is EMPTY!")
-                        return None
-                    # Check if the required columns are present
-                    expected_columns =  ['rsID', 'Chromosome', 'Position', 'Genotype','Master_ID']
-                    missing_columns = [col for col in expected_columns if col not in Ancient_Filtered_rsID_df.columns]
-                    if missing_columns:
-                        st.error(f"Error: Missing required columns: {', '.join(missing_columns)}")
-                        return False
-                    
-                    expected_column2 = ['AlleleID', 'GeneID', 'ClinicalSignificance', 'rsID', 'Chromosome',
-                                        'ReferenceAlleleVCF', 'AlternateAlleleVCF', 'NumberSubmitters',
-                                        'ClinSigSimple', 'PhenotypeList', 'ReviewStatus']
-                    if list(ClinVar_Filtered_rsID_df.columns) != expected_column2:
-                        st.error(f"Error: Columns do not match the expected format. "
-                                f"Expected columns: {', '.join(expected_column2)}. "
-                                f"Found columns: {', '.join(ClinVar_Filtered_rsID_df.columns)}.")
-                        return False
-
-                    # Check for missing values
-                    def check_missing_values(df, columns):
-                        missing_data = df[columns].isnull().any(axis=1)
-                        if missing_data.any():
-                            st.error(f"Error: Missing values detected in columns: {', '.join(columns)}")
-                            # Return the filtered dataframe with no missing values
-                            return df[~missing_data] 
-                        return df
-                    # Check for missing values
-                    Ancient_Filtered_rsID_df = check_missing_values(Ancient_Filtered_rsID_df, ["rsID", "Genotype"])
-                    ClinVar_Filtered_rsID_df = check_missing_values(ClinVar_Filtered_rsID_df, ["rsID", "AlternateAlleleVCF"])
-                    
-                    # Check for valid genotype format in Ancient_Filtered_rsID file
-                    def check_genotype_format(df):
-                        invalid_genotypes = df[~df["Genotype"].str.match(r"^[ACGT]{2}$")]
-                        if not invalid_genotypes.empty:
-                            st.warning(f"Warning: Invalid Genotype format detected. Genotypes must be two-letter combinations like 'AA', 'AT', etc. The conresponding row will be deleted !!! ")
-                             # Return the filtered dataframe excluding invalid genotypes
-                            return df[~df["Genotype"].isin(invalid_genotypes["Genotype"])]  
-                        return df
-                    Ancient_Filtered_rsID_df = check_genotype_format(Ancient_Filtered_rsID_df)
-
-                    # Check if the rsID contains the expected format in Ancient_Filtered_rsID file
-                    def check_rsID_format(df):
-                        df["rsID"] = df["rsID"].astype(str)
-                        # Check if the rsID contains the expected format (e.g., 'rs' followed by digits)
-                        invalid_rsIDs = df[~df["rsID"].str.match(r"^rs\d+$")]
-                        if not invalid_rsIDs.empty:
-                            st.warning(f"Warning: Invalid rsIDs detected and the conresponding row will be deleted !!!")
-                            # Filter out invalid rsIDs
-                            return df[~df["rsID"].isin(invalid_rsIDs["rsID"])]
-                        return df
-                    # Ensure format in Ancient_Filtered_rsID file is valid
-                    Ancient_Filtered_rsID_df = check_rsID_format(Ancient_Filtered_rsID_df)
-                    # then strip ID
-                    Ancient_Filtered_rsID_df["rsID"] = Ancient_Filtered_rsID_df["rsID"].str[2:].astype(str)
-
-                    New_ClinVar_Filtered_rsID_df = ClinVar_Filtered_rsID_df[["AlleleID", "GeneID", "ClinicalSignificance", "rsID", "ReferenceAlleleVCF", "AlternateAlleleVCF", "NumberSubmitters", "ClinSigSimple", "PhenotypeList", "ReviewStatus"]]
-                    New_ClinVar_Filtered_rsID_df["rsID"] = New_ClinVar_Filtered_rsID_df["rsID"].astype(str)
-                    # Merge datasets
-                    merged_df = Ancient_Filtered_rsID_df.merge(New_ClinVar_Filtered_rsID_df, on=["rsID"], how="inner")
-
-                    def Filter_mutation(row):
-                        """
-                        to determine mutation status
-                        """
-                        Genotype = row["Genotype"]
-                        Alt_Allele = row["AlternateAlleleVCF"]
-                        if len(Genotype) != 2:
-                            return "Genotype is Unknown"
-                        allele1, allele2 = Genotype[0], Genotype[1]
-                        if allele1 == Alt_Allele and allele2 == Alt_Allele:
-                            return 2  # Homozygous Mutation
-                        elif allele1 == Alt_Allele or allele2 == Alt_Allele:
-                            return 1  # Heterozygous Mutation
-                        else:
-                            return 0  # No mutation, Homozygous Reference
-                    # Apply classification function to every row of  merge_df, then assign the result to a new column "Mutation_Status"  
-                    merged_df["Mutation_Status"] = merged_df.apply(Filter_mutation, axis=1)
-                    # only keep the Mutation_Status is 1 and 2
-                    filtered_df = merged_df[merged_df["Mutation_Status"] > 0]
-                    return filtered_df
 
                 except pd.errors.EmptyDataError:
                     st.error("Error: The input file exists but is EMPTY. Exiting the program.")
@@ -176,10 +127,34 @@ with content_container:
                     st.error(f"Error: An error occurred while reading the input files: {e}")
                     return None
 
-            output_df = Filtering_Ancient_from_ClinVar(ancient_file, clinvar_file)
-
-            if output_df is not None:
+            # Streamlit runs the page again on every click, the markers of the same files and options are kept in the session and only called once
+            # the output file and the carrier matrix are added to them when they are first needed
+            markers_key = (source_hash(ancient_file), source_hash(clinvar_file), correct_flips)
+            markers = st.session_state.get("ancient_markers")
+            if markers is None or markers["key"] != markers_key:
+                with Stage_Metrics.stage("Filtering_Ancient_from_ClinVar") as record:
+                    output_df = Filtering_Ancient_from_ClinVar(ancient_file, clinvar_file, correct_flips)
+                    record["Rows"] = None if output_df is None else len(output_df)
+                # a failed call is not kept, the files are read again on the next run
+                markers = None if output_df is None else {"key": markers_key, "markers": output_df, "csv": None, "carrier_matrix": None, "npz": None}
+                st.session_state["ancient_markers"] = markers
+
+            if markers is not None:
+                output_df = markers["markers"]
+                issues = output_df.attrs["issues"]
+                if issues["Missing"]:
+                    st.error("Error: Missing values detected in columns: rsID, Genotype")
+                if issues["Missing_AlternateAlleleVCF"]:
+                    st.error("Error: Missing values detected in columns: rsID, AlternateAlleleVCF")
+                if issues["Invalid_Genotype"]:
+                    st.warning(f"Warning: Invalid Genotype format detected. Genotypes must be two-letter combinations like 'AA', 'AT', etc. The conresponding row will be deleted !!! ")
+                if issues["Invalid_rsID"]:
+                    st.warning(f"Warning: Invalid rsIDs detected and the conresponding row will be deleted !!!")
                 st.write(f"The output file contains {output_df.shape[0]} rows and {output_df.shape[1]} columns.")
+                allele_check = output_df.attrs.get("allele_check", {})
+                if allele_check.get("strand_flip") or allele_check.get("mismatch"):
+                    st.warning(f"Warning: {allele_check['strand_flip']} genotypes only match ReferenceAlleleVCF/AlternateAlleleVCF on the opposite strand (strand flip), "
+                               f"{allele_check['mismatch']} genotypes match neither strand. Check the strand and the genome assembly of the genotype file !!!")
                 st.write("""
                         The column **Mutation_Status** indicates how many alleles have mutated. 
                          
@@ -191,13 +166,53 @@ with content_container:
                          """)
                 output_file_name = "Ancient_ClinVar_Markers.txt"
                 st.dataframe(output_df.head(10))
-                output_csv = output_df.to_csv(index=False, sep="\t").encode("utf-8")
+                if markers["csv"] is None:
+                    with Stage_Metrics.stage("to_csv", rows=len(output_df)):
+                        markers["csv"] = output_df.to_csv(index=False, sep="\t").encode("utf-8")
                 st.download_button(
                     label="Download Ancient ClinVar Markers Output File",
-                    data=output_csv,
+                    data=markers["csv"],
                     file_name=output_file_name,
                     mime="text/csv",
                 )
 
-
-                
\ No newline at end of file
+                # the sparse samples x ClinVar variants matrix, the aggregates are computed from the matrix instead of the whole table
+                if st.checkbox("Build the carrier matrix (samples x ClinVar variants) to count the carriers", value=False):
+                    if markers["carrier_matrix"] is None:
+                        with Stage_Metrics.stage("build_carrier_matrix", rows=len(output_df)):
+                            markers["carrier_matrix"] = build_carrier_matrix(output_df)
+                    carrier_matrix = markers["carrier_matrix"]
+                    st.write(f"The carrier matrix has {carrier_matrix.shape[0]} samples, {carrier_matrix.shape[1]} ClinVar variants and {len(carrier_matrix)} carriers.")
+                    # the .npz file is only written when it is asked for, then kept for the next runs
+                    if markers["npz"] is None and st.button("Prepare the carrier matrix file (.npz) for download"):
+                        with Stage_Metrics.stage("carrier_matrix_bytes", rows=len(carrier_matrix)):
+                            markers["npz"] = carrier_matrix_bytes(carrier_matrix)
+                    if markers["npz"] is not None:
+                        st.download_button(
+                            label="Download Ancient ClinVar Carrier Matrix",
+                            data=markers["npz"],
+                            file_name="Ancient_ClinVar_Markers.carriers.npz",
+                            mime="application/octet-stream",
+                        )
+                    selected_significance = st.multiselect("ClinicalSignificance", carrier_matrix.categories["ClinicalSignificance"])
+                    selected_review = st.multiselect("ReviewStatus", carrier_matrix.categories["ReviewStatus"])
+                    mask = carrier_matrix.variant_mask(selected_significance, selected_review)
+                    aggregate = st.radio("Count the carriers", ["per sample", "per ClinVar variant", "per gene", "of one rsID"], horizontal=True)
+                    if aggregate == "per sample":
+                        st.dataframe(carrier_matrix.per_sample(mask))
+                    elif aggregate == "per ClinVar variant":
+                        st.dataframe(carrier_matrix.per_variant(mask))
+                    elif aggregate == "per gene":
+                        st.dataframe(carrier_matrix.per_gene(mask))
+                    else:
+                        rsid = st.text_input("rsID", value="").strip().removeprefix("rs")
+                        if rsid.isdigit():
+                            st.dataframe(carrier_matrix.carriers_of(rsid=int(rsid)))
+                        elif rsid:
+                            st.warning("Warning: The rsID should be a number with or without the prefix rs, for example rs5082 !!!")
+
+
+                
+            if metrics.records:
+                with st.expander("Performance"):
+                    st.dataframe(metrics.table(), hide_index=True)
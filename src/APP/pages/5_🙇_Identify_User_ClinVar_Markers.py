@@ -12,17 +12,29 @@ Description:
 Imported modules:
     - pandas: used for data manipulation and analysis.
     - streamlit: interactive web-based filtering and data preview
+    - Pipeline_Steps: the logic of the page, shared with ClinVar_Pipeline.py. It opens the indexed store of ClinVar_to_SNP.txt (built the first time the file is uploaded),
+      reads the raw file of the genotyping company (23andMe, AncestryDNA), Test_DNA.txt or a one-sample .vcf or .vcf.gz file (only the SNPs in ClinVar are decoded),
+      and calls Marker_Caller to join the genotypes to ClinVar, count the mutated alleles and check the alleles against the reference, without a Python call per row
+    - Stage_Metrics: the time, the rows and the memory of every stage (opening the store, reading, checking, calling, writing), shown in the expander "Performance"
 
 Procedures:
     1. Check if both input files are uploaded. Validate the format and contents of the input files (rsID, Genotype).
-    2. Merge the datasets based on matching rsID values.
+       A raw 23andMe or AncestryDNA file or a VCF file is converted to the same table as Test_DNA.txt, only for the SNPs in ClinVar.
+    2. Look up the rsID values in the indexed ClinVar store and join the matching ClinVar rows.
     3. Filter out rows based on mutation status: only individuals with mutations (heterozygous or homozygous) are included.
+       Warn about the genotypes that only match the ClinVar alleles on the opposite strand (strand flip) or on neither strand.
     4. Display a preview of the results and provide a downloadable output file.
 
 """
 
+import os
+import sys
 import streamlit as st
 import pandas as pd
+# the shared ClinVar-SMART modules are in the src directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from Pipeline_Steps import user_markers
+import Stage_Metrics
 
 st.set_page_config(layout="wide")
 content_container = st.container()
@@ -30,6 +42,8 @@ with content_container:
     col1, col2, col3 = st.columns([1, 7, 1])
     with col2:
         st.title("Identify Which ClinVar Markers the TestUser Has")
+        # the time, the rows and the memory of every stage of this run
+        metrics = Stage_Metrics.begin("Identify Which ClinVar Markers the TestUser Has")
         st.markdown("") 
         st.markdown("""**Need To Know: The reference database is the output file from "Filter ClinVar Dataset", a lighter version of variant_summary.txt**""")
         st.markdown("""
@@ -37,7 +51,7 @@ with content_container:
                     
                     📗ClinVar_to_SNP.txt, **from the step "Filter ClinVar Dataset"**
                     
-                    📗Test_DNA.txt: The TestUser file.
+                    📗Test_DNA.txt: The TestUser file, the raw file of 23andMe or AncestryDNA (.txt, .csv or .zip), or a VCF file (.vcf or .vcf.gz) with one sample.
                      
                      ⚠ Try to use bash command to **Standardize the TestUser files. The right format is listed as belowed !**
         """)
@@ -58,8 +72,10 @@ with content_container:
                     | rs116587930 | 1 | 727841 | GG |
                         """)
         st.success("Please upload the two files Test_DNA.txt & ClinVar_to_SNP.txt")
-        user_file = st.file_uploader("Upload Test_DNA.txt", type=["txt"])
+        user_file = st.file_uploader("Upload Test_DNA.txt", type=["txt", "csv", "zip", "vcf", "gz"])
         clinvar_file = st.file_uploader("Upload ClinVar_to_SNP.txt", type=["txt"])
+        # a genotype on the opposite strand, like CT for ReferenceAlleleVCF G and AlternateAlleleVCF A, can be counted as AG
+        correct_flips = st.checkbox("Count the alternate alleles of strand-flipped genotypes on the opposite strand", value=False)
      
         # File check function
         def file_check(file):
@@ -74,88 +90,31 @@ with content_container:
                 st.stop()  # Stop execution of the script
 
         if user_file and clinvar_file:
-            def Filtering_Ancient_from_ClinVar(user_file, clinvar_file):
+            def Filtering_Ancient_from_ClinVar(user_file, clinvar_file, correct_flips=False):
                 try:
-                    User_Filtered_rsID_df = pd.read_csv(user_file, sep="\t", header=0)
-                    ClinVar_Filtered_rsID_df = pd.read_csv(clinvar_file, sep="\t", header=0)
-
-                    # Check if the required columns are present
-                    expected_columns =  ['rsID', 'Chromosome', 'Position', 'Genotype']
-                    # Check if the columns in the uploaded file match exactly with the expected columns
-                    if list(User_Filtered_rsID_df.columns) != expected_columns:
-                        st.error(f"Error: Columns in Test_DNA.txt do not match the expected format. "
-                                f"Expected columns: {', '.join(expected_columns)}. "
-                                f"Found columns: {', '.join(User_Filtered_rsID_df.columns)}.")
-                        return False
-                    
-                    expected_column2 = ['AlleleID', 'GeneID', 'ClinicalSignificance', 'rsID', 'Chromosome',
-                                        'ReferenceAlleleVCF', 'AlternateAlleleVCF', 'NumberSubmitters',
-                                        'ClinSigSimple', 'PhenotypeList', 'ReviewStatus']
-                    if list(ClinVar_Filtered_rsID_df.columns) != expected_column2:
-                        st.error(f"Error: Columns do not match the expected format. "
-                                f"Expected columns: {', '.join(expected_column2)}. "
-                                f"Found columns: {', '.join(ClinVar_Filtered_rsID_df.columns)}.")
-                        return False
-
-                    # Check for missing values
-                    def check_missing_values(df, columns):
-                        missing_data = df[columns].isnull().any(axis=1)
-                        if missing_data.any():
-                            st.error(f"Error: Missing values detected in columns: {', '.join(columns)}")
-                            return df[~missing_data]  # Return the filtered dataframe with no missing values
-                        return df
-                    # Check for missing values
-                    User_Filtered_rsID_df = check_missing_values(User_Filtered_rsID_df, ["rsID", "Genotype"])
-                    ClinVar_Filtered_rsID_df = check_missing_values(ClinVar_Filtered_rsID_df, ["rsID", "AlternateAlleleVCF"])
-
-                    # Check for invalid genotypes (two-letter combinations of A, C, G, T)
-                    def check_genotype_format(df):
-                        invalid_genotypes = df[~df["Genotype"].str.match(r"^[ACGT]{2}$")]
-                        if not invalid_genotypes.empty:
-                            invalid_genotype_values = invalid_genotypes["Genotype"].values
-                            st.warning(f"Warning: Invalid Genotype format detected. Genotypes must be two-letter combinations like 'AA', 'AT', etc. The conresponding row will be deleted !!! ")
-                            # Return the filtered dataframe excluding invalid genotypes
-                            return df[~df["Genotype"].isin(invalid_genotype_values)]  # Exclude invalid genotypes
-                        return df
-                    User_Filtered_rsID_df = check_genotype_format(User_Filtered_rsID_df)
-
-                    # Check if the rsID contains the expected format
-                    def check_rsID_format(df):
-                        df["rsID"] = df["rsID"].astype(str)
-                        # Check if the rsID contains the expected format (e.g., 'rs' followed by digits)
-                        invalid_rsIDs = df[~df["rsID"].str.match(r"^rs\d+$")]
-                        if not invalid_rsIDs.empty:
-                            st.warning(f"Warning: Invalid rsIDs detected and the conresponding row will be deleted !!!")
-                            # Filter out invalid rsIDs
-                            df = df[~df["rsID"].isin(invalid_rsIDs["rsID"])]
-                        return df
-                    User_Filtered_rsID_df = check_rsID_format(User_Filtered_rsID_df)
-
-                    # After filtering the the conresponding rows with invaild rsID and genotype, strip rsID without the prefix "rs"
-                    User_Filtered_rsID_df["rsID"] = User_Filtered_rsID_df["rsID"].str[2:].astype(str)
-                    New_ClinVar_Filtered_rsID_df = ClinVar_Filtered_rsID_df[["AlleleID", "GeneID", "ClinicalSignificance", "rsID", "ReferenceAlleleVCF", "AlternateAlleleVCF", "NumberSubmitters", "ClinSigSimple", "PhenotypeList", "ReviewStatus"]]
-                    New_ClinVar_Filtered_rsID_df["rsID"] = New_ClinVar_Filtered_rsID_df["rsID"].astype(str)
-                    merged_df = User_Filtered_rsID_df.merge(New_ClinVar_Filtered_rsID_df, on=["rsID"], how="inner")
-
-                    def Filter_mutation(row):
-                        """
-                        to determine mutation status
-                        """
-                        Genotype = str(row["Genotype"])
-                        Alt_Allele = str(row["AlternateAlleleVCF"])
-                        if len(Genotype) != 2:
-                            return "Genotype is Unknown"
-                        allele1, allele2 = Genotype[0], Genotype[1]
-                        if allele1 == Alt_Allele and allele2 == Alt_Allele:
-                            return 2  # Homozygous Mutation
-                        elif allele1 == Alt_Allele or allele2 == Alt_Allele:
-                            return 1  # Heterozygous Mutation
-                        else:
-                            return 0  # No mutation, Homozygous Reference
-                        
-                    merged_df["Mutation_Status"] = merged_df.apply(Filter_mutation, axis=1)
-                    merged_df["Mutation_Status"] = pd.to_numeric(merged_df["Mutation_Status"], errors="coerce")
-                    filtered_df = merged_df[merged_df["Mutation_Status"] > 0]
+                    # the ClinVar file is opened as a store sorted by rsID, the columns and the empty file are checked when the store is built
+                    # the text file is read line by line, the lines with an rsID that is not in ClinVar are dropped before they are split,
+                    # the columns of the header are checked and the no-calls ("--" or "0") are removed
+                    # the rows with a missing value, an invalid genotype or an invalid rsID are removed, then the rsID is stripped of the prefix "rs"
+                    # look up the rsIDs in the ClinVar store (an rsID can match several ClinVar rows), count the alternate alleles of every genotype
+                    # and check the alleles against ReferenceAlleleVCF and AlternateAlleleVCF in the same pass, only keep the Mutation_Status is 1 and 2
+                    try:
+                        filtered_df = user_markers(user_file, clinvar_file, correct_flips)
+                    except ValueError as e:
+                        st.error(f"Error: {e}")
+                        return None
+                    issues = filtered_df.attrs["issues"]
+                    if "SNPs" in issues:
+                        st.write(f"{issues['In_ClinVar']} of {issues['SNPs']} SNPs of the user are in ClinVar, "
+                                 f"{issues['No_Call']} no-calls are removed.")
+                    if issues["Missing"]:
+                        st.error("Error: Missing values detected in columns: rsID, Genotype")
+                    if issues["Missing_AlternateAlleleVCF"]:
+                        st.error("Error: Missing values detected in columns: rsID, AlternateAlleleVCF")
+                    if issues["Invalid_Genotype"]:
+                        st.warning(f"Warning: Invalid Genotype format detected. Genotypes must be two-letter combinations like 'AA', 'AT', etc. The conresponding row will be deleted !!! ")
+                    if issues["Invalid_rsID"]:
+                        st.warning(f"Warning: Invalid rsIDs detected and the conresponding row will be deleted !!!")
                     return filtered_df
                 except pd.errors.EmptyDataError:
                     st.error("Error: The input file exists but is EMPTY. Exiting the program.")
@@ -167,9 +126,15 @@ with content_container:
                     st.error(f"Error: An error occurred while reading the input files: {e}")
                     return None
 
-            output_df = Filtering_Ancient_from_ClinVar(user_file, clinvar_file)
+            with Stage_Metrics.stage("Filtering_Ancient_from_ClinVar") as record:
+                output_df = Filtering_Ancient_from_ClinVar(user_file, clinvar_file, correct_flips)
+                record["Rows"] = None if output_df is None else len(output_df)
             if output_df is not None:
                 st.write(f"The output file contains {output_df.shape[0]} rows and {output_df.shape[1]} columns.")
+                allele_check = output_df.attrs.get("allele_check", {})
+                if allele_check.get("strand_flip") or allele_check.get("mismatch"):
+                    st.warning(f"Warning: {allele_check['strand_flip']} genotypes only match ReferenceAlleleVCF/AlternateAlleleVCF on the opposite strand (strand flip), "
+                               f"{allele_check['mismatch']} genotypes match neither strand. Check the strand and the genome assembly of the genotype file !!!")
                 rsID_number = output_df["rsID"].count()
                 st.write("""
                         The column **Mutation_Status** indicates how many alleles have mutated. 
@@ -184,10 +149,14 @@ with content_container:
                 st.write(f"This user has {rsID_number} SNPs")
                 output_file_name = "Test_ClinVar_Markers.txt"
                 st.dataframe(output_df.head(10))
-                output_csv = output_df.to_csv(index=False, sep="\t").encode("utf-8")
+                with Stage_Metrics.stage("to_csv", rows=len(output_df)):
+                    output_csv = output_df.to_csv(index=False, sep="\t").encode("utf-8")
                 st.download_button(
                     label="Download User ClinVar Markers Output File",
                     data=output_csv,
                     file_name=output_file_name,
                     mime="text/csv",
-                )
\ No newline at end of file
+                )
+            if metrics.records:
+                with st.expander("Performance"):
+                    st.dataframe(metrics.table(), hide_index=True)
@@ -15,15 +15,39 @@ Description:
 Imported modules:
     - pandas: used for data manipulation and analysis.
     - streamlit: interactive web-based filtering and data preview
+    - Genotype_Matrix: reads the genotype matrix (.geno or .geno.gz) of the page "Convert .ped and .map File to Extract rsID" instead of Ancient_ClinVar_Markers.txt
+    - Marker_Caller: counts the mutated alleles of the ancient genotypes read from the genotype matrix
+    - VCF_Reader: reads the ancient genotypes from a .vcf or .vcf.gz file, only the records of the user's rsIDs are decoded
+    - Shared_Index: indexes Ancient_ClinVar_Markers.txt by (rsID, Genotype), the shared markers are looked up instead of merging the whole table
+    - ClinVar_Resource: keeps the shared index of every file once per process for all sessions, the least recently used indexes are dropped above the memory ceiling
+    - Sharing_Matrix: counts the shared markers of several users with every ancient sample and keeps the most similar samples
+    - Stage_Metrics: the time, the rows and the memory of every stage (loading the index, finding the shared markers, writing), shown in the expander "Performance"
 
 Procedures:
     1. perform error checks before continuing next steps.
     2. Merge the datasets based on matching rsID values and genotype
+       With Ancient_ClinVar_Markers.txt or its shared index (.shared.npz), the index is built or read once per file and every user marker is one lookup.
+       With a genotype matrix or a VCF file, only the columns of the user's rsIDs are read, the ancient genotypes get the ClinVar annotation of the user marker with the same rsID and genotype.
     3. output to a table in which ancient people have the same ClinVAR mutations as the user.
+    4. Optional: compare several users with every ancient sample, the number of shared markers and a score weighted by ClinicalSignificance,
+       and output the most similar ancient samples of every user and the most similar users of every ancient sample.
 
 """
+import os
+import sys
 import streamlit as st
 import pandas as pd
+import numpy as np
+# the shared ClinVar-SMART modules are in the src directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+from ClinVar_Store import rsid_to_int
+from Genotype_Matrix import is_genotype_matrix, open_matrix
+from Marker_Caller import mutation_status, shared_markers
+from ClinVar_Resource import shared_index as load_index, source_hash
+from Shared_Index import shared_index_bytes
+from Sharing_Matrix import sharing_matrix
+import Stage_Metrics
+from VCF_Reader import is_vcf, read_vcf
 
 st.set_page_config(layout="wide")
 content_container = st.container()
@@ -31,11 +55,13 @@ with content_container:
     col1, col2, col3 = st.columns([1, 7, 1])
     with col2:
         st.title("Find What ClinVar Markers Ancient Samples and User Shared")
+        # the time, the rows and the memory of every stage of this run
+        metrics = Stage_Metrics.begin("Find What ClinVar Markers Ancient Samples and User Shared")
         st.markdown("") 
         st.markdown("""
                     **Input Files**:
                     
-                    📗Ancient_ClinVar_Markers.txt, **from the step "Identify Which Ancient People have ClinVar Markers"**
+                    📗Ancient_ClinVar_Markers.txt, **from the step "Identify Which Ancient People have ClinVar Markers"**, or the genotype matrix Ancient_samples_filtered_rsID.geno.gz **from the step "Convert .ped and .map File to Extract rsID"**, or a VCF file (.vcf or .vcf.gz), or the shared index Ancient_ClinVar_Markers.shared.npz **downloaded from this page**
                     
                     📗Test_ClinVar_Markers.txt, **from the step "Identify Which ClinVar Markers the TestUser Has"**
                      
@@ -50,7 +76,7 @@ with content_container:
         """)
         st.success("Please upload the two files Ancient_ClinVar_Markers.txt & Test_ClinVar_Markers.txt")
         user_clinvar_file = st.file_uploader("Upload Test_ClinVar_Marker.txt", type=["txt"])
-        ancient_clinvar_file = st.file_uploader("Upload Ancient_ClinVar_Markers.txt", type=["txt"])
+        ancient_clinvar_file = st.file_uploader("Upload Ancient_ClinVar_Markers.txt", type=["txt", "geno", "gz", "vcf", "npz"])
         # File check function
         def file_check(file):
                 if not file:
@@ -71,73 +97,121 @@ with content_container:
             def Test_Ancient_Shared(user_clinvar_file, ancient_clinvar_file):
                 try:
                     User_ClinVarMarker_df = pd.read_csv(user_clinvar_file, sep="\t", header=0)
-                    Ancient_ClinVarMarker_df = pd.read_csv(ancient_clinvar_file, sep="\t", header=0)
+                    # the genotype matrix is read after the user file is checked, only the columns of the user's rsIDs are needed
+                    ancient_is_vcf = is_vcf(ancient_clinvar_file)
+                    ancient_is_matrix = ancient_is_vcf or is_genotype_matrix(ancient_clinvar_file)
                     # Check for missing columns in User_ClinVarMarker_df
                     missing_columns1 = [col for col in expected_column1 if col not in User_ClinVarMarker_df.columns]
                     if missing_columns1:
                         st.error(f"Error: The uploaded file is missing the following required columns: {', '.join(missing_columns1)}")
-                        return None
-                    # Check for missing columns in Ancient_ClinVarMarker_df
-                    missing_columns2 = [col for col in expected_column1 if col not in Ancient_ClinVarMarker_df.columns]
-                    if missing_columns2:
-                        st.error(f"Error: The uploaded file is missing the following required columns: {', '.join(missing_columns2)}")
-                        return None
+                        return None, None
                     
                     User_ClinVarMarker_df["rsID"] = User_ClinVarMarker_df["rsID"].astype(str)
+                    if not ancient_is_matrix:
+                        # Ancient_ClinVar_Markers.txt or its .shared.npz: one lookup per user marker, the missing columns raise a ValueError
+                        # the shared index of Ancient_ClinVar_Markers.txt is built once per file and kept for the next users and sessions
+                        with Stage_Metrics.stage("load_index"):
+                            shared_index = load_index(ancient_clinvar_file)
+                        with Stage_Metrics.stage("shared", rows=len(User_ClinVarMarker_df)):
+                            shared_df = shared_index.shared(User_ClinVarMarker_df)
+                        return shared_df, shared_index
+                    else:
+                        if ancient_is_vcf:
+                            # the VCF file: only the records of the user's rsIDs are decoded
+                            matrix = read_vcf(ancient_clinvar_file, rsid_to_int(User_ClinVarMarker_df["rsID"]))
+                        else:
+                            matrix = open_matrix(ancient_clinvar_file)
+                        # read only the SNP columns of the user's rsIDs, the rsID is stripped like in Ancient_ClinVar_Markers.txt
+                        user_snps = np.isin(rsid_to_int(matrix.snps["rsID"]), rsid_to_int(User_ClinVarMarker_df["rsID"]))
+                        Ancient_Genotype_df = matrix.long_table(np.flatnonzero(user_snps))[["Master_ID", "rsID", "Genotype"]]
+                        Ancient_Genotype_df["rsID"] = Ancient_Genotype_df["rsID"].str[2:]
+                        # the same rsID and genotype have the same ClinVar rows, so the ancient genotypes get the annotation of the user markers
+                        annotation_columns = ["rsID", "Genotype"] + expected_column1[4:-1]
+                        annotation_df = User_ClinVarMarker_df[annotation_columns].drop_duplicates()
+                        Ancient_ClinVarMarker_df = Ancient_Genotype_df.merge(annotation_df, on=["rsID", "Genotype"], how="inner")
+                        Ancient_ClinVarMarker_df["Mutation_Status"] = mutation_status(Ancient_ClinVarMarker_df["Genotype"], Ancient_ClinVarMarker_df["AlternateAlleleVCF"])
                     Ancient_ClinVarMarker_df["rsID"] = Ancient_ClinVarMarker_df["rsID"].astype(str)
 
-                    output_columns_1 = ["rsID", "Genotype", "Chromosome", "Position"]
-                    output_columns_2 = ["Master_ID", "rsID", "Genotype",
-                                        "AlleleID", "GeneID", "ClinicalSignificance",
-                                        "ReferenceAlleleVCF", "AlternateAlleleVCF", "NumberSubmitters", "ClinSigSimple", "PhenotypeList", "ReviewStatus", "Mutation_Status"]
-
-                    Filtered_User_ClinVarMarker_df = User_ClinVarMarker_df[output_columns_1]
-                    Filtered_Ancient_ClinVarMarker_df = Ancient_ClinVarMarker_df[output_columns_2]
-                    merged_df = Filtered_User_ClinVarMarker_df.merge(Filtered_Ancient_ClinVarMarker_df, on=["rsID", "Genotype"], how="inner")
-                    merged_df['Master_ID'] = merged_df['Master_ID'].astype(str)
-
-                    grouped_df = merged_df.groupby('rsID').agg({
-                        'Genotype': 'first',
-                        'Chromosome': 'first',
-                        'Position': 'first',
-                        'AlleleID': 'first',
-                        'GeneID': 'first',
-                        'ClinicalSignificance': 'first',
-                        'ReferenceAlleleVCF': 'first',
-                        'AlternateAlleleVCF': 'first',
-                        'NumberSubmitters': 'first',
-                        'ClinSigSimple': 'first',
-                        'PhenotypeList': 'first',
-                        'ReviewStatus': 'first',
-                        'Mutation_Status': 'first',
-                        'Master_ID': lambda x: ','.join(x),
-                    }).reset_index()
-                    # Count how many Master_IDs match for each rsID
-                    master_id_count_df = merged_df.groupby('rsID')['Master_ID'].nunique().reset_index()
-                    master_id_count_df.columns = ['rsID', 'Master_ID_Count']
-                    # Merge the master ID count with the grouped dataframe
-                    final_output_df = pd.merge(grouped_df, master_id_count_df, on="rsID", how="left")
-                    return final_output_df
+                    # merge on rsID and Genotype, one row per rsID with the Master_IDs separated by commas and the number of Master_IDs
+                    final_output_df = shared_markers(User_ClinVarMarker_df, Ancient_ClinVarMarker_df)
+                    return final_output_df, None
                 
                 except pd.errors.EmptyDataError:
                     st.error("Error: The input file exists but is EMPTY.")
-                    return None
+                    return None, None
                 except pd.errors.ParserError as parser_errors:
                     st.error(f"Error: ParserError occurred while reading the input file: {parser_errors}")
-                    return None
+                    return None, None
+                except ValueError as e:
+                    st.error(f"Error: {e}")
+                    return None, None
                 except Exception as e:
                     st.error(f"Error: An error occurred while reading the input files: {e}")
-                    return None
+                    return None, None
                 
-            output_df = Test_Ancient_Shared(user_clinvar_file, ancient_clinvar_file)
+            with Stage_Metrics.stage("Test_Ancient_Shared") as record:
+                output_df, shared_index = Test_Ancient_Shared(user_clinvar_file, ancient_clinvar_file)
+                record["Rows"] = None if output_df is None else len(output_df)
+            if shared_index is not None and not ancient_clinvar_file.name.endswith(".npz"):
+                st.write(f"The shared index has {len(shared_index)} (rsID, Genotype) keys of {shared_index.n_samples} ancient samples. "
+                         "Upload the index instead of Ancient_ClinVar_Markers.txt next time, it does not need to be built again.")
+                # the .npz file is only written when it is asked for, then kept in the session for the next runs of the page
+                index_key = source_hash(ancient_clinvar_file)
+                index_npz = st.session_state.get("shared_index_npz")
+                if (index_npz is None or index_npz[0] != index_key) and st.button("Prepare the shared index file (.npz) for download"):
+                    with Stage_Metrics.stage("shared_index_bytes", rows=len(shared_index)):
+                        index_npz = (index_key, shared_index_bytes(shared_index))
+                    st.session_state["shared_index_npz"] = index_npz
+                if index_npz is not None and index_npz[0] == index_key:
+                    st.download_button(
+                        label="Download Ancient Shared Index",
+                        data=index_npz[1],
+                        file_name="Ancient_ClinVar_Markers.shared.npz",
+                        mime="application/octet-stream",
+                    )
             if output_df is not None:
                 st.write(f"The output file contains {output_df.shape[0]} rows and {output_df.shape[1]} columns.")
                 output_file_name = "Test_Ancient_Shared.txt"
                 st.dataframe(output_df.head(10))
-                output_csv = output_df.to_csv(index=False, sep="\t").encode("utf-8")
+                with Stage_Metrics.stage("to_csv", rows=len(output_df)):
+                    output_csv = output_df.to_csv(index=False, sep="\t").encode("utf-8")
                 st.download_button(
                     label="Download Ancient and User Shared Markers Output File",
                     data=output_csv,
                     file_name=output_file_name,
                     mime="text/csv",
-                )
\ No newline at end of file
+                )
+
+            # several users at once: needs the shared index of Ancient_ClinVar_Markers.txt
+            if shared_index is not None and st.checkbox("Compare several users with all ancient samples (sharing matrix)", value=False):
+                users_files = st.file_uploader("Upload the Test_ClinVar_Markers.txt files of the users", type=["txt"], accept_multiple_files=True)
+                k = st.number_input("The number of the most similar samples kept", min_value=1, max_value=100, value=10)
+                if users_files:
+                    try:
+                        users = [(os.path.splitext(file.name)[0].removesuffix("_ClinVar_Markers"), pd.read_csv(file, sep="\t", header=0, usecols=["rsID", "Genotype"]))
+                                 for file in users_files]
+                        with Stage_Metrics.stage("sharing_matrix", rows=len(users)):
+                            top_ancients_df, top_users_df, _ = sharing_matrix(shared_index, users, k=int(k))
+                    except (ValueError, KeyError) as e:
+                        st.error(f"Error: An error occurred while reading the users files: {e}")
+                        st.stop()
+                    st.write(f"{len(users)} users x {shared_index.n_samples} ancient samples, the score weights the shared markers by ClinicalSignificance.")
+                    st.markdown("**The most similar ancient samples of every user**")
+                    st.dataframe(top_ancients_df)
+                    st.download_button(
+                        label="Download Sharing_Top_Ancients.txt",
+                        data=top_ancients_df.to_csv(index=False, sep="\t").encode("utf-8"),
+                        file_name="Sharing_Top_Ancients.txt",
+                        mime="text/csv",
+                    )
+                    st.markdown("**The most similar users of every ancient sample**")
+                    st.dataframe(top_users_df)
+                    st.download_button(
+                        label="Download Sharing_Top_Users.txt",
+                        data=top_users_df.to_csv(index=False, sep="\t").encode("utf-8"),
+                        file_name="Sharing_Top_Users.txt",
+                        mime="text/csv",
+                    )
+            if metrics.records:
+                with st.expander("Performance"):
+                    st.dataframe(metrics.table(), hide_index=True)
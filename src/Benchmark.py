@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: Benchmark.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This script times and memory-profiles every stage of the workflow on the synthetic files of Synthetic_Data.py, at several scales,
+    and appends the results to a table, so the speed and the memory of a change can be compared with the commit before it.
+    The stages are the functions behind the pages:
+        - filter_clinvar: parse and filter variant_summary.txt.gz with an empty cache (page "Filter ClinVar Dataset")
+        - filter_clinvar_cached: filter the cached table of the same release
+        - rsID_Extract: the common rsIDs of the .map file and ClinVar_to_SNP.txt (rsID_Parser.py)
+        - ped_map: the .ped/.map files to the long table (page "Convert .ped and .map File to Extract rsID")
+        - bed_to_rsID: the binary PLINK files to the long table (PLINK_Reader.py)
+        - ancient_markers: the mutation status of every ancient genotype (page "Identify Ancients ClinVar Markers")
+        - user_markers: a raw 23andMe file of 600,000 SNPs (page "Identify User ClinVar Markers")
+        - shared_markers: the merge and groupby of the page "Find Shared ClinVar Markers", the two marker tables are read in full like the page
+        - shared_index: the same with the index of Shared_Index.py, built from Ancient_ClinVar_Markers.txt and queried
+    The synthetic files of a scale and a seed are written once to the data directory and used again by the next runs.
+    Every stage runs in a new process: the input files are read first (not timed), then the stage is timed; the shared stages read their files in the timed part, like the page.
+    The peak resident memory of the process is reset after reading the inputs and read after the stage (and the peak of its worker processes),
+    the memory used by the stage is this peak minus the memory after reading the inputs.
+    The results are appended to Benchmark_Results.txt with the commit of the working tree; the compare command shows the change of every stage between two commits.
+
+Imported modules:
+    - pandas: used for data manipulation and analysis.
+    - argparse, os, sys, subprocess, time: to parse command-line arguments, to find the commit and to time the stages
+    - concurrent.futures, multiprocessing: to run every stage in a new process
+    - resource: the peak resident memory of the worker processes, not available on Windows
+    - Synthetic_Data: the synthetic input files
+    - ClinVar_Cache, ClinVar_Reader, ClinVar_Store, rsID_Parser, PLINK_Reader, Marker_Caller, Pipeline_Steps, Shared_Index: the stages
+    - Stage_Metrics: the memory of the process from /proc/self/status
+
+Procedures:
+    1. write the synthetic files of every scale if they are not in the data directory yet, with ClinVar_to_SNP.txt, the ancient table and the marker tables
+       that the later stages read.
+    2. run every stage of every scale in a new process, read its inputs, time it and read the peak memory.
+    3. append one row per stage and repeat to the results table.
+    4. compare: the best time and memory of every stage of two commits, the stages slower than the threshold are flagged.
+
+Outputfile:
+    default = Benchmark_Results.txt, one row per stage, scale and repeat, tab-delimited
+    default = Benchmark_Data, the synthetic files of every scale and seed
+Usage:
+        python Benchmark.py run [--scales small medium large] [--stages STAGE ...] [--repeat N] [--seed SEED] [--jobs JOBS]
+        python Benchmark.py compare BASE_COMMIT [NEW_COMMIT] [--threshold 0.1]
+    ---------- Examples:
+        python Benchmark.py run --scales small medium --repeat 3
+        python Benchmark.py run --scales large --stages filter_clinvar ancient_markers
+        python Benchmark.py compare <old-commit> <new-commit>
+
+"""
+import argparse
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+# make sure the module is installed
+try:
+    import pandas as pd
+    from concurrent.futures import ProcessPoolExecutor
+    import ClinVar_Cache
+    import Synthetic_Data
+    from ClinVar_Reader import iter_variant_summary, load_variant_summary, write_filtered_clinvar
+    from ClinVar_Store import open_store
+    from Marker_Caller import shared_markers
+    from PLINK_Reader import bed_to_rsID, read_map, write_ped_table
+    from Pipeline_Steps import DEFAULT_ASSEMBLY, DEFAULT_CLIN_SIGNIFICANCE, DEFAULT_REVIEW_STATUS, ancient_markers, filter_clinvar, user_markers
+    from Shared_Index import load_shared_index
+    from Stage_Metrics import memory_mb
+    from rsID_Parser import rsID_Extract
+except ImportError as e:
+    sys.exit(f"ERROR: Python module not installed. {e}")
+# the peak memory is not measured without the module resource (Windows)
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# the size of the synthetic files of every scale, the user file always has the size of a genotyping chip
+SCALES = {
+    "small": {"variants": 100000, "samples": 50, "snps": 20000, "user_snps": 600000},
+    "medium": {"variants": 1000000, "samples": 200, "snps": 100000, "user_snps": 600000},
+    "large": {"variants": 3000000, "samples": 1000, "snps": 200000, "user_snps": 600000},
+}
+# bump the version when Synthetic_Data.py writes different files, the data directory of the old version is not used again
+SYNTHETIC_VERSION = 1
+RESULT_COLUMNS = ["Date", "Commit", "Scale", "Seed", "Stage", "Repeat", "Rows", "Seconds", "Rows_per_Second", "Peak_RSS_MB", "Stage_RSS_MB"]
+READY_FILE = "ready"
+
+
+def data_files(data_dir):
+    """
+    Function:
+        the paths of the synthetic files and of the files made from them in the data directory of a scale
+    Input:
+        data_dir: the data directory of a scale and a seed
+    Output:
+        dictionary name -> path
+    """
+    names = {"variant_summary": "variant_summary.txt.gz", "clinvar": "ClinVar_to_SNP.txt", "panel": "panel", "ped": "panel.ped", "map": "panel.map",
+             "ancient": "Ancient_samples_filtered_rsID.txt", "user": "user_23andMe.txt",
+             "ancient_markers": "Ancient_ClinVar_Markers.txt", "user_markers": "user_ClinVar_Markers.txt", "cache": "cache"}
+    return {name: os.path.join(data_dir, path) for name, path in names.items()}
+
+
+def prepare_data(scale, seed, datadir, jobs=None):
+    """
+    Function:
+        write the synthetic files of a scale, and the files the later stages read, if they are not written yet
+    Input:
+        scale: the name of the scale in SCALES
+        seed: the seed of the random generators
+        datadir: the data directory of all scales
+        jobs: the number of worker processes for the ancient markers
+    Output:
+        dictionary name -> path, see data_files
+    """
+    data_dir = os.path.join(datadir, f"{scale}_seed{seed}_v{SYNTHETIC_VERSION}")
+    files = data_files(data_dir)
+    if os.path.isfile(os.path.join(data_dir, READY_FILE)):
+        return files
+    size = SCALES[scale]
+    os.makedirs(data_dir, exist_ok=True)
+    ClinVar_Cache.CACHE_DIR = files["cache"]
+    print(f"Writing the synthetic files of the scale {scale} to {data_dir}")
+    Synthetic_Data.write_variant_summary(files["variant_summary"], size["variants"], seed)
+    # the cached table is used by filter_clinvar_cached, ClinVar_to_SNP.txt by all later stages
+    if ClinVar_Cache.HAS_ARROW:
+        load_variant_summary(files["variant_summary"])
+    write_filtered_clinvar(iter_variant_summary(files["variant_summary"]), files["clinvar"], DEFAULT_ASSEMBLY,
+                           DEFAULT_CLIN_SIGNIFICANCE, DEFAULT_REVIEW_STATUS, True)
+    open_store(files["clinvar"])
+    # the same panel as .ped/.map and as .bed/.bim/.fam
+    for file_format in ("ped", "bed"):
+        Synthetic_Data.write_panel(files["clinvar"], files["panel"], size["samples"], size["snps"], file_format, seed)
+    Synthetic_Data.write_user(files["clinvar"], files["user"], size["user_snps"], "23andme", seed)
+    if os.path.isfile(files["ancient"]):
+        os.remove(files["ancient"])
+    bed_to_rsID(files["panel"], files["clinvar"], files["ancient"])
+    ancient_markers(files["ancient"], files["clinvar"], jobs=jobs).to_csv(files["ancient_markers"], sep="\t", index=False)
+    user_markers(files["user"], files["clinvar"]).to_csv(files["user_markers"], sep="\t", index=False)
+    open(os.path.join(data_dir, READY_FILE), "w").close()
+    return files
+
+
+# every stage is (setup, run): setup reads the inputs and is not timed, run gets what setup returns and a working directory
+# and returns the number of input rows of the stage, for the rows per second
+def _setup_files(files, size, jobs):
+    return files, size, jobs
+
+
+def _filter_clinvar(args, workdir):
+    files, size, _ = args
+    # an empty cache, so the release is parsed again
+    ClinVar_Cache.CACHE_DIR = os.path.join(workdir, "cache")
+    filter_clinvar(files["variant_summary"], os.path.join(workdir, "ClinVar_to_SNP.txt"))
+    return 2 * size["variants"]
+
+
+def _filter_clinvar_cached(args, workdir):
+    files, size, _ = args
+    filter_clinvar(files["variant_summary"], os.path.join(workdir, "ClinVar_to_SNP.txt"))
+    return 2 * size["variants"]
+
+
+def _rsid_extract(args, workdir):
+    files, size, _ = args
+    rsID_Extract(files["map"], files["clinvar"], os.path.join(workdir, "rsID.txt"), os.path.join(workdir, "rsID_Annotation.txt"))
+    return size["snps"]
+
+
+def _setup_ped_map(files, size, jobs):
+    return read_map(files["map"]), files, size, jobs
+
+
+def _ped_map(args, workdir):
+    map_df, files, size, jobs = args
+    write_ped_table(map_df, files["ped"], os.path.join(workdir, "Ancient_samples_filtered_rsID.txt"), jobs=jobs)
+    return size["samples"] * size["snps"]
+
+
+def _bed_to_rsid(args, workdir):
+    files, size, _ = args
+    bed_to_rsID(files["panel"], files["clinvar"], os.path.join(workdir, "Ancient_samples_filtered_rsID.txt"))
+    return size["samples"] * size["snps"]
+
+
+def _setup_ancient(files, size, jobs):
+    # the number of rows of the ancient table, without the header
+    with open(files["ancient"], "rb") as f:
+        rows = sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b"")) - 1
+    return files, rows, jobs
+
+
+def _ancient_markers(args, workdir):
+    files, rows, jobs = args
+    ancient_markers(files["ancient"], files["clinvar"], jobs=jobs)
+    return rows
+
+
+def _user_markers(args, workdir):
+    files, size, _ = args
+    user_markers(files["user"], files["clinvar"])
+    return size["user_snps"]
+
+
+def _read_user_markers(files):
+    # the user markers are read like the page, the rsIDs are compared as text
+    user_df = pd.read_csv(files["user_markers"], sep="\t", header=0)
+    user_df["rsID"] = user_df["rsID"].astype(str)
+    return user_df
+
+
+def _shared_markers(args, workdir):
+    files, _, _ = args
+    # the page reads the two marker tables in full and merges them, the reading is timed too
+    user_df = _read_user_markers(files)
+    ancient_df = pd.read_csv(files["ancient_markers"], sep="\t", header=0)
+    ancient_df["rsID"] = ancient_df["rsID"].astype(str)
+    shared_markers(user_df, ancient_df)
+    return len(ancient_df)
+
+
+def _shared_index(args, workdir):
+    files, _, _ = args
+    # the page builds the index from Ancient_ClinVar_Markers.txt, then finds the shared markers of the user
+    user_df = _read_user_markers(files)
+    index = load_shared_index(files["ancient_markers"])
+    index.shared(user_df)
+    return index.n_rows
+
+
+STAGES = {
+    "filter_clinvar": (_setup_files, _filter_clinvar),
+    "filter_clinvar_cached": (_setup_files, _filter_clinvar_cached),
+    "rsID_Extract": (_setup_files, _rsid_extract),
+    "ped_map": (_setup_ped_map, _ped_map),
+    "bed_to_rsID": (_setup_files, _bed_to_rsid),
+    "ancient_markers": (_setup_ancient, _ancient_markers),
+    "user_markers": (_setup_files, _user_markers),
+    "shared_markers": (_setup_files, _shared_markers),
+    "shared_index": (_setup_files, _shared_index),
+}
+
+
+def reset_peak():
+    """
+    Function:
+        reset the peak resident memory (VmHWM) of this process to its current memory, Linux only.
+        The reset is for the whole process, it is only used here because every stage of the benchmark runs alone in its own process
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss_mb():
+    """
+    Function:
+        the peak resident memory of this process and of its largest finished worker process
+    Output:
+        megabytes, None if the memory cannot be read
+    """
+    peak = memory_mb("VmHWM")
+    if resource is None:
+        return peak
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 1024 ** 2
+    if peak is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 1024 ** 2
+    return max(peak, children)
+
+
+def measure_stage(stage, files, size, jobs):
+    """
+    Function:
+        run one stage in this (new) process: read the inputs, time the stage and read the peak memory
+    Input:
+        stage: the name of the stage in STAGES
+        files: dictionary name -> path, see data_files
+        size: the size of the scale, see SCALES
+        jobs: the number of worker processes of the stages that use a pool
+    Output:
+        dictionary with Rows, Seconds, Peak_RSS_MB and Stage_RSS_MB
+    """
+    ClinVar_Cache.CACHE_DIR = files["cache"]
+    setup, run = STAGES[stage]
+    args = setup(files, size, jobs)
+    # the memory of the stage is counted from the memory after reading the inputs
+    reset_peak()
+    before = memory_mb("VmRSS") or peak_rss_mb()
+    with tempfile.TemporaryDirectory(prefix="Benchmark_") as workdir:
+        start = time.perf_counter()
+        rows = run(args, workdir)
+        seconds = time.perf_counter() - start
+    peak = peak_rss_mb()
+    if peak is None:
+        return {"Rows": rows, "Seconds": round(seconds, 4), "Peak_RSS_MB": None, "Stage_RSS_MB": None}
+    return {"Rows": rows, "Seconds": round(seconds, 4), "Peak_RSS_MB": round(peak, 1), "Stage_RSS_MB": round(max(peak - before, 0), 1)}
+
+
+def current_commit():
+    """
+    Function:
+        the commit of the working tree of this script, with "-dirty" if the tracked files are changed
+    Output:
+        the short commit hash, "unknown" outside of a git repository
+    """
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty", "--abbrev=7"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_benchmark(scales, stages, seed, repeat, datadir, results_file, jobs=None):
+    """
+    Function:
+        run the stages at every scale and append the results to the results table
+    Input:
+        scales: the names of the scales
+        stages: the names of the stages
+        seed: the seed of the synthetic files
+        repeat: the number of runs of every stage
+        datadir: the data directory of the synthetic files
+        results_file: the results table, created if it does not exist
+        jobs: the number of worker processes of the stages that use a pool
+    Output:
+        DataFrame of the new rows of the results table
+    """
+    commit = current_commit()
+    jobs = jobs or os.cpu_count() or 1
+    rows = []
+    for scale in scales:
+        files = prepare_data(scale, seed, datadir, jobs)
+        for stage in stages:
+            for run in range(1, repeat + 1):
+                # a new process for every run, so the peak memory and the caches of one stage do not affect the next one
+                with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    result = pool.submit(measure_stage, stage, files, SCALES[scale], jobs).result()
+                result["Rows_per_Second"] = round(result["Rows"] / max(result["Seconds"], 1e-9))
+                rows.append({"Date": time.strftime("%Y-%m-%d %H:%M:%S"), "Commit": commit, "Scale": scale, "Seed": seed,
+                             "Stage": stage, "Repeat": run, **result})
+                print(f"{scale:>6} {stage:<22} run {run}: {result['Seconds']:>9.3f} s {result['Rows_per_Second']:>12} rows/s "
+                      f"peak {result['Peak_RSS_MB']} MB (stage {result['Stage_RSS_MB']} MB)")
+    results_df = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    results_df.to_csv(results_file, sep="\t", index=False, mode="a", header=not os.path.isfile(results_file))
+    return results_df
+
+
+def compare_results(results_file, base, new=None, threshold=0.1):
+    """
+    Function:
+        compare the best time and the peak memory of every stage and scale between two commits
+    Input:
+        results_file: the results table
+        base: the commit to compare with
+        new: the new commit, default is the commit of the last row of the table
+        threshold: a stage is flagged as slower if its time grew by more than this share
+    Raise error:
+        check if both commits have results
+    Output:
+        DataFrame with one row per scale and stage
+    """
+    results_df = pd.read_csv(results_file, sep="\t", header=0, dtype={"Commit": str})
+    new = new or results_df["Commit"].iloc[-1]
+    for commit in (base, new):
+        if not (results_df["Commit"] == commit).any():
+            raise ValueError(f"No results of the commit {commit} in {results_file}")
+    # the best run of every stage, the other runs are slower because of the machine and not because of the code
+    best = results_df.groupby(["Commit", "Scale", "Stage"], sort=False).agg(Seconds=("Seconds", "min"), Peak_RSS_MB=("Peak_RSS_MB", "min"))
+    compare_df = best.loc[base].join(best.loc[new], lsuffix="_Base", rsuffix="_New", how="inner").reset_index()
+    compare_df["Time_Ratio"] = (compare_df["Seconds_New"] / compare_df["Seconds_Base"]).round(3)
+    compare_df["Memory_Ratio"] = (compare_df["Peak_RSS_MB_New"] / compare_df["Peak_RSS_MB_Base"]).round(3)
+    compare_df["Status"] = "same"
+    compare_df.loc[compare_df["Time_Ratio"] > 1 + threshold, "Status"] = "slower"
+    compare_df.loc[compare_df["Time_Ratio"] < 1 - threshold, "Status"] = "faster"
+    return compare_df
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Benchmark.py', description="time and memory-profile the stages of the workflow on synthetic files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the benchmark and append the results")
+    run_parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small"], help="the scales of the synthetic files")
+    run_parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES), help="the stages to run, default is all stages")
+    run_parser.add_argument("--repeat", type=int, default=1, help="the number of runs of every stage")
+    run_parser.add_argument("--seed", type=int, default=0, help="the seed of the synthetic files")
+    run_parser.add_argument("--datadir", type=str, default="Benchmark_Data", help="the directory of the synthetic files")
+    run_parser.add_argument("--jobs", type=int, default=None, help="the number of worker processes of the stages that use a pool, default is the number of CPUs")
+    compare_parser = subparsers.add_parser("compare", help="compare the results of two commits")
+    compare_parser.add_argument("base", type=str, help="the commit to compare with")
+    compare_parser.add_argument("new", type=str, nargs='?', default=None, help="default is the commit of the last results")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="flag the stages whose time changed by more than this share")
+    for subparser in (run_parser, compare_parser):
+        subparser.add_argument("--results", type=str, default="Benchmark_Results.txt", help="the results table, tab-delimited")
+    args = parser.parse_args()
+    if args.command == "run":
+        run_benchmark(args.scales, args.stages, args.seed, args.repeat, args.datadir, args.results, args.jobs)
+        print(f"The results are appended to {args.results}")
+        return
+    if not os.path.isfile(args.results):
+        sys.exit(f"Error: The input file {args.results} is NOT FOUND !")
+    try:
+        compare_df = compare_results(args.results, args.base, args.new, args.threshold)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    print(compare_df.to_string(index=False))
+    if (compare_df["Status"] == "slower").any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: Carrier_Matrix.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module saves the output of the page "Identify Ancients ClinVar Markers" (Ancient_ClinVar_Markers.txt) as a sparse samples x ClinVar variants matrix,
+    so questions like "how many pathogenic variants does every individual carry", "which samples carry rs5082" or "how many carriers per gene"
+    are answered from a few arrays instead of scanning the whole table again.
+    A ClinVar variant is one ClinVar row (AlleleID), the value of the matrix is the dosage (Mutation_Status 1 or 2), the non-carriers are not saved.
+    The matrix is saved twice, by sample (CSR: the variants of every sample are next to each other) and by variant (CSC: the samples of every variant),
+    so both the row aggregates and the column aggregates are a single pass over the carriers.
+    The variant table keeps AlleleID, rsID, GeneID, ClinicalSignificance and ReviewStatus, the text columns as integer codes of their categories,
+    so the aggregates can be filtered by ClinicalSignificance or ReviewStatus with a boolean mask of the variants.
+    Everything is saved in one .npz file next to the table, for example Ancient_ClinVar_Markers.carriers.npz.
+
+Imported modules:
+    - numpy: to build, save and query the sparse matrix
+    - pandas: used for data manipulation and analysis.
+    - argparse, os, sys: to parse command-line arguments and to check the files
+
+Procedures:
+    1. number the samples (Master_ID) and the ClinVar variants (AlleleID) of the marker table.
+    2. sort the carriers by sample (CSR) and by variant (CSC), save the arrays, the sample names and the variant table.
+    3. select the variants by ClinicalSignificance, ReviewStatus or gene and aggregate the carriers per sample, per variant or per gene.
+
+Usage:
+        python Carrier_Matrix.py build Ancient_ClinVar_Markers.txt [output_file]
+        python Carrier_Matrix.py query carrier_matrix.npz {sample,variant,gene} [--significance ...] [--review ...] [--rsid RSID] [--sample MASTER_ID]
+    ---------- Examples:
+        python Carrier_Matrix.py build Ancient_ClinVar_Markers.txt Ancient_ClinVar_Markers.carriers.npz
+        python Carrier_Matrix.py query Ancient_ClinVar_Markers.carriers.npz sample --significance Pathogenic
+        python Carrier_Matrix.py query Ancient_ClinVar_Markers.carriers.npz variant --rsid rs5082
+
+"""
+import argparse
+import io
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# bump the version when the layout of the file changes
+CARRIER_MATRIX_VERSION = 1
+# the columns of the variant table, the text columns are saved as codes of their categories
+VARIANT_COLUMNS = ["AlleleID", "rsID", "GeneID", "ClinicalSignificance", "ReviewStatus"]
+CODED_COLUMNS = ["ClinicalSignificance", "ReviewStatus"]
+# the columns of the marker table that are needed
+MARKER_COLUMNS = ["Master_ID"] + VARIANT_COLUMNS + ["Mutation_Status"]
+
+
+class CarrierMatrix:
+    """
+    The sparse samples x ClinVar variants dosage matrix, by sample (CSR) and by variant (CSC), with the sample names and the variant table.
+    """
+
+    def __init__(self, samples, variants, categories, csr, csc):
+        self.samples = samples
+        self.variants = variants
+        self.categories = categories
+        # (indptr, indices, data) of the two layouts
+        self.row_ptr, self.row_variants, self.row_dosage = csr
+        self.col_ptr, self.col_samples, self.col_dosage = csc
+        # the sample of every carrier in the CSR layout and the variant of every carrier in the CSC layout
+        self.row_samples = np.repeat(np.arange(len(samples), dtype=np.int32), np.diff(self.row_ptr))
+        self.col_variants = np.repeat(np.arange(len(variants), dtype=np.int32), np.diff(self.col_ptr))
+
+    @property
+    def shape(self):
+        return len(self.samples), len(self.variants)
+
+    def __len__(self):
+        return len(self.row_dosage)
+
+    def variant_mask(self, clinical_significance=None, review_status=None, genes=None):
+        """
+        Function:
+            select the ClinVar variants
+        Input:
+            clinical_significance: list of ClinicalSignificance values to keep, default is all
+            review_status: list of ReviewStatus values to keep, default is all
+            genes: list of GeneID to keep, default is all
+        Output:
+            numpy boolean array, one value per variant
+        """
+        mask = np.ones(len(self.variants), dtype=bool)
+        for col, selected in (("ClinicalSignificance", clinical_significance), ("ReviewStatus", review_status)):
+            if selected:
+                # compare the codes: the categories are looked up once, not the values of every variant
+                # the last value is for the missing values (code -1), so an empty list of categories can be indexed too
+                keep = np.append(np.isin(np.array(self.categories[col], dtype=object), list(selected)), False)
+                mask &= keep[self.variants[col].to_numpy()]
+        if genes:
+            mask &= np.isin(self.variants["GeneID"].to_numpy(), np.asarray(genes, dtype=np.int64))
+        return mask
+
+    def variant_table(self):
+        """
+        Function:
+            the variant table with the text columns decoded
+        Output:
+            DataFrame with VARIANT_COLUMNS
+        """
+        variants_df = self.variants.copy()
+        for col in CODED_COLUMNS:
+            variants_df[col] = pd.Categorical.from_codes(variants_df[col].to_numpy(), categories=self.categories[col])
+        return variants_df
+
+    def per_sample(self, mask=None):
+        """
+        Function:
+            the number of carried variants and alternate alleles of every sample, a row aggregate of the CSR layout
+        Input:
+            mask: the selected variants from variant_mask, default is all variants
+        Output:
+            DataFrame with the columns Master_ID, Carried_Variants, Homozygous_Variants, Alternate_Alleles, sorted by Carried_Variants
+        """
+        selected = np.ones(len(self), dtype=bool) if mask is None else mask[self.row_variants]
+        samples = self.row_samples[selected]
+        dosage = self.row_dosage[selected]
+        n = len(self.samples)
+        result_df = pd.DataFrame({
+            "Master_ID": self.samples,
+            "Carried_Variants": np.bincount(samples, minlength=n),
+            "Homozygous_Variants": np.bincount(samples[dosage == 2], minlength=n),
+            "Alternate_Alleles": np.bincount(samples, weights=dosage, minlength=n).astype(np.int64),
+        })
+        return result_df[result_df["Carried_Variants"] > 0].sort_values("Carried_Variants", ascending=False, kind="stable").reset_index(drop=True)
+
+    def per_variant(self, mask=None):
+        """
+        Function:
+            the number of carriers of every variant, a column aggregate of the CSC layout
+        Input:
+            mask: the selected variants from variant_mask, default is all variants
+        Output:
+            DataFrame with the variant table and the columns Carriers, Homozygous_Carriers, Carrier_Frequency (of the samples in the matrix)
+        """
+        n = len(self.variants)
+        variants_df = self.variant_table()
+        variants_df["Carriers"] = np.diff(self.col_ptr)
+        variants_df["Homozygous_Carriers"] = np.bincount(self.col_variants[self.col_dosage == 2], minlength=n)
+        variants_df["Carrier_Frequency"] = variants_df["Carriers"] / max(len(self.samples), 1)
+        if mask is not None:
+            variants_df = variants_df[mask]
+        return variants_df.sort_values("Carriers", ascending=False, kind="stable").reset_index(drop=True)
+
+    def per_gene(self, mask=None):
+        """
+        Function:
+            the number of variants and of different carriers of every gene, a sample that carries two variants of a gene is counted once
+        Input:
+            mask: the selected variants from variant_mask, default is all variants
+        Output:
+            DataFrame with the columns GeneID, Variants, Carriers, sorted by Carriers
+        """
+        selected = np.ones(len(self), dtype=bool) if mask is None else mask[self.col_variants]
+        gene_codes, genes = pd.factorize(self.variants["GeneID"])
+        carrier_genes = gene_codes[self.col_variants[selected]].astype(np.int64)
+        # the different (gene, sample) pairs
+        pairs = np.unique(carrier_genes * len(self.samples) + self.col_samples[selected])
+        variant_genes = gene_codes if mask is None else gene_codes[mask]
+        genes_df = pd.DataFrame({
+            "GeneID": genes,
+            "Variants": np.bincount(variant_genes, minlength=len(genes)),
+            "Carriers": np.bincount(pairs // max(len(self.samples), 1), minlength=len(genes)),
+        })
+        return genes_df[genes_df["Variants"] > 0].sort_values("Carriers", ascending=False, kind="stable").reset_index(drop=True)
+
+    def carriers_of(self, rsid=None, allele_id=None):
+        """
+        Function:
+            the samples that carry a variant, a column slice of the CSC layout
+        Input:
+            rsid: integer rsID, all variants of the rsID
+            allele_id: integer AlleleID
+        Output:
+            DataFrame with the columns Master_ID, AlleleID, rsID, Mutation_Status
+        """
+        column = "rsID" if rsid is not None else "AlleleID"
+        variants = np.flatnonzero(self.variants[column].to_numpy() == (rsid if rsid is not None else allele_id))
+        parts = [np.arange(self.col_ptr[v], self.col_ptr[v + 1]) for v in variants]
+        entries = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        return pd.DataFrame({
+            "Master_ID": self.samples[self.col_samples[entries]],
+            "AlleleID": self.variants["AlleleID"].to_numpy()[self.col_variants[entries]],
+            "rsID": self.variants["rsID"].to_numpy()[self.col_variants[entries]],
+            "Mutation_Status": self.col_dosage[entries],
+        })
+
+    def variants_of(self, master_id):
+        """
+        Function:
+            the variants carried by one sample, a row slice of the CSR layout
+        Input:
+            master_id: the Master_ID of the sample
+        Output:
+            DataFrame with the variant table and Mutation_Status
+        """
+        sample = np.flatnonzero(self.samples == master_id)
+        if not len(sample):
+            return self.variant_table().iloc[0:0].assign(Mutation_Status=np.zeros(0, dtype=np.int8))
+        start, end = self.row_ptr[sample[0]], self.row_ptr[sample[0] + 1]
+        variants_df = self.variant_table().iloc[self.row_variants[start:end]].reset_index(drop=True)
+        variants_df["Mutation_Status"] = self.row_dosage[start:end]
+        return variants_df
+
+
+def _sparse(major, minor, dosage, n_major):
+    # sort the carriers by the major index, the minor index is kept in its order inside a major index
+    order = np.lexsort((minor, major))
+    indptr = np.zeros(n_major + 1, dtype=np.int64)
+    np.cumsum(np.bincount(major, minlength=n_major), out=indptr[1:])
+    return indptr, minor[order].astype(np.int32), dosage[order].astype(np.int8)
+
+
+def build_carrier_matrix(markers_df):
+    """
+    Function:
+        build the sparse carrier matrix from the marker table of the page "Identify Ancients ClinVar Markers"
+    Input:
+        markers_df: DataFrame of Ancient_ClinVar_Markers.txt
+    Raise error:
+        check if the columns of the marker table are present
+    Output:
+        CarrierMatrix
+    """
+    missing_columns = [col for col in MARKER_COLUMNS if col not in markers_df.columns]
+    if missing_columns:
+        raise ValueError(f"The marker table is missing the following required columns: {', '.join(missing_columns)}")
+    sample_codes, samples = pd.factorize(markers_df["Master_ID"].astype(str))
+    # a variant is one ClinVar row, its AlleleID is unique in ClinVar_to_SNP.txt
+    variant_codes, allele_ids = pd.factorize(markers_df["AlleleID"].astype(np.int64))
+    first = pd.Series(np.arange(len(markers_df))).groupby(variant_codes).first().to_numpy()
+    variants = pd.DataFrame({"AlleleID": np.asarray(allele_ids, dtype=np.int64),
+                             "rsID": markers_df["rsID"].to_numpy()[first].astype(np.int64),
+                             "GeneID": markers_df["GeneID"].to_numpy()[first].astype(np.int64)})
+    categories = {}
+    for col in CODED_COLUMNS:
+        codes, values = pd.factorize(markers_df[col].iloc[first].astype("string"), sort=True)
+        variants[col] = codes.astype(np.int32)
+        categories[col] = [str(value) for value in values]
+    dosage = markers_df["Mutation_Status"].to_numpy(dtype=np.int8)
+    csr = _sparse(sample_codes, variant_codes, dosage, len(samples))
+    csc = _sparse(variant_codes, sample_codes, dosage, len(allele_ids))
+    return CarrierMatrix(np.asarray(samples, dtype=object), variants[VARIANT_COLUMNS], categories, csr, csc)
+
+
+def save_carrier_matrix(matrix, output_file):
+    """
+    Function:
+        save the carrier matrix to a .npz file
+    Input:
+        matrix: CarrierMatrix
+        output_file: the path of the .npz file or a binary file object
+    """
+    arrays = {
+        "version": np.array(CARRIER_MATRIX_VERSION),
+        "samples": np.asarray(matrix.samples, dtype=str),
+        "row_ptr": matrix.row_ptr, "row_variants": matrix.row_variants, "row_dosage": matrix.row_dosage,
+        "col_ptr": matrix.col_ptr, "col_samples": matrix.col_samples, "col_dosage": matrix.col_dosage,
+    }
+    for col in VARIANT_COLUMNS:
+        arrays[f"variant_{col}"] = matrix.variants[col].to_numpy()
+    for col in CODED_COLUMNS:
+        arrays[f"categories_{col}"] = np.asarray(matrix.categories[col], dtype=str)
+    np.savez_compressed(output_file, **arrays)
+
+
+def carrier_matrix_bytes(matrix):
+    """
+    Function:
+        the .npz file of the carrier matrix in memory, for the download button
+    Input:
+        matrix: CarrierMatrix
+    Output:
+        bytes
+    """
+    buffer = io.BytesIO()
+    save_carrier_matrix(matrix, buffer)
+    return buffer.getvalue()
+
+
+def open_carrier_matrix(source):
+    """
+    Function:
+        read a carrier matrix saved with save_carrier_matrix
+    Input:
+        source: the path of the .npz file or an uploaded file object
+    Raise error:
+        check the version of the file
+    Output:
+        CarrierMatrix
+    """
+    with np.load(source, allow_pickle=False) as arrays:
+        if int(arrays["version"]) != CARRIER_MATRIX_VERSION:
+            raise ValueError(f"The carrier matrix has version {int(arrays['version'])}, this version of ClinVar-SMART reads version {CARRIER_MATRIX_VERSION}.")
+        variants = pd.DataFrame({col: arrays[f"variant_{col}"] for col in VARIANT_COLUMNS})
+        categories = {col: arrays[f"categories_{col}"].tolist() for col in CODED_COLUMNS}
+        return CarrierMatrix(arrays["samples"].astype(object), variants, categories,
+                             (arrays["row_ptr"], arrays["row_variants"], arrays["row_dosage"]),
+                             (arrays["col_ptr"], arrays["col_samples"], arrays["col_dosage"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Carrier_Matrix.py', description="save Ancient_ClinVar_Markers.txt as a sparse carrier matrix and query it")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build the carrier matrix of a marker table")
+    build_parser.add_argument("markers_file", type=str, help="Path to Ancient_ClinVar_Markers.txt")
+    build_parser.add_argument("output_file", type=str, nargs='?', default=None, help="default is the marker table with the suffix .carriers.npz")
+    query_parser = subparsers.add_parser("query", help="aggregate the carriers per sample, per variant or per gene")
+    query_parser.add_argument("matrix_file", type=str, help="Path to the .carriers.npz file")
+    query_parser.add_argument("aggregate", choices=["sample", "variant", "gene"], help="the aggregate")
+    query_parser.add_argument("--significance", type=str, nargs="+", default=None, help="keep the variants with these ClinicalSignificance values")
+    query_parser.add_argument("--review", type=str, nargs="+", default=None, help="keep the variants with these ReviewStatus values")
+    query_parser.add_argument("--rsid", type=str, default=None, help="list the carriers of this rsID, for example rs5082")
+    query_parser.add_argument("--sample", type=str, default=None, help="list the variants carried by this Master_ID")
+    query_parser.add_argument("--output", type=str, default=None, help="write the result to this file instead of printing it")
+    args = parser.parse_args()
+    input_file = args.markers_file if args.command == "build" else args.matrix_file
+    if not os.path.isfile(input_file):
+        sys.exit(f"Error: The input file {input_file} is NOT FOUND !")
+    try:
+        if args.command == "build":
+            output_file = args.output_file or f"{os.path.splitext(args.markers_file)[0]}.carriers.npz"
+            matrix = build_carrier_matrix(pd.read_csv(args.markers_file, sep="\t", header=0, usecols=MARKER_COLUMNS))
+            save_carrier_matrix(matrix, output_file)
+            print(f"The carrier matrix {output_file} has {matrix.shape[0]} samples, {matrix.shape[1]} ClinVar variants and {len(matrix)} carriers.")
+            return
+        matrix = open_carrier_matrix(args.matrix_file)
+        if args.rsid:
+            result_df = matrix.carriers_of(rsid=int(args.rsid.removeprefix("rs")))
+        elif args.sample:
+            result_df = matrix.variants_of(args.sample)
+        else:
+            mask = matrix.variant_mask(args.significance, args.review)
+            result_df = {"sample": matrix.per_sample, "variant": matrix.per_variant, "gene": matrix.per_gene}[args.aggregate](mask)
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Error: {e}")
+    if args.output:
+        result_df.to_csv(args.output, sep="\t", index=False)
+    else:
+        print(result_df.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
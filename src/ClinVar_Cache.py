@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: ClinVar_Cache.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module keeps a disk-backed columnar cache (Arrow IPC / Feather v2 format) of the parsed ClinVar tables.
+    Every cached table is keyed by the SHA-256 hash of the source file, so the same ClinVar release is parsed from text only once,
+    no matter which Streamlit session or which upload it comes from. The next load is a memory-mapped open of the cached file.
+    The total size of the cache directory is capped, the least recently used tables (older releases) are evicted first.
+    pyarrow is optional, without it HAS_ARROW is False and the callers read the text files as before.
+
+Imported modules:
+    - pandas: used for data manipulation and analysis.
+    - pyarrow (optional): to write and memory-map the Arrow IPC files
+    - hashlib: to compute the hash of the source file
+    - json: to save the metadata of a cached table, for example the categories and value counts of the dictionary-encoded columns
+    - os, shutil: to check file status in directory and to remove evicted tables
+    - tempfile: a unique temporary name for every writer, the Streamlit sessions are threads of the same process
+
+Procedures:
+    1. compute the SHA-256 hash of the source file.
+    2. if a cached table with the same hash exists, memory-map it.
+    3. otherwise parse the source file chunk by chunk, write the chunks to a new cached table (and its metadata file), then evict the oldest tables above the size cap.
+
+Environment variables:
+    CLINVAR_SMART_CACHE: the cache directory, default is ~/.cache/ClinVar_SMART
+    CLINVAR_SMART_CACHE_GB: the maximum size of the cache directory in GB, default is 10
+
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import pandas as pd
+# pyarrow is optional, the cache is disabled if it is not installed
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    HAS_ARROW = True
+except ImportError:
+    pa = None
+    HAS_ARROW = False
+
+CACHE_DIR = os.environ.get("CLINVAR_SMART_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "ClinVar_SMART"))
+CACHE_MAX_BYTES = int(float(os.environ.get("CLINVAR_SMART_CACHE_GB", "10")) * 1024 ** 3)
+# bump the version when the layout of the cached tables changes, old files are then never opened again and evicted
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".arrow"
+METADATA_SUFFIX = ".json"
+# size of the blocks read when hashing the source file
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_hash(source):
+    """
+    Function:
+        compute the SHA-256 hash of the content of the source file
+    Input:
+        source: the path of the file or an uploaded file object
+    Output:
+        the hexadecimal hash string
+    """
+    sha256 = hashlib.sha256()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+                sha256.update(block)
+    else:
+        source.seek(0)
+        for block in iter(lambda: source.read(HASH_BLOCK_SIZE), b""):
+            sha256.update(block)
+        # reset the file pointer after reading
+        source.seek(0)
+    return sha256.hexdigest()
+
+
+def cache_path(kind, key, cache_dir=None):
+    """
+    Function:
+        the path of the cached table
+    Input:
+        kind: the name of the table, for example "variant_summary" or "ClinVar_to_SNP"
+        key: the hash of the source file
+        cache_dir: the cache directory, default is CACHE_DIR
+    Output:
+        the path of the cached table
+    """
+    return os.path.join(cache_dir or CACHE_DIR, f"{kind}_v{CACHE_VERSION}_{key}{CACHE_SUFFIX}")
+
+
+def metadata_path(path):
+    """
+    Function:
+        the path of the metadata file of a cached table
+    Input:
+        path: the path of the cached table
+    Output:
+        the path of the metadata file
+    """
+    return path[:-len(CACHE_SUFFIX)] + METADATA_SUFFIX
+
+
+def read_metadata(path):
+    """
+    Function:
+        read the metadata file of a cached table
+    Input:
+        path: the path of the cached table
+    Raise error:
+        check if the metadata file exists, a table cached without it is invalid and is parsed again by load_cached
+    Output:
+        dictionary
+    """
+    if not os.path.isfile(metadata_path(path)):
+        raise ValueError(f"The metadata file of the cached table {path} is missing, please load the file again to rebuild the cache.")
+    with open(metadata_path(path)) as f:
+        return json.load(f)
+
+
+def is_cached(path, metadata=True):
+    """
+    Function:
+        check if a cached table is complete: the table and, if it needs one, its metadata file
+    Input:
+        path: the path of the cached table
+        metadata: True if the table is saved with a metadata file
+    Output:
+        True or False
+    """
+    return os.path.isfile(path) and (not metadata or os.path.isfile(metadata_path(path)))
+
+
+def write_table(chunks, path, metadata=None):
+    """
+    Function:
+        write the DataFrame chunks to an Arrow IPC file, one record batch per chunk.
+        The file is written under a temporary name and renamed at the end, so a crash never leaves a half-written cached table.
+    Input:
+        chunks: DataFrames with the same columns
+        path: the path of the cached table
+        metadata: function called after the last chunk, returning a dictionary saved next to the table
+    Output:
+        the number of rows written
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # a unique temporary file, two sessions caching the same release never write to the same file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".", suffix=".tmp")
+    os.close(fd)
+    tmp_metadata = None
+    writer = None
+    schema = None
+    row_count = 0
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            for chunk in chunks:
+                # the schema of the first chunk is used for all chunks
+                batch = pa.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False)
+                if writer is None:
+                    schema = batch.schema
+                    writer = pa.ipc.new_file(sink, schema)
+                writer.write_batch(batch)
+                row_count += len(chunk)
+            if writer is None:
+                raise ValueError("The input file has no rows, nothing to cache.")
+            writer.close()
+        # the metadata file is written before the table is renamed, so a cached table always has its metadata
+        if metadata is not None:
+            tmp_metadata = f"{tmp_path}{METADATA_SUFFIX}"
+            with open(tmp_metadata, "w") as f:
+                json.dump(metadata(), f)
+            os.replace(tmp_metadata, metadata_path(path))
+        os.replace(tmp_path, path)
+    finally:
+        for tmp in (tmp_path, tmp_metadata):
+            if tmp is not None and os.path.exists(tmp):
+                os.remove(tmp)
+    return row_count
+
+
+def open_table(path):
+    """
+    Function:
+        memory-map a cached table, the data is only read from disk when it is used
+    Input:
+        path: the path of the cached table
+    Output:
+        pyarrow Table
+    """
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def table_to_pandas(table, categories=None):
+    """
+    Function:
+        convert a cached table to a DataFrame. String columns stay Arrow-backed (pd.ArrowDtype),
+        so they are not copied into millions of Python string objects.
+        Columns stored as dictionary codes are turned into pandas Categorical columns without decoding the strings.
+    Input:
+        table: pyarrow Table
+        categories: dictionary of column name -> list of categories, for the columns stored as integer codes
+    Output:
+        DataFrame
+    """
+    def types_mapper(arrow_type):
+        if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+            return pd.ArrowDtype(arrow_type)
+        return None
+    df = table.to_pandas(types_mapper=types_mapper)
+    for col, values in (categories or {}).items():
+        df[col] = pd.Categorical.from_codes(df[col].to_numpy(), categories=values)
+    return df
+
+
+def iter_table_chunks(table, categories=None):
+    """
+    Function:
+        convert a cached table to DataFrames one record batch at a time, so the peak memory depends on the batch size
+    Input:
+        table: pyarrow Table
+        categories: dictionary of column name -> list of categories, for the columns stored as integer codes
+    Output:
+        generator of DataFrames
+    """
+    for batch in table.to_batches():
+        yield table_to_pandas(pa.Table.from_batches([batch]), categories)
+
+
+def evict(max_bytes=None, cache_dir=None, keep=()):
+    """
+    Function:
+        delete the least recently used cached tables until the cache directory is smaller than max_bytes.
+        The indexed stores of ClinVar_Store are directories in the cache directory, they are evicted in the same way.
+    Input:
+        max_bytes: the maximum size of the cache directory, default is CACHE_MAX_BYTES
+        cache_dir: the cache directory, default is CACHE_DIR
+        keep: paths that are never deleted, for example the table that was just written
+    Output:
+        the list of deleted paths
+    """
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(cache_dir):
+        return []
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.endswith(CACHE_SUFFIX) and os.path.isfile(path):
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+        elif os.path.isdir(path) and not name.endswith(".tmp"):
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.stat(path).st_mtime, size, path))
+    total = sum(size for _, size, _ in entries)
+    deleted = []
+    # the oldest tables are evicted first
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path in keep:
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+            if os.path.isfile(metadata_path(path)):
+                os.remove(metadata_path(path))
+        total -= size
+        deleted.append(path)
+    return deleted
+
+
+def load_cached(source, kind, parse, cache_dir=None, key=None, metadata=None):
+    """
+    Function:
+        return the cached table of the source file, parse and cache it first if it is not in the cache yet
+    Input:
+        source: the path of the file or an uploaded file object
+        kind: the name of the table, for example "variant_summary"
+        parse: function taking the source and returning DataFrame chunks
+        cache_dir: the cache directory, default is CACHE_DIR
+        key: the hash of the source file if it is already known
+        metadata: function called after parsing, returning a dictionary saved next to the table, see read_metadata
+    Output:
+        pyarrow Table (memory-mapped) and the path of the cached table
+    """
+    key = key or file_hash(source)
+    path = cache_path(kind, key, cache_dir)
+    if is_cached(path, metadata is not None):
+        # mark the table as recently used for the eviction
+        os.utime(path)
+    else:
+        # a table without its metadata file (removed or from an interrupted copy) is parsed again
+        write_table(parse(source), path, metadata)
+        evict(cache_dir=cache_dir, keep=(path,))
+    return open_table(path), path
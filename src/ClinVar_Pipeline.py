@@ -0,0 +1,480 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: ClinVar_Pipeline.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This script runs the whole workflow of the pages without the app, as a graph of stages:
+
+        variant_summary.txt.gz -> clinvar (ClinVar_to_SNP.txt) -> ancient_genotypes (Ancient_samples_filtered_rsID.txt) -> ancient_markers (Ancient_ClinVar_Markers.txt) -> shared_index -+
+                                                          \\-> user_markers ({name}_ClinVar_Markers.txt), one stage per user -----------------------------------------------------+-> shared ({name}_Ancient_Shared.txt)
+
+    Every stage is a function of Pipeline_Steps (or Shared_Index) run in a pool of processes, a stage starts as soon as the stages it reads are done,
+    so the ancient branch and the user branch run at the same time. A stage runs in one worker process and does not start a pool of its own,
+    so the pipeline uses at most --jobs processes.
+    The output of a stage is keyed by a hash of everything it depends on: the name and the version of the stage, its parameters,
+    the content hash of its input files and the keys of the stages it reads. The output is kept under its key in the directory .pipeline of the output directory.
+    When the same command is run again, a stage whose key already has an output is not run again ("cached"),
+    so only the stages after a changed input file or parameter are run, for example a new user only runs its two stages.
+    The content hash of an input file is kept with its size and modification time, so an unchanged input file is not read again to compute the hash.
+    The output of every stage is linked into the output directory under the name the page would download,
+    and a summary of the run (status, key and time of every stage) is written to Pipeline_Summary.txt.
+
+Imported modules:
+    - pandas: used for data manipulation and analysis.
+    - argparse: to parse command-line arguments and options
+    - contextlib, io: to print the messages of a stage with the path of its output in the output directory
+    - concurrent.futures: to run the stages with a pool of processes
+    - hashlib, json: to compute the key of a stage and to keep the hashes of the input files
+    - os, shutil, time: to check file status in directory, to link the outputs and to time the stages
+    - sys: to control over the Python runtime environment
+    - ClinVar_Cache: the content hash of an input file
+    - ClinVar_Store: the store of ClinVar_to_SNP.txt is built once before the branches start
+    - Pipeline_Steps: the logic of the pages
+    - Shared_Index: the index of the ancient markers and the markers shared with every user
+    - User_Batch: the names of the users
+
+Procedures:
+    1. perform error checks before continuing next steps, list the stages of the given inputs.
+    2. compute the key of every stage when the stages it reads are done, and skip the stages whose output already exists.
+    3. run the other stages in the process pool, the output is written to a temporary directory and renamed when the stage is done.
+    4. link the outputs into the output directory and write the summary of the run.
+
+Inputfile:
+    variant_summary.txt(.gz) or ClinVar_to_SNP.txt
+    optional: the ancient genotypes, the binary PLINK files (--bfile, --keep), the .ped and .map files (--ped, --map)
+              or Ancient_samples_filtered_rsID.txt, its genotype matrix or a VCF file (--ancient)
+    optional: user files or directories of user files (--users)
+Outputfile:
+    in the output directory:
+        ClinVar_to_SNP.txt, Ancient_samples_filtered_rsID.txt, Ancient_ClinVar_Markers.txt, Ancient_ClinVar_Markers.shared.npz,
+        {name}_ClinVar_Markers.txt and {name}_Ancient_Shared.txt for every user
+        Pipeline_Summary.txt: one row per stage
+        .pipeline: the outputs of the stages under their keys
+Usage:
+        python ClinVar_Pipeline.py (--variant-summary FILE | --clinvar FILE) [--bfile PREFIX [--keep FILE] | --ped FILE --map FILE | --ancient FILE] [--users FILE_OR_DIR ...] [--outdir OUTDIR] [--jobs JOBS]
+    ---------- Examples:
+        python ClinVar_Pipeline.py --variant-summary variant_summary.txt.gz --bfile v54.1_1240K_public --keep Ancient_samples.txt --users TestUsers/ --outdir Pipeline
+        python ClinVar_Pipeline.py --clinvar ClinVar_to_SNP.txt --ancient Ancient_samples_filtered_rsID.txt --users Test1_DNA.txt Test2_DNA.txt
+
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import time
+# make sure the module is installed
+try:
+    import pandas as pd
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    import ClinVar_Cache
+    from ClinVar_Store import open_store
+    from Pipeline_Steps import (DEFAULT_ASSEMBLY, DEFAULT_CLIN_SIGNIFICANCE, DEFAULT_REVIEW_STATUS,
+                                ancient_genotypes, ancient_markers, filter_clinvar, user_markers)
+    from Shared_Index import INDEX_COLUMNS, build_shared_index, open_shared_index, save_shared_index
+    from User_Batch import list_user_files, user_name
+except ImportError as e:
+    sys.exit(f"ERROR: Python module not installed. {e}")
+
+# bump the version of a stage when its output changes, so the outputs kept under the old keys are not used again
+STAGE_VERSIONS = {"clinvar": 1, "ancient_genotypes": 1, "ancient_markers": 1, "shared_index": 1, "user_markers": 1, "shared": 1}
+# the directory of the outputs of the stages and of the hashes of the input files, in the output directory
+PIPELINE_DIR = ".pipeline"
+HASHES_FILE = "hashes.json"
+# the number of rows and the time of a stage, kept next to its output
+STAGE_FILE = "stage.json"
+SUMMARY_COLUMNS = ["Stage", "Status", "Rows", "Seconds", "Key", "Output"]
+
+
+class Stage:
+    """
+    One stage of the pipeline: a function, the files it reads and its parameters.
+    """
+
+    def __init__(self, name, kind, func, output, inputs, params=None, options=None):
+        # the name is unique in the pipeline, the kind is the name of the function, for example user_markers:Test1 and user_markers
+        self.name = name
+        self.kind = kind
+        self.func = func
+        self.output = output
+        # the arguments of func that are files: the path of an input file or the Stage whose output is read
+        self.inputs = inputs
+        # the parameters are part of the key, the options (like the number of processes) do not change the output
+        self.params = params or {}
+        self.options = options or {}
+        self.key = None
+
+    def upstream(self):
+        return [value for value in self.inputs.values() if isinstance(value, Stage)]
+
+
+class HashCache:
+    """
+    The content hashes of the input files, kept with the size and the modification time of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hashes = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                self.hashes = json.load(f)
+
+    def file_hash(self, file_path):
+        """
+        Function:
+            the content hash of a file, computed again only if its size or modification time changed
+        Input:
+            file_path: the path of the file
+        Output:
+            the hexadecimal hash string
+        """
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        kept = self.hashes.get(file_path)
+        if kept and kept["size"] == stat.st_size and kept["mtime_ns"] == stat.st_mtime_ns:
+            return kept["hash"]
+        key = ClinVar_Cache.file_hash(file_path)
+        self.hashes[file_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "hash": key}
+        return key
+
+    def save(self):
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(self.hashes, f)
+        os.replace(f"{self.path}.tmp", self.path)
+
+
+def stage_key(stage, hash_cache):
+    """
+    Function:
+        the key of a stage: the hash of its kind, version, output name, parameters, the content hash of its input files and the keys of its upstream stages
+    Input:
+        stage: Stage, the keys of its upstream stages are already computed
+        hash_cache: HashCache of the input files
+    Output:
+        the hexadecimal hash string
+    """
+    inputs = {}
+    for arg, value in stage.inputs.items():
+        if isinstance(value, Stage):
+            inputs[arg] = value.key
+        elif value is None:
+            inputs[arg] = None
+        else:
+            inputs[arg] = hash_cache.file_hash(value)
+    description = {"kind": stage.kind, "version": STAGE_VERSIONS[stage.kind], "output": stage.output,
+                   "params": stage.params, "inputs": inputs}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def artifact_path(outdir, stage):
+    """
+    Function:
+        the path of the output of a stage under its key
+    Input:
+        outdir: the output directory
+        stage: Stage with its key
+    Output:
+        the path of the output file
+    """
+    return os.path.join(outdir, PIPELINE_DIR, stage.kind, stage.key[:16], stage.output)
+
+
+def input_path(outdir, value):
+    """
+    Function:
+        the path of a file argument of a stage
+    Input:
+        outdir: the output directory
+        value: the path of an input file, a Stage or None
+    Output:
+        the path of the file
+    """
+    return artifact_path(outdir, value) if isinstance(value, Stage) else value
+
+
+def run_stage(func, output_file, kwargs, published_file=None):
+    """
+    Function:
+        run the function of a stage in a worker process, the output is written to a temporary directory that is renamed when the stage is done,
+        so an interrupted stage is run again by the next run
+    Input:
+        func: the function of the stage, called with the output file and kwargs
+        output_file: the path of the output under the key of the stage
+        kwargs: the arguments of the function
+        published_file: the path of the output in the output directory, shown in the messages and the errors instead of the temporary file
+    Output:
+        the number of rows of the output and the time in seconds
+    """
+    start = time.perf_counter()
+    key_dir = os.path.dirname(output_file)
+    tmp_dir = f"{key_dir}.{os.getpid()}.tmp"
+    tmp_file = os.path.join(tmp_dir, os.path.basename(output_file))
+    os.makedirs(tmp_dir, exist_ok=True)
+    messages = io.StringIO()
+    try:
+        try:
+            with contextlib.redirect_stdout(messages):
+                rows = func(tmp_file, **kwargs)
+        except Exception as e:
+            raise RuntimeError(str(e).replace(tmp_file, published_file or output_file)) from None
+        finally:
+            # the temporary file only exists in this worker, the messages show where the output is linked
+            print(messages.getvalue().replace(tmp_file, published_file or output_file), end="")
+        seconds = round(time.perf_counter() - start, 3)
+        with open(os.path.join(tmp_dir, STAGE_FILE), "w") as f:
+            json.dump({"Rows": rows, "Seconds": seconds}, f)
+        if os.path.isdir(key_dir):
+            shutil.rmtree(key_dir)
+        os.replace(tmp_dir, key_dir)
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+    return rows, seconds
+
+
+def publish(output_file, outdir):
+    """
+    Function:
+        link the output of a stage into the output directory, a copy is made if the file system has no hard links
+    Input:
+        output_file: the path of the output under the key of the stage
+        outdir: the output directory
+    Output:
+        the path of the output in the output directory
+    """
+    published = os.path.join(outdir, os.path.basename(output_file))
+    # the rename of a link to the same file does nothing, the output of a cached stage is usually linked already
+    if os.path.isfile(published) and os.path.samefile(output_file, published):
+        return published
+    if os.path.lexists(f"{published}.tmp"):
+        os.remove(f"{published}.tmp")
+    try:
+        os.link(output_file, f"{published}.tmp")
+    except OSError:
+        shutil.copyfile(output_file, f"{published}.tmp")
+    os.replace(f"{published}.tmp", published)
+    return published
+
+
+def _filter_stage(output_file, variant_summary, assembly, clin_significance, review_status, phenotype_list_required):
+    row_count, _ = filter_clinvar(variant_summary, output_file, assembly, clin_significance, review_status, phenotype_list_required)
+    # the store is built here once, the stages of both branches open it from the cache
+    open_store(output_file)
+    return row_count
+
+
+def _ancient_genotypes_stage(output_file, clinvar_file, bed=None, bim=None, fam=None, keep_file=None, map_file=None, ped_file=None, jobs=1):
+    # the .bed, .bim and .fam files are hashed one by one, PLINK_Reader reads them by their prefix
+    bfile = bed[:-len(".bed")] if bed else None
+    return ancient_genotypes(clinvar_file, output_file, bfile, keep_file, map_file, ped_file, jobs)
+
+
+def _ancient_markers_stage(output_file, genotype_file, clinvar_file, correct_flips, jobs=1):
+    markers_df = ancient_markers(genotype_file, clinvar_file, correct_flips, jobs)
+    markers_df.to_csv(output_file, sep="\t", index=False)
+    return len(markers_df)
+
+
+def _shared_index_stage(output_file, markers_file):
+    index = build_shared_index(pd.read_csv(markers_file, sep="\t", header=0, usecols=INDEX_COLUMNS))
+    save_shared_index(index, output_file)
+    return len(index)
+
+
+def _user_markers_stage(output_file, user_file, clinvar_file, correct_flips):
+    markers_df = user_markers(user_file, clinvar_file, correct_flips)
+    markers_df.to_csv(output_file, sep="\t", index=False)
+    return len(markers_df)
+
+
+def _shared_stage(output_file, index_file, markers_file):
+    shared_df = open_shared_index(index_file).shared(pd.read_csv(markers_file, sep="\t", header=0))
+    shared_df.to_csv(output_file, sep="\t", index=False)
+    return len(shared_df)
+
+
+def pipeline_stages(args, user_files):
+    """
+    Function:
+        list the stages of the given inputs, every stage is after the stages it reads
+    Input:
+        args: the parsed command-line arguments
+        user_files: the user files
+    Output:
+        list of Stage
+    """
+    stages = []
+    if args.variant_summary:
+        clinvar = Stage("clinvar", "clinvar", _filter_stage, "ClinVar_to_SNP.txt", {"variant_summary": args.variant_summary},
+                        params={"assembly": args.assembly, "clin_significance": args.clin_significance,
+                                "review_status": args.review_status, "phenotype_list_required": not args.keep_not_provided})
+        stages.append(clinvar)
+    else:
+        clinvar = args.clinvar
+    ancient_index = None
+    genotypes = args.ancient
+    if args.bfile or args.ped:
+        inputs = {"clinvar_file": clinvar}
+        if args.bfile:
+            inputs.update(bed=f"{args.bfile}.bed", bim=f"{args.bfile}.bim", fam=f"{args.bfile}.fam", keep_file=args.keep)
+        else:
+            inputs.update(map_file=args.map, ped_file=args.ped)
+        # the stage already runs in a worker of the pool, so it decodes the .ped file in its own process
+        genotypes = Stage("ancient_genotypes", "ancient_genotypes", _ancient_genotypes_stage, "Ancient_samples_filtered_rsID.txt", inputs,
+                          options={"jobs": 1})
+        stages.append(genotypes)
+    if genotypes:
+        markers = Stage("ancient_markers", "ancient_markers", _ancient_markers_stage, "Ancient_ClinVar_Markers.txt",
+                        {"genotype_file": genotypes, "clinvar_file": clinvar}, params={"correct_flips": args.correct_flips},
+                        options={"jobs": 1})
+        ancient_index = Stage("shared_index", "shared_index", _shared_index_stage, "Ancient_ClinVar_Markers.shared.npz",
+                              {"markers_file": markers})
+        stages += [markers, ancient_index]
+    for user_file in user_files:
+        name = user_name(user_file)
+        markers = Stage(f"user_markers:{name}", "user_markers", _user_markers_stage, f"{name}_ClinVar_Markers.txt",
+                        {"user_file": user_file, "clinvar_file": clinvar}, params={"correct_flips": args.correct_flips})
+        stages.append(markers)
+        if ancient_index:
+            stages.append(Stage(f"shared:{name}", "shared", _shared_stage, f"{name}_Ancient_Shared.txt",
+                                {"index_file": ancient_index, "markers_file": markers}))
+    return stages
+
+
+def run_pipeline(stages, outdir, jobs=None):
+    """
+    Function:
+        run the stages with a pool of processes, a stage is submitted when the stages it reads are done and skipped if its output already exists
+    Input:
+        stages: list of Stage, every stage is after the stages it reads
+        outdir: the output directory
+        jobs: the number of worker processes, default is the number of CPUs
+    Output:
+        DataFrame with one row per stage, also written to Pipeline_Summary.txt
+    """
+    os.makedirs(os.path.join(outdir, PIPELINE_DIR), exist_ok=True)
+    hash_cache = HashCache(os.path.join(outdir, PIPELINE_DIR, HASHES_FILE))
+    rows = {}
+    pending = list(stages)
+    running = {}
+
+    def finish(stage, row):
+        rows[stage.name] = {"Stage": stage.name, "Key": stage.key[:16] if stage.key else None, **row}
+        if row["Status"] in ("done", "cached"):
+            rows[stage.name]["Output"] = publish(artifact_path(outdir, stage), outdir)
+        print(f"[{len(rows)}/{len(stages)}] {stage.name}: {row['Status']}")
+
+    with ProcessPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+        while pending or running:
+            # submit every stage whose upstream stages are finished, a cached stage can make the next stages ready at once
+            ready = True
+            while ready:
+                ready = False
+                for stage in list(pending):
+                    statuses = [rows[up.name]["Status"] if up.name in rows else None for up in stage.upstream()]
+                    if None in statuses and not any(status in ("error", "skipped") for status in statuses):
+                        continue
+                    pending.remove(stage)
+                    ready = True
+                    if any(status in ("error", "skipped") for status in statuses):
+                        finish(stage, {"Status": "skipped"})
+                        continue
+                    try:
+                        stage.key = stage_key(stage, hash_cache)
+                    except OSError as e:
+                        print(f"Error: {stage.name}: {e}")
+                        finish(stage, {"Status": "error"})
+                        continue
+                    output_file = artifact_path(outdir, stage)
+                    if os.path.isfile(output_file):
+                        # the number of rows of the run that made the output, the time of a cached stage is 0
+                        with open(os.path.join(os.path.dirname(output_file), STAGE_FILE)) as f:
+                            finish(stage, {"Status": "cached", "Rows": json.load(f)["Rows"], "Seconds": 0})
+                        continue
+                    kwargs = {arg: input_path(outdir, value) for arg, value in stage.inputs.items()}
+                    running[pool.submit(run_stage, stage.func, output_file, {**kwargs, **stage.params, **stage.options},
+                                        os.path.join(outdir, stage.output))] = stage
+            hash_cache.save()
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    row_count, seconds = future.result()
+                    finish(stage, {"Status": "done", "Rows": row_count, "Seconds": seconds})
+                except Exception as e:
+                    print(f"Error: {stage.name}: {e}")
+                    finish(stage, {"Status": "error"})
+    summary_df = pd.DataFrame([rows[stage.name] for stage in stages], columns=SUMMARY_COLUMNS)
+    summary_df["Rows"] = summary_df["Rows"].astype("Int64")
+    summary_df.to_csv(os.path.join(outdir, "Pipeline_Summary.txt"), sep="\t", index=False)
+    return summary_df
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='ClinVar_Pipeline.py', description="run the whole workflow as a graph of stages, the stages whose inputs did not change are not run again")
+    clinvar_group = parser.add_mutually_exclusive_group(required=True)
+    clinvar_group.add_argument("--variant-summary", type=str, default=None, help="Path to variant_summary.txt(.gz)")
+    clinvar_group.add_argument("--clinvar", type=str, default=None, help="Path to ClinVar_to_SNP.txt, instead of filtering variant_summary.txt(.gz)")
+    parser.add_argument("--assembly", type=str, default=DEFAULT_ASSEMBLY, help="the selected assembly")
+    parser.add_argument("--clin-significance", nargs="+", default=DEFAULT_CLIN_SIGNIFICANCE, help="the selected ClinicalSignificance values")
+    parser.add_argument("--review-status", nargs="+", default=DEFAULT_REVIEW_STATUS, help="the selected ReviewStatus values")
+    parser.add_argument("--keep-not-provided", action="store_true", help="keep the variants whose PhenotypeList is 'not provided'")
+    ancient_group = parser.add_mutually_exclusive_group()
+    ancient_group.add_argument("--bfile", type=str, default=None, help="the prefix of the .bed, .bim and .fam files of the ancient samples")
+    ancient_group.add_argument("--ped", type=str, default=None, help="the .ped file of the ancient samples, with --map")
+    ancient_group.add_argument("--ancient", type=str, default=None, help="Ancient_samples_filtered_rsID.txt, its genotype matrix or a VCF file")
+    parser.add_argument("--keep", type=str, default=None, help="the samples to keep with --bfile (Family_ID and Master_ID)")
+    parser.add_argument("--map", type=str, default=None, help="the .map file of the ancient samples, with --ped")
+    parser.add_argument("--users", nargs="+", default=[], help="user files or directories of user files")
+    parser.add_argument("--correct-flips", action="store_true", help="count the alternate alleles of strand-flipped genotypes on the opposite strand")
+    parser.add_argument("--outdir", type=str, default="Pipeline", help="the output directory")
+    parser.add_argument("--jobs", type=int, default=None, help="the number of worker processes, default is the number of CPUs")
+    args = parser.parse_args()
+    if bool(args.ped) != bool(args.map):
+        sys.exit("Error: --ped and --map are used together.")
+    if args.keep and not args.bfile:
+        sys.exit("Error: --keep is used with --bfile.")
+    input_files = [args.variant_summary or args.clinvar, args.ancient, args.keep, args.ped, args.map]
+    if args.bfile:
+        input_files += [f"{args.bfile}.bed", f"{args.bfile}.bim", f"{args.bfile}.fam"]
+    for input_file in filter(None, input_files):
+        if not os.path.isfile(input_file):
+            sys.exit(f"Error: The input file {input_file} is NOT FOUND !")
+    user_files = []
+    try:
+        for user_source in args.users:
+            if os.path.isdir(user_source):
+                user_files += list_user_files(user_source)
+            elif os.path.isfile(user_source):
+                user_files.append(user_source)
+            else:
+                sys.exit(f"Error: The input file {user_source} is NOT FOUND !")
+        names = [user_name(path) for path in user_files]
+        duplicated = sorted({name for name in names if names.count(name) > 1})
+        if duplicated:
+            raise ValueError(f"User files with the same name would write the same output files: {', '.join(duplicated)}")
+        if args.clinvar:
+            # the store is built once here, the stages of both branches open it from the cache
+            open_store(args.clinvar)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    start = time.perf_counter()
+    summary_df = run_pipeline(pipeline_stages(args, user_files), args.outdir, args.jobs)
+    status = summary_df["Status"].value_counts()
+    print(f"Done: {status.get('done', 0)}, cached: {status.get('cached', 0)}, errors: {status.get('error', 0)}, "
+          f"skipped: {status.get('skipped', 0)}, {time.perf_counter() - start:.1f} seconds, summary: {os.path.join(args.outdir, 'Pipeline_Summary.txt')}")
+    if (summary_df["Status"] == "error").any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
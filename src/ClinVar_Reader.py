@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: ClinVar_Reader.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module reads the tab_delimited variant_summary.txt (or the compressed variant_summary.txt.gz) file from ClinVar in chunks.
+    Only the columns needed by the filtering step and by ClinVar_to_SNP.txt are kept, so the peak memory depends on the chunk size and not on the size of the ClinVar release.
+    The filters of the page "Filter ClinVar Dataset" (variant type, assembly, rsID, ClinicalSignificance, ReviewStatus, PhenotypeList) are applied to every chunk,
+    and the filtered rows are written to the output file chunk by chunk.
+
+Imported modules:
+    - pandas: used for data manipulation and analysis.
+    - numpy: to re-encode the categorical columns as integer codes
+    - os: to check file status in directory
+    - time, Stage_Metrics: the time of the reading, the filtering and the writing of the chunks, shown on the page
+
+Procedures:
+    1. detect if the input is compressed (gzip) and check the header for the required columns.
+    2. read the required columns chunk by chunk and rename them for easier reference.
+    3. collect the options (Assembly, ClinicalSignificance, ReviewStatus) and their counts for the filtering widgets.
+    4. filter every chunk based on the specified criterias and write the filtered rows to the output file.
+    5. with pyarrow installed, the parsed columns are kept in the ClinVar_Cache, so the same release is parsed from text only once.
+       The low-cardinality columns (Type, Assembly, ClinicalSignificance, ReviewStatus) are stored as small integer codes,
+       their categories and value counts are saved with the cached table and used as the options of the filtering page.
+
+"""
+import os
+import time
+import numpy as np
+import pandas as pd
+import ClinVar_Cache
+import Stage_Metrics
+
+# columns needed from variant_summary.txt by the filter step and the output file
+REQUIRED_COLUMNS = ['Type', '#AlleleID', 'GeneID', 'ClinicalSignificance', 'RS# (dbSNP)', 'Chromosome',
+                    'ReferenceAlleleVCF', 'AlternateAlleleVCF', 'NumberSubmitters',
+                    'ClinSigSimple', 'PhenotypeList', 'ReviewStatus', 'Assembly']
+# rename columns for easier reference in the future
+RENAME_COLUMNS = {'RS# (dbSNP)': 'rsID', '#AlleleID': 'AlleleID'}
+# columns of the output file ClinVar_to_SNP.txt
+OUTPUT_COLUMNS = ['AlleleID', 'GeneID', 'ClinicalSignificance', 'rsID', 'Chromosome',
+                  'ReferenceAlleleVCF', 'AlternateAlleleVCF', 'NumberSubmitters',
+                  'ClinSigSimple', 'PhenotypeList', 'ReviewStatus']
+# columns offered as options on the filtering page
+OPTION_COLUMNS = ['Assembly', 'ClinicalSignificance', 'ReviewStatus']
+# low-cardinality columns, they are read as categorical columns and filtered by their integer codes
+CATEGORICAL_COLUMNS = ['Type', 'Assembly', 'ClinicalSignificance', 'ReviewStatus']
+# column types, Chromosome has values like X, Y and MT so it is kept as string
+COLUMN_DTYPES = {'#AlleleID': 'int64', 'GeneID': 'int64', 'RS# (dbSNP)': 'int64', 'NumberSubmitters': 'int64',
+                 'ClinSigSimple': 'int64', 'Chromosome': 'str', 'Type': 'category', 'ClinicalSignificance': 'category',
+                 'ReferenceAlleleVCF': 'str', 'AlternateAlleleVCF': 'str', 'PhenotypeList': 'str',
+                 'ReviewStatus': 'category', 'Assembly': 'category'}
+# column types of ClinVar_to_SNP.txt, the output of the page "Filter ClinVar Dataset"
+CLINVAR_TO_SNP_DTYPES = {'AlleleID': 'int64', 'GeneID': 'int64', 'rsID': 'int64', 'NumberSubmitters': 'int64',
+                         'ClinSigSimple': 'int64', 'Chromosome': 'str', 'ClinicalSignificance': 'str',
+                         'ReferenceAlleleVCF': 'str', 'AlternateAlleleVCF': 'str', 'PhenotypeList': 'str',
+                         'ReviewStatus': 'str'}
+# the default filtering parameters, the same as the defaults of the page "Filter ClinVar Dataset"
+DEFAULT_CLIN_SIGNIFICANCE = ['Pathogenic']
+DEFAULT_REVIEW_STATUS = ['criteria provided, multiple submitters, no conflicts',
+                         'criteria provided, single submitter',
+                         'criteria provided, conflicting classifications',
+                         'reviewed by expert panel',
+                         'practice guideline']
+# number of rows read at a time
+DEFAULT_CHUNKSIZE = 200000
+# the first two bytes of a gzip file
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def detect_compression(source):
+    """
+    Function:
+        detect if the input is gzip compressed, based on the first two bytes of the file
+    Input:
+        source: the path of variant_summary.txt(.gz) or an uploaded file object
+    Output:
+        "gzip" for a compressed input, otherwise None
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            magic = f.read(2)
+    else:
+        source.seek(0)
+        magic = source.read(2)
+        # reset the file pointer after reading
+        source.seek(0)
+    return "gzip" if magic == GZIP_MAGIC else None
+
+
+def read_header(source):
+    """
+    Function:
+        read the column names of variant_summary.txt(.gz) and check for missing columns
+    Input:
+        source: the path of variant_summary.txt(.gz) or an uploaded file object
+    Raise error:
+        check if the file is empty
+        check if the required columns are present
+    Output:
+        the list of column names
+    """
+    compression = detect_compression(source)
+    header = pd.read_csv(source, sep='\t', nrows=0, compression=compression)
+    if not isinstance(source, (str, os.PathLike)):
+        source.seek(0)
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in header.columns]
+    if missing_columns:
+        raise ValueError(f"The uploaded file is missing the following required columns: {', '.join(missing_columns)}")
+    return list(header.columns)
+
+
+def iter_variant_summary(source, chunksize=DEFAULT_CHUNKSIZE, columns=REQUIRED_COLUMNS):
+    """
+    Function:
+        read the required columns of variant_summary.txt(.gz) chunk by chunk
+    Input:
+        source: the path of variant_summary.txt(.gz) or an uploaded file object
+        chunksize: the number of rows read at a time
+        columns: the variant_summary columns to read, default is REQUIRED_COLUMNS
+    Output:
+        generator of DataFrames, the columns "RS# (dbSNP)" and "#AlleleID" are renamed to "rsID" and "AlleleID"
+    """
+    read_header(source)
+    compression = detect_compression(source)
+    dtypes = {col: COLUMN_DTYPES[col] for col in columns}
+    reader = pd.read_csv(source, sep='\t', header=0, usecols=columns, dtype=dtypes,
+                         compression=compression, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            yield chunk.rename(columns=RENAME_COLUMNS)
+
+
+def encode_categories(chunks, categories, counts, columns=CATEGORICAL_COLUMNS):
+    """
+    Function:
+        re-encode the categorical columns of every chunk with categories shared by all chunks, so they can be stored as small integer codes.
+        pandas gives every chunk its own categories, the shared categories grow when a chunk has a new value.
+    Input:
+        chunks: DataFrames from iter_variant_summary
+        categories: dictionary of column name -> list of categories, updated in place
+        counts: dictionary of column name -> list with the number of rows of every category, updated in place
+        columns: the categorical columns
+    Output:
+        generator of DataFrames, the categorical columns are replaced by int16 codes (-1 for missing values)
+    """
+    for chunk in chunks:
+        for col in columns:
+            shared = categories.setdefault(col, [])
+            shared_counts = counts.setdefault(col, [])
+            chunk_categories = chunk[col].cat.categories
+            # position of every chunk category in the shared categories, new values are appended
+            lookup = pd.Index(shared, dtype=object).get_indexer(chunk_categories)
+            new = lookup < 0
+            lookup[new] = np.arange(len(shared), len(shared) + new.sum())
+            shared.extend(chunk_categories[new].tolist())
+            shared_counts.extend([0] * int(new.sum()))
+            # the last entry maps the missing value code -1 to -1
+            lookup = np.append(lookup, -1).astype(np.int16)
+            codes = lookup[chunk[col].cat.codes.to_numpy()]
+            for code, count in enumerate(np.bincount(codes[codes >= 0], minlength=len(shared))):
+                shared_counts[code] += int(count)
+            chunk[col] = codes
+        yield chunk
+
+
+@Stage_Metrics.timed("load_variant_summary")
+def load_variant_summary(source, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Function:
+        return the cached table of variant_summary.txt(.gz), the file is parsed chunk by chunk and cached if it is not in the cache yet.
+        The categorical columns are stored as integer codes, the categories and value counts are saved in the metadata of the cached table.
+    Input:
+        source: the path of variant_summary.txt(.gz) or an uploaded file object
+        chunksize: the number of rows read at a time
+    Output:
+        pyarrow Table (memory-mapped) and the path of the cached table
+    """
+    categories = {}
+    counts = {}
+
+    def parse(s):
+        return encode_categories(iter_variant_summary(s, chunksize), categories, counts)
+
+    def metadata():
+        return {"categories": categories, "counts": counts}
+    return ClinVar_Cache.load_cached(source, "variant_summary", parse, metadata=metadata)
+
+
+def read_clinvar_to_snp(source):
+    """
+    Function:
+        read ClinVar_to_SNP.txt, the output of the page "Filter ClinVar Dataset", with fixed column types
+    Input:
+        source: the path of ClinVar_to_SNP.txt or an uploaded file object
+    Output:
+        DataFrame
+    """
+    return pd.read_csv(source, sep='\t', header=0, dtype=CLINVAR_TO_SNP_DTYPES)
+
+
+def summarize_metadata(table, metadata, columns=OPTION_COLUMNS):
+    """
+    Function:
+        the value counts of the option columns, precomputed when the table was cached, so no column has to be scanned
+    Input:
+        table: pyarrow Table from load_variant_summary
+        metadata: the metadata of the cached table, from ClinVar_Cache.read_metadata
+        columns: the option columns
+    Output:
+        the number of rows and a dictionary of column name -> pandas Series (value -> count)
+    """
+    summary = {col: pd.Series(metadata["counts"][col], index=metadata["categories"][col], dtype="int64", name="count")
+               for col in columns}
+    return table.num_rows, summary
+
+
+def summarize_options(chunks, columns=OPTION_COLUMNS):
+    """
+    Function:
+        count the values of the option columns, the values are kept in the order they first appear in the file
+    Input:
+        chunks: DataFrames from iter_variant_summary
+        columns: the columns to count
+    Output:
+        the number of rows and a dictionary of column name -> pandas Series (value -> count)
+    """
+    totals = {col: {} for col in columns}
+    row_count = 0
+    for chunk in chunks:
+        row_count += len(chunk)
+        for col in columns:
+            chunk_counts = chunk[col].value_counts()
+            counts = totals[col]
+            for value in chunk[col].dropna().unique():
+                counts[value] = counts.get(value, 0) + int(chunk_counts[value])
+    summary = {col: pd.Series(totals[col], dtype="int64", name="count") for col in columns}
+    return row_count, summary
+
+
+def category_mask(column, values):
+    """
+    Function:
+        select the rows whose value is one of values. For a categorical column the values are translated to their integer codes once,
+        then only the small integer codes of the rows are compared.
+    Input:
+        column: pandas Series
+        values: the selected values
+    Output:
+        boolean pandas Series
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        wanted = column.cat.categories.get_indexer(list(values))
+        mask = np.isin(column.cat.codes.to_numpy(), wanted[wanted >= 0])
+        return pd.Series(mask, index=column.index)
+    return column.isin(values)
+
+
+def filter_clinvar_data(df, assembly, clin_significance, review_status, phenotype_list_required):
+    """
+    Function:
+        filter the ClinVar rows based on the filtering parameters
+    Input:
+        df: DataFrame with the renamed variant_summary columns
+        assembly, clin_significance, review_status, phenotype_list_required: the filtering parameters
+    Output:
+        the filtered DataFrame
+    """
+    filtered_df = df[
+        # Keep only single nucleotide variants
+        category_mask(df['Type'], ['single nucleotide variant']) &
+        # Assembly - GRCh37. The data for the variant are reported for each assembly, so most variants have a line for GRCh37 (hg19) and another line for GRCh38 (hg38)
+        category_mask(df['Assembly'], [assembly]) &
+        # rsID is integer that would be reported as -1 if missing
+        (df['rsID'] != -1) &
+        category_mask(df['ClinicalSignificance'], clin_significance) &
+        category_mask(df['ReviewStatus'], review_status)
+    ]
+    if phenotype_list_required:
+        # Exclude missing phenotype info
+        filtered_df = filtered_df[filtered_df["PhenotypeList"] != "not provided"]
+    return filtered_df
+
+
+def write_filtered_clinvar(chunks, output_file, assembly, clin_significance, review_status,
+                           phenotype_list_required, preview_rows=10):
+    """
+    Function:
+        filter the chunks and write the filtered rows to the output file chunk by chunk, in tab-delimited format
+    Input:
+        chunks: DataFrames from iter_variant_summary
+        output_file: the path for the output_file, ClinVar_to_SNP.txt
+        assembly, clin_significance, review_status, phenotype_list_required: the filtering parameters
+        preview_rows: the number of rows kept for preview
+    Output:
+        the number of rows written and a DataFrame with the first preview_rows rows
+    """
+    row_count = 0
+    preview_chunks = []
+    # the time of every step is summed over the chunks: reading (and parsing) the chunk, filtering it, writing it
+    read_seconds = filter_seconds = write_seconds = 0.0
+    scanned = 0
+    with Stage_Metrics.stage("write_filtered_clinvar") as record, open(output_file, "w", newline="") as out:
+        # write the header even if no row passes the filters
+        out.write('\t'.join(OUTPUT_COLUMNS) + '\n')
+        chunks = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            read_seconds += time.perf_counter() - start
+            scanned += len(chunk)
+            start = time.perf_counter()
+            filtered_df = filter_clinvar_data(chunk, assembly, clin_significance, review_status, phenotype_list_required)[OUTPUT_COLUMNS]
+            filter_seconds += time.perf_counter() - start
+            start = time.perf_counter()
+            filtered_df.to_csv(out, sep='\t', index=False, header=False)
+            write_seconds += time.perf_counter() - start
+            if row_count < preview_rows:
+                preview_chunks.append(filtered_df.head(preview_rows - row_count))
+            row_count += len(filtered_df)
+        record["Rows"] = row_count
+        Stage_Metrics.add_stage("read chunks", read_seconds, scanned)
+        Stage_Metrics.add_stage("filter_clinvar_data", filter_seconds, scanned)
+        Stage_Metrics.add_stage("to_csv", write_seconds, row_count)
+    preview_df = pd.concat(preview_chunks) if preview_chunks else pd.DataFrame(columns=OUTPUT_COLUMNS)
+    return row_count, preview_df
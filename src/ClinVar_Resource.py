@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: ClinVar_Resource.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module keeps one read-only copy of every opened ClinVar resource per process, shared by all pages and all Streamlit sessions.
+    The resources are the indexed store of ClinVar_to_SNP.txt (ClinVar_Store), the cached Arrow table of variant_summary.txt(.gz) (ClinVar_Cache)
+    and the shared index of Ancient_ClinVar_Markers.txt (Shared_Index, in memory).
+    The store and the Arrow table are memory-mapped, so the pages and the sessions read the same pages of the files, and the shared index is held in memory once per process;
+    nothing is copied or pickled per session, unlike st.cache_data which returns a new copy of the DataFrame on every hit.
+    The resources are counted with the size of their files (the most memory they can take once every page is read).
+    Above the ceiling, the least recently used resources (the older ClinVar releases) are dropped from the pool, the sessions still using one keep it until they finish.
+    The hash of a file (the key of the disk cache) is computed once per file and kept with its size and modification time, or with the id of the uploaded file,
+    so a page run again by Streamlit does not read the whole file again.
+
+Imported modules:
+    - collections, threading: the least recently used order of the resources and the lock of every resource, shared by the threads of the sessions
+    - os: to check file status in directory
+    - ClinVar_Cache, ClinVar_Reader: the hash of the files, the cached and memory-mapped Arrow table of variant_summary.txt(.gz)
+    - ClinVar_Store: the indexed store of ClinVar_to_SNP.txt
+    - Shared_Index: the index (rsID, Genotype) -> ancient samples of Ancient_ClinVar_Markers.txt
+    - Stage_Metrics: the time of getting the store, shown on the pages
+
+Procedures:
+    1. find the key of the source file: its hash, computed only once per file.
+    2. if the resource of the key is in the pool, mark it as recently used and return it.
+    3. otherwise open it (build the store first if it is not in the cache directory yet), add it to the pool and drop the least recently used resources above the ceiling.
+
+Environment variables:
+    CLINVAR_SMART_RESOURCE_GB: the memory ceiling of the shared resources in GB, default is 4
+
+"""
+import os
+import threading
+from collections import OrderedDict
+import ClinVar_Cache
+import Stage_Metrics
+from ClinVar_Reader import load_variant_summary
+from ClinVar_Store import ClinVarStore, open_store, store_path
+from Shared_Index import load_shared_index
+
+RESOURCE_MAX_BYTES = int(float(os.environ.get("CLINVAR_SMART_RESOURCE_GB", "4")) * 1024 ** 3)
+# the number of file hashes kept
+HASH_MEMO_SIZE = 256
+
+
+class ResourcePool:
+    """
+    The opened resources of the process in the least recently used order, with their size in bytes.
+    """
+
+    def __init__(self, max_bytes=RESOURCE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, open_resource, size):
+        """
+        Function:
+            return the resource of the key, open it and add it to the pool if it is not in the pool yet
+        Input:
+            key: the key of the resource, the path of the store or of the cached table
+            open_resource: function taking the key and returning the resource
+            size: function taking the key and returning the size of the resource in bytes
+        Output:
+            the shared resource
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+        # the resource is opened outside of the pool lock, only the sessions asking for the same key wait for it
+        with key_lock(key):
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return self._entries[key][0]
+                self.misses += 1
+            resource = open_resource(key)
+            resource_size = size(key)
+            with self._lock:
+                self._entries[key] = (resource, resource_size)
+                self._evict(keep=key)
+            return resource
+
+    def _evict(self, keep=None):
+        # the least recently used resources are dropped first, never the one just opened
+        total = sum(size for _, size in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            total -= self._entries.pop(key)[1]
+
+    def discard(self, key):
+        """
+        Function:
+            drop a resource from the pool, for example when its files were removed from the cache directory
+        Input:
+            key: the key of the resource
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Function:
+            drop all resources from the pool
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def usage(self):
+        """
+        Function:
+            the resources in the pool, the least recently used first
+        Output:
+            list of (key, size in bytes)
+        """
+        with self._lock:
+            return [(key, size) for key, (_, size) in self._entries.items()]
+
+
+# the pool shared by all pages and sessions of the process
+POOL = ResourcePool()
+_hash_memo = OrderedDict()
+_hash_lock = threading.Lock()
+# one lock per key (the path of a store or of a cached table), a second session building the same resource waits and opens the one of the first
+_key_locks = {}
+_key_locks_lock = threading.Lock()
+
+
+def key_lock(key):
+    """
+    Function:
+        the lock of a key, shared by all threads of the process
+    Input:
+        key: the key of the resource, e.g. the path of the store or of the cached table
+    Output:
+        threading.Lock
+    """
+    # a lock is a few bytes and there is one per ClinVar release or ancient file, so the locks are kept
+    with _key_locks_lock:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def _memo_key(source):
+    # a path is identified by its size and modification time, an uploaded file by its id (Streamlit) or its name and size
+    if isinstance(source, (str, os.PathLike)):
+        stat = os.stat(source)
+        return ("path", os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+    file_id = getattr(source, "file_id", None)
+    if file_id is None:
+        return None
+    return ("upload", file_id, getattr(source, "name", None), getattr(source, "size", None))
+
+
+def source_hash(source):
+    """
+    Function:
+        the hash of the source file like ClinVar_Cache.file_hash, computed only once per file
+    Input:
+        source: the path of the file or an uploaded file object
+    Output:
+        the hexadecimal hash string
+    """
+    memo_key = _memo_key(source)
+    if memo_key is None:
+        return ClinVar_Cache.file_hash(source)
+    with _hash_lock:
+        if memo_key in _hash_memo:
+            _hash_memo.move_to_end(memo_key)
+            return _hash_memo[memo_key]
+    key = ClinVar_Cache.file_hash(source)
+    with _hash_lock:
+        _hash_memo[memo_key] = key
+        if len(_hash_memo) > HASH_MEMO_SIZE:
+            _hash_memo.popitem(last=False)
+    return key
+
+
+def _directory_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+@Stage_Metrics.timed("shared_store")
+def shared_store(source, cache_dir=None):
+    """
+    Function:
+        open the store of ClinVar_to_SNP.txt like ClinVar_Store.open_store, once per process for all pages and sessions
+    Input:
+        source: the path of ClinVar_to_SNP.txt or of a store directory, or an uploaded file object
+        cache_dir: the cache directory, default is ClinVar_Cache.CACHE_DIR
+    Output:
+        ClinVarStore, shared and read-only
+    """
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        path = os.path.abspath(source)
+    else:
+        path = os.path.abspath(store_path(source_hash(source), cache_dir))
+        if not os.path.isdir(path):
+            with key_lock(path):
+                # the store is built (or built again after it was evicted from the cache directory), unless another session just built it
+                if not os.path.isdir(path):
+                    POOL.discard(path)
+                    open_store(source, cache_dir)
+        else:
+            # mark the store as recently used for the eviction of the cache directory
+            os.utime(path)
+    # every array is mapped when the store is opened, so the store can be used even if its directory is evicted later
+    return POOL.get(path, lambda key: ClinVarStore(key).map_all(), _directory_size)
+
+
+def shared_table(path):
+    """
+    Function:
+        memory-map a cached table like ClinVar_Cache.open_table, once per process for all pages and sessions
+    Input:
+        path: the path of the cached table
+    Output:
+        pyarrow Table, shared and read-only
+    """
+    os.utime(path)
+    return POOL.get(os.path.abspath(path), ClinVar_Cache.open_table, os.path.getsize)
+
+
+def shared_variant_summary(source):
+    """
+    Function:
+        the cached table of variant_summary.txt(.gz) like ClinVar_Reader.load_variant_summary, parsed once and opened once per process
+    Input:
+        source: the path of variant_summary.txt(.gz) or an uploaded file object
+    Output:
+        pyarrow Table (memory-mapped, shared and read-only) and the path of the cached table
+    """
+    path = ClinVar_Cache.cache_path("variant_summary", source_hash(source))
+    if not ClinVar_Cache.is_cached(path):
+        with key_lock(os.path.abspath(path)):
+            if not ClinVar_Cache.is_cached(path):
+                POOL.discard(os.path.abspath(path))
+                _, path = load_variant_summary(source)
+    return shared_table(path), path
+
+
+def shared_index(source):
+    """
+    Function:
+        the shared index of Ancient_ClinVar_Markers.txt or of its .shared.npz file like Shared_Index.load_shared_index, built once per process for all sessions
+    Input:
+        source: the path of the file or an uploaded file object
+    Output:
+        SharedIndex, shared and read-only
+    """
+    # the index is counted with the size of its file, like the other resources
+    if isinstance(source, (str, os.PathLike)):
+        size = os.path.getsize(source)
+    else:
+        size = getattr(source, "size", None) or len(source.getbuffer())
+    return POOL.get(f"shared_index_{source_hash(source)}", lambda _: load_shared_index(source), lambda _: size)
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: ClinVar_Store.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module builds an indexed on-disk store of ClinVar_to_SNP.txt, the output of the page "Filter ClinVar Dataset".
+    The rows are sorted by the integer rsID and every column is saved as a numpy array (.npy), so the store is opened with memory-mapping in no time,
+    without parsing the text file again. Text columns are saved as one UTF-8 byte array plus the offsets of every value.
+    A second sorted array of AlleleID is saved with the row order, so the store can be searched by rsID and by AlleleID.
+    The join index is built once with the store: the unique rsIDs and the first row of every rsID, so the rows of an rsID are a row range
+    and a batch of rsIDs is joined with one binary search (numpy.searchsorted) per key, O(log n), without merging string keys.
+    The allele columns ReferenceAlleleVCF and AlternateAlleleVCF are also saved as integer codes of their categories,
+    so the mutation status is computed from integers and a joined row only needs its store row number to find its annotation.
+    The store of an uploaded file is kept in the ClinVar_Cache directory, keyed by the hash of the file.
+
+Imported modules:
+    - numpy: to save, memory-map and search the sorted arrays
+    - pandas: used for data manipulation and analysis.
+    - json: to save the description of the store
+    - os, shutil, tempfile: to create, rename and remove the store directory
+    - ClinVar_Reader, ClinVar_Cache: to read ClinVar_to_SNP.txt and to find the cache directory
+    - Stage_Metrics: the time of opening (or building) the store
+
+Procedures:
+    1. read ClinVar_to_SNP.txt and check the columns.
+    2. sort the rows by rsID, save every column, the join index, the allele codes and the AlleleID index to the store directory.
+    3. open the store with memory-mapping and look up rsIDs or AlleleIDs with binary search.
+
+Usage:
+        python ClinVar_Store.py ClinVar_to_SNP.txt [store_directory]
+    ---------- Examples:
+        python ClinVar_Store.py ClinVar_to_SNP.txt
+        python ClinVar_Store.py ClinVar_to_SNP.txt ClinVar_to_SNP.store
+
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+import ClinVar_Cache
+import Stage_Metrics
+from ClinVar_Reader import OUTPUT_COLUMNS, read_clinvar_to_snp
+
+# bump the version when the layout of the store changes
+STORE_VERSION = 2
+STORE_SUFFIX = ".store"
+# the columns also saved as integer codes of their categories
+CODED_COLUMNS = ["ReferenceAlleleVCF", "AlternateAlleleVCF"]
+# the most digits of an rsID, so every valid rsID fits in a 64-bit integer, shared by all readers of rsIDs
+MAX_RSID_DIGITS = 18
+
+
+def rsid_to_int(rsids):
+    """
+    Function:
+        convert rsIDs like "rs5082" (or the digits only, like in ClinVar_to_SNP.txt) to integers
+    Input:
+        rsids: pandas Series
+    Output:
+        numpy int64 array, -1 for the values that are not a valid rsID
+    """
+    # a genotype table has the same rsID once per sample, only the different values are converted
+    codes, unique = pd.factorize(rsids, use_na_sentinel=False)
+    digits = pd.Series(unique).astype(str).str.strip().str.replace(r"^rs", "", regex=True)
+    # at most MAX_RSID_DIGITS digits, a longer value would overflow the 64-bit integer; converted without float, so no digit is lost
+    valid = digits.str.fullmatch(rf"\d{{1,{MAX_RSID_DIGITS}}}").to_numpy(dtype=bool)
+    converted = np.full(len(digits), -1, dtype=np.int64)
+    converted[valid] = digits[valid].astype(np.int64).to_numpy()
+    return converted[codes]
+
+
+def build_store(clinvar_df, store_dir, source_hash=None):
+    """
+    Function:
+        save ClinVar_to_SNP.txt as an indexed store, the rows are sorted by rsID
+    Input:
+        clinvar_df: DataFrame of ClinVar_to_SNP.txt
+        store_dir: the directory of the store, it is written under a temporary name and renamed at the end
+        source_hash: the hash of ClinVar_to_SNP.txt, saved in the description of the store
+    Raise error:
+        check if the columns match the columns of ClinVar_to_SNP.txt
+        check if the file is empty
+    Output:
+        the directory of the store
+    """
+    if list(clinvar_df.columns) != OUTPUT_COLUMNS:
+        raise ValueError(f"Columns do not match the expected format. "
+                         f"Expected columns: {', '.join(OUTPUT_COLUMNS)}. "
+                         f"Found columns: {', '.join(map(str, clinvar_df.columns))}.")
+    if clinvar_df.empty:
+        raise ValueError("The ClinVar file is EMPTY!")
+    # the stable sort keeps the rows with the same rsID in the order of the file
+    order = np.argsort(clinvar_df["rsID"].to_numpy(dtype=np.int64), kind="stable")
+    clinvar_df = clinvar_df.iloc[order].reset_index(drop=True)
+    # a unique temporary directory, two threads or processes building the same store never write to the same directory
+    parent_dir = os.path.dirname(os.path.abspath(store_dir))
+    os.makedirs(parent_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent_dir, prefix=os.path.basename(store_dir) + ".", suffix=".tmp")
+    try:
+        columns = {}
+        for col in OUTPUT_COLUMNS:
+            values = clinvar_df[col]
+            if pd.api.types.is_integer_dtype(values.dtype):
+                np.save(os.path.join(tmp_dir, f"{col}.npy"), values.to_numpy(dtype=np.int64))
+                columns[col] = "int64"
+            else:
+                # text column: one byte array with all values and the offset of every value, missing values are flagged
+                missing = values.isna().to_numpy()
+                encoded = [b"" if m else str(v).encode("utf-8") for v, m in zip(values.to_numpy(), missing)]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+                np.cumsum([len(v) for v in encoded], out=offsets[1:])
+                np.save(os.path.join(tmp_dir, f"{col}.data.npy"), np.frombuffer(b"".join(encoded), dtype=np.uint8))
+                np.save(os.path.join(tmp_dir, f"{col}.offsets.npy"), offsets)
+                np.save(os.path.join(tmp_dir, f"{col}.missing.npy"), missing)
+                columns[col] = "str"
+        # the row number in ClinVar_to_SNP.txt, to write rows in the order of the file
+        np.save(os.path.join(tmp_dir, "FileRow.npy"), order.astype(np.int64))
+        # join index: the unique rsIDs and the first row of every rsID, the last value is the number of rows
+        unique_rsids, first_rows = np.unique(clinvar_df["rsID"].to_numpy(dtype=np.int64), return_index=True)
+        np.save(os.path.join(tmp_dir, "rsID.unique.npy"), unique_rsids)
+        np.save(os.path.join(tmp_dir, "rsID.start.npy"), np.append(first_rows, len(clinvar_df)).astype(np.int64))
+        # the allele columns as codes, -1 for missing values
+        categories = {}
+        for col in CODED_COLUMNS:
+            codes, values = pd.factorize(clinvar_df[col].astype("string"), sort=True)
+            np.save(os.path.join(tmp_dir, f"{col}.codes.npy"), codes.astype(np.int32))
+            categories[col] = [str(value) for value in values]
+        # index of AlleleID: the sorted AlleleIDs and their row numbers
+        allele_order = np.argsort(clinvar_df["AlleleID"].to_numpy(dtype=np.int64), kind="stable")
+        np.save(os.path.join(tmp_dir, "AlleleID.order.npy"), allele_order)
+        np.save(os.path.join(tmp_dir, "AlleleID.sorted.npy"), clinvar_df["AlleleID"].to_numpy(dtype=np.int64)[allele_order])
+        with open(os.path.join(tmp_dir, "store.json"), "w") as f:
+            json.dump({"version": STORE_VERSION, "rows": len(clinvar_df), "columns": columns, "categories": categories,
+                       "source_hash": source_hash}, f)
+        # the old store is renamed aside and only removed once the new one is in place
+        old_dir = f"{tmp_dir[:-len('.tmp')]}.old.tmp"
+        try:
+            os.replace(store_dir, old_dir)
+        except FileNotFoundError:
+            old_dir = None
+        try:
+            os.replace(tmp_dir, store_dir)
+        except OSError:
+            # another thread or process put the same store in place first, its store is kept
+            if not os.path.isdir(store_dir):
+                raise
+        if old_dir is not None:
+            shutil.rmtree(old_dir, ignore_errors=True)
+    finally:
+        if os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+    return store_dir
+
+
+class ClinVarStore:
+    """
+    The indexed store of ClinVar_to_SNP.txt, every array is memory-mapped and only read from disk when it is used.
+    """
+
+    def __init__(self, store_dir):
+        with open(os.path.join(store_dir, "store.json")) as f:
+            self.description = json.load(f)
+        if self.description["version"] != STORE_VERSION:
+            raise ValueError(f"The store {store_dir} has version {self.description['version']}, please build it again with this version of ClinVar_Store.py.")
+        self.store_dir = store_dir
+        # the memory maps are opened once, the store can be shared by the sessions (see ClinVar_Resource)
+        self._arrays = {}
+        self.columns = self.description["columns"]
+        self.categories = self.description["categories"]
+        self.rsID = self._load("rsID.npy")
+        self.rsid_unique = self._load("rsID.unique.npy")
+        self.rsid_start = self._load("rsID.start.npy")
+        self.file_row = self._load("FileRow.npy")
+        self.allele_order = self._load("AlleleID.order.npy")
+        self.allele_sorted = self._load("AlleleID.sorted.npy")
+
+    def _load(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.store_dir, name), mmap_mode="r")
+        return self._arrays[name]
+
+    def map_all(self):
+        """
+        Function:
+            memory-map every array of the store now, nothing is read from disk until it is used
+        Output:
+            the store
+        """
+        for name in os.listdir(self.store_dir):
+            if name.endswith(".npy"):
+                self._load(name)
+        return self
+
+    def __len__(self):
+        return self.description["rows"]
+
+    def contains(self, rsids):
+        """
+        Function:
+            check which rsIDs are in the store
+        Input:
+            rsids: integer rsIDs
+        Output:
+            numpy boolean array
+        """
+        return self._find(rsids)[1]
+
+    def _find(self, rsids):
+        # the position of every rsID in the unique rsIDs of the join index and whether it is found
+        rsids = np.asarray(rsids, dtype=np.int64)
+        position = np.searchsorted(self.rsid_unique, rsids)
+        found = position < len(self.rsid_unique)
+        found[found] = self.rsid_unique[position[found]] == rsids[found]
+        return position, found
+
+    def row_range(self, rsid):
+        """
+        Function:
+            the rows of one rsID, the rows of the same rsID are next to each other
+        Input:
+            rsid: integer rsID
+        Output:
+            the first row and the row after the last row
+        """
+        position, found = self._find([rsid])
+        if not found[0]:
+            start = int(np.searchsorted(self.rsID, rsid))
+            return start, start
+        return int(self.rsid_start[position[0]]), int(self.rsid_start[position[0] + 1])
+
+    def lookup_rsids(self, rsids):
+        """
+        Function:
+            batch lookup of rsIDs, an rsID can have several rows (several AlleleIDs or alternate alleles)
+        Input:
+            rsids: integer rsIDs
+        Output:
+            two numpy arrays of the same length: the position of the query rsID and the matching store row, in the order of the query
+        """
+        position, found = self._find(rsids)
+        # the row range of every found rsID from the join index, the rsIDs that are not found have no rows
+        start = np.zeros(len(position), dtype=np.int64)
+        end = np.zeros(len(position), dtype=np.int64)
+        start[found] = self.rsid_start[position[found]]
+        end[found] = self.rsid_start[position[found] + 1]
+        counts = end - start
+        query = np.repeat(np.arange(len(rsids)), counts)
+        # the row numbers of every range: start of the range plus the position inside the range
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return query, np.repeat(start, counts) + offsets
+
+    def lookup_alleleids(self, alleleids):
+        """
+        Function:
+            batch lookup of AlleleIDs
+        Input:
+            alleleids: integer AlleleIDs
+        Output:
+            numpy array with the store row of every AlleleID, -1 if the AlleleID is not in the store
+        """
+        alleleids = np.asarray(alleleids, dtype=np.int64)
+        position = np.searchsorted(self.allele_sorted, alleleids)
+        rows = np.full(len(alleleids), -1, dtype=np.int64)
+        found = position < len(self.allele_sorted)
+        found[found] = self.allele_sorted[position[found]] == alleleids[found]
+        rows[found] = self.allele_order[position[found]]
+        return rows
+
+    def codes(self, name, rows=None):
+        """
+        Function:
+            read the integer codes of a column saved with categories (CODED_COLUMNS)
+        Input:
+            name: the column name
+            rows: the store rows, default is all rows
+        Output:
+            numpy int32 array, the index in self.categories[name], -1 for missing values
+        """
+        values = self._load(f"{name}.codes.npy")
+        return np.asarray(values if rows is None else values[rows])
+
+    def column(self, name, rows=None):
+        """
+        Function:
+            read the values of one column. Every different store row is decoded once, the repeated rows share the same value.
+        Input:
+            name: the column name
+            rows: the store rows, default is all rows
+        Output:
+            numpy array, text columns are object arrays with None for missing values
+        """
+        if self.columns[name] == "int64":
+            values = self._load(f"{name}.npy")
+            return np.asarray(values if rows is None else values[rows])
+        if rows is not None:
+            # a joined table has the same store row many times, for example one row per sample
+            unique_rows, inverse = np.unique(np.asarray(rows, dtype=np.int64), return_inverse=True)
+            return self._decode(name, unique_rows)[inverse]
+        return self._decode(name, np.arange(len(self)))
+
+    def _decode(self, name, rows):
+        data = self._load(f"{name}.data.npy")
+        offsets = self._load(f"{name}.offsets.npy")
+        missing = self._load(f"{name}.missing.npy")
+        starts = offsets[rows]
+        ends = offsets[rows + 1]
+        return np.array([None if m else bytes(data[s:e]).decode("utf-8")
+                         for s, e, m in zip(starts, ends, missing[rows])], dtype=object)
+
+    def missing(self, name):
+        """
+        Function:
+            the number of missing values of a text column
+        Input:
+            name: the column name
+        Output:
+            integer
+        """
+        return int(self._load(f"{name}.missing.npy").sum()) if self.columns[name] == "str" else 0
+
+    def take(self, rows, columns=None):
+        """
+        Function:
+            read the store rows as a DataFrame
+        Input:
+            rows: the store rows
+            columns: the column names, default is all columns of ClinVar_to_SNP.txt
+        Output:
+            DataFrame
+        """
+        return pd.DataFrame({col: self.column(col, rows) for col in (columns or OUTPUT_COLUMNS)})
+
+
+def store_path(key, cache_dir=None):
+    """
+    Function:
+        the directory of the store of a ClinVar_to_SNP.txt file in the cache directory
+    Input:
+        key: the hash of ClinVar_to_SNP.txt
+        cache_dir: the cache directory, default is ClinVar_Cache.CACHE_DIR
+    Output:
+        the directory of the store
+    """
+    return os.path.join(cache_dir or ClinVar_Cache.CACHE_DIR, f"ClinVar_to_SNP_v{STORE_VERSION}_{key}{STORE_SUFFIX}")
+
+
+@Stage_Metrics.timed("open_store")
+def open_store(source, cache_dir=None):
+    """
+    Function:
+        open the store of ClinVar_to_SNP.txt, build it first if it is not in the cache directory yet.
+        A directory that already is a store is opened directly.
+    Input:
+        source: the path of ClinVar_to_SNP.txt or of a store directory, or an uploaded file object
+        cache_dir: the cache directory, default is ClinVar_Cache.CACHE_DIR
+    Output:
+        ClinVarStore
+    """
+    if isinstance(source, (str, os.PathLike)) and os.path.isdir(source):
+        return ClinVarStore(source)
+    key = ClinVar_Cache.file_hash(source)
+    path = store_path(key, cache_dir)
+    if os.path.isdir(path):
+        # mark the store as recently used for the eviction
+        os.utime(path)
+    else:
+        build_store(read_clinvar_to_snp(source), path, key)
+        ClinVar_Cache.evict(cache_dir=cache_dir, keep=(path,))
+    return ClinVarStore(path)
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        sys.exit("Usage: python ClinVar_Store.py ClinVar_to_SNP.txt [store_directory]")
+    input_file = sys.argv[1]
+    if not os.path.isfile(input_file):
+        sys.exit(f"Error: The input file {input_file} is NOT FOUND !")
+    if len(sys.argv) == 3:
+        store_dir = build_store(read_clinvar_to_snp(input_file), sys.argv[2], ClinVar_Cache.file_hash(input_file))
+    else:
+        store_dir = open_store(input_file).store_dir
+    print(f"The store of {input_file} is {store_dir}")
+
+
+if __name__ == "__main__":
+    main()
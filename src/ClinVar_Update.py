@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: ClinVar_Update.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    ClinVar publishes a new variant_summary.txt.gz every month. This script updates the output of the page "Filter ClinVar Dataset" (ClinVar_to_SNP.txt)
+    and the downstream marker tables (Ancient_ClinVar_Markers.txt, Test_ClinVar_Markers.txt) from the difference between the previous and the new release,
+    instead of running the whole workflow again.
+    Both releases are read through the ClinVar_Cache, so the previous release is a memory-mapped open of its cached table.
+    The variants are compared by AlleleID: every row gets a hash of the columns used by the filters and the output file,
+    AlleleIDs only in the new release are "added", AlleleIDs only in the previous release are "removed", and AlleleIDs with a different hash are "changed".
+    Only the rows of these AlleleIDs are removed from or added to ClinVar_to_SNP.txt, the other rows are kept as they are,
+    and the new rows are put where the filter would have written them (the order of the new release), so the file is the same as a new run of the filter.
+    Limitation: ClinVar does not publish the difference between two releases, so both releases are read in full (from the cache) and every row is hashed,
+    this part costs the size of a release and not the size of the difference. The output files are text files, a file with removed or added rows is written again
+    (the size of the output file, much smaller than a release), a file without a change is not touched.
+    A marker table is only called again for the rsIDs of its kept markers and of the new ClinVar rows: a small store of these ClinVar rows is built,
+    and the genotype file (text, genotype matrix or VCF) is read and checked by the same functions as the pages (Pipeline_Steps), so the table is the same as a new run.
+
+Imported modules:
+    - pandas: used for data manipulation and analysis.
+    - numpy: to compare the row hashes
+    - argparse: to parse command-line arguments and options
+    - os: to check file status in directory
+    - sys: to control over the Python runtime environment
+    - ClinVar_Reader, ClinVar_Cache: to read the ClinVar releases through the cache and to apply the same filters as the page "Filter ClinVar Dataset"
+    - tempfile: the directory of the small store of the ClinVar rows called again
+    - ClinVar_Store, ClinVar_Resource: the store of the ClinVar rows called again, dropped from the shared resources at the end
+    - Pipeline_Steps, Marker_Caller: to read, check and call the genotypes of a marker table like the pages
+
+Procedures:
+    1. perform error checks before continuing next steps.
+    2. load both releases from the cache and compute the row hash of every AlleleID of the selected assembly.
+    3. find the added, removed and changed AlleleIDs.
+    4. remove the rows of the removed and changed AlleleIDs from ClinVar_to_SNP.txt, then add the rows of the added and changed AlleleIDs that pass the filters
+       in the order of the new release.
+    5. call every marker table again for the rsIDs of its kept markers and of the new ClinVar rows, from the genotype file the marker table was made from.
+    6. write the report of the changed variants.
+
+Inputfile:
+    variant_summary.txt.gz of the previous release, variant_summary.txt.gz of the new release, ClinVar_to_SNP.txt
+    optional: pairs of marker table and genotype file, for example Ancient_ClinVar_Markers.txt Ancient_samples_filtered_rsID.txt
+Outputfile:
+    ClinVar_to_SNP.txt and the marker tables are updated in place
+    default = ClinVar_Update_Report.txt
+Usage:
+        python ClinVar_Update.py previous_variant_summary.txt.gz new_variant_summary.txt.gz ClinVar_to_SNP.txt [--markers MARKERS GENOTYPES] [--correct-flips] [--report ClinVar_Update_Report.txt]
+    ---------- Examples:
+        python ClinVar_Update.py variant_summary_2025-03.txt.gz variant_summary_2025-04.txt.gz ClinVar_to_SNP.txt
+        python ClinVar_Update.py variant_summary_2025-03.txt.gz variant_summary_2025-04.txt.gz ClinVar_to_SNP.txt --markers Ancient_ClinVar_Markers.txt Ancient_samples_filtered_rsID.txt --markers Test1_ClinVar_Markers.txt Test1_DNA.txt
+
+"""
+import argparse
+import os
+import sys
+import tempfile
+# make sure the module is installed
+try:
+    import numpy as np
+    import pandas as pd
+    import ClinVar_Cache
+    from ClinVar_Reader import (DEFAULT_CLIN_SIGNIFICANCE, DEFAULT_REVIEW_STATUS, OUTPUT_COLUMNS, filter_clinvar_data,
+                                load_variant_summary, read_clinvar_to_snp)
+    from ClinVar_Resource import POOL, shared_store
+    from ClinVar_Store import build_store
+    from Marker_Caller import call_markers
+    from Pipeline_Steps import ANCIENT_COLUMNS, check_genotypes, read_genotypes, user_markers
+except ImportError as e:
+    sys.exit(f"ERROR: Python module not installed. {e}")
+
+# the columns compared between the two releases, a change in any of them can change the output files
+COMPARED_COLUMNS = ['Type', 'Assembly'] + OUTPUT_COLUMNS
+
+
+def load_release(source, assembly):
+    """
+    Function:
+        load a ClinVar release from the cache and keep the rows of the selected assembly
+    Input:
+        source: the path of variant_summary.txt(.gz)
+        assembly: the selected assembly, for example GRCh37
+    Output:
+        DataFrame indexed by AlleleID
+    """
+    table, path = load_variant_summary(source)
+    categories = ClinVar_Cache.read_metadata(path)["categories"]
+    df = ClinVar_Cache.table_to_pandas(table, categories)
+    df = df[df["Assembly"] == assembly]
+    return df.set_index("AlleleID", drop=False)
+
+
+def row_hashes(df):
+    """
+    Function:
+        hash the compared columns of every row, then combine the hashes of the rows with the same AlleleID
+    Input:
+        df: DataFrame from load_release
+    Output:
+        pandas Series AlleleID -> uint64 hash
+    """
+    # categorical columns are hashed by their values, so the different categories of the two releases do not matter
+    hashes = pd.util.hash_pandas_object(df[COMPARED_COLUMNS], index=False)
+    # the sum does not depend on the order of the rows with the same AlleleID
+    return hashes.groupby(df.index.to_numpy()).sum()
+
+
+def diff_releases(old_df, new_df):
+    """
+    Function:
+        find the added, removed and changed AlleleIDs between two releases
+    Input:
+        old_df, new_df: DataFrames from load_release
+    Output:
+        three numpy arrays: added, removed and changed AlleleIDs
+    """
+    old_hashes = row_hashes(old_df)
+    new_hashes = row_hashes(new_df)
+    added = np.setdiff1d(new_hashes.index.to_numpy(), old_hashes.index.to_numpy())
+    removed = np.setdiff1d(old_hashes.index.to_numpy(), new_hashes.index.to_numpy())
+    common = np.intersect1d(old_hashes.index.to_numpy(), new_hashes.index.to_numpy())
+    changed = common[old_hashes.loc[common].to_numpy() != new_hashes.loc[common].to_numpy()]
+    return added, removed, changed
+
+
+def write_in_place(df, output_file):
+    """
+    Function:
+        write a DataFrame to a tab-delimited file, through a temporary file so an interrupted update never leaves a half-written file
+    Input:
+        df: DataFrame
+        output_file: the path of the file to replace
+    """
+    tmp_file = f"{output_file}.tmp"
+    df.to_csv(tmp_file, sep="\t", index=False)
+    os.replace(tmp_file, output_file)
+
+
+def patch_markers(markers_file, genotypes_file, clinvar_df, stale_ids, fresh_ids, correct_flips=False):
+    """
+    Function:
+        update a marker table: call it again for the rsIDs of its kept markers and of the new ClinVar rows, the other rsIDs have no marker before and after the update
+    Input:
+        markers_file: the marker table, Ancient_ClinVar_Markers.txt (with Master_ID) or Test_ClinVar_Markers.txt
+        genotypes_file: the genotype file the marker table was made from, Ancient_samples_filtered_rsID.txt, a genotype matrix, a VCF file or Test_DNA.txt
+        clinvar_df: the updated ClinVar_to_SNP.txt
+        stale_ids: the removed and changed AlleleIDs
+        fresh_ids: the added and changed AlleleIDs
+        correct_flips: the marker table was called with the strand flips corrected
+    Output:
+        the number of removed rows and the number of added rows, the marker table is only written again if one of them is not 0
+    """
+    markers_df = pd.read_csv(markers_file, sep="\t", header=0)
+    removed_count = int(markers_df["AlleleID"].isin(stale_ids).sum())
+    kept_rsids = markers_df.loc[~markers_df["AlleleID"].isin(stale_ids), "rsID"]
+    fresh_rsids = clinvar_df.loc[clinvar_df["AlleleID"].isin(fresh_ids), "rsID"]
+    if not removed_count and fresh_rsids.empty:
+        return 0, 0
+    # all ClinVar rows of these rsIDs in the order of the file, so the rows of an rsID are joined in the same order as with the whole file
+    called_df = clinvar_df[clinvar_df["rsID"].isin(np.union1d(kept_rsids.to_numpy(dtype=np.int64), fresh_rsids.to_numpy(dtype=np.int64)))]
+    if called_df.empty:
+        updated_df = markers_df.iloc[0:0]
+    else:
+        with tempfile.TemporaryDirectory(prefix="ClinVar_Update_") as tmp_dir:
+            store_dir = os.path.join(tmp_dir, "called.store")
+            build_store(called_df.reset_index(drop=True), store_dir)
+            try:
+                if "Master_ID" in markers_df.columns:
+                    # like Pipeline_Steps.ancient_markers, a genotype matrix or a VCF file without these rsIDs has no marker
+                    clinvar_store = shared_store(store_dir)
+                    genotype_df = read_genotypes(genotypes_file, clinvar_store)
+                    if genotype_df.empty:
+                        updated_df = markers_df.iloc[0:0]
+                    else:
+                        genotype_df, _ = check_genotypes(genotype_df, ANCIENT_COLUMNS)
+                        updated_df = call_markers(genotype_df, clinvar_store, correct_flips)
+                else:
+                    updated_df = user_markers(genotypes_file, store_dir, correct_flips)
+            finally:
+                # the store is removed with the temporary directory
+                POOL.discard(os.path.abspath(store_dir))
+    added_count = int(updated_df["AlleleID"].isin(fresh_ids).sum())
+    if removed_count or added_count:
+        write_in_place(updated_df, markers_file)
+    return removed_count, added_count
+
+
+def update_release(old_release, new_release, clinvar_to_snp, markers, report_file, assembly,
+                   clin_significance, review_status, phenotype_list_required, correct_flips=False):
+    """
+    Function:
+        update ClinVar_to_SNP.txt and the marker tables from the difference between two ClinVar releases
+    Input:
+        old_release, new_release: the paths of variant_summary.txt(.gz) of the previous and the new release
+        clinvar_to_snp: the path of ClinVar_to_SNP.txt made from the previous release
+        markers: list of (marker table, genotype file) pairs
+        report_file: the path of the report of the changed variants
+        assembly, clin_significance, review_status, phenotype_list_required: the filtering parameters used for ClinVar_to_SNP.txt
+        correct_flips: the marker tables were called with the strand flips corrected
+    Raise error:
+        check if the input files exist or not
+    Output:
+        dictionary with the number of added, removed and changed variants
+    """
+    # Step 1: perform error checks before continuing next steps
+    for input_file in [old_release, new_release, clinvar_to_snp] + [path for pair in markers for path in pair]:
+        if not os.path.isfile(input_file):
+            print(f"Error: The input file {input_file} is NOT FOUND !")
+            return None
+    # Step 2: load both releases from the cache
+    old_df = load_release(old_release, assembly)
+    new_df = load_release(new_release, assembly)
+    # Step 3: find the added, removed and changed AlleleIDs
+    added, removed, changed = diff_releases(old_df, new_df)
+    stale_ids = np.concatenate([removed, changed])
+    fresh_ids = np.concatenate([added, changed])
+    print(f"Added: {len(added)}, Removed: {len(removed)}, Changed: {len(changed)} variants in {assembly}")
+    # Step 4: patch ClinVar_to_SNP.txt, only the rows of the stale and fresh AlleleIDs are touched
+    SNP_df = read_clinvar_to_snp(clinvar_to_snp)
+    before_count = len(SNP_df)
+    SNP_df = SNP_df[~SNP_df["AlleleID"].isin(stale_ids)]
+    # the position of every row in the new release, the filter writes the rows in this order
+    positions = np.arange(len(new_df))
+    is_fresh = new_df.index.isin(fresh_ids)
+    fresh_df = new_df[is_fresh].set_index(positions[is_fresh])
+    new_rows = filter_clinvar_data(fresh_df, assembly, clin_significance, review_status, phenotype_list_required)[OUTPUT_COLUMNS]
+    new_rows = new_rows.astype({"ClinicalSignificance": str, "ReviewStatus": str})
+    # the file is only written again if a row is removed or added
+    if len(SNP_df) < before_count or len(new_rows):
+        # a kept row is put at the first row of its AlleleID in the new release, the rows of an AlleleID keep the order of the file
+        first_positions = pd.Series(positions, index=new_df.index)
+        first_positions = first_positions[~first_positions.index.duplicated()]
+        kept_positions = first_positions.reindex(SNP_df["AlleleID"]).fillna(len(new_df)).to_numpy(dtype=np.int64)
+        order = np.argsort(np.concatenate([kept_positions, new_rows.index.to_numpy(dtype=np.int64)]), kind="stable")
+        SNP_df = pd.concat([SNP_df, new_rows], ignore_index=True).iloc[order]
+        write_in_place(SNP_df, clinvar_to_snp)
+    print(f"{clinvar_to_snp}: {before_count} -> {len(SNP_df)} rows")
+    # Step 5: patch the marker tables
+    for markers_file, genotypes_file in markers:
+        removed_count, added_count = patch_markers(markers_file, genotypes_file, SNP_df, stale_ids, fresh_ids, correct_flips)
+        print(f"{markers_file}: {removed_count} rows removed, {added_count} rows added")
+    # Step 6: write the report of the changed variants
+    report_rows = []
+    # one row per AlleleID in the report
+    old_df = old_df[~old_df.index.duplicated()]
+    new_df = new_df[~new_df.index.duplicated()]
+    for change, ids in (("added", added), ("removed", removed), ("changed", changed)):
+        old_part = old_df.reindex(ids)
+        new_part = new_df.reindex(ids)
+        report_rows.append(pd.DataFrame({
+            "AlleleID": ids,
+            "rsID": new_part["rsID"].fillna(old_part["rsID"]).astype("int64").to_numpy(),
+            "Change": change,
+            "Old_ClinicalSignificance": old_part["ClinicalSignificance"].to_numpy(),
+            "New_ClinicalSignificance": new_part["ClinicalSignificance"].to_numpy(),
+            "Old_ReviewStatus": old_part["ReviewStatus"].to_numpy(),
+            "New_ReviewStatus": new_part["ReviewStatus"].to_numpy(),
+            "In_ClinVar_to_SNP": np.isin(ids, new_rows["AlleleID"].to_numpy()),
+        }))
+    pd.concat(report_rows, ignore_index=True).to_csv(report_file, sep="\t", index=False)
+    return {"added": len(added), "removed": len(removed), "changed": len(changed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='ClinVar_Update.py', description="update ClinVar_to_SNP.txt and the marker tables from the difference between two ClinVar releases")
+    parser.add_argument("old_release", type=str, help="Path to variant_summary.txt(.gz) of the previous release")
+    parser.add_argument("new_release", type=str, help="Path to variant_summary.txt(.gz) of the new release")
+    parser.add_argument("ClinVar_to_SNP", type=str, help="Path to ClinVar_to_SNP.txt made from the previous release, updated in place")
+    parser.add_argument("--markers", nargs=2, action="append", default=[], metavar=("MARKERS", "GENOTYPES"),
+                        help="a marker table to update in place and the genotype file it was made from, can be repeated")
+    parser.add_argument("--report", type=str, default="ClinVar_Update_Report.txt", help="the report of the changed variants, tab-delimited")
+    parser.add_argument("--assembly", type=str, default="GRCh37", help="the assembly used for ClinVar_to_SNP.txt")
+    parser.add_argument("--clin-significance", nargs="+", default=DEFAULT_CLIN_SIGNIFICANCE, help="the selected ClinicalSignificance values")
+    parser.add_argument("--review-status", nargs="+", default=DEFAULT_REVIEW_STATUS, help="the selected ReviewStatus values")
+    parser.add_argument("--keep-not-provided", action="store_true", help="keep the variants whose PhenotypeList is 'not provided'")
+    parser.add_argument("--correct-flips", action="store_true", help="the marker tables were called with the strand flips corrected")
+    args = parser.parse_args()
+    if not ClinVar_Cache.HAS_ARROW:
+        sys.exit("ERROR: Python module not installed. pyarrow is needed to keep the cached ClinVar releases.")
+    update_release(args.old_release, args.new_release, args.ClinVar_to_SNP, args.markers, args.report, args.assembly,
+                   args.clin_significance, args.review_status, not args.keep_not_provided, args.correct_flips)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: Genotype_Matrix.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module saves the genotypes of the page "Convert .ped and .map File to Extract rsID" as a compact binary genotype matrix (.geno),
+    instead of the long table Ancient_samples_filtered_rsID.txt that repeats Master_ID, rsID, Chromosome and Position for every genotype.
+    The matrix has one row per sample and one column per SNP, every genotype is one byte (uint8): the pair of allele codes of the .ped file,
+    5 * allele1 + allele2 with the codes 0, A, T, C, G, so 0 is the missing genotype "00" and the order of the alleles is kept.
+    The sample table (Master_ID) and the SNP table (rsID, Chromosome, Position) are saved once, at the end of the file.
+    The file layout is:
+        8 bytes   magic number b"CVSGENO" + version
+        8 bytes   offset of the tables (little-endian unsigned integer)
+        samples x SNPs bytes of the matrix, sample by sample
+        the tables as JSON
+    The matrix starts at a fixed offset, so an uncompressed .geno file is opened with numpy.memmap. A .geno.gz file is the same file compressed with gzip,
+    it is decompressed as a stream into the array of the matrix when opened. The pages "Identify Ancients" and "Find Shared" read both directly.
+
+Imported modules:
+    - numpy: to write and memory-map the matrix
+    - pandas: used for data manipulation and analysis.
+    - gzip, json, os, shutil, struct: to write, compress and read the file
+    - argparse, sys: to parse command-line arguments and options
+    - PLINK_Reader: to decode the .ped file chunk by chunk, or the selected SNPs and samples of the .bed file
+    - ClinVar_Store: to select the SNPs of the .bed file that are in ClinVar_to_SNP.txt
+
+Procedures:
+    1. write the header, then append the rows of the matrix chunk by chunk, then write the tables and their offset.
+    2. optionally compress the file with gzip.
+    3. open the file (memory-mapped if not compressed) and convert the selected SNPs to the long table.
+
+Usage:
+        python Genotype_Matrix.py ped map_file ped_file [output_file]
+        python Genotype_Matrix.py bed bfile ClinVar_to_SNP.txt [output_file] [--keep Ancient_samples.txt]
+        the output file is compressed with gzip if its name ends with .gz
+    ---------- Examples:
+        python Genotype_Matrix.py ped Ancient_samples_filtered.map Ancient_samples_filtered.ped Ancient_samples_filtered.geno.gz
+        python Genotype_Matrix.py bed v54.1_1240K_public ClinVar_to_SNP.txt Ancient_samples_filtered.geno.gz --keep Ancient_samples.txt
+
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import struct
+import sys
+import numpy as np
+import pandas as pd
+from ClinVar_Store import open_store
+from PLINK_Reader import (DEFAULT_PED_CHUNK, PED_GENOTYPES, PED_NUCLEOTIDES, decode_genotypes, decode_ped_rows, iter_ped_lines,
+                          long_table, open_bed, read_bim, read_fam, read_map, select_samples, select_variants)
+
+GENO_MAGIC = b"CVSGENO\x01"
+GENO_VERSION = 1
+# the matrix starts after the magic number and the offset of the tables
+MATRIX_OFFSET = 16
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+class GenotypeMatrixWriter:
+    """
+    Write a .geno file chunk by chunk: the SNP table is known at the start, the samples are appended chunk by chunk.
+    Use it with "with", the tables are written when the writer is closed.
+    """
+
+    def __init__(self, output_file, snps, compress=False):
+        self.output_file = output_file
+        self.compress = compress
+        self.snps = snps[["rsID", "Chromosome", "Position"]].reset_index(drop=True)
+        self.master_ids = []
+        # the file is written under a temporary name and renamed at the end
+        self.tmp_file = f"{output_file}.{os.getpid()}.tmp"
+        self.f = open(self.tmp_file, "wb")
+        self.f.write(GENO_MAGIC + struct.pack("<Q", 0))
+
+    def write(self, master_ids, codes):
+        """
+        Function:
+            append the genotypes of a chunk of samples
+        Input:
+            master_ids: the Master_ID of every sample
+            codes: numpy uint8 array of shape (samples, SNPs), the genotype codes 5 * allele1 + allele2
+        Raise error:
+            check if the number of SNPs matches the SNP table
+        """
+        if codes.shape[1] != len(self.snps):
+            raise ValueError(f"The genotypes have {codes.shape[1]} SNPs but the SNP table has {len(self.snps)} SNPs.")
+        self.f.write(np.ascontiguousarray(codes, dtype=np.uint8).tobytes())
+        self.master_ids.extend(str(master_id) for master_id in master_ids)
+
+    def close(self):
+        tables = {"version": GENO_VERSION, "samples": self.master_ids,
+                  "snps": {col: self.snps[col].astype(str).tolist() for col in self.snps.columns}}
+        offset = self.f.tell()
+        self.f.write(json.dumps(tables).encode("utf-8"))
+        # the offset of the tables is written in the header at the end
+        self.f.seek(len(GENO_MAGIC))
+        self.f.write(struct.pack("<Q", offset))
+        self.f.close()
+        if self.compress:
+            # without file name and time in the gzip header, the same genotypes give the same file
+            with open(self.tmp_file, "rb") as src, open(f"{self.tmp_file}.gz", "wb") as raw, \
+                    gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0) as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(f"{self.tmp_file}.gz", self.tmp_file)
+        os.replace(self.tmp_file, self.output_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+            os.remove(self.tmp_file)
+
+
+class GenotypeMatrix:
+    """
+    An opened .geno file: the sample table, the SNP table and the matrix (memory-mapped if the file is not compressed).
+    """
+
+    def __init__(self, master_ids, snps, codes):
+        self.master_ids = master_ids
+        self.snps = snps
+        self.codes = codes
+
+    def __len__(self):
+        return len(self.master_ids)
+
+    def genotype_count(self):
+        """
+        Function:
+            the number of genotypes that are not missing, the number of rows of the long table
+        Output:
+            integer
+        """
+        return int(np.count_nonzero(self.codes))
+
+    def head(self, n_rows=10):
+        """
+        Function:
+            the first rows of the long table for preview, only the first samples are read
+        Input:
+            n_rows: the number of rows
+        Output:
+            DataFrame with the columns Master_ID, rsID, Chromosome, Position, Genotype
+        """
+        # every sample has at most one row per SNP, read more samples in case of missing genotypes
+        first = GenotypeMatrix(self.master_ids[:n_rows * 10], self.snps, self.codes[:n_rows * 10])
+        return first.long_table().head(n_rows)
+
+    def long_table(self, snp_idx=None):
+        """
+        Function:
+            convert the matrix to the long table of the page "Convert .ped and .map File to Extract rsID", the missing genotypes are left out
+        Input:
+            snp_idx: the columns (SNPs) to convert, default is all SNPs. Only these columns are read from the file.
+        Output:
+            DataFrame with the columns Master_ID, rsID, Chromosome, Position, Genotype, sample by sample
+        """
+        snp_idx = np.arange(len(self.snps)) if snp_idx is None else np.sort(np.asarray(snp_idx, dtype=np.int64))
+        snps = self.snps.iloc[snp_idx].reset_index(drop=True)
+        codes = np.asarray(self.codes[:, snp_idx])
+        sample_pos, snp_pos = np.nonzero(codes)
+        return long_table(self.master_ids, snps, sample_pos, snp_pos, PED_GENOTYPES[codes[sample_pos, snp_pos]])
+
+
+def is_genotype_matrix(source):
+    """
+    Function:
+        check if the file is a .geno file (compressed or not)
+    Input:
+        source: the path of the file or an uploaded file object
+    Output:
+        True or False
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            head = f.read(len(GENO_MAGIC))
+    else:
+        head = source.read(len(GENO_MAGIC))
+        source.seek(0)
+    if head[:2] == GZIP_MAGIC:
+        if isinstance(source, (str, os.PathLike)):
+            with gzip.open(source, "rb") as f:
+                head = f.read(len(GENO_MAGIC))
+        else:
+            head = gzip.GzipFile(fileobj=source).read(len(GENO_MAGIC))
+            source.seek(0)
+    return head[:7] == GENO_MAGIC[:7]
+
+
+def _check_header(header):
+    # the magic number, the version and the offset of the tables
+    if header[:7] != GENO_MAGIC[:7]:
+        raise ValueError("The file is not a genotype matrix (.geno) file.")
+    if header[7] != GENO_VERSION:
+        raise ValueError(f"The genotype matrix has version {header[7]}, this version of ClinVar-SMART reads version {GENO_VERSION}.")
+    return struct.unpack("<Q", header[len(GENO_MAGIC):MATRIX_OFFSET])[0]
+
+
+def _read_tables(tables):
+    master_ids = np.array(tables["samples"], dtype=object)
+    snps = pd.DataFrame(tables["snps"])
+    snps["Position"] = snps["Position"].astype(np.int64)
+    return master_ids, snps
+
+
+def _read_stream(stream):
+    # the header, the matrix and the tables are read in the order of the file, the matrix is read directly into its array
+    offset = _check_header(stream.read(MATRIX_OFFSET))
+    codes = np.empty(offset - MATRIX_OFFSET, dtype=np.uint8)
+    view = memoryview(codes)
+    filled = 0
+    while filled < len(codes):
+        count = stream.readinto(view[filled:])
+        if not count:
+            raise ValueError("The genotype matrix file is truncated.")
+        filled += count
+    master_ids, snps = _read_tables(json.loads(stream.read()))
+    return GenotypeMatrix(master_ids, snps, codes.reshape(len(master_ids), len(snps)))
+
+
+def open_matrix(source):
+    """
+    Function:
+        open a .geno file, an uncompressed file on disk is memory-mapped, the other files are read as a stream:
+        a .geno.gz file is decompressed block by block, so only the decompressed matrix is kept in memory, not the whole compressed file as well
+    Input:
+        source: the path of the .geno or .geno.gz file or an uploaded file object
+    Raise error:
+        check the magic number and the version of the file
+    Output:
+        GenotypeMatrix
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            header = f.read(MATRIX_OFFSET)
+        if header[:2] == GZIP_MAGIC:
+            with gzip.open(source, "rb") as stream:
+                return _read_stream(stream)
+        offset = _check_header(header)
+        with open(source, "rb") as f:
+            f.seek(offset)
+            master_ids, snps = _read_tables(json.loads(f.read()))
+        codes = np.memmap(source, dtype=np.uint8, mode="r", offset=MATRIX_OFFSET, shape=(len(master_ids), len(snps)))
+        return GenotypeMatrix(master_ids, snps, codes)
+    head = source.read(2)
+    source.seek(0)
+    try:
+        if head == GZIP_MAGIC:
+            return _read_stream(gzip.GzipFile(fileobj=source))
+        return _read_stream(source)
+    finally:
+        # reset the file pointer after reading
+        source.seek(0)
+
+
+def ped_to_matrix(map_df, ped_file, output_file, chunk_samples=DEFAULT_PED_CHUNK, compress=True):
+    """
+    Function:
+        decode the .ped file chunk by chunk and write the genotypes to a .geno file
+    Input:
+        map_df: DataFrame of the .map file
+        ped_file: the path of the .ped file or an uploaded file object
+        output_file: the path of the .geno file
+        chunk_samples: the number of samples in every chunk
+        compress: compress the file with gzip
+    Output:
+        the number of samples and SNPs
+    """
+    with GenotypeMatrixWriter(output_file, map_df, compress) as writer:
+        for first_index, lines in iter_ped_lines(ped_file, chunk_samples):
+            ped_samples, alleles = decode_ped_rows(lines, first_index, 4 * len(map_df) - 1)
+            writer.write(ped_samples["Master_ID"], alleles[:, 0::2] * 5 + alleles[:, 1::2])
+    return len(writer.master_ids), len(map_df)
+
+
+def bed_codes(bim_snps, genotypes):
+    """
+    Function:
+        convert the decoded genotypes of a .bed file to the genotype codes of the matrix
+    Input:
+        bim_snps: DataFrame of the selected SNPs of the .bim file (Allele1, Allele2)
+        genotypes: the decoded genotypes from PLINK_Reader.decode_genotypes
+    Output:
+        numpy uint8 array of shape (samples, SNPs)
+    """
+    nucleotide = {n: i for i, n in enumerate(PED_NUCLEOTIDES)}
+    # alleles other than A, T, C, G are missing
+    allele1 = bim_snps["Allele1"].map(nucleotide).fillna(0).to_numpy(dtype=np.uint8)
+    allele2 = bim_snps["Allele2"].map(nucleotide).fillna(0).to_numpy(dtype=np.uint8)
+    # the codes of Allele1+Allele1, Allele1+Allele2, Allele2+Allele2 and of the missing genotype
+    table = np.stack([allele1 * 5 + allele1, allele1 * 5 + allele2, allele2 * 5 + allele2, np.zeros_like(allele1)], axis=1)
+    return table[np.arange(len(bim_snps)), genotypes]
+
+
+def bed_to_matrix(bfile, clinvar_file, output_file, keep_file=None, compress=True):
+    """
+    Function:
+        write the genotypes of the ClinVar SNPs and the kept samples of the binary PLINK files to a .geno file
+    Input:
+        bfile: the prefix of the .bed, .bim and .fam files
+        clinvar_file: ClinVar_to_SNP.txt
+        output_file: the path of the .geno file
+        keep_file: the samples to keep, default is all samples
+        compress: compress the file with gzip
+    Output:
+        the number of samples and SNPs
+    """
+    bim_df = read_bim(f"{bfile}.bim")
+    fam_df = read_fam(f"{bfile}.fam")
+    bed = open_bed(f"{bfile}.bed", len(fam_df), len(bim_df))
+    variant_idx = select_variants(bim_df, open_store(clinvar_file))
+    sample_idx = select_samples(fam_df, keep_file)
+    snps = bim_df.iloc[variant_idx].reset_index(drop=True)
+    with GenotypeMatrixWriter(output_file, snps, compress) as writer:
+        writer.write(fam_df["Master_ID"].to_numpy()[sample_idx], bed_codes(snps, decode_genotypes(bed, variant_idx, sample_idx)))
+    return len(sample_idx), len(variant_idx)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Genotype_Matrix.py', description="save the genotypes of a .ped/.map or .bed/.bim/.fam file as a binary genotype matrix (.geno)")
+    subparsers = parser.add_subparsers(dest="input_format", required=True)
+    ped_parser = subparsers.add_parser("ped", help="convert a .ped and .map file")
+    ped_parser.add_argument("map_file", type=str, help="Path to the .map file")
+    ped_parser.add_argument("ped_file", type=str, help="Path to the .ped file")
+    ped_parser.add_argument("output_file", type=str, nargs='?', default="Ancient_samples_filtered.geno.gz", help="the genotype matrix, compressed if the name ends with .gz")
+    bed_parser = subparsers.add_parser("bed", help="extract the ClinVar SNPs of a .bed, .bim and .fam file")
+    bed_parser.add_argument("bfile", type=str, help="the prefix of the .bed, .bim and .fam files, for example v54.1_1240K_public")
+    bed_parser.add_argument("ClinVar_to_SNP", type=str, help="Path to the ClinVar_to_SNP.txt file")
+    bed_parser.add_argument("output_file", type=str, nargs='?', default="Ancient_samples_filtered.geno.gz", help="the genotype matrix, compressed if the name ends with .gz")
+    bed_parser.add_argument("--keep", type=str, default=None, help="the samples to keep (Family_ID and Master_ID), for example Ancient_samples.txt")
+    args = parser.parse_args()
+    if os.path.isfile(args.output_file):
+        sys.exit(f"Error: The output {args.output_file} already exists !. Please remove or rename existing output file")
+    compress = args.output_file.endswith(".gz")
+    try:
+        if args.input_format == "ped":
+            n_samples, n_snps = ped_to_matrix(read_map(args.map_file), args.ped_file, args.output_file, compress=compress)
+        else:
+            n_samples, n_snps = bed_to_matrix(args.bfile, args.ClinVar_to_SNP, args.output_file, args.keep, compress)
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+    print(f"The genotype matrix {args.output_file} contains {n_samples} samples and {n_snps} SNPs.")
+
+
+if __name__ == "__main__":
+    main()
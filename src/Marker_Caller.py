@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: Marker_Caller.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module finds the ClinVar markers of a genotype table (Ancient_samples_filtered_rsID.txt or Test_DNA.txt), like the pages "Identify ... ClinVar Markers".
+    The genotypes are joined to the rows of ClinVar_to_SNP.txt with the same rsID through the join index of the ClinVar store (rsID -> row range),
+    then the alternate alleles of every genotype are counted and only the genotypes with at least one mutated allele are kept.
+    The carriers are found from integer codes only, a carrier is a genotype row and a store row; the ClinVar columns are added at the end,
+    every ClinVar row is decoded once and shared by all its carriers.
+    The alleles are not compared row by row: a table has only a few different (Genotype, AlternateAlleleVCF, ReferenceAlleleVCF) combinations,
+    so the combinations are numbered with pandas.factorize, every combination is classified once and the results are spread back to the rows.
+    The same pass checks the genotype against ReferenceAlleleVCF and AlternateAlleleVCF and finds the genotypes that are on the opposite strand.
+    For large cohorts the genotype table is split into shards of samples that are called by a pool of processes.
+    Every worker memory-maps the same ClinVar store, so the ClinVar table is shared read-only, and the shards are put together in their original order,
+    so the result is the same as calling the whole table in one process.
+
+Imported modules:
+    - numpy: to split the samples into shards
+    - pandas: used for data manipulation and analysis.
+    - concurrent.futures: to call the shards with a pool of processes
+    - ClinVar_Store: indexed store of ClinVar_to_SNP.txt keyed by rsID
+    - Stage_Metrics: the time and the number of markers of every call
+
+Procedures:
+    1. look up the rsIDs of the genotype table in the join index of the ClinVar store, every genotype row gets the row range of its rsID.
+    2. count the alternate alleles of every genotype (Mutation_Status, int8) from the allele codes of the store and keep the carriers with Mutation_Status 1 or 2.
+       Check the alleles of every genotype against ReferenceAlleleVCF and AlternateAlleleVCF, the counts are kept in the attrs of the result.
+    3. build the marker table of the carriers with the ClinVar columns.
+    4. with more than one process, split the samples into shards, call every shard in the pool and put the shards together in order.
+    5. find the markers shared by a user and the ancient samples, same rsID and same Genotype.
+
+"""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import Stage_Metrics
+from ClinVar_Store import ClinVarStore, rsid_to_int
+
+# the columns of ClinVar_to_SNP.txt joined to the genotype table, in the order of the marker tables
+JOIN_COLUMNS = ["AlleleID", "GeneID", "ClinicalSignificance", "ReferenceAlleleVCF", "AlternateAlleleVCF",
+                "NumberSubmitters", "ClinSigSimple", "PhenotypeList", "ReviewStatus"]
+# the columns of the shared markers after rsID, the first row of every rsID
+SHARED_COLUMNS = ["Genotype", "Chromosome", "Position"] + JOIN_COLUMNS + ["Mutation_Status"]
+# a shard has at least this many genotype rows, smaller tables are called in one process
+MIN_SHARD_ROWS = 200000
+# Mutation_Status of a genotype that is not two letters
+UNKNOWN_STATUS = -1
+# the results of the allele check against ReferenceAlleleVCF and AlternateAlleleVCF
+ALLELE_UNCHECKED = -1  # the genotype or the alleles are not single nucleotides A, C, G, T
+ALLELE_OK = 0  # both alleles are the reference or the alternate allele
+ALLELE_PALINDROMIC = 1  # A/T or C/G SNP and the genotype matches both strands, the strand can not be checked
+ALLELE_FLIP = 2  # the alleles only match on the opposite strand
+ALLELE_MISMATCH = 3  # the alleles do not match on either strand
+ALLELE_CHECK_LABELS = {ALLELE_UNCHECKED: "unchecked", ALLELE_OK: "ok", ALLELE_PALINDROMIC: "palindromic",
+                       ALLELE_FLIP: "strand_flip", ALLELE_MISMATCH: "mismatch"}
+COMPLEMENT = {"A": "T", "T": "A", "C": "G", "G": "C"}
+
+
+def classify_allele(genotype, alt_allele, ref_allele=None, correct_flips=False):
+    """
+    Function:
+        classify one (Genotype, AlternateAlleleVCF, ReferenceAlleleVCF) combination, like Filter_mutation on the pages "Identify ... ClinVar Markers".
+        The genotype is checked against the alleles on the same strand and on the opposite strand, it is palindromic only if it matches both,
+        so a genotype of an A/T or C/G SNP that matches neither strand is a mismatch.
+    Input:
+        genotype, alt_allele, ref_allele: the values of one row, ref_allele None skips the allele check
+        correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+    Output:
+        Mutation_Status (2, 1, 0 or UNKNOWN_STATUS) and the allele check (ALLELE_... or None)
+    """
+    if not isinstance(genotype, str) or len(genotype) != 2:
+        return UNKNOWN_STATUS, None if ref_allele is None else ALLELE_UNCHECKED
+    alt_allele = str(alt_allele)
+    status = (genotype[0] == alt_allele) + (genotype[1] == alt_allele)
+    if ref_allele is None:
+        return status, None
+    ref_allele = str(ref_allele)
+    if ref_allele not in COMPLEMENT or alt_allele not in COMPLEMENT or genotype[0] not in COMPLEMENT or genotype[1] not in COMPLEMENT:
+        return status, ALLELE_UNCHECKED
+    alleles = {ref_allele, alt_allele}
+    flipped = "".join(COMPLEMENT[allele] for allele in genotype)
+    direct_match = set(genotype) <= alleles
+    flipped_match = set(flipped) <= alleles
+    # the genotype of an A/T or C/G SNP matches both strands, its strand is ambiguous
+    if direct_match and flipped_match:
+        return status, ALLELE_PALINDROMIC
+    if direct_match:
+        return status, ALLELE_OK
+    if flipped_match:
+        if correct_flips:
+            status = (flipped[0] == alt_allele) + (flipped[1] == alt_allele)
+        return status, ALLELE_FLIP
+    return status, ALLELE_MISMATCH
+
+
+def classify_codes(codes, uniques, correct_flips=False):
+    """
+    Function:
+        count the alternate alleles of every row and check the alleles against the reference, from the integer codes of the values.
+        The codes of the columns are combined into one integer, every different combination is classified once with classify_allele.
+    Input:
+        codes: list of numpy integer arrays of the same length, the codes of Genotype, AlternateAlleleVCF and optionally ReferenceAlleleVCF
+        uniques: the values of the codes of every column, uniques[i][codes[i]] is the value of a row
+        correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+    Output:
+        numpy int8 array of Mutation_Status and numpy int8 array of the allele check (None without ReferenceAlleleVCF)
+    """
+    combined = np.zeros(len(codes[0]), dtype=np.int64)
+    for column_codes, unique in zip(codes, uniques):
+        combined = combined * len(unique) + column_codes
+    combination_codes, combinations = pd.factorize(combined)
+    status = np.empty(len(combinations), dtype=np.int8)
+    check = np.empty(len(combinations), dtype=np.int8)
+    for i, combination in enumerate(combinations):
+        # split the combined integer back into the code of every column
+        parts = []
+        for unique in reversed(uniques):
+            combination, code = divmod(combination, len(unique))
+            parts.append(unique[code])
+        parts.reverse()
+        status[i], allele_check = classify_allele(*parts, correct_flips=correct_flips)
+        check[i] = ALLELE_UNCHECKED if allele_check is None else allele_check
+    return status[combination_codes], None if len(codes) < 3 else check[combination_codes]
+
+
+def classify_genotypes(genotype, alt_allele, ref_allele=None, correct_flips=False):
+    """
+    Function:
+        count the alternate alleles of every genotype and check the alleles against the reference, in one pass over the rows
+    Input:
+        genotype: pandas Series of two-letter genotypes
+        alt_allele: pandas Series of alternate alleles
+        ref_allele: pandas Series of reference alleles, None skips the allele check
+        correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+    Output:
+        numpy int8 array of Mutation_Status and numpy int8 array of the allele check (None without ref_allele)
+    """
+    columns = [genotype, alt_allele] if ref_allele is None else [genotype, alt_allele, ref_allele]
+    factorized = [pd.factorize(values, use_na_sentinel=False) for values in columns]
+    return classify_codes([codes for codes, _ in factorized], [list(unique) for _, unique in factorized], correct_flips)
+
+
+def mutation_status(genotype, alt_allele):
+    """
+    Function:
+        count how many alleles of the genotype are the alternate allele
+    Input:
+        genotype: pandas Series of two-letter genotypes
+        alt_allele: pandas Series of alternate alleles
+    Output:
+        pandas Series of int8, 2 = Homozygous Mutation, 1 = Heterozygous Mutation, 0 = No mutation, -1 = the genotype is not two letters
+    """
+    return pd.Series(classify_genotypes(genotype, alt_allele)[0], index=genotype.index)
+
+
+def allele_check_counts(check):
+    """
+    Function:
+        count the genotypes of every allele check result
+    Input:
+        check: the allele check of classify_genotypes
+    Output:
+        dictionary label -> count
+    """
+    counts = np.bincount(check.astype(np.int64) + 1, minlength=len(ALLELE_CHECK_LABELS))
+    return {label: int(counts[value + 1]) for value, label in ALLELE_CHECK_LABELS.items()}
+
+
+def find_carriers(genotype_df, clinvar_store, correct_flips=False):
+    """
+    Function:
+        find the genotypes that carry the alternate allele of a ClinVar row with the same rsID, an rsID can match several ClinVar rows.
+        The join is an array gather through the join index of the store and the alleles are compared as integer codes,
+        no ClinVar text column is read.
+    Input:
+        genotype_df: DataFrame with the columns rsID (the digits without "rs") and Genotype
+        clinvar_store: ClinVarStore of ClinVar_to_SNP.txt
+        correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+    Output:
+        DataFrame with the columns Genotype_Row (the position in genotype_df), ClinVar_Row (the store row) and Mutation_Status (1 or 2),
+        in the order of genotype_df.merge(ClinVar_to_SNP, on="rsID"), attrs["allele_check"] has the counts of the allele check of all joined rows
+    """
+    query, rows = clinvar_store.lookup_rsids(rsid_to_int(genotype_df["rsID"]))
+    alt_codes = clinvar_store.codes("AlternateAlleleVCF", rows)
+    # the ClinVar rows without AlternateAlleleVCF are removed
+    keep = alt_codes >= 0
+    query, rows, alt_codes = query[keep], rows[keep], alt_codes[keep]
+    genotype_codes, genotypes = pd.factorize(genotype_df["Genotype"], use_na_sentinel=False)
+    # a missing ReferenceAlleleVCF (-1) is the last value, None
+    ref_codes = clinvar_store.codes("ReferenceAlleleVCF", rows)
+    ref_alleles = clinvar_store.categories["ReferenceAlleleVCF"] + [None]
+    ref_codes = np.where(ref_codes < 0, len(ref_alleles) - 1, ref_codes)
+    status, check = classify_codes([genotype_codes[query], alt_codes, ref_codes],
+                                   [list(genotypes), clinvar_store.categories["AlternateAlleleVCF"], ref_alleles], correct_flips)
+    carrier = status > 0
+    carriers_df = pd.DataFrame({"Genotype_Row": query[carrier], "ClinVar_Row": rows[carrier], "Mutation_Status": status[carrier]})
+    carriers_df.attrs["allele_check"] = allele_check_counts(check)
+    return carriers_df
+
+
+def marker_table(genotype_df, carriers_df, clinvar_store):
+    """
+    Function:
+        build the marker table from the carriers: the genotype rows with the ClinVar columns of their store rows.
+        Every ClinVar row is decoded once, the carriers of the same ClinVar row share its values.
+    Input:
+        genotype_df: the genotype table of find_carriers
+        carriers_df: the output of find_carriers
+        clinvar_store: ClinVarStore of ClinVar_to_SNP.txt
+    Output:
+        DataFrame with the columns of genotype_df, JOIN_COLUMNS and Mutation_Status
+    """
+    markers_df = pd.concat([genotype_df.iloc[carriers_df["Genotype_Row"].to_numpy()].reset_index(drop=True),
+                            clinvar_store.take(carriers_df["ClinVar_Row"].to_numpy(), JOIN_COLUMNS)], axis=1)
+    markers_df["Mutation_Status"] = carriers_df["Mutation_Status"].to_numpy()
+    markers_df.attrs["allele_check"] = carriers_df.attrs.get("allele_check", {})
+    return markers_df
+
+
+@Stage_Metrics.timed(rows=len)
+def call_markers(genotype_df, clinvar_store, correct_flips=False):
+    """
+    Function:
+        find the ClinVar markers of the genotype table
+    Input:
+        genotype_df: DataFrame with the columns rsID (the digits without "rs") and Genotype
+        clinvar_store: ClinVarStore of ClinVar_to_SNP.txt
+        correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+    Output:
+        DataFrame of the joined rows with Mutation_Status 1 (Heterozygous Mutation) or 2 (Homozygous Mutation),
+        attrs["allele_check"] has the counts of the allele check of all joined rows
+    """
+    return marker_table(genotype_df, find_carriers(genotype_df, clinvar_store, correct_flips), clinvar_store)
+
+
+@Stage_Metrics.timed(rows=len)
+def shared_markers(user_markers_df, ancient_markers_df):
+    """
+    Function:
+        find the markers the user shares with the ancient samples (same rsID and same Genotype), like the page "Find Shared ClinVar Markers".
+        The ancient markers with the same rsID are put in one row with the Master_IDs separated by commas and the number of different Master_IDs.
+        The result is the same as merging the two tables on rsID and Genotype and grouping the merged rows by rsID,
+        but the rows are joined and grouped as integer codes, only the first row of every rsID is read from the text columns.
+    Input:
+        user_markers_df: the marker table of the user (Test_ClinVar_Markers.txt)
+        ancient_markers_df: the marker table of the ancient samples (Ancient_ClinVar_Markers.txt), or only its rows with the rsIDs of the user
+    Output:
+        DataFrame with the columns rsID, SHARED_COLUMNS, Master_ID and Master_ID_Count, sorted by rsID
+    """
+    # the rsIDs are compared as text like the merge of the page, every different rsID is converted once
+    user_rsid_codes, user_rsids = pd.factorize(user_markers_df["rsID"], use_na_sentinel=False)
+    ancient_rsid_codes, ancient_rsids = pd.factorize(ancient_markers_df["rsID"], use_na_sentinel=False)
+    rsid_codes, rsid_text = pd.factorize(np.concatenate([np.asarray(user_rsids).astype(str), np.asarray(ancient_rsids).astype(str)]))
+    user_rsid_codes = rsid_codes[:len(user_rsids)][user_rsid_codes]
+    ancient_rsid_codes = rsid_codes[len(user_rsids):][ancient_rsid_codes]
+    # the (rsID, Genotype) of both tables as one integer key
+    genotype_codes, genotypes = pd.factorize(np.concatenate([user_markers_df["Genotype"].to_numpy(), ancient_markers_df["Genotype"].to_numpy()]))
+    keys = np.r_[user_rsid_codes, ancient_rsid_codes].astype(np.int64) * (len(genotypes) + 1) + genotype_codes
+    user_keys, ancient_keys = keys[:len(user_rsid_codes)], keys[len(user_rsid_codes):]
+    # the matching ancient rows of every user row, in the order of the user rows and then of the ancient rows, like an inner merge
+    order = np.argsort(ancient_keys, kind="stable")
+    start = np.searchsorted(ancient_keys[order], user_keys, side="left")
+    counts = np.searchsorted(ancient_keys[order], user_keys, side="right") - start
+    user_rows = np.repeat(np.arange(len(user_keys)), counts)
+    ancient_rows = order[np.repeat(start, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)]
+    # group the merged rows by rsID, sorted as text like groupby
+    group_codes, group_rsids = pd.factorize(rsid_text[user_rsid_codes[user_rows]], sort=True)
+    group_order = np.argsort(group_codes, kind="stable")
+    bounds = np.searchsorted(group_codes[group_order], np.arange(len(group_rsids) + 1))
+    shared_df = pd.DataFrame({"rsID": np.asarray(group_rsids, dtype=object)})
+    for col in SHARED_COLUMNS:
+        table, rows = (user_markers_df, user_rows) if col in ("Genotype", "Chromosome", "Position") else (ancient_markers_df, ancient_rows)
+        # the first merged row of every rsID
+        first = rows[group_order[bounds[:-1]]]
+        column = table[col].iloc[first].reset_index(drop=True)
+        missing = column.isna().to_numpy()
+        if missing.any():
+            # groupby first skips the missing values: the first row with a value, only read for the rsIDs whose first row is missing
+            for i in np.flatnonzero(missing):
+                values = table[col].iloc[rows[group_order[bounds[i]:bounds[i + 1]]]].dropna()
+                if len(values):
+                    column.iloc[i] = values.iloc[0]
+        shared_df[col] = column
+    # the Master_IDs of every rsID in the order of the merged rows, every different Master_ID is converted to text once
+    master_codes, master_uniques = pd.factorize(ancient_markers_df["Master_ID"].to_numpy()[ancient_rows][group_order], use_na_sentinel=False)
+    master_ids = np.asarray(master_uniques).astype(str).astype(object)[master_codes]
+    shared_df["Master_ID"] = [",".join(master_ids[bounds[i]:bounds[i + 1]]) for i in range(len(group_rsids))]
+    # Count how many Master_IDs match for each rsID
+    pairs = np.sort(group_codes[group_order].astype(np.int64) * (len(master_uniques) + 1) + master_codes)
+    pairs = pairs[np.r_[True, pairs[1:] != pairs[:-1]]] if len(pairs) else pairs
+    shared_df["Master_ID_Count"] = np.bincount(pairs // (len(master_uniques) + 1), minlength=len(group_rsids)).astype(np.int64)
+    return shared_df
+
+
+def sample_shards(master_ids, n_shards):
+    """
+    Function:
+        split the rows of the genotype table into shards of whole samples, the rows of one sample are next to each other
+    Input:
+        master_ids: pandas Series with the Master_ID of every row
+        n_shards: the number of shards
+    Output:
+        list of (first row, row after the last row) of every shard
+    """
+    # the first row of every sample
+    starts = np.flatnonzero(np.r_[True, master_ids.to_numpy()[1:] != master_ids.to_numpy()[:-1]])
+    bounds = [int(part[0]) for part in np.array_split(starts, n_shards) if len(part)] + [len(master_ids)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+# the ClinVar store of the worker processes, opened once when the worker starts
+_worker_store = None
+
+
+def _init_worker(store_dir):
+    global _worker_store
+    # every array is mapped when the worker starts, so the shards still run if the store directory is evicted from the cache during the run
+    _worker_store = ClinVarStore(store_dir).map_all()
+
+
+def _call_shard(shard_df, correct_flips):
+    markers_df = call_markers(shard_df, _worker_store, correct_flips)
+    return markers_df, markers_df.attrs["allele_check"]
+
+
+@Stage_Metrics.timed(rows=len)
+def call_markers_parallel(genotype_df, clinvar_store, jobs=1, correct_flips=False):
+    """
+    Function:
+        find the ClinVar markers of the genotype table with a pool of processes, the samples are split into shards.
+        The result is the same as call_markers.
+    Input:
+        genotype_df: DataFrame with the columns Master_ID, rsID (the digits without "rs") and Genotype
+        clinvar_store: ClinVarStore of ClinVar_to_SNP.txt, the workers memory-map its directory
+        jobs: the number of worker processes, default is 1 (no pool), the callers pass the number they can use
+        correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+    Output:
+        DataFrame of the joined rows with Mutation_Status 1 or 2, in the order of genotype_df, attrs["allele_check"] like call_markers
+    """
+    n_shards = min(jobs, len(genotype_df) // MIN_SHARD_ROWS)
+    if n_shards <= 1 or "Master_ID" not in genotype_df.columns:
+        return call_markers(genotype_df, clinvar_store, correct_flips)
+    shards = [genotype_df.iloc[start:end] for start, end in sample_shards(genotype_df["Master_ID"], n_shards)]
+    with ProcessPoolExecutor(max_workers=n_shards, initializer=_init_worker, initargs=(clinvar_store.store_dir,)) as pool:
+        # map returns the shards in the order they were submitted
+        results = list(pool.map(_call_shard, shards, [correct_flips] * len(shards)))
+    markers_df = pd.concat([shard_df for shard_df, _ in results], ignore_index=True)
+    # the attrs are not kept by concat, the counts of the shards are added up
+    markers_df.attrs["allele_check"] = {label: sum(counts[label] for _, counts in results) for label in ALLELE_CHECK_LABELS.values()}
+    return markers_df
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: Marker_Service.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This script runs ClinVar-SMART as a local HTTP/JSON service without the web pages. The process keeps the ClinVar store of ClinVar_to_SNP.txt
+    and the index of the ancient markers (Ancient_ClinVar_Markers.txt, the output of the page "Identify Ancients ClinVar Markers") in memory,
+    so a request does not read or check these files again like a rerun of the pages does.
+    A request sends the genotype file of one user (Test_DNA.txt or the raw 23andMe or AncestryDNA file) and gets back the ClinVar markers of the user,
+    like the page "Identify User ClinVar Markers", and the ancient individuals sharing them, like the page "Find Shared ClinVar Markers".
+    The ancient markers are kept as the shared index (rsID, Genotype) -> ancient samples of Shared_Index, a request looks up the keys of the user's markers only.
+    The same script has a load-test client that sends user files with several connections and reports the latency percentiles.
+
+Imported modules:
+    - numpy: to compute the latency percentiles
+    - pandas: used for data manipulation and analysis.
+    - http.server, http.client: the HTTP server and the client of the load test
+    - json, io, urllib.parse: to read and write the requests and the responses
+    - concurrent.futures: the connections of the load test
+    - argparse, os, sys, time: to parse command-line arguments, to check the files and to time the requests
+    - ClinVar_Store: indexed store of ClinVar_to_SNP.txt keyed by rsID
+    - Marker_Caller: finds the markers of the user and the markers shared with the ancient samples
+    - User_Reader: reads the user file, only the lines of the rsIDs in ClinVar are decoded
+    - User_Batch: checks the user table like the page "Identify User ClinVar Markers"
+    - Shared_Index: the index (rsID, Genotype) -> ancient samples of Ancient_ClinVar_Markers.txt
+
+Procedures:
+    1. open the ClinVar store and the shared index once, the index is built from Ancient_ClinVar_Markers.txt or read from its .shared.npz file.
+    2. for every POST /markers request: read the user file of the body, check it and find the ClinVar markers of the user.
+    3. look up the (rsID, Genotype) of the markers in the shared index.
+    4. answer with JSON: the counts of the user file, the markers and the shared markers.
+
+Endpoints:
+    GET  /health   the number of ClinVar rows and ancient samples
+    POST /markers  the body is the user file, or JSON {"genotypes": [{"rsID": "rs5082", "Genotype": "AG", ...}]} with Content-Type application/json
+                   ?correct_flips=1 counts the alternate alleles of strand-flipped genotypes on the opposite strand
+                   a body larger than --max-body-mb is answered with 413, a body that can not be read with 400, a file of the server that can not be read with 500
+Usage:
+        python Marker_Service.py serve ClinVar_to_SNP.txt Ancient_ClinVar_Markers.txt [--host HOST] [--port PORT] [--max-body-mb MB]
+        python Marker_Service.py load user_files [user_files ...] [--url URL] [--requests N] [--concurrency C]
+    ---------- Examples:
+        python Marker_Service.py serve ClinVar_to_SNP.txt Ancient_ClinVar_Markers.txt --port 8765
+        curl --data-binary @Test1_DNA.txt http://127.0.0.1:8765/markers
+        python Marker_Service.py load Test1_DNA.txt Test2_DNA.txt --requests 500 --concurrency 4
+
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import numpy as np
+import pandas as pd
+from ClinVar_Store import open_store
+from Marker_Caller import call_markers
+from Shared_Index import load_shared_index
+from User_Reader import USER_COLUMNS, read_user_file
+from User_Batch import clean_user_table
+
+DEFAULT_PORT = 8765
+# the largest body of a request, a raw 23andMe or AncestryDNA file is about 25 MB
+DEFAULT_MAX_BODY_MB = 64
+
+
+class MarkerService:
+    """
+    The ClinVar store and the shared index of the service, shared by all requests.
+    """
+
+    def __init__(self, clinvar_file, ancient_file):
+        # every array is mapped now, so the service keeps working if the store directory is evicted from the cache later
+        self.clinvar_store = open_store(clinvar_file).map_all()
+        self.shared_index = load_shared_index(ancient_file)
+
+    def health(self):
+        return {"status": "ok", "clinvar_rows": len(self.clinvar_store), "ancient_markers": self.shared_index.n_rows,
+                "ancient_samples": self.shared_index.n_samples}
+
+    def markers(self, body, is_json=False, correct_flips=False):
+        """
+        Function:
+            find the ClinVar markers of a user and the markers shared with the ancient samples
+        Input:
+            body: the bytes of the user file, or of the JSON {"genotypes": [...]}
+            is_json: the body is JSON
+            correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+        Raise error:
+            ValueError if the user file or the JSON can not be read
+        Output:
+            the JSON text of the response
+        """
+        start = time.perf_counter()
+        if is_json:
+            payload = json.loads(body)
+            genotypes = payload.get("genotypes") if isinstance(payload, dict) else None
+            if not isinstance(genotypes, list):
+                raise ValueError('The JSON body should have a list "genotypes" of {"rsID": ..., "Genotype": ...}.')
+            user_df = pd.DataFrame(genotypes).reindex(columns=USER_COLUMNS)
+            counts = {"snps": len(user_df), "no_call": 0}
+        else:
+            user_df = read_user_file(io.BytesIO(body), self.clinvar_store.rsid_unique)
+            counts = dict(user_df.attrs)
+        user_df, issues = clean_user_table(user_df)
+        markers_df = call_markers(user_df, self.clinvar_store, correct_flips)
+        shared_df = self.shared_index.shared(markers_df)
+        summary = {**counts, **{name.lower(): count for name, count in issues.items()},
+                   "markers": len(markers_df), **markers_df.attrs["allele_check"], "shared": len(shared_df),
+                   "milliseconds": round((time.perf_counter() - start) * 1000, 2)}
+        # the tables are written by pandas, missing values are null
+        return (f'{{"user": {json.dumps(summary)}, "markers": {markers_df.to_json(orient="records")}, '
+                f'"shared": {shared_df.to_json(orient="records")}}}')
+
+
+class MarkerRequestHandler(BaseHTTPRequestHandler):
+    # keep the connection open between the requests of a client
+    protocol_version = "HTTP/1.1"
+    service = None
+    verbose = False
+    max_body = DEFAULT_MAX_BODY_MB * 1024 ** 2
+
+    def send_json(self, status, text, close=False):
+        data = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if close:
+            # the body of the request was not read, the connection can not be used for the next request
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/health":
+            self.send_json(200, json.dumps(self.service.health()))
+        else:
+            self.send_json(404, json.dumps({"error": f"Unknown path {self.path}"}))
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_json(400, json.dumps({"error": "Invalid Content-Length"}), close=True)
+            return
+        # a body above the limit is not read, so one request can not fill the memory of the service
+        if length > self.max_body:
+            self.send_json(413, json.dumps({"error": f"The body is larger than {self.max_body} bytes"}), close=True)
+            return
+        body = self.rfile.read(length)
+        if url.path != "/markers":
+            self.send_json(404, json.dumps({"error": f"Unknown path {self.path}"}))
+            return
+        correct_flips = parse_qs(url.query).get("correct_flips", ["0"])[0].lower() in ("1", "true", "yes")
+        is_json = self.headers.get("Content-Type", "").startswith("application/json")
+        try:
+            self.send_json(200, self.service.markers(body, is_json, correct_flips))
+        except (ValueError, KeyError, pd.errors.ParserError) as e:
+            # pandas.errors.EmptyDataError is a ValueError
+            self.send_json(400, json.dumps({"error": str(e)}))
+        except OSError as e:
+            # a file of the service could not be read, the error is on the server
+            self.send_json(500, json.dumps({"error": f"The server could not read a file: {e}"}))
+
+    def log_message(self, format, *args):
+        # one line per request slows down the load test, only with --verbose
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def serve(clinvar_file, ancient_file, host="127.0.0.1", port=DEFAULT_PORT, verbose=False, max_body_mb=DEFAULT_MAX_BODY_MB):
+    """
+    Function:
+        load ClinVar_to_SNP.txt and Ancient_ClinVar_Markers.txt once and answer the requests until Ctrl+C
+    Input:
+        clinvar_file: ClinVar_to_SNP.txt
+        ancient_file: Ancient_ClinVar_Markers.txt or its shared index (.shared.npz)
+        host, port: the address of the service
+        verbose: print one line per request
+        max_body_mb: the largest body of a request in MB, larger requests are answered with 413
+    """
+    start = time.perf_counter()
+    MarkerRequestHandler.service = MarkerService(clinvar_file, ancient_file)
+    MarkerRequestHandler.verbose = verbose
+    MarkerRequestHandler.max_body = int(max_body_mb * 1024 ** 2)
+    server = ThreadingHTTPServer((host, port), MarkerRequestHandler)
+    health = MarkerRequestHandler.service.health()
+    print(f"Loaded {health['clinvar_rows']} ClinVar rows and {health['ancient_markers']} markers of {health['ancient_samples']} ancient samples "
+          f"in {time.perf_counter() - start:.1f} s, listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def load_test(user_files, url, n_requests=200, concurrency=4, correct_flips=False):
+    """
+    Function:
+        send the user files to the service with several connections and measure the latency of every request
+    Input:
+        user_files: the user files, sent one after the other
+        url: the address of the service, for example http://127.0.0.1:8765
+        n_requests: the number of requests
+        concurrency: the number of connections sending at the same time
+        correct_flips: add ?correct_flips=1 to the requests
+    Output:
+        dictionary with the number of requests, errors, requests per second and the latency percentiles in milliseconds
+    """
+    address = urlsplit(url)
+    bodies = [open(path, "rb").read() for path in user_files]
+    path = "/markers" + ("?correct_flips=1" if correct_flips else "")
+
+    def worker(requests):
+        # one connection per worker, kept open between the requests
+        connection = HTTPConnection(address.hostname, address.port or 80, timeout=60)
+        latencies, errors = [], 0
+        # the first request of the connection is not timed
+        connection.request("POST", path, body=bodies[0])
+        connection.getresponse().read()
+        for i in requests:
+            start = time.perf_counter()
+            connection.request("POST", path, body=bodies[i % len(bodies)])
+            response = connection.getresponse()
+            response.read()
+            latencies.append(time.perf_counter() - start)
+            errors += response.status != 200
+        connection.close()
+        return latencies, errors
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(worker, [range(i, n_requests, concurrency) for i in range(concurrency)]))
+    seconds = time.perf_counter() - start
+    latencies = np.concatenate([np.array(latency) for latency, _ in results]) * 1000
+    return {"requests": len(latencies), "errors": sum(errors for _, errors in results),
+            "requests_per_second": round(len(latencies) / seconds, 1),
+            **{f"p{q}_ms": round(float(np.percentile(latencies, q)), 1) for q in (50, 90, 99)},
+            "max_ms": round(float(latencies.max()), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Marker_Service.py', description="serve the ClinVar markers of users and the shared ancient markers over HTTP/JSON")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    serve_parser = subparsers.add_parser("serve", help="load ClinVar_to_SNP.txt and Ancient_ClinVar_Markers.txt once and answer the requests")
+    serve_parser.add_argument("ClinVar_to_SNP", type=str, help="Path to the ClinVar_to_SNP.txt file")
+    serve_parser.add_argument("ancient_markers", type=str, help="Path to Ancient_ClinVar_Markers.txt or to its .shared.npz file")
+    serve_parser.add_argument("--host", type=str, default="127.0.0.1", help="default is 127.0.0.1, only this computer")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"default is {DEFAULT_PORT}")
+    serve_parser.add_argument("--verbose", action="store_true", help="print one line per request")
+    serve_parser.add_argument("--max-body-mb", type=float, default=DEFAULT_MAX_BODY_MB, help=f"the largest request body in MB, larger requests are answered with 413, default is {DEFAULT_MAX_BODY_MB}")
+    load_parser = subparsers.add_parser("load", help="send user files to the service and report the latency")
+    load_parser.add_argument("user_files", type=str, nargs="+", help="the user files sent in the requests")
+    load_parser.add_argument("--url", type=str, default=f"http://127.0.0.1:{DEFAULT_PORT}", help="the address of the service")
+    load_parser.add_argument("--requests", type=int, default=200, help="the number of requests")
+    load_parser.add_argument("--concurrency", type=int, default=4, help="the number of connections sending at the same time")
+    load_parser.add_argument("--correct-flips", action="store_true", help="count the alternate alleles of strand-flipped genotypes on the opposite strand")
+    args = parser.parse_args()
+    input_files = [args.ClinVar_to_SNP, args.ancient_markers] if args.command == "serve" else args.user_files
+    for input_file in input_files:
+        if not os.path.isfile(input_file):
+            sys.exit(f"Error: The input file {input_file} is NOT FOUND !")
+    try:
+        if args.command == "serve":
+            serve(args.ClinVar_to_SNP, args.ancient_markers, args.host, args.port, args.verbose, args.max_body_mb)
+        else:
+            result = load_test(args.user_files, args.url, args.requests, args.concurrency, args.correct_flips)
+            print("\t".join(result))
+            print("\t".join(str(value) for value in result.values()))
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
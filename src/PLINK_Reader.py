@@ -0,0 +1,504 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: PLINK_Reader.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This script reads the binary PLINK files (.bed/.bim/.fam, for example v54.1_1240K_public) directly, without plink --recode and plink --extract.
+    The .bed file stores 2 bits per genotype, SNP by SNP (SNP-major): every SNP is a block of ceil(samples / 4) bytes, four samples per byte.
+    The .bed file is opened with numpy.memmap, so only the blocks of the selected SNPs are read from disk.
+    The SNPs are selected by their rsID in the .bim file (the rsIDs in ClinVar_to_SNP.txt), the samples are selected by the .fam file (the samples in Ancient_samples.txt).
+    The 2-bit codes are decoded with whole-array operations into the genotypes (for example "AG") with the alleles of the .bim file.
+    The output is the same table as the page "Convert .ped and .map File to Extract rsID" (Ancient_samples_filtered_rsID.txt), the missing genotypes are left out.
+    The text .ped file of that page is decoded here too: the genotype columns of all samples are read into one 2D uint8 array of allele codes,
+    checked and translated to nucleotides with lookup tables, and the missing genotypes ("00") are masked, without a Python loop over the genotypes.
+    The .ped file is read a chunk of samples at a time and the long table is written to disk chunk by chunk, so the memory does not grow with the number of samples.
+    The chunks can be decoded by a pool of processes (sample shards), the .map table is sent once to every worker and the chunks are written in the order of the file.
+
+Imported modules:
+    - numpy: to memory-map and decode the .bed file
+    - pandas: used for data manipulation and analysis.
+    - argparse: to parse command-line arguments and options
+    - os: to check file status in directory
+    - concurrent.futures, collections: to decode the chunks of the .ped file with a pool of processes, in the order of the file
+    - sys: to control over the Python runtime environment
+    - ClinVar_Store: indexed store of ClinVar_to_SNP.txt keyed by rsID
+    - rsID_Parser: to parse the rsIDs of the .bim file
+    - Stage_Metrics: the time and the number of rows written
+
+Procedures:
+    1. perform error checks before continuing next steps.
+    2. read the .bim and .fam files, select the SNPs whose rsID is in ClinVar_to_SNP.txt and the samples in the keep file.
+    3. memory-map the .bed file and check its header.
+    4. decode the 2-bit genotypes of the selected SNPs and samples.
+    5. write Master_ID, rsID, Chromosome, Position and Genotype of the called genotypes to the output file.
+
+Inputfile:
+    v54.1_1240K_public.bed v54.1_1240K_public.bim v54.1_1240K_public.fam (given as the prefix v54.1_1240K_public)
+    ClinVar_to_SNP.txt, Ancient_samples.txt (optional, the samples to keep: Family_ID and Master_ID)
+Outputfile:
+    default = Ancient_samples_filtered_rsID.txt
+Usage:
+        python PLINK_Reader.py bfile ClinVar_to_SNP.txt [output_file] [--keep Ancient_samples.txt]
+    ---------- Examples:
+        python PLINK_Reader.py v54.1_1240K_public ClinVar_to_SNP.txt --keep Ancient_samples.txt
+        python PLINK_Reader.py v54.1_1240K_public ClinVar_to_SNP.txt Ancient_samples_filtered_rsID.txt --keep Ancient_samples.txt
+
+"""
+import argparse
+import os
+import sys
+# make sure the module is installed
+try:
+    import numpy as np
+    import pandas as pd
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from ClinVar_Store import open_store
+    from rsID_Parser import parse_rsIDs
+    import Stage_Metrics
+except ImportError as e:
+    sys.exit(f"ERROR: Python module not installed. {e}")
+
+# the first three bytes of a .bed file: two magic numbers and 0x01 for the SNP-major mode
+BED_MAGIC = bytes([0x6c, 0x1b, 0x01])
+MAP_COLUMNS = ["Chromosome", "rsID", "Genetic distance", "Position"]
+BIM_COLUMNS = ["Chromosome", "rsID", "Genetic distance", "Position", "Allele1", "Allele2"]
+FAM_COLUMNS = ["Family_ID", "Master_ID", "Paternal_ID", "Maternal_ID", "Sex", "Phenotype"]
+OUTPUT_COLUMNS = ["Master_ID", "rsID", "Chromosome", "Position", "Genotype"]
+# the 2-bit codes of the .bed file: 0 homozygous Allele1, 1 missing, 2 heterozygous, 3 homozygous Allele2
+# as the column of the genotype table of every SNP: 0 Allele1+Allele1, 1 Allele1+Allele2, 2 Allele2+Allele2, -1 missing
+CODE_TO_GENOTYPE = np.array([0, -1, 1, 2], dtype=np.int8)
+# the allele codes of the .ped file and their nucleotides, the same as the page "Convert .ped and .map File to Extract rsID"
+PED_NUCLEOTIDES = np.array(["0", "A", "T", "C", "G"], dtype=object)
+# lookup table from the byte of an allele code ("0" to "4") to its position in PED_NUCLEOTIDES, 255 for invalid bytes
+PED_CODE = np.full(256, 255, dtype=np.uint8)
+PED_CODE[np.frombuffer(b"01234", dtype=np.uint8)] = np.arange(5, dtype=np.uint8)
+# the genotype of every pair of allele codes: PED_GENOTYPES[5 * allele1 + allele2], for example 5 * 1 + 4 -> "AG"
+PED_GENOTYPES = np.array([a + b for a in PED_NUCLEOTIDES for b in PED_NUCLEOTIDES], dtype=object)
+# the number of samples (rows of the .ped file) decoded at a time
+DEFAULT_PED_CHUNK = 1000
+
+
+def read_bim(bim_file):
+    """
+    Function:
+        read the .bim file, one row per SNP in the order of the .bed file
+    Input:
+        bim_file: the path of the .bim file
+    Output:
+        DataFrame with the columns Chromosome, rsID, Genetic distance, Position, Allele1, Allele2
+    """
+    return pd.read_csv(bim_file, sep=r"\s+", header=None, names=BIM_COLUMNS,
+                       dtype={"Chromosome": str, "rsID": str, "Allele1": str, "Allele2": str})
+
+
+def read_fam(fam_file):
+    """
+    Function:
+        read the .fam file, one row per sample in the order of the .bed file
+    Input:
+        fam_file: the path of the .fam file
+    Output:
+        DataFrame with the columns Family_ID, Master_ID, Paternal_ID, Maternal_ID, Sex, Phenotype
+    """
+    return pd.read_csv(fam_file, sep=r"\s+", header=None, names=FAM_COLUMNS, dtype=str)
+
+
+def open_bed(bed_file, n_samples, n_variants):
+    """
+    Function:
+        memory-map the .bed file as a 2D uint8 array, one row of packed bytes per SNP
+    Input:
+        bed_file: the path of the .bed file
+        n_samples: the number of samples in the .fam file
+        n_variants: the number of SNPs in the .bim file
+    Raise error:
+        check the magic numbers and the SNP-major mode of the .bed file
+        check if the size of the .bed file matches the .bim and .fam files
+    Output:
+        numpy.memmap of shape (n_variants, ceil(n_samples / 4))
+    """
+    with open(bed_file, "rb") as f:
+        if f.read(3) != BED_MAGIC:
+            raise ValueError(f"{bed_file} is not a SNP-major PLINK .bed file.")
+    bytes_per_variant = (n_samples + 3) // 4
+    expected = 3 + n_variants * bytes_per_variant
+    if os.path.getsize(bed_file) != expected:
+        raise ValueError(f"The size of {bed_file} ({os.path.getsize(bed_file)} bytes) does not match "
+                         f"{n_variants} SNPs and {n_samples} samples ({expected} bytes).")
+    return np.memmap(bed_file, dtype=np.uint8, mode="r", offset=3, shape=(n_variants, bytes_per_variant))
+
+
+def select_variants(bim_df, clinvar_store):
+    """
+    Function:
+        select the SNPs of the .bim file whose rsID is in ClinVar_to_SNP.txt
+    Input:
+        bim_df: DataFrame of the .bim file
+        clinvar_store: ClinVarStore of ClinVar_to_SNP.txt
+    Output:
+        numpy array with the row numbers of the selected SNPs, in the order of the .bim file
+    """
+    rsIDs, reasons = parse_rsIDs(bim_df["rsID"])
+    selected = reasons == ""
+    selected[selected] = clinvar_store.contains(rsIDs[selected])
+    return np.flatnonzero(selected)
+
+
+def select_samples(fam_df, keep_file=None):
+    """
+    Function:
+        select the samples of the .fam file listed in the keep file (Family_ID and Master_ID, like plink --keep)
+    Input:
+        fam_df: DataFrame of the .fam file
+        keep_file: the path of the keep file, default is all samples
+    Output:
+        numpy array with the row numbers of the selected samples, in the order of the .fam file
+    """
+    if keep_file is None:
+        return np.arange(len(fam_df))
+    keep_df = pd.read_csv(keep_file, sep=r"\s+", header=None, usecols=[0, 1], names=["Family_ID", "Master_ID"], dtype=str)
+    keep = pd.MultiIndex.from_frame(keep_df)
+    return np.flatnonzero(pd.MultiIndex.from_frame(fam_df[["Family_ID", "Master_ID"]]).isin(keep))
+
+
+def decode_genotypes(bed, variant_idx, sample_idx):
+    """
+    Function:
+        decode the 2-bit codes of the selected SNPs and samples
+    Input:
+        bed: the memory-mapped .bed file from open_bed
+        variant_idx: the row numbers of the selected SNPs
+        sample_idx: the row numbers of the selected samples
+    Output:
+        numpy int8 array of shape (samples, SNPs): 0 Allele1+Allele1, 1 Allele1+Allele2, 2 Allele2+Allele2, -1 missing
+    """
+    # only the blocks of the selected SNPs are read from the memory-mapped file
+    packed = np.asarray(bed[variant_idx])
+    # the byte of every sample and the position of its 2 bits inside the byte
+    shift = ((sample_idx % 4) * 2).astype(np.uint8)
+    codes = (packed[:, sample_idx // 4] >> shift) & 0b11
+    return CODE_TO_GENOTYPE[codes].T
+
+
+def long_table(master_ids, snps, sample_pos, snp_pos, called):
+    """
+    Function:
+        build the long table of the page "Convert .ped and .map File to Extract rsID" from the called genotypes
+    Input:
+        master_ids: numpy array with the Master_ID of every sample
+        snps: DataFrame with the columns rsID, Chromosome and Position of every SNP
+        sample_pos, snp_pos: the sample and the SNP of every called genotype
+        called: the genotype of every called genotype, for example "AG"
+    Output:
+        DataFrame with the columns Master_ID, rsID, Chromosome, Position, Genotype
+    """
+    return pd.DataFrame({
+        "Master_ID": master_ids[sample_pos],
+        "rsID": snps["rsID"].to_numpy(dtype=object)[snp_pos],
+        "Chromosome": snps["Chromosome"].to_numpy()[snp_pos],
+        "Position": snps["Position"].to_numpy()[snp_pos],
+        "Genotype": called,
+    }, columns=OUTPUT_COLUMNS)
+
+
+def genotype_table(bim_df, variant_idx, genotypes, fam_df, sample_idx):
+    """
+    Function:
+        convert the decoded genotypes of the .bed file to the long table of the page "Convert .ped and .map File to Extract rsID"
+    Input:
+        bim_df, variant_idx: the .bim file and the row numbers of the selected SNPs
+        genotypes: the decoded genotypes from decode_genotypes
+        fam_df, sample_idx: the .fam file and the row numbers of the selected samples
+    Output:
+        DataFrame with the columns Master_ID, rsID, Chromosome, Position, Genotype, one row per sample and SNP, sample by sample
+    """
+    snps = bim_df.iloc[variant_idx].reset_index(drop=True)
+    allele1 = snps["Allele1"].to_numpy(dtype=object)
+    allele2 = snps["Allele2"].to_numpy(dtype=object)
+    # the three genotypes of every SNP: Allele1+Allele1, Allele1+Allele2, Allele2+Allele2
+    table = np.stack([allele1 + allele1, allele1 + allele2, allele2 + allele2], axis=1)
+    sample_pos, snp_pos = np.nonzero(genotypes >= 0)
+    called = table[snp_pos, genotypes[sample_pos, snp_pos]]
+    # "00" is a missing genotype in the .ped file too (both alleles of a monomorphic SNP can be "0")
+    keep = called != "00"
+    return long_table(fam_df["Master_ID"].to_numpy(dtype=object)[sample_idx], snps, sample_pos[keep], snp_pos[keep], called[keep])
+
+
+def read_map(map_file):
+    """
+    Function:
+        read the .map file, one row per SNP in the order of the genotype columns of the .ped file
+    Input:
+        map_file: the path of the .map file or an uploaded file object
+    Raise error:
+        check if every rsID starts with "rs"
+    Output:
+        DataFrame with the columns Chromosome, rsID, Genetic distance, Position
+    """
+    map_df = pd.read_csv(map_file, sep="\t", header=None, names=MAP_COLUMNS)
+    if not all(map_df["rsID"].astype(str).str.startswith("rs")):
+        raise ValueError("The .map file is not in the correct format. rsID should start with 'rs'.")
+    return map_df
+
+
+def decode_ped_rows(lines, first_index=0, genotype_length=None):
+    """
+    Function:
+        decode rows of the .ped file: the first six columns as a DataFrame and the genotype columns as a 2D uint8 array of allele codes
+    Input:
+        lines: the rows of the .ped file as bytes
+        first_index: the row number of the first row in the .ped file, for the error messages
+        genotype_length: the length in bytes of the genotype columns of the first row of the .ped file, default is the first of these rows
+    Raise error:
+        check if every genotype is one of the allele codes 0, 1, 2, 3, 4
+        check if every row has the same number of genotype columns
+    Output:
+        DataFrame with the columns Family_ID, Master_ID, Paternal_ID, Maternal_ID, Sex, Phenotype
+        numpy uint8 array of shape (samples, 2 * SNPs), the positions of the allele codes in PED_NUCLEOTIDES
+    """
+    # split the first six columns from the genotype columns of every row
+    rows = [line.split(maxsplit=6) for line in lines]
+    samples = pd.DataFrame([[field.decode("utf-8") for field in row[:6]] for row in rows], columns=FAM_COLUMNS)
+    genotype_text = [row[6].strip() if len(row) == 7 else b"" for row in rows]
+    lengths = np.array([len(text) for text in genotype_text])
+    expected = lengths[0] if genotype_length is None else genotype_length
+    if (lengths != expected).any():
+        index = int(np.flatnonzero(lengths != expected)[0])
+        raise ValueError(f"Row {first_index + index} has {(lengths[index] + 1) // 2} genotype columns, the first row has {(expected + 1) // 2}.")
+    # all genotype columns as one 2D byte array, one row per sample: the allele codes are every second byte, separated by one space
+    block = np.frombuffer(b" ".join(genotype_text) + b" ", dtype=np.uint8).reshape(len(rows), expected + 1)
+    alleles = PED_CODE[block[:, 0::2]]
+    invalid = (alleles == 255).any(axis=1) | ((block[:, 1::2] != ord(" ")) & (block[:, 1::2] != ord("\t"))).any(axis=1)
+    if invalid.any():
+        raise ValueError(f"Invalid genotype values detected in row {first_index + int(np.flatnonzero(invalid)[0])}. Allowed values are: 0, 1, 2, 3, 4.")
+    return samples, alleles
+
+
+def iter_ped_lines(ped_file, chunk_samples=DEFAULT_PED_CHUNK):
+    """
+    Function:
+        read the rows of the .ped file chunk_samples rows (samples) at a time, without decoding them
+    Input:
+        ped_file: the path of the .ped file or an uploaded file object
+        chunk_samples: the number of samples in every chunk
+    Raise error:
+        check if the .ped file is empty
+    Output:
+        generator of (the row number of the first row of the chunk, list of the rows as bytes)
+    """
+    is_path = isinstance(ped_file, (str, os.PathLike))
+    f = open(ped_file, "rb") if is_path else ped_file
+    try:
+        lines = []
+        first_index = 0
+        for line in f:
+            if not line.strip():
+                continue
+            lines.append(line)
+            if len(lines) == chunk_samples:
+                yield first_index, lines
+                first_index += len(lines)
+                lines = []
+        if lines:
+            yield first_index, lines
+        elif first_index == 0:
+            raise ValueError("The .ped file is empty or incomplete !!!")
+    finally:
+        if is_path:
+            f.close()
+        else:
+            # reset the file pointer after reading
+            f.seek(0)
+
+
+def iter_ped(ped_file, chunk_samples=DEFAULT_PED_CHUNK):
+    """
+    Function:
+        read the .ped file chunk_samples rows (samples) at a time, so the peak memory depends on the chunk size and not on the number of samples
+    Input:
+        ped_file: the path of the .ped file or an uploaded file object
+        chunk_samples: the number of samples in every chunk
+    Raise error:
+        check if the .ped file is empty, and the errors of decode_ped_rows
+    Output:
+        generator of (DataFrame with the first six columns, numpy uint8 array of allele codes), see decode_ped_rows
+    """
+    genotype_length = None
+    for first_index, lines in iter_ped_lines(ped_file, chunk_samples):
+        samples, alleles = decode_ped_rows(lines, first_index, genotype_length)
+        # every chunk must have as many genotype columns as the first row of the file
+        genotype_length = 2 * alleles.shape[1] - 1
+        yield samples, alleles
+
+
+def read_ped(ped_file):
+    """
+    Function:
+        read the whole .ped file, see iter_ped
+    Input:
+        ped_file: the path of the .ped file or an uploaded file object
+    Output:
+        DataFrame with the columns Family_ID, Master_ID, Paternal_ID, Maternal_ID, Sex, Phenotype
+        numpy uint8 array of shape (samples, 2 * SNPs), the positions of the allele codes in PED_NUCLEOTIDES
+    """
+    chunks = list(iter_ped(ped_file, DEFAULT_PED_CHUNK))
+    return pd.concat([samples for samples, _ in chunks], ignore_index=True), np.vstack([alleles for _, alleles in chunks])
+
+
+def ped_table(map_df, ped_samples, alleles):
+    """
+    Function:
+        convert the allele codes of the .ped file to nucleotides and match them to the SNPs of the .map file
+        (the nth pair of alleles is the nth SNP), the missing genotypes ("00") are left out
+    Input:
+        map_df: DataFrame of the .map file
+        ped_samples: DataFrame with the first six columns of the .ped file
+        alleles: the allele codes from read_ped
+    Raise error:
+        check if the number of SNPs in the .ped file matches the .map file
+    Output:
+        DataFrame with the columns Master_ID, rsID, Chromosome, Position, Genotype, one row per sample and SNP, sample by sample
+    """
+    if alleles.shape[1] != 2 * len(map_df):
+        raise ValueError(f"The .ped file has {alleles.shape[1] // 2} SNPs but the .map file has {len(map_df)} SNPs.")
+    # the pair of allele codes of every genotype as one number, 0 is the missing genotype "00"
+    pairs = alleles[:, 0::2].astype(np.uint8) * 5 + alleles[:, 1::2]
+    sample_pos, snp_pos = np.nonzero(pairs)
+    return long_table(ped_samples["Master_ID"].to_numpy(dtype=object), map_df, sample_pos, snp_pos,
+                      PED_GENOTYPES[pairs[sample_pos, snp_pos]])
+
+
+def ped_chunk_text(map_df, first_index, lines, preview_rows=10):
+    """
+    Function:
+        decode one chunk of rows of the .ped file and convert it to the tab-delimited text of the long table
+    Input:
+        map_df: DataFrame of the .map file
+        first_index: the row number of the first row of the chunk
+        lines: the rows of the chunk as bytes
+        preview_rows: the number of rows kept for preview
+    Output:
+        the text of the rows of the long table (without header), the number of rows and a DataFrame with the first preview_rows rows
+    """
+    # the genotype columns of every row must match the SNPs of the .map file
+    ped_samples, alleles = decode_ped_rows(lines, first_index, 4 * len(map_df) - 1)
+    chunk_df = ped_table(map_df, ped_samples, alleles)
+    return chunk_df.to_csv(sep="\t", index=False, header=False), len(chunk_df), chunk_df.head(preview_rows)
+
+
+# the .map file of the worker processes, sent once when the worker starts and shared read-only by all its chunks
+_worker_map_df = None
+
+
+def _init_ped_worker(map_df):
+    global _worker_map_df
+    _worker_map_df = map_df
+
+
+def _ped_chunk_worker(first_index, lines, preview_rows):
+    return ped_chunk_text(_worker_map_df, first_index, lines, preview_rows)
+
+
+@Stage_Metrics.timed(rows=lambda result: result[0])
+def write_ped_table(map_df, ped_file, output_file, chunk_samples=DEFAULT_PED_CHUNK, preview_rows=10, jobs=1):
+    """
+    Function:
+        decode the .ped file chunk by chunk and write the long table to the output file chunk by chunk, in tab-delimited format.
+        With jobs > 1 the chunks (shards of samples) are decoded by a pool of processes, at most 2 * jobs chunks are in flight,
+        and the chunks are written in the order of the .ped file, so the output is the same as with one process.
+    Input:
+        map_df: DataFrame of the .map file
+        ped_file: the path of the .ped file or an uploaded file object
+        output_file: the path for the output_file, Ancient_samples_filtered_rsID.txt
+        chunk_samples: the number of samples in every chunk
+        preview_rows: the number of rows kept for preview
+        jobs: the number of worker processes
+    Output:
+        the number of rows written and a DataFrame with the first preview_rows rows
+    """
+    row_count = 0
+    preview_chunks = []
+    with open(output_file, "w", newline="") as out:
+        out.write("\t".join(OUTPUT_COLUMNS) + "\n")
+
+        def write_chunk(text, n_rows, preview_df):
+            nonlocal row_count
+            out.write(text)
+            if row_count < preview_rows:
+                preview_chunks.append(preview_df.head(preview_rows - row_count))
+            row_count += n_rows
+
+        if jobs <= 1:
+            for first_index, lines in iter_ped_lines(ped_file, chunk_samples):
+                write_chunk(*ped_chunk_text(map_df, first_index, lines, preview_rows))
+        else:
+            pending = deque()
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_ped_worker, initargs=(map_df,)) as pool:
+                for first_index, lines in iter_ped_lines(ped_file, chunk_samples):
+                    pending.append(pool.submit(_ped_chunk_worker, first_index, lines, preview_rows))
+                    # write the oldest chunk first, so the output is in the order of the .ped file
+                    if len(pending) >= 2 * jobs:
+                        write_chunk(*pending.popleft().result())
+                while pending:
+                    write_chunk(*pending.popleft().result())
+    preview_df = pd.concat(preview_chunks) if preview_chunks else pd.DataFrame(columns=OUTPUT_COLUMNS)
+    return row_count, preview_df
+
+
+@Stage_Metrics.timed(rows=lambda row_count: row_count)
+def bed_to_rsID(bfile, clinvar_file, output_file, keep_file=None):
+    """
+    Function:
+        extract the genotypes of the ClinVar SNPs and the kept samples from the binary PLINK files
+    Input:
+        bfile: the prefix of the .bed, .bim and .fam files
+        clinvar_file: ClinVar_to_SNP.txt
+        output_file: the output file, the same format as Ancient_samples_filtered_rsID.txt
+        keep_file: the samples to keep, default is all samples
+    Raise error:
+        check if the input files exist or not
+        check if the output file already exists
+    Output:
+        the number of rows written to output_file
+    """
+    input_files = [f"{bfile}.bed", f"{bfile}.bim", f"{bfile}.fam", clinvar_file] + ([keep_file] if keep_file else [])
+    for input_file in input_files:
+        if not os.path.isfile(input_file):
+            print(f"Error: The input file {input_file} is NOT FOUND !")
+            return None
+    if os.path.isfile(output_file):
+        print(f"Error: The output {output_file} already exists !. Please remove or rename existing output file")
+        return None
+    try:
+        bim_df = read_bim(f"{bfile}.bim")
+        fam_df = read_fam(f"{bfile}.fam")
+        bed = open_bed(f"{bfile}.bed", len(fam_df), len(bim_df))
+        variant_idx = select_variants(bim_df, open_store(clinvar_file))
+        sample_idx = select_samples(fam_df, keep_file)
+    except Exception as e:
+        print(f"Error: An error occurred while reading the input files: {e}")
+        return None
+    print(f"Selected {len(variant_idx)} of {len(bim_df)} SNPs and {len(sample_idx)} of {len(fam_df)} samples.")
+    genotypes = decode_genotypes(bed, variant_idx, sample_idx)
+    output_df = genotype_table(bim_df, variant_idx, genotypes, fam_df, sample_idx)
+    output_df.to_csv(output_file, sep="\t", index=False)
+    print(f"The output file {output_file} contains {len(output_df)} rows.")
+    return len(output_df)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='PLINK_Reader.py', description="extract the genotypes of the ClinVar SNPs from the binary PLINK files (.bed/.bim/.fam)")
+    parser.add_argument("bfile", type=str, help="the prefix of the .bed, .bim and .fam files, for example v54.1_1240K_public")
+    parser.add_argument("ClinVar_to_SNP", type=str, help="Path to the ClinVar_to_SNP.txt file")
+    parser.add_argument("output_file", type=str, nargs='?', default="Ancient_samples_filtered_rsID.txt", help="the output should consist of tab-delimited columns (fields)")
+    parser.add_argument("--keep", type=str, default=None, help="the samples to keep (Family_ID and Master_ID), for example Ancient_samples.txt")
+    args = parser.parse_args()
+    bed_to_rsID(args.bfile, args.ClinVar_to_SNP, args.output_file, args.keep)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: Pipeline_Steps.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module has the logic of the pages as functions without streamlit, so the pages, the batch scripts and ClinVar_Pipeline.py run the same code.
+    Every function reads its input files and returns a DataFrame or writes an output file, the errors are raised as ValueError and shown by the caller.
+        - filter_clinvar: the page "Filter ClinVar Dataset", variant_summary.txt(.gz) -> ClinVar_to_SNP.txt
+        - ancient_genotypes: the page "Convert .ped and .map File to Extract rsID" or PLINK_Reader.py, -> Ancient_samples_filtered_rsID.txt
+        - ancient_markers: the page "Identify Ancients ClinVar Markers", -> Ancient_ClinVar_Markers.txt
+        - user_markers: the page "Identify User ClinVar Markers", -> Test_ClinVar_Markers.txt
+    The shared markers of the page "Find Shared ClinVar Markers" are found with Shared_Index.
+
+Imported modules:
+    - numpy, pandas: used for data manipulation and analysis.
+    - ClinVar_Reader, ClinVar_Cache: chunked reading and filtering of variant_summary.txt(.gz) through the cache
+    - ClinVar_Store: indexed store of ClinVar_to_SNP.txt keyed by rsID
+    - ClinVar_Resource: the store opened once per process and shared by the pages and the sessions
+    - PLINK_Reader: the .ped/.map files and the binary PLINK files
+    - Genotype_Matrix, VCF_Reader, User_Reader: the other formats of the genotypes
+    - Marker_Caller: joins the genotypes to ClinVar and counts the mutated alleles
+    - Stage_Metrics: the time, the rows and the memory of reading and checking the genotypes, shown on the pages
+
+Procedures:
+    1. filter variant_summary.txt(.gz) with the filters of the page "Filter ClinVar Dataset".
+    2. convert the ancient genotypes (.bed/.bim/.fam or .ped/.map) to the table Ancient_samples_filtered_rsID.txt.
+    3. read the genotypes of the ancient samples or of a user as one table, remove the rows with a missing value, an invalid genotype or an invalid rsID.
+    4. call the ClinVar markers of the table.
+
+"""
+import numpy as np
+import pandas as pd
+import ClinVar_Cache
+import Stage_Metrics
+from ClinVar_Reader import DEFAULT_CLIN_SIGNIFICANCE, DEFAULT_REVIEW_STATUS, iter_variant_summary, load_variant_summary, write_filtered_clinvar
+from ClinVar_Resource import shared_store
+from ClinVar_Store import rsid_to_int
+from Genotype_Matrix import is_genotype_matrix, open_matrix
+from Marker_Caller import call_markers, call_markers_parallel
+from PLINK_Reader import bed_to_rsID, read_map, write_ped_table
+from User_Reader import read_user_file
+from VCF_Reader import is_vcf, read_vcf, user_table
+
+# the default assembly, the default ClinicalSignificance and ReviewStatus are the same as the page "Filter ClinVar Dataset"
+DEFAULT_ASSEMBLY = "GRCh37"
+# the columns of the genotype tables
+ANCIENT_COLUMNS = ['rsID', 'Chromosome', 'Position', 'Genotype', 'Master_ID']
+USER_COLUMNS = ['rsID', 'Chromosome', 'Position', 'Genotype']
+
+
+def filter_clinvar(variant_summary, output_file, assembly=DEFAULT_ASSEMBLY, clin_significance=DEFAULT_CLIN_SIGNIFICANCE,
+                   review_status=DEFAULT_REVIEW_STATUS, phenotype_list_required=True):
+    """
+    Function:
+        filter variant_summary.txt(.gz) like the page "Filter ClinVar Dataset", the parsed release is read from the cache if pyarrow is installed
+    Input:
+        variant_summary: the path of variant_summary.txt(.gz) or an uploaded file object
+        output_file: ClinVar_to_SNP.txt
+        assembly, clin_significance, review_status, phenotype_list_required: the filtering parameters
+    Output:
+        the number of rows written and a DataFrame with the first rows
+    """
+    if ClinVar_Cache.HAS_ARROW:
+        table, path = load_variant_summary(variant_summary)
+        chunks = ClinVar_Cache.iter_table_chunks(table, ClinVar_Cache.read_metadata(path)["categories"])
+    else:
+        chunks = iter_variant_summary(variant_summary)
+    return write_filtered_clinvar(chunks, output_file, assembly, clin_significance, review_status, phenotype_list_required)
+
+
+def ancient_genotypes(clinvar_file, output_file, bfile=None, keep_file=None, map_file=None, ped_file=None, jobs=1):
+    """
+    Function:
+        convert the genotypes of the ancient samples to the table Ancient_samples_filtered_rsID.txt,
+        from the binary PLINK files (only the ClinVar SNPs and the kept samples) or from the .ped and .map files
+    Input:
+        clinvar_file: ClinVar_to_SNP.txt, used for the binary PLINK files
+        output_file: Ancient_samples_filtered_rsID.txt
+        bfile, keep_file: the prefix of the .bed, .bim and .fam files and the samples to keep
+        map_file, ped_file: the .map and .ped files, used if bfile is None
+        jobs: the number of worker processes decoding the .ped file, default is 1 (no pool), the command-line scripts pass their --jobs
+    Raise error:
+        check if the genotypes are given and converted
+    Output:
+        the number of rows written to output_file
+    """
+    if bfile:
+        row_count = bed_to_rsID(bfile, clinvar_file, output_file, keep_file)
+        if row_count is None:
+            raise ValueError(f"The binary PLINK files {bfile} could not be converted.")
+        return row_count
+    if not (map_file and ped_file):
+        raise ValueError("The binary PLINK files or the .map and .ped files are needed.")
+    row_count, _ = write_ped_table(read_map(map_file), ped_file, output_file, jobs=jobs)
+    return row_count
+
+
+@Stage_Metrics.timed(rows=len)
+def read_genotypes(genotype_file, clinvar_store):
+    """
+    Function:
+        read the genotypes of the ancient samples as one table, like the page "Identify Ancients ClinVar Markers"
+    Input:
+        genotype_file: Ancient_samples_filtered_rsID.txt, the genotype matrix (.geno or .geno.gz) or a VCF file, the path or an uploaded file object
+        clinvar_store: ClinVarStore, only the SNPs in ClinVar are read from the genotype matrix and the VCF file
+    Output:
+        DataFrame of the genotypes
+    """
+    if is_vcf(genotype_file):
+        # the VCF file: the records with an rsID that is not in ClinVar are skipped before the samples are read
+        return read_vcf(genotype_file, clinvar_store.rsID).long_table()
+    if is_genotype_matrix(genotype_file):
+        # the genotype matrix: only the columns of the SNPs in ClinVar are read and converted to rows
+        matrix = open_matrix(genotype_file)
+        in_clinvar = clinvar_store.contains(rsid_to_int(matrix.snps["rsID"]))
+        return matrix.long_table(np.flatnonzero(in_clinvar))
+    return pd.read_csv(genotype_file, sep="\t", header=0)
+
+
+@Stage_Metrics.timed(rows=lambda result: len(result[0]))
+def check_genotypes(genotype_df, expected_columns):
+    """
+    Function:
+        check the genotype table like the pages: the rows with a missing value, an invalid genotype or an invalid rsID are removed
+    Input:
+        genotype_df: DataFrame of the genotypes
+        expected_columns: the columns the table should have, ANCIENT_COLUMNS or USER_COLUMNS
+    Raise error:
+        check if the required columns are present
+    Output:
+        the checked table with the rsID without the prefix "rs", and a dictionary with the number of removed rows of every check
+    """
+    missing_columns = [col for col in expected_columns if col not in genotype_df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
+    issues = {}
+    missing = genotype_df[["rsID", "Genotype"]].isnull().any(axis=1)
+    issues["Missing"] = int(missing.sum())
+    genotype_df = genotype_df[~missing]
+    # two-letter combinations of A, C, G, T
+    invalid_genotype = ~genotype_df["Genotype"].astype(str).str.match(r"^[ACGT]{2}$")
+    issues["Invalid_Genotype"] = int(invalid_genotype.sum())
+    genotype_df = genotype_df[~invalid_genotype].copy()
+    # the rsID contains the expected format, 'rs' followed by digits
+    genotype_df["rsID"] = genotype_df["rsID"].astype(str)
+    invalid_rsid = ~genotype_df["rsID"].str.match(r"^rs\d+$")
+    issues["Invalid_rsID"] = int(invalid_rsid.sum())
+    genotype_df = genotype_df[~invalid_rsid].copy()
+    # then strip the prefix "rs"
+    genotype_df["rsID"] = genotype_df["rsID"].str[2:].astype(str)
+    return genotype_df, issues
+
+
+def ancient_markers(genotype_file, clinvar_file, correct_flips=False, jobs=1):
+    """
+    Function:
+        identify which ancient samples have ClinVar markers, like the page "Identify Ancients ClinVar Markers"
+    Input:
+        genotype_file: Ancient_samples_filtered_rsID.txt, the genotype matrix or a VCF file
+        clinvar_file: ClinVar_to_SNP.txt or the directory of its store, the path or an uploaded file object
+        correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+        jobs: the number of worker processes, default is 1 (no pool), the command-line scripts pass their --jobs and the pages CLINVAR_SMART_APP_JOBS
+    Raise error:
+        check if the genotype table is empty
+        see check_genotypes
+    Output:
+        DataFrame of the markers with Mutation_Status 1 or 2, attrs["allele_check"] like call_markers,
+        attrs["issues"] has the number of removed rows of every check and the number of ClinVar rows without AlternateAlleleVCF
+    """
+    clinvar_store = shared_store(clinvar_file)
+    genotype_df = read_genotypes(genotype_file, clinvar_store)
+    if genotype_df.empty:
+        raise ValueError("The genotype table is EMPTY!")
+    genotype_df, issues = check_genotypes(genotype_df, ANCIENT_COLUMNS)
+    issues["Missing_AlternateAlleleVCF"] = clinvar_store.missing("AlternateAlleleVCF")
+    # the samples are split into shards called by jobs processes for large files
+    markers_df = call_markers_parallel(genotype_df, clinvar_store, jobs=jobs, correct_flips=correct_flips)
+    markers_df.attrs["issues"] = issues
+    return markers_df
+
+
+def user_markers(user_file, clinvar_file, correct_flips=False):
+    """
+    Function:
+        find the ClinVar markers of a user, like the page "Identify User ClinVar Markers"
+    Input:
+        user_file: Test_DNA.txt, a raw 23andMe or AncestryDNA file or a one-sample VCF file
+        clinvar_file: ClinVar_to_SNP.txt or the directory of its store, the path or an uploaded file object
+        correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+    Raise error:
+        see check_genotypes
+    Output:
+        DataFrame of the markers with Mutation_Status 1 or 2, attrs["allele_check"] like call_markers,
+        attrs["issues"] like ancient_markers, with the number of SNPs, of SNPs in ClinVar and of no-calls of a text file
+    """
+    clinvar_store = shared_store(clinvar_file)
+    if is_vcf(user_file):
+        # the records with an rsID that is not in ClinVar are skipped before the genotype is read
+        user_df = user_table(read_vcf(user_file, clinvar_store.rsID))
+        read_counts = {}
+    else:
+        # only the lines of the rsIDs in ClinVar are decoded, the no-calls ("--" or "0") are removed
+        user_df = read_user_file(user_file, clinvar_store.rsid_unique)
+        read_counts = {"SNPs": user_df.attrs["snps"], "In_ClinVar": len(user_df), "No_Call": user_df.attrs["no_call"]}
+    user_df, issues = check_genotypes(user_df, USER_COLUMNS)
+    issues["Missing_AlternateAlleleVCF"] = clinvar_store.missing("AlternateAlleleVCF")
+    markers_df = call_markers(user_df, clinvar_store, correct_flips)
+    markers_df.attrs["issues"] = {**read_counts, **issues}
+    return markers_df
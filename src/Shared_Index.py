@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: Shared_Index.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module saves the output of the page "Identify Ancients ClinVar Markers" (Ancient_ClinVar_Markers.txt) as an index (rsID, Genotype) -> ancient samples,
+    so the page "Find Shared ClinVar Markers" finds the markers a user shares with the ancient samples without merging the user markers with the whole table.
+    Every different (rsID, Genotype) of the ancient markers is one key. A key keeps:
+        - the samples of its ancient rows in the order of the file, to write the Master_IDs like the merge of the page
+        - the sorted different samples, to count the different Master_IDs of an rsID
+        - its ClinVar columns (the first value of every column that is not missing), read once per key instead of once per ancient row
+    A user with n markers needs n lookups of a key, the Master_ID text of a shared key is joined from the sample numbers of its rows (nothing is kept per key).
+    The result is the same as the merge and the two groupby of the page.
+    Everything is saved in one .npz file next to the table, for example Ancient_ClinVar_Markers.shared.npz.
+
+Imported modules:
+    - numpy: to build, save and look up the index
+    - pandas: used for data manipulation and analysis.
+    - argparse, os, sys: to parse command-line arguments and to check the files
+    - ClinVar_Store: converts the rsIDs to integers
+    - Marker_Caller: the columns of the shared markers
+
+Procedures:
+    1. number the samples (Master_ID) and the keys (rsID, Genotype) of the marker table.
+    2. sort the ancient rows by key, keep the samples of every key in the order of the file and sorted, and the first ClinVar values of every key.
+    3. look up the (rsID, Genotype) of every user marker, group the user markers with a key by rsID
+       and join the Master_IDs, count the different samples and take the first values of the rsID from the keys.
+
+Usage:
+        python Shared_Index.py build Ancient_ClinVar_Markers.txt [output_file]
+        python Shared_Index.py query shared_index.npz Test_ClinVar_Markers.txt [output_file]
+    ---------- Examples:
+        python Shared_Index.py build Ancient_ClinVar_Markers.txt Ancient_ClinVar_Markers.shared.npz
+        python Shared_Index.py query Ancient_ClinVar_Markers.shared.npz Test1_ClinVar_Markers.txt Test1_Ancient_Shared.txt
+
+"""
+import argparse
+import io
+import os
+import sys
+import numpy as np
+import pandas as pd
+from ClinVar_Store import rsid_to_int
+from Marker_Caller import JOIN_COLUMNS, SHARED_COLUMNS
+
+# bump the version when the layout of the file changes
+SHARED_INDEX_VERSION = 1
+# the columns of the marker table that are needed
+INDEX_COLUMNS = ["Master_ID", "rsID", "Genotype"] + JOIN_COLUMNS + ["Mutation_Status"]
+# the ClinVar columns of a key
+KEY_COLUMNS = JOIN_COLUMNS + ["Mutation_Status"]
+# the columns of the shared markers that come from the user markers
+USER_SHARED_COLUMNS = ["Genotype", "Chromosome", "Position"]
+
+
+class SharedIndex:
+    """
+    The ancient samples of every (rsID, Genotype) of the ancient markers, with the ClinVar columns of every key.
+    """
+
+    def __init__(self, samples, key_rsids, key_genotypes, genotypes, row_samples, sample_sets, key_values, n_rows):
+        self.samples = samples
+        self.key_rsids = key_rsids
+        self.key_genotypes = key_genotypes
+        self.genotypes = genotypes
+        # (indptr, samples) of the ancient rows of every key in the order of the file, and of the sorted different samples of every key
+        self.row_ptr, self.row_samples = row_samples
+        self.sample_ptr, self.key_samples = sample_sets
+        self.key_values = key_values
+        self.n_rows = n_rows
+        self.genotype_code = {genotype: code for code, genotype in enumerate(genotypes)}
+        # the keys are sorted by (rsID, Genotype code), one integer per key for searchsorted
+        self.sorted_keys = self._keys(key_rsids, key_genotypes)
+
+    def _keys(self, rsids, genotype_codes):
+        return np.asarray(rsids, dtype=np.int64) * (len(self.genotypes) + 1) + genotype_codes
+
+    @property
+    def n_samples(self):
+        return len(self.samples)
+
+    def __len__(self):
+        return len(self.key_rsids)
+
+    def lookup(self, rsids, genotypes):
+        """
+        Function:
+            find the key of every (rsID, Genotype)
+        Input:
+            rsids: integer rsIDs
+            genotypes: the genotypes, same length as rsids
+        Output:
+            numpy int64 array, the key of every (rsID, Genotype), -1 if no ancient sample has it
+        """
+        codes = np.array([self.genotype_code.get(genotype, -1) for genotype in genotypes], dtype=np.int64)
+        rsids = np.asarray(rsids, dtype=np.int64)
+        if not len(self):
+            return np.full(len(rsids), -1, dtype=np.int64)
+        keys = self._keys(rsids, codes)
+        found = np.minimum(np.searchsorted(self.sorted_keys, keys), len(self) - 1)
+        hit = (codes >= 0) & (rsids >= 0) & (self.sorted_keys[found] == keys)
+        return np.where(hit, found, -1)
+
+    def carriers(self, key):
+        """
+        Function:
+            the sorted different samples of a key
+        Input:
+            key: the key from lookup
+        Output:
+            numpy int32 array of sample numbers
+        """
+        return self.key_samples[self.sample_ptr[key]:self.sample_ptr[key + 1]]
+
+    def key_master_ids(self, key):
+        # the Master_IDs of the ancient rows of the key separated by commas, built for every call:
+        # the index is shared by all sessions of the process, so nothing is kept per key
+        return ",".join(self.samples[self.row_samples[self.row_ptr[key]:self.row_ptr[key + 1]]])
+
+    def shared(self, user_markers_df):
+        """
+        Function:
+            find the markers the user shares with the ancient samples (same rsID and same Genotype), like the page "Find Shared ClinVar Markers".
+            The result is the same as Marker_Caller.shared_markers with the whole ancient marker table.
+        Input:
+            user_markers_df: the marker table of the user (Test_ClinVar_Markers.txt)
+        Output:
+            DataFrame with the columns rsID, SHARED_COLUMNS, Master_ID and Master_ID_Count, sorted by rsID
+        """
+        keys = self.lookup(rsid_to_int(user_markers_df["rsID"]), user_markers_df["Genotype"])
+        matched = np.flatnonzero(keys >= 0)
+        # group the user markers with a key by rsID, sorted as text like groupby
+        group_codes, group_rsids = pd.factorize(user_markers_df["rsID"].astype(str).to_numpy()[matched], sort=True)
+        group_order = np.argsort(group_codes, kind="stable")
+        bounds = np.searchsorted(group_codes[group_order], np.arange(len(group_rsids) + 1))
+        groups = [matched[group_order[bounds[i]:bounds[i + 1]]] for i in range(len(group_rsids))]
+        shared_df = pd.DataFrame({"rsID": np.asarray(group_rsids, dtype=object)})
+        for col in SHARED_COLUMNS:
+            if col in USER_SHARED_COLUMNS:
+                values, rows = user_markers_df[col], [group[0] for group in groups]
+            else:
+                values, rows = self.key_values[col], [keys[group[0]] for group in groups]
+            column = values.iloc[rows].reset_index(drop=True)
+            # groupby first skips the missing values: the first user marker or key of the rsID with a value
+            for i in np.flatnonzero(column.isna().to_numpy()):
+                group_values = (values.iloc[groups[i]] if col in USER_SHARED_COLUMNS else values.iloc[keys[groups[i]]]).dropna()
+                if len(group_values):
+                    column.iloc[i] = group_values.iloc[0]
+            shared_df[col] = column
+        shared_df["Master_ID"] = [",".join(self.key_master_ids(key) for key in keys[group]) for group in groups]
+        # the different samples of an rsID: one key is already sorted and different, several keys are put together
+        shared_df["Master_ID_Count"] = np.array([len(self.carriers(keys[group[0]])) if len(set(keys[group])) == 1
+                                                 else len(np.unique(np.concatenate([self.carriers(key) for key in set(keys[group])])))
+                                                 for group in groups], dtype=np.int64)
+        return shared_df
+
+
+def _csr(keys, values, n_keys):
+    indptr = np.zeros(n_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=n_keys), out=indptr[1:])
+    return indptr, values.astype(np.int32)
+
+
+def build_shared_index(markers_df):
+    """
+    Function:
+        build the shared index from the marker table of the page "Identify Ancients ClinVar Markers"
+    Input:
+        markers_df: DataFrame of Ancient_ClinVar_Markers.txt
+    Raise error:
+        check if the columns of the marker table are present
+    Output:
+        SharedIndex
+    """
+    missing_columns = [col for col in INDEX_COLUMNS if col not in markers_df.columns]
+    if missing_columns:
+        raise ValueError(f"The marker table is missing the following required columns: {', '.join(missing_columns)}")
+    markers_df = markers_df.reset_index(drop=True)
+    sample_codes, samples = pd.factorize(markers_df["Master_ID"].astype(str))
+    genotype_codes, genotypes = pd.factorize(markers_df["Genotype"])
+    rsids = rsid_to_int(markers_df["rsID"])
+    # the rows without a valid rsID or Genotype can not be shared
+    valid = np.flatnonzero((rsids >= 0) & (genotype_codes >= 0))
+    key_codes, key_uniques = pd.factorize(rsids[valid] * (len(genotypes) + 1) + genotype_codes[valid], sort=True)
+    n_keys = len(key_uniques)
+    # the rows of every key in the order of the file
+    order = np.argsort(key_codes, kind="stable")
+    row_samples = _csr(key_codes, sample_codes[valid][order], n_keys)
+    # the different samples of every key, sorted
+    pairs = np.unique(key_codes.astype(np.int64) * max(len(samples), 1) + sample_codes[valid])
+    sample_sets = _csr(pairs // max(len(samples), 1), pairs % max(len(samples), 1), n_keys)
+    # the first value of every ClinVar column that is not missing, like groupby first
+    key_values = markers_df[KEY_COLUMNS].iloc[valid].groupby(key_codes, sort=True).first().reset_index(drop=True)
+    key_uniques = np.asarray(key_uniques, dtype=np.int64)
+    return SharedIndex(np.asarray(samples, dtype=object), key_uniques // (len(genotypes) + 1), key_uniques % (len(genotypes) + 1),
+                       [str(genotype) for genotype in genotypes], row_samples, sample_sets, key_values, len(markers_df))
+
+
+def save_shared_index(index, output_file):
+    """
+    Function:
+        save the shared index to a .npz file
+    Input:
+        index: SharedIndex
+        output_file: the path of the .npz file or a binary file object
+    """
+    arrays = {
+        "version": np.array(SHARED_INDEX_VERSION), "n_rows": np.array(index.n_rows),
+        "samples": np.asarray(index.samples, dtype=str), "genotypes": np.asarray(index.genotypes, dtype=str),
+        "key_rsids": index.key_rsids, "key_genotypes": index.key_genotypes,
+        "row_ptr": index.row_ptr, "row_samples": index.row_samples,
+        "sample_ptr": index.sample_ptr, "key_samples": index.key_samples,
+    }
+    # the text columns are saved as codes of their categories, -1 for the missing values
+    text_columns = []
+    for col in KEY_COLUMNS:
+        values = index.key_values[col]
+        if pd.api.types.is_numeric_dtype(values):
+            arrays[f"key_{col}"] = values.to_numpy()
+        else:
+            codes, categories = pd.factorize(values)
+            arrays[f"key_{col}"] = codes.astype(np.int32)
+            arrays[f"categories_{col}"] = np.asarray(categories, dtype=str)
+            text_columns.append(col)
+    arrays["text_columns"] = np.asarray(text_columns, dtype=str)
+    np.savez_compressed(output_file, **arrays)
+
+
+def shared_index_bytes(index):
+    """
+    Function:
+        the .npz file of the shared index in memory, for the download button
+    Input:
+        index: SharedIndex
+    Output:
+        bytes
+    """
+    buffer = io.BytesIO()
+    save_shared_index(index, buffer)
+    return buffer.getvalue()
+
+
+def open_shared_index(source):
+    """
+    Function:
+        read a shared index saved with save_shared_index
+    Input:
+        source: the path of the .npz file or an uploaded file object
+    Raise error:
+        check the version of the file
+    Output:
+        SharedIndex
+    """
+    with np.load(source, allow_pickle=False) as arrays:
+        if "version" not in arrays or "key_rsids" not in arrays:
+            raise ValueError("The .npz file is not a shared index of Ancient_ClinVar_Markers.txt.")
+        if int(arrays["version"]) != SHARED_INDEX_VERSION:
+            raise ValueError(f"The shared index has version {int(arrays['version'])}, this version of ClinVar-SMART reads version {SHARED_INDEX_VERSION}.")
+        text_columns = arrays["text_columns"].tolist()
+        key_values = pd.DataFrame()
+        for col in KEY_COLUMNS:
+            if col in text_columns:
+                key_values[col] = pd.Categorical.from_codes(arrays[f"key_{col}"], categories=arrays[f"categories_{col}"].tolist()).astype(object)
+            else:
+                key_values[col] = arrays[f"key_{col}"]
+        return SharedIndex(arrays["samples"].astype(object), arrays["key_rsids"], arrays["key_genotypes"], arrays["genotypes"].tolist(),
+                           (arrays["row_ptr"], arrays["row_samples"]), (arrays["sample_ptr"], arrays["key_samples"]), key_values, int(arrays["n_rows"]))
+
+
+def load_shared_index(source):
+    """
+    Function:
+        open a shared index (.npz) or build it from Ancient_ClinVar_Markers.txt
+    Input:
+        source: the path or the uploaded file of the .npz file or of Ancient_ClinVar_Markers.txt
+    Output:
+        SharedIndex
+    """
+    name = source if isinstance(source, str) else getattr(source, "name", "")
+    if name.endswith(".npz"):
+        return open_shared_index(source)
+    return build_shared_index(pd.read_csv(source, sep="\t", header=0))
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Shared_Index.py', description="index Ancient_ClinVar_Markers.txt by (rsID, Genotype) and find the markers shared with a user")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build_parser = subparsers.add_parser("build", help="build the shared index of a marker table")
+    build_parser.add_argument("markers_file", type=str, help="Path to Ancient_ClinVar_Markers.txt")
+    build_parser.add_argument("output_file", type=str, nargs='?', default=None, help="default is the marker table with the suffix .shared.npz")
+    query_parser = subparsers.add_parser("query", help="find the markers a user shares with the ancient samples")
+    query_parser.add_argument("index_file", type=str, help="Path to the .shared.npz file or to Ancient_ClinVar_Markers.txt")
+    query_parser.add_argument("user_markers", type=str, help="Path to Test_ClinVar_Markers.txt")
+    query_parser.add_argument("output_file", type=str, nargs='?', default=None, help="default is Test_Ancient_Shared.txt")
+    args = parser.parse_args()
+    input_files = [args.markers_file] if args.command == "build" else [args.index_file, args.user_markers]
+    for input_file in input_files:
+        if not os.path.isfile(input_file):
+            sys.exit(f"Error: The input file {input_file} is NOT FOUND !")
+    try:
+        if args.command == "build":
+            output_file = args.output_file or f"{os.path.splitext(args.markers_file)[0]}.shared.npz"
+            index = build_shared_index(pd.read_csv(args.markers_file, sep="\t", header=0, usecols=INDEX_COLUMNS))
+            save_shared_index(index, output_file)
+            print(f"The shared index {output_file} has {len(index)} (rsID, Genotype) keys of {index.n_samples} samples and {index.n_rows} markers.")
+            return
+        index = load_shared_index(args.index_file)
+        shared_df = index.shared(pd.read_csv(args.user_markers, sep="\t", header=0))
+        output_file = args.output_file or "Test_Ancient_Shared.txt"
+        shared_df.to_csv(output_file, sep="\t", index=False)
+        print(f"{len(shared_df)} shared markers are written to {output_file}.")
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
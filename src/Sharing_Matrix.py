@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: Sharing_Matrix.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This script compares every user with every ancient individual at once: for every (user, ancient sample) pair it counts the shared marker genotypes
+    (same rsID and same Genotype, like the page "Find Shared ClinVar Markers") and a score weighted by the ClinicalSignificance of the shared markers.
+    It writes the most similar ancient samples of every user (top k) and, the other way round, the users most similar to every ancient sample.
+    The ancient markers are read from the shared index of Shared_Index.py, every (rsID, Genotype) key of the index is one bit.
+    Every sample (ancient or user) is a row of 64-bit words with one bit per key it has, so the shared markers of a pair are
+    the number of bits set in (user words AND ancient words), counted with a vectorized popcount.
+    The keys are ordered by their weight and every weight starts a new word, so a word has one weight and the score is the sum of popcount x weight of the words.
+    A block of users only needs the words where at least one of its users has a bit, the other words are skipped.
+    The blocks of users are computed by a pool of processes, the ancient words are sent once to every worker.
+
+Imported modules:
+    - numpy: to build the bitsets and count the shared bits
+    - pandas: used for data manipulation and analysis.
+    - argparse: to parse command-line arguments and options
+    - concurrent.futures: to compute the blocks of users with a pool of processes
+    - os, sys, time: to find the files, to check them and to time the matrix
+    - ClinVar_Store: converts the rsIDs to integers
+    - Shared_Index: the index (rsID, Genotype) -> ancient samples of Ancient_ClinVar_Markers.txt
+
+Procedures:
+    1. open the shared index (or build it from Ancient_ClinVar_Markers.txt) and read the marker tables of the users, perform error checks before continuing next steps.
+    2. weight every key by its ClinicalSignificance, order the keys by weight and pack the keys of every ancient sample and of every user into 64-bit words.
+    3. for every block of users: AND the words with the words of every ancient sample, count the bits and add up the counts and the weights of the words.
+    4. keep the top k ancient samples of every user and the top k users of every ancient sample, optionally the whole matrix.
+
+Inputfile:
+    Ancient_ClinVar_Markers.txt or Ancient_ClinVar_Markers.shared.npz, the marker tables of the users ({name}_ClinVar_Markers.txt, for example the output of User_Batch.py)
+Outputfile:
+    in the output directory:
+    Sharing_Top_Ancients.txt: the top k ancient samples of every user
+    Sharing_Top_Users.txt: the top k users of every ancient sample
+    Sharing_Matrix.npz (with --matrix): the shared markers and the scores of all pairs
+Usage:
+        python Sharing_Matrix.py ancient_index user_markers [user_markers ...] [--outdir OUTDIR] [--top-k K] [--jobs JOBS] [--weight SIGNIFICANCE=WEIGHT] [--matrix]
+    ---------- Examples:
+        python Sharing_Matrix.py Ancient_ClinVar_Markers.shared.npz User_Batch/ --top-k 10
+        python Sharing_Matrix.py Ancient_ClinVar_Markers.txt Test1_ClinVar_Markers.txt Test2_ClinVar_Markers.txt --weight "Likely pathogenic=0.8" --matrix
+
+"""
+import argparse
+import os
+import sys
+import time
+# make sure the module is installed
+try:
+    import numpy as np
+    import pandas as pd
+    from concurrent.futures import ProcessPoolExecutor
+    from ClinVar_Store import rsid_to_int
+    from Shared_Index import load_shared_index
+except ImportError as e:
+    sys.exit(f"ERROR: Python module not installed. {e}")
+
+# the weight of a shared marker by its ClinicalSignificance, the first term is used for combinations like "Pathogenic; risk factor"
+SIGNIFICANCE_WEIGHTS = {"Pathogenic": 1.0, "Pathogenic/Likely pathogenic": 0.75, "Likely pathogenic": 0.5,
+                        "risk factor": 0.25, "Uncertain significance": 0.1, "Likely benign": 0.0, "Benign": 0.0}
+# the weight of the other ClinicalSignificance values
+DEFAULT_WEIGHT = 0.1
+# the marker tables of the users end with this name, the part before it is the name of the user
+MARKERS_SUFFIX = "_ClinVar_Markers.txt"
+# the number of users in a block, one block is one task of the pool
+USERS_PER_BLOCK = 256
+# the largest AND of words computed at once, in bytes
+BLOCK_BYTES = 64 * 2 ** 20
+TOP_K = 10
+
+if hasattr(np, "bitwise_count"):
+    popcount = np.bitwise_count
+else:
+    # numpy < 2.0: count the bits of every byte with a table
+    _BYTE_BITS = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(words):
+        return _BYTE_BITS[words.view(np.uint8)].reshape(*words.shape, 8).sum(axis=-1, dtype=np.uint8)
+
+
+def significance_weights(significance, weights=None):
+    """
+    Function:
+        the weight of every key by its ClinicalSignificance
+    Input:
+        significance: pandas Series with the ClinicalSignificance of every key
+        weights: dictionary ClinicalSignificance -> weight, default is SIGNIFICANCE_WEIGHTS
+    Output:
+        numpy float64 array, one weight per key
+    """
+    weights = SIGNIFICANCE_WEIGHTS if weights is None else weights
+    # the different values are looked up once
+    codes, values = pd.factorize(significance, use_na_sentinel=False)
+    value_weights = [weights.get(str(value), weights.get(str(value).split(";")[0].strip(), DEFAULT_WEIGHT)) for value in values]
+    return np.asarray(value_weights, dtype=np.float64)[codes]
+
+
+def key_words(key_weights):
+    """
+    Function:
+        place the keys in 64-bit words, the keys of the same weight are next to each other and every weight starts a new word
+    Input:
+        key_weights: the weight of every key
+    Output:
+        (the bit of every key, the weight of every word)
+    """
+    weight_codes, weights = pd.factorize(key_weights, sort=True)
+    bits = np.zeros(len(key_weights), dtype=np.int64)
+    word_weights, n_words = [], 0
+    for code, weight in enumerate(weights):
+        keys = np.flatnonzero(weight_codes == code)
+        bits[keys] = n_words * 64 + np.arange(len(keys))
+        words = -(-len(keys) // 64)
+        word_weights += [weight] * words
+        n_words += words
+    return bits, np.asarray(word_weights, dtype=np.float64)
+
+
+def pack_bits(rows, bits, n_rows, n_words):
+    """
+    Function:
+        set the bits of every row
+    Input:
+        rows: the row of every bit
+        bits: the bit numbers, a (row, bit) is given once
+        n_rows, n_words: the shape of the words
+    Output:
+        numpy uint64 array (n_rows, n_words)
+    """
+    words = np.zeros(n_rows * n_words, dtype=np.uint64)
+    np.bitwise_or.at(words, np.asarray(rows, dtype=np.int64) * n_words + bits // 64, np.left_shift(np.uint64(1), (bits % 64).astype(np.uint64)))
+    return words.reshape(n_rows, n_words)
+
+
+def share_block(user_words, ancient_words, word_weights):
+    """
+    Function:
+        the shared markers and the weighted scores of a block of users with every ancient sample
+    Input:
+        user_words: numpy uint64 array (users, words)
+        ancient_words: numpy uint64 array (ancient samples, words)
+        word_weights: the weight of every word
+    Output:
+        (shared markers, numpy int32 array (users, ancient samples), scores, numpy float64 array (users, ancient samples))
+    """
+    # only the words where a user of the block has a bit can have a shared bit
+    used = np.flatnonzero(user_words.any(axis=0))
+    n_users, n_ancients = len(user_words), len(ancient_words)
+    counts = np.zeros((n_users, n_ancients), dtype=np.int32)
+    scores = np.zeros((n_users, n_ancients), dtype=np.float64)
+    if not len(used):
+        return counts, scores
+    user_words, ancient_words = user_words[:, used], ancient_words[:, used]
+    # the words of a weight are next to each other: the bits are counted per weight and multiplied by the weight once
+    starts = np.flatnonzero(np.r_[True, word_weights[used][1:] != word_weights[used][:-1]])
+    weights = word_weights[used][starts]
+    # the ancient samples are split so the AND of a part is at most BLOCK_BYTES
+    step = max(1, BLOCK_BYTES // (8 * n_users * len(used)))
+    for start in range(0, n_ancients, step):
+        shared = popcount(user_words[:, None, :] & ancient_words[None, start:start + step, :])
+        weight_counts = np.add.reduceat(shared, starts, axis=-1, dtype=np.int32)
+        counts[:, start:start + step] = weight_counts.sum(axis=-1)
+        # rounded, so the same score from different weights is equal for the ranking
+        scores[:, start:start + step] = np.round(weight_counts @ weights, 9)
+    return counts, scores
+
+
+def top_k(counts, scores, k):
+    """
+    Function:
+        the k best entries of every row by score, then by shared markers, then by column; the entries without shared markers are left out
+    Input:
+        counts, scores: numpy arrays (rows, columns), the output of share_block
+        k: the number of entries kept
+    Output:
+        (columns, shared markers, scores), numpy arrays (rows, k), the columns of the missing entries are -1
+    """
+    n_rows, n_columns = counts.shape
+    best = np.full((n_rows, k), -1, dtype=np.int64)
+    best_counts = np.zeros((n_rows, k), dtype=np.int32)
+    best_scores = np.zeros((n_rows, k), dtype=np.float64)
+    if not n_rows or not n_columns or not k:
+        return best, best_counts, best_scores
+    # the k-th best score of every row, only the entries with at least this score are sorted
+    kth = -np.partition(-scores, min(k, n_columns) - 1, axis=1)[:, min(k, n_columns) - 1]
+    rows, columns = np.nonzero((scores >= kth[:, None]) & (counts > 0))
+    order = np.lexsort((columns, -counts[rows, columns], -scores[rows, columns], rows))
+    rows, columns = rows[order], columns[order]
+    # the rank of every entry in its row
+    ranks = np.arange(len(rows)) - np.searchsorted(rows, rows)
+    keep = ranks < k
+    rows, columns, ranks = rows[keep], columns[keep], ranks[keep]
+    best[rows, ranks] = columns
+    best_counts[rows, ranks] = counts[rows, columns]
+    best_scores[rows, ranks] = scores[rows, columns]
+    return best, best_counts, best_scores
+
+
+# the ancient words of the worker processes, sent once when the worker starts
+_worker_ancient_words = None
+_worker_word_weights = None
+
+
+def _init_worker(ancient_words, word_weights):
+    global _worker_ancient_words, _worker_word_weights
+    _worker_ancient_words, _worker_word_weights = ancient_words, word_weights
+
+
+def _share_users(user_words, k, keep_matrix):
+    counts, scores = share_block(user_words, _worker_ancient_words, _worker_word_weights)
+    return top_k(counts, scores, k), top_k(counts.T, scores.T, k), (counts, scores) if keep_matrix else None
+
+
+def user_keys(shared_index, users):
+    """
+    Function:
+        the keys of the shared index that every user has, the marker tables of all users are looked up at once
+    Input:
+        shared_index: SharedIndex of the ancient markers
+        users: list of (name, marker table with the columns rsID and Genotype)
+    Output:
+        (the user of every key, the key), every (user, key) once, the markers that no ancient sample has are left out
+    """
+    markers_df = pd.concat([markers_df[["rsID", "Genotype"]] for _, markers_df in users] + [pd.DataFrame(columns=["rsID", "Genotype"])], ignore_index=True)
+    rows = np.repeat(np.arange(len(users), dtype=np.int64), [len(markers_df) for _, markers_df in users])
+    keys = shared_index.lookup(rsid_to_int(markers_df["rsID"]), markers_df["Genotype"])
+    pairs = np.unique(rows[keys >= 0] * max(len(shared_index), 1) + keys[keys >= 0])
+    return pairs // max(len(shared_index), 1), pairs % max(len(shared_index), 1)
+
+
+def sharing_matrix(shared_index, users, weights=None, k=TOP_K, jobs=1, keep_matrix=False):
+    """
+    Function:
+        compare every user with every ancient sample of the shared index
+    Input:
+        shared_index: SharedIndex of the ancient markers
+        users: list of (name, marker table) of the users
+        weights: dictionary ClinicalSignificance -> weight, default is SIGNIFICANCE_WEIGHTS
+        k: the number of the most similar samples kept
+        jobs: the number of worker processes
+        keep_matrix: also return the shared markers and the scores of all pairs
+    Raise error:
+        check if there is a user
+    Output:
+        (the top k ancient samples of every user, the top k users of every ancient sample, (shared markers, scores) or None), DataFrames and numpy arrays
+    """
+    if not users:
+        raise ValueError("No marker table of a user to compare")
+    bits, word_weights = key_words(significance_weights(shared_index.key_values["ClinicalSignificance"], weights))
+    n_words = len(word_weights)
+    # the ancient words from the different samples of every key
+    key_of_sample = np.repeat(np.arange(len(shared_index)), np.diff(shared_index.sample_ptr))
+    ancient_words = pack_bits(shared_index.key_samples, bits[key_of_sample], shared_index.n_samples, n_words)
+    user_rows, keys = user_keys(shared_index, users)
+    user_words = pack_bits(user_rows, bits[keys], len(users), n_words)
+    blocks = [slice(start, start + USERS_PER_BLOCK) for start in range(0, len(users), USERS_PER_BLOCK)]
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(blocks)))
+    if jobs == 1:
+        _init_worker(ancient_words, word_weights)
+        results = [_share_users(user_words[block], k, keep_matrix) for block in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(ancient_words, word_weights)) as pool:
+            results = list(pool.map(_share_users, [user_words[block] for block in blocks], [k] * len(blocks), [keep_matrix] * len(blocks)))
+    user_names = np.asarray([name for name, _ in users], dtype=object)
+    # the top ancient samples of every user, one block after the other
+    best, best_counts, best_scores = (np.concatenate([result[0][i] for result in results]) for i in range(3))
+    user_rows, ranks = np.nonzero(best >= 0)
+    top_ancients_df = pd.DataFrame({"User": user_names[user_rows], "Rank": ranks + 1, "Master_ID": shared_index.samples[best[user_rows, ranks]],
+                                    "Shared_Markers": best_counts[user_rows, ranks], "Weighted_Score": best_scores[user_rows, ranks].round(4)})
+    # the top users of every ancient sample: the top k of every block are put together and the top k of them are kept
+    best, best_counts, best_scores = (np.concatenate([result[1][i] for result in results], axis=1) for i in range(3))
+    offsets = np.repeat([block.start for block in blocks], k)
+    # the candidates of the blocks are in the order of the users, so the ties are still kept in the order of the users
+    order, best_counts, best_scores = top_k(best_counts, best_scores, k)
+    best = np.where(order >= 0, np.take_along_axis(best + offsets, np.maximum(order, 0), axis=1), -1)
+    sample_rows, ranks = np.nonzero(best >= 0)
+    top_users_df = pd.DataFrame({"Master_ID": shared_index.samples[sample_rows], "Rank": ranks + 1, "User": user_names[best[sample_rows, ranks]],
+                                 "Shared_Markers": best_counts[sample_rows, ranks], "Weighted_Score": best_scores[sample_rows, ranks].round(4)})
+    matrix = None
+    if keep_matrix:
+        matrix = (np.concatenate([result[2][0] for result in results]), np.concatenate([result[2][1] for result in results]))
+    return top_ancients_df, top_users_df, matrix
+
+
+def list_marker_files(sources):
+    """
+    Function:
+        the marker tables of the users from files and directories
+    Input:
+        sources: marker tables or directories, in a directory the files ending with _ClinVar_Markers.txt are used
+    Output:
+        list of (name of the user, path)
+    """
+    marker_files = []
+    for source in sources:
+        if os.path.isdir(source):
+            paths = sorted(os.path.join(source, name) for name in os.listdir(source)
+                           if name.endswith(MARKERS_SUFFIX) and name != f"Cohort{MARKERS_SUFFIX}")
+        else:
+            paths = [source]
+        for path in paths:
+            name = os.path.basename(path)
+            marker_files.append((name[:-len(MARKERS_SUFFIX)] if name.endswith(MARKERS_SUFFIX) else os.path.splitext(name)[0], path))
+    return marker_files
+
+
+def parse_weights(values):
+    # "ClinicalSignificance=weight" values of --weight replace the default weights
+    weights = dict(SIGNIFICANCE_WEIGHTS)
+    for value in values or []:
+        significance, _, weight = value.rpartition("=")
+        if not significance:
+            raise ValueError(f'--weight {value}: use "ClinicalSignificance=weight", for example "Likely pathogenic=0.8"')
+        weights[significance] = float(weight)
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Sharing_Matrix.py', description="count the shared ClinVar markers of every user and every ancient sample")
+    parser.add_argument("ancient_index", type=str, help="Path to Ancient_ClinVar_Markers.shared.npz or to Ancient_ClinVar_Markers.txt")
+    parser.add_argument("user_markers", type=str, nargs="+", help="the marker tables of the users, or directories of {name}_ClinVar_Markers.txt files")
+    parser.add_argument("--outdir", type=str, default="Sharing_Matrix", help="the output directory")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help=f"the number of the most similar samples kept, default is {TOP_K}")
+    parser.add_argument("--jobs", type=int, default=None, help="the number of worker processes, default is the number of CPUs")
+    parser.add_argument("--weight", type=str, action="append", default=None, help='the weight of a ClinicalSignificance, for example "Pathogenic=1", can be repeated')
+    parser.add_argument("--matrix", action="store_true", help="also save the shared markers and the scores of all pairs to Sharing_Matrix.npz")
+    args = parser.parse_args()
+    for input_file in [args.ancient_index] + args.user_markers:
+        if not os.path.exists(input_file):
+            sys.exit(f"Error: The input file {input_file} is NOT FOUND !")
+    try:
+        weights = parse_weights(args.weight)
+        shared_index = load_shared_index(args.ancient_index)
+        marker_files = list_marker_files(args.user_markers)
+        if not marker_files:
+            raise ValueError("No marker table of a user found")
+        users = [(name, pd.read_csv(path, sep="\t", header=0, usecols=["rsID", "Genotype"])) for name, path in marker_files]
+    except (OSError, ValueError, KeyError) as e:
+        sys.exit(f"Error: An error occurred while reading the input files: {e}")
+    start = time.perf_counter()
+    top_ancients_df, top_users_df, matrix = sharing_matrix(shared_index, users, weights, args.top_k, args.jobs, args.matrix)
+    seconds = time.perf_counter() - start
+    os.makedirs(args.outdir, exist_ok=True)
+    top_ancients_df.to_csv(os.path.join(args.outdir, "Sharing_Top_Ancients.txt"), sep="\t", index=False)
+    top_users_df.to_csv(os.path.join(args.outdir, "Sharing_Top_Users.txt"), sep="\t", index=False)
+    if matrix is not None:
+        np.savez_compressed(os.path.join(args.outdir, "Sharing_Matrix.npz"), users=np.asarray([name for name, _ in users], dtype=str),
+                            samples=np.asarray(shared_index.samples, dtype=str), shared_markers=matrix[0], scores=matrix[1])
+    print(f"{len(users)} users x {shared_index.n_samples} ancient samples in {seconds:.1f} s, "
+          f"{len(users) * shared_index.n_samples / max(seconds, 1e-9):.0f} pairs/s, the outputs are in {args.outdir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: Stage_Metrics.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module records the wall time, the number of rows, the throughput (rows per second) and the memory added by every stage of a page
+    (parsing, checking, calling the markers, writing the output ...), so a slow page shows which stage is the bottleneck.
+    A page starts a recorder with begin(), the stages are measured with the context manager stage() or the decorator timed(),
+    and the page shows recorder.table() in an expander. The stages of a page run in the thread of its session, so the recorders of the sessions are separate.
+    The stages outside of a page (the command-line scripts) are only recorded to the JSON lines file.
+    Settings (environment variables):
+        - CLINVAR_SMART_METRICS: "0" turns the measures off, stage() and timed() only call the function then (default "1")
+        - CLINVAR_SMART_METRICS_FILE: append every stage as one JSON line to this file, for the monitoring (default: not written)
+    The memory of a stage is the peak resident memory of the process during the stage minus the resident memory at its start (Linux only).
+    The resident memory is sampled by one background thread while a stage is open, so nothing of the process is reset
+    and the stages of the sessions running at the same time do not change each other's start; their allocations are counted in the peak too.
+    A peak shorter than the sampling interval can be missed. The memory of the worker processes is not counted.
+
+Imported modules:
+    - pandas: the table of the stages shown on the page
+    - contextlib, contextvars, functools, json, os, threading, time: the timer, the memory sampler, the recorder of the current session and the JSON lines file
+
+Procedures:
+    1. begin(page) starts a new recorder for the current run of a page.
+    2. stage(name) measures the time and the memory added by its block, the number of rows is set by the block; timed() does the same for a function.
+    3. every stage is added to the recorder of the page and written to the JSON lines file if it is set, add_stage() adds a stage timed by the caller.
+    4. recorder.table() has one row per stage for the page.
+
+"""
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import pandas as pd
+
+# the measures are on by default, they cost a few microseconds per stage
+ENABLED = os.environ.get("CLINVAR_SMART_METRICS", "1") != "0"
+METRICS_FILE = os.environ.get("CLINVAR_SMART_METRICS_FILE") or None
+# the columns of the table shown on the pages
+METRICS_COLUMNS = ["Stage", "Seconds", "Rows", "Rows_per_Second", "Peak_RSS_Delta_MB"]
+# the interval of the samples of the resident memory while a stage is open
+SAMPLE_SECONDS = 0.02
+
+# the recorder of the page and the open stage of the current session (thread)
+_recorder = contextvars.ContextVar("stage_recorder", default=None)
+_open_stage = contextvars.ContextVar("open_stage", default=None)
+_file_lock = threading.Lock()
+
+
+class StageRecorder:
+    """
+    The stages of one run of a page, in the order they started.
+    """
+    def __init__(self, page):
+        self.page = page
+        self.records = []
+
+    def table(self):
+        """
+        Function:
+            the stages as a table, the nested stages are indented under their parent
+        Output:
+            DataFrame with the columns METRICS_COLUMNS
+        """
+        rows = [{**record, "Stage": "\u2003" * record["Depth"] + record["Stage"]} for record in self.records]
+        return pd.DataFrame(rows, columns=METRICS_COLUMNS).astype({"Rows": "Int64", "Rows_per_Second": "Int64"})
+
+
+def begin(page):
+    """
+    Function:
+        start a new recorder for the current run of a page, the stages of the run are added to it
+    Input:
+        page: the name of the page
+    Output:
+        StageRecorder
+    """
+    recorder = StageRecorder(page)
+    _recorder.set(recorder)
+    return recorder
+
+
+def memory_mb(field):
+    """
+    Function:
+        a memory field of this process from /proc/self/status (Linux), VmHWM is the peak resident memory and VmRSS the current one.
+        ru_maxrss of the module resource is kept across fork and exec, so a new process would start with the peak of the process that started it.
+    Input:
+        field: "VmHWM" or "VmRSS"
+    Output:
+        megabytes, None if /proc/self/status is not available
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler:
+    """
+    One background thread sampling the resident memory (VmRSS) of the process while at least one stage is open,
+    every sample raises the peak of all open stages. The thread stops when the last stage is closed.
+    """
+    def __init__(self, interval=SAMPLE_SECONDS):
+        self.interval = interval
+        self._records = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def open(self, record):
+        with self._lock:
+            self._records[id(record)] = record
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="Stage_Metrics_sampler", daemon=True)
+                self._thread.start()
+
+    def close(self, record):
+        with self._lock:
+            self._records.pop(id(record), None)
+
+    def _run(self):
+        while True:
+            rss = memory_mb("VmRSS")
+            # the peaks are raised under the lock, so a closed stage is never changed after close()
+            with self._lock:
+                if not self._records:
+                    self._thread = None
+                    return
+                if rss is not None:
+                    for record in self._records.values():
+                        record["_peak"] = max(record["_peak"], rss)
+            time.sleep(self.interval)
+
+
+_sampler = MemorySampler()
+
+
+def _write_line(record):
+    # one JSON object per line, the lock keeps the lines of the sessions apart
+    line = json.dumps({"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "pid": os.getpid(), **record})
+    try:
+        with _file_lock, open(METRICS_FILE, "a") as f:
+            f.write(line + "\n")
+    except OSError:
+        pass
+
+
+def _active():
+    # the stages are measured only if they are shown on a page or written to the JSON lines file
+    return ENABLED and (_recorder.get() is not None or METRICS_FILE is not None)
+
+
+def _new_record(name, rows):
+    # the record is added to the recorder when the stage starts, so the nested stages are listed under their parent
+    parent = _open_stage.get()
+    record = {"Stage": name, "Rows": rows, "Depth": 0 if parent is None else parent["Depth"] + 1,
+              "Seconds": None, "Rows_per_Second": None, "Peak_RSS_Delta_MB": None}
+    recorder = _recorder.get()
+    if recorder is not None:
+        recorder.records.append(record)
+    return record
+
+
+def _finish(record, seconds, delta):
+    record["Seconds"] = round(seconds, 4)
+    record["Rows_per_Second"] = round(record["Rows"] / seconds) if record["Rows"] is not None and seconds > 0 else None
+    record["Peak_RSS_Delta_MB"] = None if delta is None else round(delta, 1)
+    if METRICS_FILE is not None:
+        recorder = _recorder.get()
+        _write_line({"page": None if recorder is None else recorder.page, **record})
+
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """
+    Function:
+        measure the wall time and the memory added by the block (peak minus start of the resident memory), the block sets record["Rows"] when the number of rows is known at the end
+    Input:
+        name: the name of the stage
+        rows: the number of rows, if it is known at the start
+    Output:
+        the record of the stage (a dictionary), an empty dictionary if nothing is recorded
+    """
+    if not _active():
+        yield {}
+        return
+    record = _new_record(name, rows)
+    token = _open_stage.set(record)
+    # the samples of the memory sampler raise the peak of every open stage, the nested stages and their parent included
+    start_rss = memory_mb("VmRSS")
+    record["_peak"] = start_rss or 0.0
+    if start_rss is not None:
+        _sampler.open(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        seconds = time.perf_counter() - start
+        _open_stage.reset(token)
+        _sampler.close(record)
+        peak = record.pop("_peak")
+        delta = None
+        if start_rss is not None:
+            # the last sample, a stage shorter than the sampling interval only has its start and its end
+            delta = max(peak, memory_mb("VmRSS") or 0.0) - start_rss
+        _finish(record, seconds, delta)
+
+
+def add_stage(name, seconds, rows=None):
+    """
+    Function:
+        add a stage timed by the caller, e.g. the time summed over the chunks of a file, its memory is not measured
+    Input:
+        name: the name of the stage
+        seconds: the wall time
+        rows: the number of rows
+    """
+    if _active():
+        _finish(_new_record(name, rows), seconds, None)
+
+
+def timed(name=None, rows=None):
+    """
+    Function:
+        decorator measuring every call of a function as a stage
+    Input:
+        name: the name of the stage, default is the name of the function
+        rows: function giving the number of rows from the result, e.g. len
+    Output:
+        the decorated function
+    """
+    def decorate(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # nothing is measured outside of a page without the JSON lines file
+            if not _active():
+                return func(*args, **kwargs)
+            with stage(stage_name) as record:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    record["Rows"] = rows(result)
+                return result
+        return wrapper
+    return decorate
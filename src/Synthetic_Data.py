@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: Synthetic_Data.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This script writes synthetic input files of a realistic size for Benchmark.py, the files in Raw_Data only have a few SNPs.
+    The same seed always writes the same files, so a benchmark can be compared across commits.
+        - variant_summary.txt.gz: N variants, every variant has a row for GRCh37 and for GRCh38 like the ClinVar release.
+          The columns have the distributions of a real release: most rows are single nucleotide variants, some have no rsID (-1),
+          several AlleleIDs can have the same rsID, the ClinicalSignificance, ReviewStatus and "not provided" PhenotypeList are mixed.
+        - an ancient panel of S samples x V SNPs as .ped/.map (the text files of Step 3) or .bed/.bim/.fam (PLINK_Reader.py).
+          Part of the SNPs are the SNPs of ClinVar_to_SNP.txt with their ClinVar alleles, the other SNPs have rsIDs that are not in ClinVar.
+          Ancient genotypes have many missing calls.
+        - a raw user file like the 23andMe download (about 600,000 SNPs, "--" for a no-call) or the AncestryDNA download (allele1 and allele2).
+    Every table is built with numpy as whole columns and written in blocks, the text of the .ped file is put together as bytes.
+
+Imported modules:
+    - numpy: the random generator and the columns of the files
+    - pandas: to write the tables
+    - argparse, gzip, os, sys: to parse command-line arguments and to write the files
+
+Procedures:
+    1. draw the columns of the variants with numpy.random.default_rng(seed), write both assemblies of every block of variants.
+    2. take the SNPs of the panel from ClinVar_to_SNP.txt and from new rsIDs, draw an allele frequency and the genotypes of every SNP.
+    3. write the genotypes as .ped/.map or as .bed/.bim/.fam.
+    4. write the user file with the SNPs of ClinVar_to_SNP.txt, new rsIDs, 23andMe internal IDs and no-calls.
+
+Usage:
+        python Synthetic_Data.py variant_summary output_file --variants N [--seed SEED]
+        python Synthetic_Data.py panel ClinVar_to_SNP.txt prefix --samples S --snps V [--format ped|bed] [--seed SEED]
+        python Synthetic_Data.py user ClinVar_to_SNP.txt output_file [--snps 600000] [--format 23andme|ancestry] [--seed SEED]
+    ---------- Examples:
+        python Synthetic_Data.py variant_summary variant_summary_2M.txt.gz --variants 1000000
+        python Synthetic_Data.py panel ClinVar_to_SNP.txt Ancient_1000x100k --samples 1000 --snps 100000 --format bed
+        python Synthetic_Data.py user ClinVar_to_SNP.txt User_600k.txt
+
+"""
+import argparse
+import gzip
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# the columns of variant_summary.txt
+VARIANT_SUMMARY_COLUMNS = ['#AlleleID', 'Type', 'Name', 'GeneID', 'GeneSymbol', 'HGNC_ID', 'ClinicalSignificance', 'ClinSigSimple', 'LastEvaluated',
+                           'RS# (dbSNP)', 'nsv/esv (dbVar)', 'RCVaccession', 'PhenotypeIDS', 'PhenotypeList', 'Origin', 'OriginSimple', 'Assembly',
+                           'ChromosomeAccession', 'Chromosome', 'Start', 'Stop', 'ReferenceAllele', 'AlternateAllele', 'Cytogenetic', 'ReviewStatus',
+                           'NumberSubmitters', 'Guidelines', 'TestedInGTR', 'OtherIDs', 'SubmitterCategories', 'VariationID', 'PositionVCF',
+                           'ReferenceAlleleVCF', 'AlternateAlleleVCF']
+# the values and their share of the rows, close to a recent ClinVar release
+TYPES = {"single nucleotide variant": 0.88, "Deletion": 0.05, "Duplication": 0.03, "Indel": 0.02, "Insertion": 0.01, "Microsatellite": 0.01}
+CLIN_SIGNIFICANCE = {"Uncertain significance": 0.42, "Likely benign": 0.25, "Benign": 0.08, "Pathogenic": 0.08, "Likely pathogenic": 0.04,
+                     "Conflicting classifications of pathogenicity": 0.07, "Pathogenic/Likely pathogenic": 0.02, "not provided": 0.02,
+                     "Benign/Likely benign": 0.02}
+REVIEW_STATUS = {"criteria provided, single submitter": 0.70, "criteria provided, multiple submitters, no conflicts": 0.12,
+                 "criteria provided, conflicting classifications": 0.07, "no assertion criteria provided": 0.07,
+                 "reviewed by expert panel": 0.02, "no classification provided": 0.015, "practice guideline": 0.005}
+CHROMOSOMES = [str(c) for c in range(1, 23)] + ["X", "Y", "MT"]
+NUCLEOTIDES = np.array(list("ACGT"))
+# the share of the variants without an rsID, and of the rsIDs shared by two AlleleIDs
+MISSING_RSID_RATE = 0.15
+SHARED_RSID_RATE = 0.05
+NOT_PROVIDED_RATE = 0.2
+# the rows of variant_summary.txt written at a time
+BLOCK_VARIANTS = 250000
+# the .ped allele codes of PLINK_Reader: 1 A, 2 T, 3 C, 4 G
+PED_CODES = {"A": 1, "T": 2, "C": 3, "G": 4}
+# the share of missing genotypes of an ancient sample, and of the panel SNPs in ClinVar
+ANCIENT_MISSING_RATE = 0.3
+CLINVAR_SNP_RATE = 0.2
+# the rsIDs that are not in ClinVar start here
+NEW_RSID_START = 900000000
+# the share of 23andMe internal IDs and of no-calls in a user file
+INTERNAL_ID_RATE = 0.03
+NO_CALL_RATE = 0.01
+# the number of user SNPs that are ClinVar SNPs, like a real genotyping chip
+USER_CLINVAR_SNPS = 5000
+
+
+def choice(rng, values, size):
+    """
+    Function:
+        draw values with the share given by a dictionary
+    Input:
+        rng: numpy Generator
+        values: dictionary value -> share of the rows
+        size: the number of values
+    Output:
+        numpy array of the values
+    """
+    share = np.array(list(values.values()), dtype=np.float64)
+    return np.array(list(values), dtype=object)[rng.choice(len(values), size=size, p=share / share.sum())]
+
+
+def alleles(rng, size):
+    """
+    Function:
+        draw two different nucleotides per row
+    Input:
+        rng: numpy Generator
+        size: the number of rows
+    Output:
+        two numpy arrays, the reference and the alternate allele
+    """
+    ref = rng.integers(0, 4, size)
+    alt = (ref + rng.integers(1, 4, size)) % 4
+    return NUCLEOTIDES[ref], NUCLEOTIDES[alt]
+
+
+def variant_block(rng, first_allele_id, n_variants):
+    """
+    Function:
+        the rows of both assemblies of a block of variants
+    Input:
+        rng: numpy Generator
+        first_allele_id: the AlleleID of the first variant
+        n_variants: the number of variants
+    Output:
+        DataFrame with the columns of variant_summary.txt, two rows per variant
+    """
+    allele_id = np.arange(first_allele_id, first_allele_id + n_variants)
+    variant_type = choice(rng, TYPES, n_variants)
+    # the rsIDs grow with the AlleleID like in ClinVar, some variants take the rsID of the variant before
+    rsid = allele_id * 17 + rng.integers(0, 17, n_variants)
+    shared = rng.random(n_variants) < SHARED_RSID_RATE
+    rsid[1:][shared[1:]] = rsid[:-1][shared[1:]]
+    rsid[rng.random(n_variants) < MISSING_RSID_RATE] = -1
+    significance = choice(rng, CLIN_SIGNIFICANCE, n_variants)
+    clin_sig_simple = np.where(pd.Series(significance).str.contains("athogenic").to_numpy(), 1,
+                               np.where(significance == "not provided", -1, 0))
+    phenotype = np.where(rng.random(n_variants) < NOT_PROVIDED_RATE, "not provided",
+                         pd.Series(rng.integers(1, 5000, n_variants)).map("Disease {}".format).to_numpy())
+    ref, alt = alleles(rng, n_variants)
+    snv = variant_type == "single nucleotide variant"
+    # the other types have longer alleles
+    ref = np.where(snv, ref, ref + alt)
+    chromosome = np.array(CHROMOSOMES, dtype=object)[rng.integers(0, len(CHROMOSOMES), n_variants)]
+    block = {
+        '#AlleleID': allele_id, 'Type': variant_type, 'GeneID': rng.integers(1, 100000, n_variants),
+        'ClinicalSignificance': significance, 'ClinSigSimple': clin_sig_simple, 'RS# (dbSNP)': rsid, 'PhenotypeList': phenotype,
+        'Chromosome': chromosome, 'ReviewStatus': choice(rng, REVIEW_STATUS, n_variants),
+        'NumberSubmitters': rng.integers(1, 20, n_variants), 'VariationID': allele_id + 10000,
+        'ReferenceAlleleVCF': ref, 'AlternateAlleleVCF': alt,
+    }
+    rows = []
+    for assembly in ("GRCh37", "GRCh38"):
+        position = rng.integers(10000, 240000000, n_variants)
+        df = pd.DataFrame({col: block.get(col, "-") for col in VARIANT_SUMMARY_COLUMNS})
+        df["Assembly"] = assembly
+        df["PositionVCF"] = position
+        df["Start"] = position
+        df["Stop"] = position
+        rows.append(df)
+    # the two rows of a variant are next to each other
+    return pd.concat(rows).sort_index(kind="stable")
+
+
+def write_variant_summary(output_file, n_variants, seed=0):
+    """
+    Function:
+        write a synthetic variant_summary.txt.gz
+    Input:
+        output_file: the output file, compressed with gzip if it ends with .gz
+        n_variants: the number of variants, the file has two rows per variant
+        seed: the seed of the random generator
+    Output:
+        the number of rows written
+    """
+    rng = np.random.default_rng(seed)
+    opener = gzip.open if output_file.endswith(".gz") else open
+    # a low compression level, the benchmark reads the file more often than it is written
+    with opener(output_file, "wt", newline="", **({"compresslevel": 1} if output_file.endswith(".gz") else {})) as out:
+        out.write("\t".join(VARIANT_SUMMARY_COLUMNS) + "\n")
+        for start in range(0, n_variants, BLOCK_VARIANTS):
+            block = variant_block(rng, start + 1, min(BLOCK_VARIANTS, n_variants - start))
+            block.to_csv(out, sep="\t", index=False, header=False)
+    return 2 * n_variants
+
+
+def clinvar_snps(clinvar_file):
+    """
+    Function:
+        the different rsIDs of ClinVar_to_SNP.txt with the chromosome and the alleles of their first row
+    Input:
+        clinvar_file: ClinVar_to_SNP.txt
+    Output:
+        DataFrame with the columns rsID, Chromosome, ReferenceAlleleVCF, AlternateAlleleVCF
+    """
+    columns = ["rsID", "Chromosome", "ReferenceAlleleVCF", "AlternateAlleleVCF"]
+    df = pd.read_csv(clinvar_file, sep="\t", header=0, usecols=columns, dtype={"Chromosome": str})[columns]
+    df = df[df["ReferenceAlleleVCF"].isin(list("ACGT")) & df["AlternateAlleleVCF"].isin(list("ACGT"))]
+    return df.drop_duplicates("rsID").reset_index(drop=True)
+
+
+def panel_snps(rng, clinvar_file, n_snps):
+    """
+    Function:
+        the SNPs of a synthetic panel: part of them from ClinVar_to_SNP.txt, the others with new rsIDs, sorted by chromosome and position
+    Input:
+        rng: numpy Generator
+        clinvar_file: ClinVar_to_SNP.txt
+        n_snps: the number of SNPs
+    Output:
+        DataFrame with the columns Chromosome, rsID, cM, Position, A1, A2 (A2 is the alternate allele)
+    """
+    clinvar_df = clinvar_snps(clinvar_file)
+    n_clinvar = min(len(clinvar_df), int(n_snps * CLINVAR_SNP_RATE))
+    clinvar_df = clinvar_df.iloc[np.sort(rng.choice(len(clinvar_df), n_clinvar, replace=False))]
+    n_new = n_snps - n_clinvar
+    ref, alt = alleles(rng, n_new)
+    snps = pd.DataFrame({
+        "Chromosome": np.concatenate([clinvar_df["Chromosome"].to_numpy(dtype=object),
+                                      np.array(CHROMOSOMES[:23], dtype=object)[rng.integers(0, 23, n_new)]]),
+        "rsID": np.concatenate([clinvar_df["rsID"].to_numpy(dtype=np.int64), NEW_RSID_START + np.arange(n_new)]),
+        "A1": np.concatenate([clinvar_df["ReferenceAlleleVCF"].to_numpy(dtype=object), ref]),
+        "A2": np.concatenate([clinvar_df["AlternateAlleleVCF"].to_numpy(dtype=object), alt]),
+    })
+    snps["Position"] = rng.integers(10000, 240000000, n_snps)
+    snps = snps.sort_values(["Chromosome", "Position"], kind="stable").reset_index(drop=True)
+    snps["rsID"] = "rs" + snps["rsID"].astype(str)
+    snps["cM"] = (snps["Position"] / 1e8).round(6)
+    return snps[["Chromosome", "rsID", "cM", "Position", "A1", "A2"]]
+
+
+def panel_genotypes(rng, n_samples, n_snps):
+    """
+    Function:
+        the genotypes of a synthetic panel, every SNP has its own allele frequency
+    Input:
+        rng: numpy Generator
+        n_samples, n_snps: the size of the panel
+    Output:
+        uint8 array samples x SNPs: 0, 1 or 2 alternate alleles, 3 for a missing genotype
+    """
+    frequency = rng.beta(0.5, 0.5, n_snps)
+    genotypes = np.empty((n_samples, n_snps), dtype=np.uint8)
+    # one sample at a time, so the random numbers do not need a float array of the whole panel
+    for sample in range(n_samples):
+        genotypes[sample] = rng.binomial(2, frequency).astype(np.uint8)
+        genotypes[sample, rng.random(n_snps) < ANCIENT_MISSING_RATE] = 3
+    return genotypes
+
+
+def write_ped_map(prefix, snps, genotypes):
+    """
+    Function:
+        write the panel as the text files prefix.ped and prefix.map
+    Input:
+        prefix: the prefix of the output files
+        snps: DataFrame from panel_snps
+        genotypes: array from panel_genotypes
+    Output:
+        the paths of the .ped and .map files
+    """
+    snps[["Chromosome", "rsID", "cM", "Position"]].to_csv(f"{prefix}.map", sep="\t", header=False, index=False)
+    # the 4 bytes "a b " of every genotype code of every SNP, the last space of a line is replaced by the newline
+    a1 = snps["A1"].map(PED_CODES).to_numpy()
+    a2 = snps["A2"].map(PED_CODES).to_numpy()
+    first = np.stack([a1, a1, a2, np.zeros_like(a1)], axis=1)
+    second = np.stack([a1, a2, a2, np.zeros_like(a1)], axis=1)
+    tokens = np.empty((len(snps), 4, 4), dtype=np.uint8)
+    tokens[:, :, 0] = first + ord("0")
+    tokens[:, :, 1] = ord(" ")
+    tokens[:, :, 2] = second + ord("0")
+    tokens[:, :, 3] = ord(" ")
+    columns = np.arange(len(snps))
+    with open(f"{prefix}.ped", "wb") as out:
+        for sample, codes in enumerate(genotypes):
+            line = tokens[columns, codes].reshape(-1)
+            line[-1] = ord("\n")
+            out.write(f"{sample + 1} Sample{sample + 1:06d} 0 0 0 -9 ".encode("ascii"))
+            out.write(line.tobytes())
+    return f"{prefix}.ped", f"{prefix}.map"
+
+
+def write_bed(prefix, snps, genotypes):
+    """
+    Function:
+        write the panel as the binary PLINK files prefix.bed, prefix.bim and prefix.fam (SNP-major)
+    Input:
+        prefix: the prefix of the output files
+        snps: DataFrame from panel_snps
+        genotypes: array from panel_genotypes
+    Output:
+        the prefix
+    """
+    n_samples, n_snps = genotypes.shape
+    snps.to_csv(f"{prefix}.bim", sep="\t", header=False, index=False)
+    pd.DataFrame({"FID": np.arange(1, n_samples + 1), "IID": [f"Sample{i + 1:06d}" for i in range(n_samples)],
+                  "Father": 0, "Mother": 0, "Sex": 0, "Phenotype": -9}).to_csv(f"{prefix}.fam", sep=" ", header=False, index=False)
+    # the 2-bit codes of the .bed file: 00 homozygous A1, 01 missing, 10 heterozygous, 11 homozygous A2
+    bed_codes = np.array([0b00, 0b10, 0b11, 0b01], dtype=np.uint8)[genotypes.T]
+    padded = np.zeros((n_snps, -(-n_samples // 4) * 4), dtype=np.uint8)
+    padded[:, :n_samples] = bed_codes
+    padded = padded.reshape(n_snps, -1, 4)
+    packed = padded[:, :, 0] | (padded[:, :, 1] << 2) | (padded[:, :, 2] << 4) | (padded[:, :, 3] << 6)
+    with open(f"{prefix}.bed", "wb") as out:
+        out.write(bytes([0x6c, 0x1b, 0x01]))
+        out.write(packed.tobytes())
+    return prefix
+
+
+def write_panel(clinvar_file, prefix, n_samples, n_snps, file_format="ped", seed=0):
+    """
+    Function:
+        write a synthetic ancient panel
+    Input:
+        clinvar_file: ClinVar_to_SNP.txt
+        prefix: the prefix of the output files
+        n_samples, n_snps: the size of the panel
+        file_format: "ped" for .ped/.map or "bed" for .bed/.bim/.fam
+        seed: the seed of the random generator
+    Output:
+        the number of genotypes written
+    """
+    rng = np.random.default_rng(seed)
+    snps = panel_snps(rng, clinvar_file, n_snps)
+    genotypes = panel_genotypes(rng, n_samples, n_snps)
+    if file_format == "bed":
+        write_bed(prefix, snps, genotypes)
+    else:
+        write_ped_map(prefix, snps, genotypes)
+    return n_samples * n_snps
+
+
+def write_user(clinvar_file, output_file, n_snps=600000, file_format="23andme", seed=0):
+    """
+    Function:
+        write a synthetic raw user file
+    Input:
+        clinvar_file: ClinVar_to_SNP.txt
+        output_file: the output file
+        n_snps: the number of lines
+        file_format: "23andme" (one genotype column, "--" for a no-call) or "ancestry" (allele1 and allele2, "0" for a no-call)
+        seed: the seed of the random generator
+    Output:
+        the number of lines written
+    """
+    rng = np.random.default_rng(seed)
+    clinvar_df = clinvar_snps(clinvar_file)
+    n_clinvar = min(len(clinvar_df), USER_CLINVAR_SNPS, n_snps)
+    clinvar_df = clinvar_df.iloc[rng.choice(len(clinvar_df), n_clinvar, replace=False)]
+    n_new = n_snps - n_clinvar
+    ref, alt = alleles(rng, n_new)
+    user = pd.DataFrame({
+        "rsid": np.concatenate(["rs" + clinvar_df["rsID"].astype(str).to_numpy(dtype=object),
+                                np.where(rng.random(n_new) < INTERNAL_ID_RATE, "i", "rs") + (NEW_RSID_START + np.arange(n_new)).astype(str)]),
+        "chromosome": np.concatenate([clinvar_df["Chromosome"].to_numpy(dtype=object),
+                                      np.array(CHROMOSOMES[:23], dtype=object)[rng.integers(0, 23, n_new)]]),
+        "position": rng.integers(10000, 240000000, n_snps),
+        "ref": np.concatenate([clinvar_df["ReferenceAlleleVCF"].to_numpy(dtype=object), ref]),
+        "alt": np.concatenate([clinvar_df["AlternateAlleleVCF"].to_numpy(dtype=object), alt]),
+    })
+    user = user.sort_values(["chromosome", "position"], kind="stable").reset_index(drop=True)
+    # most genotypes of a user are homozygous reference
+    n_alt = rng.choice(3, n_snps, p=[0.8, 0.15, 0.05])
+    user["allele1"] = np.where(n_alt == 2, user["alt"], user["ref"])
+    user["allele2"] = np.where(n_alt >= 1, user["alt"], user["ref"])
+    no_call = rng.random(n_snps) < NO_CALL_RATE
+    with open(output_file, "w", newline="") as out:
+        if file_format == "ancestry":
+            user.loc[no_call, ["allele1", "allele2"]] = "0"
+            out.write("#AncestryDNA raw data download\n#synthetic data written by Synthetic_Data.py\n")
+            user[["rsid", "chromosome", "position", "allele1", "allele2"]].to_csv(out, sep="\t", index=False)
+        else:
+            user["genotype"] = user["allele1"] + user["allele2"]
+            user.loc[no_call, "genotype"] = "--"
+            out.write("# This data file generated by 23andMe\n# synthetic data written by Synthetic_Data.py\n")
+            out.write("# rsid\tchromosome\tposition\tgenotype\n")
+            user[["rsid", "chromosome", "position", "genotype"]].to_csv(out, sep="\t", index=False, header=False)
+    return n_snps
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='Synthetic_Data.py', description="write synthetic input files of a realistic size for the benchmark")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    summary_parser = subparsers.add_parser("variant_summary", help="write a synthetic variant_summary.txt.gz")
+    summary_parser.add_argument("output_file", type=str, help="the output file, for example variant_summary.txt.gz")
+    summary_parser.add_argument("--variants", type=int, required=True, help="the number of variants, the file has two rows (GRCh37, GRCh38) per variant")
+    panel_parser = subparsers.add_parser("panel", help="write a synthetic ancient panel")
+    panel_parser.add_argument("ClinVar_to_SNP", type=str, help="Path to ClinVar_to_SNP.txt, part of the SNPs are its SNPs")
+    panel_parser.add_argument("prefix", type=str, help="the prefix of the output files")
+    panel_parser.add_argument("--samples", type=int, required=True, help="the number of samples")
+    panel_parser.add_argument("--snps", type=int, required=True, help="the number of SNPs")
+    panel_parser.add_argument("--format", choices=["ped", "bed"], default="ped", help="the .ped/.map files or the .bed/.bim/.fam files")
+    user_parser = subparsers.add_parser("user", help="write a synthetic raw user file")
+    user_parser.add_argument("ClinVar_to_SNP", type=str, help="Path to ClinVar_to_SNP.txt, part of the SNPs are its SNPs")
+    user_parser.add_argument("output_file", type=str, help="the output file")
+    user_parser.add_argument("--snps", type=int, default=600000, help="the number of SNPs")
+    user_parser.add_argument("--format", choices=["23andme", "ancestry"], default="23andme", help="the format of the genotyping company")
+    for subparser in (summary_parser, panel_parser, user_parser):
+        subparser.add_argument("--seed", type=int, default=0, help="the seed of the random generator")
+    args = parser.parse_args()
+    if args.command != "variant_summary" and not os.path.isfile(args.ClinVar_to_SNP):
+        sys.exit(f"Error: The input file {args.ClinVar_to_SNP} is NOT FOUND !")
+    try:
+        if args.command == "variant_summary":
+            count = write_variant_summary(args.output_file, args.variants, args.seed)
+            print(f"{args.output_file} has {count} rows.")
+        elif args.command == "panel":
+            count = write_panel(args.ClinVar_to_SNP, args.prefix, args.samples, args.snps, args.format, args.seed)
+            print(f"The panel {args.prefix} has {count} genotypes.")
+        else:
+            count = write_user(args.ClinVar_to_SNP, args.output_file, args.snps, args.format, args.seed)
+            print(f"{args.output_file} has {count} SNPs.")
+    except (OSError, ValueError) as e:
+        sys.exit(f"Error: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: User_Batch.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This script runs the page "Identify User ClinVar Markers" for a whole cohort of users: a directory or an archive (.zip, .tar, .tar.gz) of Test_DNA.txt,
+    raw 23andMe or AncestryDNA files or one-sample VCF files.
+    The ClinVar side is loaded once: the indexed ClinVar store is built (or found in the cache) before the batch starts,
+    and every worker memory-maps the same store directory, so ClinVar_to_SNP.txt is not read and checked again for every user.
+    The users are processed in parallel by a pool of processes. Every user gets the same marker table as the page ({name}_ClinVar_Markers.txt),
+    and two cohort files are written at the end: one row per user (the number of SNPs, the rows removed by the checks and the markers)
+    and one row per ClinVar variant (how many users carry it, heterozygous and homozygous).
+    A user whose marker table already exists and was made from the same user file, the same ClinVar release and the same options
+    (saved in {name}_ClinVar_Markers.txt.run.json) is not called again, its marker table is read for the cohort files,
+    so an interrupted batch continues where it stopped when the same command is run again.
+    A user that can not be read or called is reported with its error in the per-user summary, the other users are still called.
+    The throughput is reported in users per minute.
+
+Imported modules:
+    - numpy: to count the carriers of the cohort
+    - pandas: used for data manipulation and analysis.
+    - argparse: to parse command-line arguments and options
+    - json: to save the inputs and the options of the marker table of every user
+    - concurrent.futures: to process the users with a pool of processes
+    - tarfile, tempfile, zipfile: to extract the archive of user files
+    - os, time: to check file status in directory and to time the batch
+    - sys: to control over the Python runtime environment
+    - ClinVar_Cache: the hash of the user files
+    - ClinVar_Store: indexed store of ClinVar_to_SNP.txt keyed by rsID
+    - Marker_Caller: joins the genotypes to ClinVar and counts the mutated alleles
+    - Pipeline_Steps: the checks of the page "Identify User ClinVar Markers"
+    - VCF_Reader: reads the one-sample VCF files, only the records of the rsIDs in ClinVar are decoded
+    - User_Reader: reads Test_DNA.txt and the raw 23andMe or AncestryDNA files, only the lines of the rsIDs in ClinVar are decoded
+
+Procedures:
+    1. list the user files of the directory, an archive is extracted to a temporary directory first, perform error checks before continuing next steps.
+    2. open (or build) the ClinVar store once.
+    3. check and call every user in the process pool like the page "Identify User ClinVar Markers", skipping the users that are already done.
+    4. write the per-user summary and the per-variant cohort table.
+
+Inputfile:
+    a directory or an archive of Test_DNA.txt files (rsID, Chromosome, Position, Genotype), raw 23andMe or AncestryDNA files or one-sample .vcf/.vcf.gz files, ClinVar_to_SNP.txt
+Outputfile:
+    for every user, in the output directory:
+        {name}_ClinVar_Markers.txt
+        {name}_ClinVar_Markers.txt.run.json (the hashes of the inputs and the options, to skip the user when the batch is run again)
+    User_Batch_Summary.txt: one row per user, with the error of the users that failed
+    Cohort_ClinVar_Markers.txt: one row per ClinVar variant carried by at least one user
+Usage:
+        python User_Batch.py users ClinVar_to_SNP.txt [--outdir OUTDIR] [--jobs JOBS] [--correct-flips]
+    ---------- Examples:
+        python User_Batch.py TestUsers/ ClinVar_to_SNP.txt
+        python User_Batch.py TestUsers.zip ClinVar_to_SNP.txt --outdir User_Batch --jobs 8
+
+"""
+import argparse
+import json
+import os
+import sys
+import tarfile
+import tempfile
+import time
+import zipfile
+# make sure the module is installed
+try:
+    import numpy as np
+    import pandas as pd
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    import ClinVar_Cache
+    from ClinVar_Store import ClinVarStore, open_store
+    from Marker_Caller import call_markers
+    from Pipeline_Steps import check_genotypes
+    from VCF_Reader import is_vcf, read_vcf, user_table
+    from User_Reader import read_user_file
+except ImportError as e:
+    sys.exit(f"ERROR: Python module not installed. {e}")
+
+# the columns of Test_DNA.txt
+USER_COLUMNS = ["rsID", "Chromosome", "Position", "Genotype"]
+# the extensions removed from the file name to get the name of the user
+USER_SUFFIXES = (".vcf.gz", ".txt.gz", ".vcf", ".txt", ".tsv", ".csv", ".zip", ".gz")
+# the columns of the per-user summary
+SUMMARY_COLUMNS = ["User", "Input", "Status", "Error", "SNPs", "No_Call", "Missing", "Invalid_Genotype", "Invalid_rsID",
+                   "Markers", "Heterozygous", "Homozygous", "Strand_Flip", "Mismatch", "Seconds"]
+# the ClinVar columns of the cohort table
+COHORT_COLUMNS = ["AlleleID", "rsID", "GeneID", "ClinicalSignificance", "PhenotypeList", "ReviewStatus"]
+# the file next to the marker table with the inputs and the options it was made from
+RUN_SUFFIX = ".run.json"
+
+
+def user_name(user_file):
+    """
+    Function:
+        the name of a user, the file name without its extension
+    Input:
+        user_file: the path of the user file
+    Output:
+        the name of the user
+    """
+    name = os.path.basename(user_file)
+    for suffix in USER_SUFFIXES:
+        if name.lower().endswith(suffix):
+            return name[:-len(suffix)]
+    return name
+
+
+def list_user_files(user_dir):
+    """
+    Function:
+        list the user files of a directory and its subdirectories, the hidden files are skipped
+    Input:
+        user_dir: the directory of the user files
+    Raise error:
+        check if the names of the users are unique, the output files are named after them
+    Output:
+        sorted list of user files
+    """
+    user_files = []
+    for root, dirs, files in os.walk(user_dir):
+        # the hidden directories, like __MACOSX of a zip file made on a Mac, are skipped
+        dirs[:] = sorted(d for d in dirs if not d.startswith((".", "__")))
+        user_files += [os.path.join(root, f) for f in sorted(files) if not f.startswith(".")]
+    names = [user_name(path) for path in user_files]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f"User files with the same name would write the same output files: {', '.join(duplicated)}")
+    return user_files
+
+
+def extract_archive(archive_file, extract_dir):
+    """
+    Function:
+        extract a .zip, .tar or .tar.gz archive of user files
+    Input:
+        archive_file: the path of the archive
+        extract_dir: the directory to extract to
+    Raise error:
+        check if the file is an archive
+    """
+    if zipfile.is_zipfile(archive_file):
+        with zipfile.ZipFile(archive_file) as archive:
+            archive.extractall(extract_dir)
+    elif tarfile.is_tarfile(archive_file):
+        with tarfile.open(archive_file) as archive:
+            # the "data" filter refuses the members outside the directory, links and device files
+            archive.extractall(extract_dir, filter="data")
+    else:
+        raise ValueError(f"{archive_file} is neither a directory nor a .zip, .tar or .tar.gz archive.")
+
+
+def clean_user_table(user_df):
+    """
+    Function:
+        check the user table like the page "Identify User ClinVar Markers": the rows with a missing value, an invalid genotype or an invalid rsID are removed
+    Input:
+        user_df: DataFrame of Test_DNA.txt
+    Raise error:
+        check if the columns are rsID, Chromosome, Position, Genotype
+    Output:
+        the checked table with the rsID without the prefix "rs", and a dictionary with the number of removed rows of every check
+    """
+    if list(user_df.columns) != USER_COLUMNS:
+        raise ValueError(f"Columns do not match the expected format. Expected columns: {', '.join(USER_COLUMNS)}. "
+                         f"Found columns: {', '.join(map(str, user_df.columns))}.")
+    return check_genotypes(user_df, USER_COLUMNS)
+
+
+# the ClinVar store of the worker processes, opened once when the worker starts
+_worker_store = None
+
+
+def _init_worker(store_dir):
+    global _worker_store
+    # every array is mapped when the worker starts, so the users still run if the store directory is evicted from the cache during the run
+    _worker_store = ClinVarStore(store_dir).map_all()
+
+
+def run_parameters(user_file, clinvar_store, correct_flips=False):
+    """
+    Function:
+        the inputs and the options of the marker table of one user: the hash of the user file, the hash of ClinVar_to_SNP.txt and correct_flips
+    Input:
+        user_file: the user file
+        clinvar_store: ClinVarStore, it keeps the hash of its ClinVar_to_SNP.txt
+        correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+    Output:
+        dictionary
+    """
+    # a store built without the hash is identified by its directory
+    clinvar = clinvar_store.description.get("source_hash") or os.path.abspath(clinvar_store.store_dir)
+    return {"user": ClinVar_Cache.file_hash(user_file), "clinvar": clinvar, "correct_flips": bool(correct_flips)}
+
+
+def is_done(run, output_file):
+    """
+    Function:
+        check if the marker table exists and was made from the same inputs and options as this run
+    Input:
+        run: the inputs and the options of this run, see run_parameters
+        output_file: the marker table of the user
+    Output:
+        True if the user can be skipped
+    """
+    if not (os.path.isfile(output_file) and os.path.isfile(f"{output_file}{RUN_SUFFIX}")):
+        return False
+    try:
+        with open(f"{output_file}{RUN_SUFFIX}") as f:
+            return json.load(f) == run
+    except (OSError, ValueError):
+        return False
+
+
+def call_user(user_file, output_file, correct_flips=False, clinvar_store=None):
+    """
+    Function:
+        check and call one user in a worker process, or read the marker table of a user that is already done with the same inputs and options
+    Input:
+        user_file: Test_DNA.txt or a one-sample VCF file
+        output_file: the marker table of the user
+        correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+        clinvar_store: ClinVarStore, default is the store of the worker process
+    Output:
+        dictionary with one row of the per-user summary (with the error if the user failed), and the AlleleID and Mutation_Status of the markers for the cohort table
+    """
+    start = time.perf_counter()
+    clinvar_store = clinvar_store or _worker_store
+    row = {"User": user_name(user_file), "Input": user_file}
+    try:
+        run = run_parameters(user_file, clinvar_store, correct_flips)
+        if is_done(run, output_file):
+            row["Status"] = "skipped"
+            markers_df = pd.read_csv(output_file, sep="\t", header=0, usecols=["AlleleID", "Mutation_Status"])
+        else:
+            if is_vcf(user_file):
+                # the records with an rsID that is not in ClinVar are skipped before the genotype is read
+                user_df = user_table(read_vcf(user_file, clinvar_store.rsID))
+                row["SNPs"] = len(user_df)
+            else:
+                # only the lines of the rsIDs in ClinVar are decoded, the no-calls are removed
+                user_df = read_user_file(user_file, clinvar_store.rsid_unique)
+                row["SNPs"] = user_df.attrs["snps"]
+                row["No_Call"] = user_df.attrs["no_call"]
+            user_df, issues = clean_user_table(user_df)
+            row.update(issues)
+            markers_df = call_markers(user_df, clinvar_store, correct_flips)
+            allele_check = markers_df.attrs["allele_check"]
+            row["Strand_Flip"] = allele_check["strand_flip"]
+            row["Mismatch"] = allele_check["mismatch"]
+            # write through a temporary file, so an interrupted user is called again by the next run
+            markers_df.to_csv(f"{output_file}.tmp", sep="\t", index=False)
+            os.replace(f"{output_file}.tmp", output_file)
+            # the inputs of the marker table are saved last, a marker table without them is made again by the next run
+            with open(f"{output_file}{RUN_SUFFIX}.tmp", "w") as f:
+                json.dump(run, f)
+            os.replace(f"{output_file}{RUN_SUFFIX}.tmp", f"{output_file}{RUN_SUFFIX}")
+            row["Status"] = "done"
+    except pd.errors.EmptyDataError:
+        print(f"Error: The input file {user_file} exists but is EMPTY.")
+        return {**row, "Status": "error", "Error": "The input file exists but is EMPTY."}, None
+    except Exception as e:
+        print(f"Error: An error occurred while processing {user_file}: {e}")
+        return {**row, "Status": "error", "Error": str(e)}, None
+    status = markers_df["Mutation_Status"].to_numpy()
+    row["Markers"] = len(markers_df)
+    row["Heterozygous"] = int((status == 1).sum())
+    row["Homozygous"] = int((status == 2).sum())
+    row["Seconds"] = round(time.perf_counter() - start, 3)
+    return row, (markers_df["AlleleID"].to_numpy(dtype=np.int64), status.astype(np.int8))
+
+
+def cohort_table(markers, clinvar_store, n_users):
+    """
+    Function:
+        count the carriers of every ClinVar variant in the cohort, a user with two rows of the same AlleleID is counted once
+    Input:
+        markers: list of (user number, AlleleID array, Mutation_Status array) of the users that were called
+        clinvar_store: ClinVarStore of ClinVar_to_SNP.txt, for the ClinVar columns of the variants
+        n_users: the number of users that were called, for the carrier frequency
+    Output:
+        DataFrame with COHORT_COLUMNS, Carriers, Heterozygous, Homozygous, Carrier_Frequency, sorted by Carriers
+    """
+    carriers_df = pd.DataFrame({
+        "User": np.concatenate([np.full(len(ids), user) for user, ids, _ in markers] or [np.zeros(0, dtype=np.int64)]),
+        "AlleleID": np.concatenate([ids for _, ids, _ in markers] or [np.zeros(0, dtype=np.int64)]),
+        "Mutation_Status": np.concatenate([status for _, _, status in markers] or [np.zeros(0, dtype=np.int8)]),
+    })
+    # the highest Mutation_Status of a user is kept
+    carriers_df = carriers_df.sort_values("Mutation_Status", ascending=False, kind="stable").drop_duplicates(["User", "AlleleID"])
+    counts_df = carriers_df.groupby("AlleleID", sort=True)["Mutation_Status"].agg(
+        Carriers="size", Heterozygous=lambda s: int((s == 1).sum()), Homozygous=lambda s: int((s == 2).sum())).reset_index()
+    rows = clinvar_store.lookup_alleleids(counts_df["AlleleID"])
+    cohort_df = clinvar_store.take(np.maximum(rows, 0), COHORT_COLUMNS)
+    # an AlleleID that is not in this ClinVar_to_SNP.txt (a marker table of an older run) keeps only its AlleleID
+    if (rows < 0).any():
+        cohort_df = cohort_df.astype({"rsID": "Int64", "GeneID": "Int64"})
+        cohort_df.loc[rows < 0, COHORT_COLUMNS[1:]] = None
+    cohort_df["AlleleID"] = counts_df["AlleleID"].to_numpy()
+    cohort_df[["Carriers", "Heterozygous", "Homozygous"]] = counts_df[["Carriers", "Heterozygous", "Homozygous"]].to_numpy()
+    cohort_df["Carrier_Frequency"] = cohort_df["Carriers"] / max(n_users, 1)
+    return cohort_df.sort_values(["Carriers", "AlleleID"], ascending=[False, True], kind="stable").reset_index(drop=True)
+
+
+def User_Batch(user_source, clinvar_file, outdir, jobs=None, correct_flips=False):
+    """
+    Function:
+        find the ClinVar markers of every user of a directory or an archive with a pool of processes
+    Input:
+        user_source: the directory or the archive (.zip, .tar, .tar.gz) of the user files
+        clinvar_file: ClinVar_to_SNP.txt
+        outdir: the output directory
+        jobs: the number of worker processes, default is the number of CPUs
+        correct_flips: count the alternate alleles of a strand-flipped genotype on the opposite strand
+    Raise error:
+        check if the input files exist
+    Output:
+        the per-user summary and the cohort table as DataFrames, also written to the output directory
+    """
+    for input_file in (user_source, clinvar_file):
+        if not os.path.exists(input_file):
+            print(f"Error: The input file {input_file} is NOT FOUND !")
+            return None
+    with tempfile.TemporaryDirectory(prefix="User_Batch_") as extract_dir:
+        try:
+            if os.path.isdir(user_source):
+                user_files = list_user_files(user_source)
+            else:
+                extract_archive(user_source, extract_dir)
+                user_files = list_user_files(extract_dir)
+            if not user_files:
+                raise ValueError(f"No user file found in {user_source}")
+            # the ClinVar store is opened once here and every array is mapped, the workers memory-map its directory when they start
+            clinvar_store = open_store(clinvar_file).map_all()
+        except Exception as e:
+            print(f"Error: An error occurred while reading the input files: {e}")
+            return None
+        os.makedirs(outdir, exist_ok=True)
+        jobs = max(1, min(jobs or os.cpu_count() or 1, len(user_files)))
+        print(f"Processing {len(user_files)} users with {jobs} processes, ClinVar store: {clinvar_store.store_dir}")
+        start = time.perf_counter()
+        rows, markers = [None] * len(user_files), []
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(clinvar_store.store_dir,)) as pool:
+            futures = {pool.submit(call_user, path, os.path.join(outdir, f"{user_name(path)}_ClinVar_Markers.txt"), correct_flips): i
+                       for i, path in enumerate(user_files)}
+            for n_done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                try:
+                    rows[i], user_markers = future.result()
+                except Exception as e:
+                    # a worker that died (for example out of memory) fails only its user
+                    print(f"Error: An error occurred while processing {user_files[i]}: {e}")
+                    rows[i], user_markers = {"User": user_name(user_files[i]), "Input": user_files[i], "Status": "error", "Error": str(e)}, None
+                if user_markers is not None:
+                    markers.append((i, *user_markers))
+                # the progress is printed every 100 users and for the last user
+                if n_done % 100 == 0 or n_done == len(user_files):
+                    minutes = (time.perf_counter() - start) / 60
+                    print(f"[{n_done}/{len(user_files)}] {n_done / max(minutes, 1e-9):.0f} users/min")
+    # the summary is in the order of the user files, the paths in the temporary directory are replaced by the archive member names
+    summary_df = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    summary_df["Input"] = [os.path.relpath(path, extract_dir) if path.startswith(extract_dir) else path for path in summary_df["Input"]]
+    for col in SUMMARY_COLUMNS[4:-1]:
+        summary_df[col] = summary_df[col].astype("Int64")
+    summary_df.to_csv(os.path.join(outdir, "User_Batch_Summary.txt"), sep="\t", index=False)
+    cohort_df = cohort_table(markers, clinvar_store, len(markers))
+    cohort_df.to_csv(os.path.join(outdir, "Cohort_ClinVar_Markers.txt"), sep="\t", index=False)
+    minutes = (time.perf_counter() - start) / 60
+    done = summary_df["Status"].value_counts()
+    print(f"Done: {done.get('done', 0)}, skipped: {done.get('skipped', 0)}, errors: {done.get('error', 0)}, "
+          f"{len(user_files) / max(minutes, 1e-9):.0f} users/min, {len(cohort_df)} ClinVar variants carried by the cohort")
+    return summary_df, cohort_df
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='User_Batch.py', description="find the ClinVar markers of a cohort of users in parallel")
+    parser.add_argument("users", type=str, help="the directory or the archive (.zip, .tar, .tar.gz) of the Test_DNA.txt, raw 23andMe/AncestryDNA or one-sample VCF files")
+    parser.add_argument("ClinVar_to_SNP", type=str, help="Path to the ClinVar_to_SNP.txt file")
+    parser.add_argument("--outdir", type=str, default="User_Batch", help="the output directory, the marker table of every user is named after the user file")
+    parser.add_argument("--jobs", type=int, default=None, help="the number of worker processes, default is the number of CPUs")
+    parser.add_argument("--correct-flips", action="store_true", help="count the alternate alleles of strand-flipped genotypes on the opposite strand")
+    args = parser.parse_args()
+    result = User_Batch(args.users, args.ClinVar_to_SNP, args.outdir, args.jobs, args.correct_flips)
+    if result is None or (result[0]["Status"] == "error").any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: User_Reader.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module reads the raw genotype file of a user as downloaded from the genotyping company, without reformatting it first (Step 5 of the README):
+    23andMe (comment lines starting with "#", one Genotype column, "--" for a no-call), AncestryDNA (two columns allele1 and allele2, "0" for a no-call),
+    comma-separated files with quoted values like MyHeritage and FamilyTreeDNA, and the reformatted Test_DNA.txt. The file can be compressed with gzip or in a .zip file.
+    A user file has about 600,000 SNPs but only a few thousand can be in ClinVar, so the file is read in blocks of bytes
+    and the rsID at the start of every line is converted to an integer with numpy, for all lines of the block at once.
+    Only the lines whose rsID is in ClinVar_to_SNP.txt are decoded and split into columns, the other lines are dropped before any Python object is made for them.
+    The output is the table Test_DNA.txt of the page "Identify User ClinVar Markers" with only the ClinVar SNPs.
+
+Imported modules:
+    - numpy: to find the rsID of every line of a block
+    - pandas: used for data manipulation and analysis.
+    - gzip, zipfile: to read the compressed user files
+    - argparse, os, sys: to parse command-line arguments and to check the files
+    - ClinVar_Store: the rsIDs of ClinVar_to_SNP.txt
+    - Genotype_Matrix: the first bytes of a gzip file
+    - Stage_Metrics: the time and the number of SNPs read
+
+Procedures:
+    1. open the file (gzip and .zip files are decompressed while reading) and find the columns in the header line, the header is optional.
+    2. read the file in blocks, convert the digits after "rs" at the start of every line to an integer and keep the lines whose rsID is in ClinVar.
+    3. split the kept lines into rsID, Chromosome, Position and Genotype, the two allele columns are put together, the no-calls are removed.
+
+Usage:
+        python User_Reader.py user_file ClinVar_to_SNP.txt [output_file]
+    ---------- Examples:
+        python User_Reader.py genome_Test6_v5_Full_20260101.zip ClinVar_to_SNP.txt Test6_DNA.txt
+        python User_Reader.py AncestryDNA.txt ClinVar_to_SNP.txt Test7_DNA.txt
+
+"""
+import argparse
+import gzip
+import os
+import sys
+import zipfile
+import numpy as np
+import pandas as pd
+import Stage_Metrics
+from ClinVar_Store import MAX_RSID_DIGITS, open_store
+from Genotype_Matrix import GZIP_MAGIC
+
+ZIP_MAGIC = b"PK\x03\x04"
+# the columns of the user table of the page "Identify User ClinVar Markers"
+USER_COLUMNS = ["rsID", "Chromosome", "Position", "Genotype"]
+# the names of the columns in the header lines of the genotyping companies, in lower case
+HEADER_NAMES = {
+    "rsID": {"rsid", "rs_id", "snp", "snp_id", "name"},
+    "Chromosome": {"chromosome", "chrom", "chr"},
+    "Position": {"position", "pos", "bp"},
+    "Genotype": {"genotype", "result", "call"},
+    "Allele1": {"allele1", "allele_1"},
+    "Allele2": {"allele2", "allele_2"},
+}
+# the column numbers of the 23andMe file, used when the file has no header line
+DEFAULT_COLUMNS = {"rsID": 0, "Chromosome": 1, "Position": 2, "Genotype": 3}
+# the size of the blocks of bytes
+BLOCK_SIZE = 1 << 22
+# the characters after the digits of the rsID: tab, comma, quote, space, end of the line
+RSID_DELIMITERS = np.frombuffer(b'\t," \r\n', dtype=np.uint8)
+# the genotypes of a no-call, a genotype with one of these characters is a no-call
+NO_CALL_CHARACTERS = ("-", "0")
+
+
+def open_user_file(source):
+    """
+    Function:
+        open a user file, a gzip file or a .zip file with one user file is decompressed while reading
+    Input:
+        source: the path of the file or an uploaded file object
+    Raise error:
+        check if the .zip file has one file
+    Output:
+        the binary stream
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            head = f.read(4)
+        raw = open(source, "rb")
+    else:
+        head = source.read(4)
+        source.seek(0)
+        raw = source
+    if head[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=raw)
+    if head == ZIP_MAGIC:
+        archive = zipfile.ZipFile(raw)
+        # the .zip file of 23andMe has one .txt file, the files of a Mac (__MACOSX) are skipped
+        members = [m for m in archive.namelist() if not m.endswith("/") and not m.startswith("__MACOSX")]
+        if len(members) != 1:
+            raise ValueError(f"The .zip file should have one user file, it has {len(members)} files.")
+        return archive.open(members[0])
+    return raw
+
+
+def iter_blocks(stream, block_size=BLOCK_SIZE):
+    """
+    Function:
+        read the stream in blocks of whole lines
+    Input:
+        stream: binary stream
+        block_size: the number of bytes read at once
+    Output:
+        generator of bytes, every block ends with a new line
+    """
+    rest = b""
+    while True:
+        block = stream.read(block_size)
+        if not block:
+            if rest:
+                yield rest + b"\n"
+            return
+        block = rest + block
+        end = block.rfind(b"\n") + 1
+        rest = block[end:]
+        if end:
+            yield block[:end]
+
+
+def split_fields(line, delimiter):
+    # the values without the spaces and the quotes of a comma-separated file
+    return [field.strip().strip('"').strip() for field in line.split(delimiter)]
+
+
+def find_columns(block):
+    """
+    Function:
+        find the delimiter and the columns of the file from the header line, the last comment line or the line before the first SNP
+    Input:
+        block: the first block of the file
+    Raise error:
+        check if the header has the columns rsID and Genotype (or allele1 and allele2), and if rsID is the first column
+    Output:
+        the delimiter (None for spaces) and a dictionary column name -> column number
+    """
+    header = None
+    is_comment = True
+    first_snp = ""
+    # the header is in the first lines, the first 64 KB are enough
+    for line in block[:1 << 16].decode("utf-8", errors="replace").splitlines():
+        text = line.lstrip("#").strip()
+        if not text:
+            continue
+        if text.lstrip('"').lower().startswith("rs") and text.lstrip('"')[2:3].isdigit():
+            first_snp = text
+            break
+        # the first line that is not a comment is the header, otherwise the last comment line
+        if is_comment:
+            header = text
+            is_comment = line.startswith("#")
+    delimiter = "\t" if "\t" in (first_snp or header or "\t") else ("," if "," in (first_snp or header) else None)
+    names = [name.lower() for name in split_fields(header or "", delimiter)]
+    columns = {column: names.index(name) for column, aliases in HEADER_NAMES.items() for name in names if name in aliases}
+    if "rsID" not in columns and is_comment:
+        # a comment line without the column names, like the first lines of the 23andMe file
+        n_fields = len(split_fields(first_snp, delimiter))
+        return delimiter, (DEFAULT_COLUMNS if n_fields <= 4 else {**DEFAULT_COLUMNS, "Genotype": None, "Allele1": 3, "Allele2": 4})
+    if (columns.get("rsID") != 0 or not {"Chromosome", "Position"} <= columns.keys()
+            or not ("Genotype" in columns or {"Allele1", "Allele2"} <= columns.keys())):
+        raise ValueError(f"Columns do not match the expected format. Expected columns: {', '.join(USER_COLUMNS)} (or allele1 and allele2 instead of Genotype), "
+                         f"starting with rsID. Found columns: {', '.join(names)}.")
+    return delimiter, columns
+
+
+def clinvar_lines(block, rsids):
+    """
+    Function:
+        find the lines of a block that start with an rsID of ClinVar, for all lines at once with numpy
+    Input:
+        block: bytes of whole lines
+        rsids: the sorted integer rsIDs of ClinVar, for example ClinVarStore.rsid_unique
+    Output:
+        the number of lines with an rsID, and the list of the kept lines (bytes)
+    """
+    data = np.frombuffer(block, dtype=np.uint8)
+    last = len(data) - 1
+    ends = np.flatnonzero(data == ord("\n"))
+    starts = np.r_[0, ends[:-1] + 1]
+    # the rsID of a comma-separated file is quoted
+    starts = starts + (data[starts] == ord('"'))
+    is_rs = (data[starts] == ord("r")) & (data[np.minimum(starts + 1, last)] == ord("s"))
+    starts, ends = starts[is_rs], ends[is_rs]
+    # the digits after "rs" are added up one position at a time for all lines, until the first character that is not a digit
+    values = np.zeros(len(starts), dtype=np.int64)
+    n_digits = np.zeros(len(starts), dtype=np.int64)
+    is_digit = np.ones(len(starts), dtype=bool)
+    # at most MAX_RSID_DIGITS digits like ClinVar_Store.rsid_to_int, a longer number is not an rsID
+    for k in range(MAX_RSID_DIGITS):
+        # the uint8 subtraction wraps around, the characters that are not digits are above 9
+        digit = data[np.minimum(starts + 2 + k, last)] - np.uint8(ord("0"))
+        is_digit &= digit < 10
+        if not is_digit.any():
+            break
+        values = np.where(is_digit, values * 10 + digit, values)
+        n_digits += is_digit
+    # the rsID ends at a delimiter, like "rs123\t", not "rs123x"
+    is_rsid = (n_digits > 0) & np.isin(data[np.minimum(starts + 2 + n_digits, last)], RSID_DELIMITERS)
+    position = np.searchsorted(rsids, values)
+    found = is_rsid & (position < len(rsids))
+    found[found] = rsids[position[found]] == values[found]
+    return int(is_rsid.sum()), [block[start:end] for start, end in zip(starts[found], ends[found])]
+
+
+@Stage_Metrics.timed(rows=len)
+def read_user_file(source, rsids):
+    """
+    Function:
+        read the ClinVar SNPs of a raw user file (23andMe, AncestryDNA, comma-separated or Test_DNA.txt)
+    Input:
+        source: the path of the file or an uploaded file object
+        rsids: the integer rsIDs of ClinVar, for example ClinVarStore.rsid_unique
+    Raise error:
+        check the columns of the header line, pandas.errors.EmptyDataError if the file is empty like pandas.read_csv
+    Output:
+        DataFrame with the columns rsID, Chromosome, Position, Genotype of the ClinVar SNPs without the no-calls,
+        attrs["snps"] is the number of SNPs with an rsID in the file and attrs["no_call"] the number of ClinVar SNPs that are no-calls
+    """
+    rsids = np.unique(np.asarray(rsids, dtype=np.int64))
+    stream = open_user_file(source)
+    rows = []
+    n_snps = 0
+    n_no_call = 0
+    try:
+        delimiter = columns = None
+        for block in iter_blocks(stream):
+            if columns is None:
+                delimiter, columns = find_columns(block)
+            n_lines, lines = clinvar_lines(block, rsids)
+            n_snps += n_lines
+            for line in lines:
+                fields = split_fields(line.decode("utf-8", errors="replace"), delimiter)
+                if columns.get("Genotype") is not None:
+                    genotype = fields[columns["Genotype"]]
+                else:
+                    genotype = fields[columns["Allele1"]] + fields[columns["Allele2"]]
+                genotype = genotype.upper()
+                if not genotype or any(c in genotype for c in NO_CALL_CHARACTERS):
+                    n_no_call += 1
+                    continue
+                # a haploid call (chromosome X, Y or MT of a male) is homozygous, like in VCF_Reader
+                if len(genotype) == 1:
+                    genotype = genotype * 2
+                rows.append((fields[0], fields[columns["Chromosome"]], fields[columns["Position"]], genotype))
+    finally:
+        if isinstance(source, (str, os.PathLike)):
+            stream.close()
+        else:
+            source.seek(0)
+    if columns is None:
+        raise pd.errors.EmptyDataError("The user file exists but is EMPTY.")
+    user_df = pd.DataFrame(rows, columns=USER_COLUMNS)
+    user_df["Position"] = pd.to_numeric(user_df["Position"], errors="coerce").astype("Int64")
+    user_df.attrs["snps"] = n_snps
+    user_df.attrs["no_call"] = n_no_call
+    return user_df
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='User_Reader.py', description="read the ClinVar SNPs of a raw user file (23andMe, AncestryDNA) to the format of Test_DNA.txt")
+    parser.add_argument("user_file", type=str, help="Path to the user file, can be compressed with gzip or in a .zip file")
+    parser.add_argument("ClinVar_to_SNP", type=str, help="Path to the ClinVar_to_SNP.txt file")
+    parser.add_argument("output_file", type=str, nargs='?', default="Test_DNA.txt", help="the table rsID, Chromosome, Position, Genotype")
+    args = parser.parse_args()
+    for input_file in (args.user_file, args.ClinVar_to_SNP):
+        if not os.path.isfile(input_file):
+            sys.exit(f"Error: The input file {input_file} is NOT FOUND !")
+    if os.path.isfile(args.output_file):
+        sys.exit(f"Error: The output {args.output_file} already exists !. Please remove or rename existing output file")
+    try:
+        user_df = read_user_file(args.user_file, open_store(args.ClinVar_to_SNP).rsid_unique)
+    except (OSError, ValueError, EOFError, zipfile.BadZipFile) as e:
+        sys.exit(f"Error: {e}")
+    user_df.to_csv(args.output_file, sep="\t", index=False)
+    print(f"{len(user_df)} of {user_df.attrs['snps']} SNPs are in ClinVar ({user_df.attrs['no_call']} no-calls removed), written to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: VCF_Reader.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This module reads the genotypes of a VCF file (.vcf or bgzip-compressed .vcf.gz), for example imputed or sequenced samples,
+    without converting it to .ped/.map first. The file is streamed line by line and only the records of the ClinVar sites are decoded:
+    the ID column (rsID) of every record is checked against the rsIDs of ClinVar_to_SNP.txt before the sample columns are split.
+    ClinVar_to_SNP.txt has no positions, so records without an rsID (ID ".") are matched by position with a sites file, a .map or .bim file
+    (for example of the genotyping panel) that gives the Chromosome, rsID and Position of the ClinVar SNPs.
+    With a sites file and a tabix index (.tbi or .csi) next to the .vcf.gz file, only the bgzip blocks around the ClinVar positions are read.
+    The output is the same genotype representation as the .ped/.map files: the genotype matrix of Genotype_Matrix, so the same long table
+    Ancient_samples_filtered_rsID.txt, a .geno file, or the Test_DNA.txt table of a one-sample VCF file.
+    BCF files are not read, convert them with "bcftools view -Oz -o input.vcf.gz input.bcf".
+
+Imported modules:
+    - numpy: to build the genotype matrix
+    - pandas: used for data manipulation and analysis.
+    - gzip, re, struct, zlib: to read the .vcf.gz file, the index and the bgzip blocks
+    - argparse, os, sys: to parse command-line arguments and to check the files
+    - ClinVar_Store: the rsIDs of ClinVar_to_SNP.txt
+    - Genotype_Matrix, PLINK_Reader: the genotype matrix and the allele codes of the .ped file
+
+Procedures:
+    1. read the header of the VCF file to get the sample names.
+    2. for every record, check the rsID (or the position) against the ClinVar sites, skip the record before the sample columns are split.
+    3. convert the GT field of every sample to the genotype code (5 * allele1 + allele2 with the codes 0, A, T, C, G) and build the genotype matrix.
+    4. with an index: find the bgzip blocks of the ClinVar positions in the index and only read these blocks.
+
+Usage:
+        python VCF_Reader.py input.vcf.gz ClinVar_to_SNP.txt [output_file] [--sites panel.bim] [--index [index_file]] [--user]
+        the output is a genotype matrix if its name ends with .geno or .geno.gz, otherwise the long table
+    ---------- Examples:
+        python VCF_Reader.py Ancient_imputed.vcf.gz ClinVar_to_SNP.txt Ancient_samples_filtered_rsID.txt
+        python VCF_Reader.py Ancient_imputed.vcf.gz ClinVar_to_SNP.txt Ancient_samples_filtered_rsID.geno.gz --sites v54.1_1240K_public.bim --index
+        python VCF_Reader.py Test6.vcf.gz ClinVar_to_SNP.txt Test6_DNA.txt --user
+
+"""
+import argparse
+import gzip
+import os
+import re
+import struct
+import sys
+import zlib
+import numpy as np
+import pandas as pd
+from ClinVar_Store import open_store, rsid_to_int
+from Genotype_Matrix import GZIP_MAGIC, GenotypeMatrix, GenotypeMatrixWriter
+from PLINK_Reader import PED_NUCLEOTIDES
+
+VCF_MAGIC = b"##fileformat=VCF"
+BCF_MAGIC = b"BCF"
+TBI_MAGIC = b"TBI\x01"
+CSI_MAGIC = b"CSI\x01"
+# the bins of a tabix index: 16 kb windows and 5 levels
+TBI_MIN_SHIFT = 14
+TBI_DEPTH = 5
+# the allele codes of the genotype matrix, other alleles (indels, "*") are missing
+ALLELE_CODE = {nucleotide.encode(): code for code, nucleotide in enumerate(PED_NUCLEOTIDES) if code}
+# the columns of the user table of the page "Identify User ClinVar Markers"
+USER_COLUMNS = ["rsID", "Chromosome", "Position", "Genotype"]
+
+
+def normalize_chrom(chrom):
+    """
+    Function:
+        the chromosome name without the prefix "chr", like in ClinVar and the .map file
+    Input:
+        chrom: the chromosome name (bytes or str)
+    Output:
+        the chromosome name, same type as the input
+    """
+    prefix = b"chr" if isinstance(chrom, bytes) else "chr"
+    return chrom[3:] if chrom.lower().startswith(prefix) else chrom
+
+
+def open_vcf(source):
+    """
+    Function:
+        open a .vcf or .vcf.gz file (bgzip is read as gzip) and check the first line
+    Input:
+        source: the path of the file or an uploaded file object
+    Raise error:
+        check if the file is a BCF file or not a VCF file
+    Output:
+        the binary stream after the first line
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            head = f.read(2)
+        stream = gzip.open(source, "rb") if head == GZIP_MAGIC else open(source, "rb")
+    else:
+        head = source.read(2)
+        source.seek(0)
+        stream = gzip.GzipFile(fileobj=source) if head == GZIP_MAGIC else source
+    first = stream.readline()
+    if first.startswith(VCF_MAGIC):
+        return stream
+    if isinstance(source, (str, os.PathLike)):
+        stream.close()
+    if first.startswith(BCF_MAGIC):
+        raise ValueError("BCF files are not supported. Please convert it with: bcftools view -Oz -o input.vcf.gz input.bcf")
+    raise ValueError("The file is not a VCF file, the first line should start with ##fileformat=VCF.")
+
+
+def is_vcf(source):
+    """
+    Function:
+        check if the file is a VCF file (compressed or not)
+    Input:
+        source: the path of the file or an uploaded file object
+    Output:
+        True or False
+    """
+    try:
+        stream = open_vcf(source)
+        if isinstance(source, (str, os.PathLike)):
+            stream.close()
+        return True
+    except (ValueError, OSError, EOFError):
+        return False
+    finally:
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+
+
+def read_samples(stream):
+    """
+    Function:
+        read the header lines of the VCF file until the line #CHROM
+    Input:
+        stream: the binary stream after the first line
+    Raise error:
+        check if the header line #CHROM is found
+    Output:
+        list of the sample names
+    """
+    for line in stream:
+        if line.startswith(b"#CHROM"):
+            return [name.decode("utf-8") for name in line.rstrip(b"\r\n").split(b"\t")[9:]]
+        if not line.startswith(b"##"):
+            break
+    raise ValueError("The header line #CHROM of the VCF file is NOT FOUND.")
+
+
+def read_sites(sites_file, rsids):
+    """
+    Function:
+        read the positions of the ClinVar SNPs from a .map or .bim file, to match the records without an rsID
+    Input:
+        sites_file: the .map or .bim file, the columns Chromosome, rsID and Position are the 1st, 2nd and 4th columns
+        rsids: the integer rsIDs of ClinVar_to_SNP.txt
+    Output:
+        dictionary (Chromosome, Position) -> rsID, as bytes
+    """
+    sites_df = pd.read_csv(sites_file, sep=r"\s+", header=None, usecols=[0, 1, 3], dtype=str)
+    sites_df.columns = ["Chromosome", "rsID", "Position"]
+    sites_df = sites_df[np.isin(rsid_to_int(sites_df["rsID"]), rsids)]
+    return {(normalize_chrom(chrom.encode()), pos.encode()): rsid.encode()
+            for chrom, rsid, pos in zip(sites_df["Chromosome"], sites_df["rsID"], sites_df["Position"])}
+
+
+def match_sites(lines, rs_names, positions, positions_only=False):
+    """
+    Function:
+        keep the records of the ClinVar sites, only the first five columns of a record are split to check it
+    Input:
+        lines: the data lines of the VCF file (bytes)
+        rs_names: set of the ClinVar rsIDs like b"rs5082"
+        positions: dictionary (Chromosome, Position) -> rsID of the sites file
+        positions_only: only keep the records at the positions of the sites file, for the parts of the file read with the index
+    Output:
+        generator of (rsID, Chromosome, Position, REF, ALT, the rest of the line) of the kept records
+    """
+    for line in lines:
+        if not line or line.startswith(b"#"):
+            continue
+        chrom, pos, vid, ref, alt, rest = line.split(b"\t", 5)
+        chrom = normalize_chrom(chrom)
+        if positions_only and (chrom, pos) not in positions:
+            continue
+        # an ID column can have several IDs, like rs12;rs34
+        rsid = next((name for name in vid.split(b";") if name in rs_names), None)
+        # only the records without an rsID are matched by position, a record with another rsID is another variant
+        if rsid is None and not vid.startswith(b"rs"):
+            rsid = positions.get((chrom, pos))
+        if rsid is None:
+            continue
+        yield rsid, chrom, pos, ref, alt, rest
+
+
+def site_codes(ref, alt, rest, n_samples):
+    """
+    Function:
+        convert the GT field of every sample of one record to the genotype code of the matrix
+    Input:
+        ref, alt: the REF and ALT columns of the record
+        rest: the columns after ALT (QUAL, FILTER, INFO, FORMAT and the samples)
+        n_samples: the number of samples in the header
+    Raise error:
+        check if the record has one column per sample
+    Output:
+        numpy uint8 array, one code per sample, 0 is the missing genotype
+    """
+    columns = rest.rstrip(b"\r\n").split(b"\t")
+    if len(columns) - 4 != n_samples:
+        raise ValueError(f"A record has {len(columns) - 4} samples but the header has {n_samples} samples.")
+    # GT is the first field of FORMAT if it is present
+    if columns[3].split(b":", 1)[0] != b"GT":
+        return np.zeros(n_samples, dtype=np.uint8)
+    # the code of every allele index, the alleles that are not one nucleotide are missing
+    allele_codes = [ALLELE_CODE.get(allele.upper(), 0) for allele in [ref] + alt.split(b",")]
+    known = {}
+    codes = np.zeros(n_samples, dtype=np.uint8)
+    for i, sample in enumerate(columns[4:]):
+        gt = sample.split(b":", 1)[0]
+        code = known.get(gt)
+        if code is None:
+            alleles = [allele_codes[int(a)] if a.isdigit() and int(a) < len(allele_codes) else 0 for a in re.split(rb"[/|]", gt)]
+            # a haploid genotype is written as homozygous, like in PLINK
+            code = known[gt] = alleles[0] * 5 + alleles[-1] if len(alleles) <= 2 else 0
+        codes[i] = code
+    return codes
+
+
+def reg2bins(beg, end, min_shift, depth):
+    """
+    Function:
+        the bins of the binning index that overlap a region, like hts_reg2bins of htslib
+    Input:
+        beg, end: the region, 0-based, end is not included
+        min_shift, depth: the size of the smallest bin (2 ** min_shift) and the number of levels
+    Output:
+        list of bin numbers
+    """
+    bins = []
+    end -= 1
+    shift = min_shift + depth * 3
+    first = 0
+    for level in range(depth + 1):
+        bins.extend(range(first + (beg >> shift), first + (end >> shift) + 1))
+        shift -= 3
+        first += 1 << (level * 3)
+    return bins
+
+
+def read_index(index_file):
+    """
+    Function:
+        read a tabix index (.tbi) or a coordinate-sorted index (.csi) of a .vcf.gz file
+    Input:
+        index_file: the path of the index
+    Raise error:
+        check the magic number of the index and the sequence names
+    Output:
+        dictionary with min_shift, depth and for every chromosome (bins, minimum offsets), bins is bin -> list of (begin, end) virtual offsets
+    """
+    with gzip.open(index_file, "rb") as f:
+        data = f.read()
+    pos = 4
+
+    def unpack(fmt):
+        nonlocal pos
+        values = struct.unpack_from(fmt, data, pos)
+        pos += struct.calcsize(fmt)
+        return values
+
+    if data[:4] == TBI_MAGIC:
+        min_shift, depth, is_csi = TBI_MIN_SHIFT, TBI_DEPTH, False
+        n_ref = unpack("<i")[0]
+        header = unpack("<7i")
+    elif data[:4] == CSI_MAGIC:
+        min_shift, depth, l_aux = unpack("<3i")
+        is_csi = True
+        aux_end = pos + l_aux
+        if l_aux < 28:
+            raise ValueError("The .csi index has no sequence names, it is not an index of a .vcf.gz file.")
+        header = unpack("<7i")
+    else:
+        raise ValueError("The index is not a .tbi or .csi file.")
+    # the sequence names, separated by \0
+    names = data[pos:pos + header[6]].split(b"\0")[:-1]
+    pos += header[6]
+    if is_csi:
+        pos = aux_end
+        n_ref = unpack("<i")[0]
+    chroms = {}
+    for name in names[:n_ref]:
+        bins = {}
+        min_offsets = {}
+        for _ in range(unpack("<i")[0]):
+            if is_csi:
+                bin_id, loffset, n_chunk = unpack("<IQi")
+                min_offsets[bin_id] = loffset
+            else:
+                bin_id, n_chunk = unpack("<Ii")
+            chunks = struct.unpack_from(f"<{2 * n_chunk}Q", data, pos)
+            pos += 16 * n_chunk
+            bins[bin_id] = list(zip(chunks[0::2], chunks[1::2]))
+        if not is_csi:
+            # the linear index of the .tbi file: the first offset of every 16 kb window
+            n_intv = unpack("<i")[0]
+            min_offsets = struct.unpack_from(f"<{n_intv}Q", data, pos)
+            pos += 8 * n_intv
+        chroms[normalize_chrom(name)] = (bins, min_offsets)
+    return {"min_shift": min_shift, "depth": depth, "csi": is_csi, "chroms": chroms}
+
+
+def index_chunks(index, chrom, positions):
+    """
+    Function:
+        the parts of the .vcf.gz file that contain the records of the positions on one chromosome
+    Input:
+        index: the output of read_index
+        chrom: the chromosome name (bytes)
+        positions: the 1-based positions
+    Output:
+        sorted list of (begin, end) virtual offsets, overlapping parts are merged
+    """
+    if chrom not in index["chroms"]:
+        return []
+    bins, min_offsets = index["chroms"][chrom]
+    chunks = []
+    for position in positions:
+        beg = position - 1
+        # the records before the minimum offset end before the position
+        if index["csi"]:
+            min_offset = 0
+        else:
+            window = beg >> TBI_MIN_SHIFT
+            min_offset = min_offsets[min(window, len(min_offsets) - 1)] if min_offsets else 0
+        for bin_id in reg2bins(beg, position, index["min_shift"], index["depth"]):
+            chunks.extend(chunk for chunk in bins.get(bin_id, ()) if chunk[1] > min_offset)
+    merged = []
+    for beg, end in sorted(chunks):
+        if merged and beg <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([beg, end])
+    return merged
+
+
+def read_bgzf_block(f):
+    """
+    Function:
+        read and decompress the next bgzip block
+    Input:
+        f: the .vcf.gz file opened in binary mode
+    Output:
+        the decompressed block and the compressed size of the block, None at the end of the file
+    """
+    header = f.read(12)
+    if len(header) < 12:
+        return None, 0
+    extra = f.read(struct.unpack_from("<H", header, 10)[0])
+    # the extra subfield "BC" has the size of the block
+    block_size = None
+    i = 0
+    while i + 4 <= len(extra):
+        length = struct.unpack_from("<H", extra, i + 2)[0]
+        if extra[i:i + 2] == b"BC":
+            block_size = struct.unpack_from("<H", extra, i + 4)[0] + 1
+        i += 4 + length
+    if block_size is None:
+        raise ValueError("The file is not compressed with bgzip, the index can not be used.")
+    data = f.read(block_size - 12 - len(extra))
+    return zlib.decompress(data[:-8], -15), block_size
+
+
+def read_chunk(f, beg, end):
+    """
+    Function:
+        read the lines between two virtual offsets of a bgzip file
+    Input:
+        f: the .vcf.gz file opened in binary mode
+        beg, end: virtual offsets (compressed offset of the block << 16 | offset in the block)
+    Output:
+        list of lines (bytes)
+    """
+    block_offset, end_block = beg >> 16, end >> 16
+    f.seek(block_offset)
+    parts = []
+    while block_offset <= end_block:
+        block, size = read_bgzf_block(f)
+        if block is None:
+            break
+        if block_offset == end_block:
+            block = block[:end & 0xFFFF]
+        parts.append(block)
+        block_offset += size
+    return b"".join(parts)[beg & 0xFFFF:].split(b"\n")
+
+
+def indexed_lines(vcf_file, index_file, positions):
+    """
+    Function:
+        read only the parts of the .vcf.gz file around the positions of the sites file, chromosome by chromosome
+    Input:
+        vcf_file: the path of the .vcf.gz file
+        index_file: the path of the .tbi or .csi index
+        positions: dictionary (Chromosome, Position) -> rsID of the sites file
+    Output:
+        generator of the data lines
+    """
+    index = read_index(index_file)
+    by_chrom = {}
+    for chrom, pos in positions:
+        by_chrom.setdefault(chrom, []).append(int(pos))
+    with open(vcf_file, "rb") as f:
+        # the chromosomes in the order of the index, like in the file
+        for chrom in index["chroms"]:
+            for beg, end in index_chunks(index, chrom, sorted(by_chrom.get(chrom, ()))):
+                yield from read_chunk(f, beg, end)
+
+
+def find_index(vcf_file):
+    """
+    Function:
+        find the index next to the .vcf.gz file
+    Input:
+        vcf_file: the path of the .vcf.gz file
+    Output:
+        the path of the .tbi or .csi file, None if there is no index
+    """
+    for suffix in (".tbi", ".csi"):
+        if os.path.isfile(vcf_file + suffix):
+            return vcf_file + suffix
+    return None
+
+
+def read_vcf(source, rsids, sites=None, index_file=None):
+    """
+    Function:
+        read the genotypes of the ClinVar sites of a VCF file as a genotype matrix
+    Input:
+        source: the path of the .vcf or .vcf.gz file or an uploaded file object
+        rsids: the integer rsIDs to keep, for example ClinVarStore.rsID
+        sites: dictionary (Chromosome, Position) -> rsID from read_sites, to match the records without an rsID
+        index_file: the .tbi or .csi index, only the parts of the file around the positions of the sites are read
+    Raise error:
+        check if the index is used with a sites file
+    Output:
+        GenotypeMatrix with one column per kept record, in the order of the file
+    """
+    rs_names = {b"rs%d" % rsid for rsid in np.unique(np.asarray(rsids, dtype=np.int64)) if rsid >= 0}
+    positions = sites or {}
+    if index_file and not positions:
+        raise ValueError("The index needs the positions of the ClinVar SNPs, please give a sites file (.map or .bim).")
+    stream = open_vcf(source)
+    try:
+        samples = read_samples(stream)
+        lines = indexed_lines(source, index_file, positions) if index_file else stream
+        snp_rows = []
+        site_columns = []
+        for rsid, chrom, pos, ref, alt, rest in match_sites(lines, rs_names, positions, bool(index_file)):
+            snp_rows.append((rsid.decode(), chrom.decode(), int(pos)))
+            site_columns.append(site_codes(ref, alt, rest, len(samples)))
+    finally:
+        if isinstance(source, (str, os.PathLike)):
+            stream.close()
+        else:
+            source.seek(0)
+    snps = pd.DataFrame(snp_rows, columns=["rsID", "Chromosome", "Position"]).astype({"Position": np.int64})
+    codes = np.stack(site_columns, axis=1) if site_columns else np.zeros((len(samples), 0), dtype=np.uint8)
+    return GenotypeMatrix(np.array(samples, dtype=object), snps, codes)
+
+
+def user_table(matrix):
+    """
+    Function:
+        the table Test_DNA.txt of the page "Identify User ClinVar Markers" from the genotype matrix of a one-sample VCF file
+    Input:
+        matrix: GenotypeMatrix with one sample
+    Raise error:
+        check if the VCF file has one sample
+    Output:
+        DataFrame with the columns rsID, Chromosome, Position, Genotype
+    """
+    if len(matrix) != 1:
+        raise ValueError(f"The VCF file of a user should have one sample, it has {len(matrix)} samples.")
+    return matrix.long_table()[USER_COLUMNS]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='VCF_Reader.py', description="read the genotypes of the ClinVar SNPs from a .vcf or .vcf.gz file")
+    parser.add_argument("vcf_file", type=str, help="Path to the .vcf or .vcf.gz file")
+    parser.add_argument("ClinVar_to_SNP", type=str, help="Path to the ClinVar_to_SNP.txt file")
+    parser.add_argument("output_file", type=str, nargs='?', default="Ancient_samples_filtered_rsID.txt",
+                        help="the long table, or a genotype matrix if the name ends with .geno or .geno.gz")
+    parser.add_argument("--sites", type=str, default=None, help="a .map or .bim file with the positions of the SNPs, to match the records without rsID")
+    parser.add_argument("--index", type=str, nargs='?', const="", default=None,
+                        help="read only the parts of the file around the sites with a .tbi or .csi index, default is the index next to the .vcf.gz file")
+    parser.add_argument("--user", action="store_true", help="write the table Test_DNA.txt (rsID, Chromosome, Position, Genotype) of a one-sample VCF file")
+    args = parser.parse_args()
+    for input_file in (args.vcf_file, args.ClinVar_to_SNP, args.sites):
+        if input_file and not os.path.isfile(input_file):
+            sys.exit(f"Error: The input file {input_file} is NOT FOUND !")
+    if os.path.isfile(args.output_file):
+        sys.exit(f"Error: The output {args.output_file} already exists !. Please remove or rename existing output file")
+    index_file = None
+    if args.index is not None:
+        index_file = args.index or find_index(args.vcf_file)
+        if not index_file:
+            sys.exit(f"Error: No .tbi or .csi index of {args.vcf_file} is found !")
+    try:
+        store = open_store(args.ClinVar_to_SNP)
+        sites = read_sites(args.sites, store.rsID) if args.sites else None
+        matrix = read_vcf(args.vcf_file, store.rsID, sites, index_file)
+        if args.output_file.endswith((".geno", ".geno.gz")):
+            with GenotypeMatrixWriter(args.output_file, matrix.snps, args.output_file.endswith(".gz")) as writer:
+                writer.write(matrix.master_ids, matrix.codes)
+            row_count = matrix.genotype_count()
+        else:
+            output_df = user_table(matrix) if args.user else matrix.long_table()
+            output_df.to_csv(args.output_file, sep="\t", index=False)
+            row_count = len(output_df)
+    except (OSError, ValueError, EOFError, zlib.error) as e:
+        sys.exit(f"Error: {e}")
+    print(f"{len(matrix.snps)} ClinVar SNPs of {len(matrix)} samples, {row_count} genotypes are written to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
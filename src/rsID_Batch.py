@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+#!/usr/bin/env python3
+"""
+Title: rsID_Batch.py
+Date: 2026-10-18
+Author: Wenxia Ren
+
+Description:
+    This script runs rsID_Parser.py for many .map or .bim files (for example the 1240K, HO and custom array panels) against one ClinVar_to_SNP.txt.
+    The ClinVar side is loaded once: the indexed ClinVar store is built (or found in the cache) before the batch starts,
+    and every worker memory-maps the same store directory, so the ClinVar table is not read again for every panel.
+    The .map/.bim files are processed in parallel by a pool of processes. Every input file gets its own output files in the output directory,
+    and a combined summary of all input files is written at the end.
+    An input file whose outputs already exist and were made from the same input file and the same ClinVar release is skipped,
+    so an interrupted batch continues where it stopped when the same command is run again, and a new ClinVar release makes all outputs again.
+
+Imported modules:
+    - pandas: used for data manipulation and analysis.
+    - argparse: to parse command-line arguments and options
+    - concurrent.futures: to process the input files with a pool of processes
+    - glob: to expand the patterns of the input files
+    - os, time: to check file status in directory and to time every input file
+    - sys: to control over the Python runtime environment
+    - ClinVar_Store: indexed store of ClinVar_to_SNP.txt keyed by rsID
+    - rsID_Parser: to extract the common rsID of one input file
+
+Procedures:
+    1. expand the input files and patterns, perform error checks before continuing next steps.
+    2. open (or build) the ClinVar store once.
+    3. run rsID_Extract for every input file in the process pool, skipping the input files that are already done.
+    4. write the combined summary of all input files.
+
+Inputfile:
+    .map or .bim files (or patterns like "panels/*.bim"), ClinVar_to_SNP.txt
+Outputfile:
+    for every input file, in the output directory:
+        {name}_rsID_Filtered.txt
+        {name}_rsID_Filtered_Annotation.txt
+        {name}_Malformed_rsID.txt
+        {name}_rsID_Filtered_Annotation.txt.run.json (the hashes of the inputs and the parameters, to skip the input file when the batch is run again)
+    default = rsID_Batch_Summary.txt in the output directory
+Usage:
+        python rsID_Batch.py map_or_bim_files [map_or_bim_files ...] ClinVar_to_SNP.txt [--outdir OUTDIR] [--jobs JOBS] [--summary SUMMARY]
+    ---------- Examples:
+        python rsID_Batch.py Ancient_1240K.map Ancient_HO.map ClinVar_to_SNP.txt
+        python rsID_Batch.py "panels/*.bim" ClinVar_to_SNP.txt --outdir rsID_Batch --jobs 8
+
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+# make sure the module is installed
+try:
+    import pandas as pd
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from ClinVar_Store import open_store
+    from rsID_Parser import MALFORMED_REASONS, rsID_Extract
+except ImportError as e:
+    sys.exit(f"ERROR: Python module not installed. {e}")
+
+# the columns of the combined summary
+SUMMARY_COLUMNS = ["Input", "Status", "Variants", "Malformed"] + list(MALFORMED_REASONS) + ["Common", "Seconds"]
+
+
+def output_files(input_file, outdir):
+    """
+    Function:
+        the output files of one input file, named after the input file without its extension
+    Input:
+        input_file: the .map or .bim file
+        outdir: the output directory
+    Output:
+        the common rsID file, the annotation file and the malformed ID file
+    """
+    name = os.path.splitext(os.path.basename(input_file))[0]
+    return (os.path.join(outdir, f"{name}_rsID_Filtered.txt"),
+            os.path.join(outdir, f"{name}_rsID_Filtered_Annotation.txt"),
+            os.path.join(outdir, f"{name}_Malformed_rsID.txt"))
+
+
+def extract_one(input_file, store_dir, outdir):
+    """
+    Function:
+        run rsID_Extract for one input file in a worker process
+    Input:
+        input_file: the .map or .bim file
+        store_dir: the directory of the ClinVar store, opened with memory-mapping by every worker
+        outdir: the output directory
+    Output:
+        dictionary with one row of the combined summary
+    """
+    start = time.perf_counter()
+    result = rsID_Extract(input_file, store_dir, *output_files(input_file, outdir))
+    row = {"Input": input_file, "Status": "error"}
+    if result is not None:
+        row["Status"] = result.pop("status")
+        row["Variants"] = result.pop("variants", None)
+        row["Malformed"] = result.pop("malformed", None)
+        row["Common"] = result.pop("common")
+        # the counts of the malformed IDs by reason
+        row.update(result)
+    row["Seconds"] = round(time.perf_counter() - start, 2)
+    return row
+
+
+def expand_inputs(patterns):
+    """
+    Function:
+        expand the input files and patterns, keep the order and remove the duplicates
+    Input:
+        patterns: paths or glob patterns of .map or .bim files
+    Raise error:
+        check if the names of the input files are unique, the output files are named after them
+    Output:
+        list of input files
+    """
+    input_files = []
+    for pattern in patterns:
+        # a pattern without a match is kept, so the missing file is reported by rsID_Extract
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            if path not in input_files:
+                input_files.append(path)
+    names = [os.path.splitext(os.path.basename(path))[0] for path in input_files]
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f"Input files with the same name would write the same output files: {', '.join(duplicated)}")
+    return input_files
+
+
+def rsID_Batch(patterns, clinvar_file, outdir, jobs=None, summary_file=None):
+    """
+    Function:
+        extract the common rsID between every input file and ClinVar_to_SNP.txt with a pool of processes
+    Input:
+        patterns: paths or glob patterns of .map or .bim files
+        clinvar_file: ClinVar_to_SNP.txt
+        outdir: the output directory
+        jobs: the number of worker processes, default is the number of CPUs
+        summary_file: the combined summary, default is rsID_Batch_Summary.txt in the output directory
+    Raise error:
+        check if ClinVar_to_SNP.txt exists
+    Output:
+        the combined summary as a DataFrame, also written to summary_file
+    """
+    if not os.path.isfile(clinvar_file):
+        print(f"Error: The input file {clinvar_file} is NOT FOUND !")
+        return None
+    try:
+        input_files = expand_inputs(patterns)
+        # the ClinVar store is opened once here, the workers only memory-map its directory
+        store_dir = open_store(clinvar_file).store_dir
+    except Exception as e:
+        print(f"Error: An error occurred while reading the input files: {e}")
+        return None
+    os.makedirs(outdir, exist_ok=True)
+    jobs = min(jobs or os.cpu_count() or 1, len(input_files))
+    print(f"Processing {len(input_files)} input files with {jobs} processes, ClinVar store: {store_dir}")
+    rows = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(extract_one, path, store_dir, outdir): path for path in input_files}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except (Exception, SystemExit) as e:
+                # an error of one input file does not stop the batch, rsID_Extract exits on an empty input file
+                print(f"Error: An error occurred while processing {futures[future]}: {e}")
+                row = {"Input": futures[future], "Status": "error"}
+            print(f"[{len(rows) + 1}/{len(input_files)}] {row['Input']}: {row['Status']}")
+            rows.append(row)
+    # the summary is in the order of the input files
+    summary_df = pd.DataFrame(rows, columns=SUMMARY_COLUMNS).set_index("Input").loc[input_files].reset_index()
+    for col in SUMMARY_COLUMNS[2:-1]:
+        summary_df[col] = summary_df[col].astype("Int64")
+    summary_df.to_csv(summary_file or os.path.join(outdir, "rsID_Batch_Summary.txt"), sep="\t", index=False)
+    done = summary_df["Status"].value_counts()
+    print(f"Done: {done.get('done', 0)}, skipped: {done.get('skipped', 0)}, errors: {done.get('error', 0)}")
+    return summary_df
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='rsID_Batch.py', description="extract the common rsID between many .map/.bim files and one ClinVar_to_SNP.txt file in parallel")
+    parser.add_argument("map_files", type=str, nargs="+", help="Paths or glob patterns of the .map or .bim files")
+    parser.add_argument("ClinVar_to_SNP", type=str, help="Path to the ClinVar_to_SNP.txt file")
+    parser.add_argument("--outdir", type=str, default="rsID_Batch", help="the output directory, the outputs of every input file are named after it")
+    parser.add_argument("--jobs", type=int, default=None, help="the number of worker processes, default is the number of CPUs")
+    parser.add_argument("--summary", type=str, default=None, help="the combined summary, default is rsID_Batch_Summary.txt in the output directory")
+    args = parser.parse_args()
+    summary_df = rsID_Batch(args.map_files, args.ClinVar_to_SNP, args.outdir, args.jobs, args.summary)
+    if summary_df is None or (summary_df["Status"] == "error").any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,19 +6,29 @@ Date: 2025-03-12
 Author: Wenxia Ren
 
 Description:
-    This script reads an filtered variant_summary file using ClinVarParser.py program and a map_file, extract the common rsID between the .map file and the filtered variant_summary.txt file
+    This script reads an filtered variant_summary file using ClinVarParser.py program and a map_file (or a PLINK .bim file), extract the common rsID between the .map file and the filtered variant_summary.txt file
     There are two output files, one is the common rsIDs between .map file and the filtered variant_summary.txt file
+    The rsIDs are parsed as 64-bit integers and intersected with the rsID-sorted ClinVar store by binary search, the annotation rows are selected by their row numbers.
+    If both output files already exist and were made from the same .map file, the same ClinVar release and the same parameters (saved in {output_file2}.run.json),
+    the .map file is skipped, so an interrupted batch (see rsID_Batch.py) continues where it stopped.
+    The output files are written under a temporary name and renamed at the end, so an existing output file is always complete.
+    The IDs of the .map file that are not a valid rsID are counted and reported by reason: missing ("."), merged (several rsIDs in one entry), without the prefix "rs" or otherwise malformed.
     The second output file is the annotation file for the common rsIDs, it contains the  following information."AlleleID', 'GeneID', 'ClinicalSignificance', 'rsID', 'Chromosome', 'ReferenceAlleleVCF', 'AlternateAlleleVCF','NumberSubmitters','ClinSigSimple','PhenotypeList".
     
 Imported modules:
     - pandas： used for data manipulation and analysis.
     - argparse: to parse command-line arguments and options
+    - json: to save the inputs and the parameters of the outputs
     - os: to check file status in directory
     - sys: to control over the Python runtime environment 
+    - numpy: to look up the integer rsIDs
+    - ClinVar_Cache: the hash of the .map file
+    - ClinVar_Store: indexed store of ClinVar_to_SNP.txt keyed by rsID, it is built the first time the file is seen and memory-mapped afterwards
+    - Stage_Metrics: the time and the number of common rsIDs, written to the JSON lines file if it is set
     
 Procedures:
     1. perform error checks before continuing next steps.
-    2. extract the common rsID between the .map file and the filtered variant_summary.txt file
+    2. parse the rsIDs of the .map file as integers, count the malformed IDs, and extract the common rsID between the .map file and the filtered variant_summary.txt file
     3. write the commmon rsIDs betweent two input_files to output_file1
     4. write the genetic information and clinical significance of the rsIDs in the output_file1 to output_file2, as the annotation file for output_file1.
 
@@ -28,63 +38,148 @@ Outputfile:
     default = Ancient_rsID_Filtered.txt
     default = Ancient_rsID_Filtered_Annotation.txt
 Usage:
-        python rsID_Parser.py Ancient_samples.map ClinVar_to_SNP.txt Ancient_rsID_Filtered.txt[optional] Ancient_rsID_Filtered_Annotation.txt[optinal]
+        python rsID_Parser.py Ancient_samples.map ClinVar_to_SNP.txt Ancient_rsID_Filtered.txt[optional] Ancient_rsID_Filtered_Annotation.txt[optinal] --malformed Malformed_rsID.txt[optional]
     ---------- Examples:
         python rsID_Parser.py Ancient_samples.map ClinVar_to_SNP.txt
         python rsID_Parser.py Ancient_samples.map ClinVar_to_SNP.txt Ancient_rsID_Filtered.txt Ancient_rsID_Filtered_Annotation.txt
+        python rsID_Parser.py Ancient_samples.map ClinVar_to_SNP.txt --malformed Ancient_Malformed_rsID.txt
        
         
 """
 import argparse
+import json
 import os
 import sys
 # make sure the module is installed
 try:
+    import numpy as np
     import pandas as pd
+    import ClinVar_Cache
+    from ClinVar_Store import MAX_RSID_DIGITS, open_store
+    import Stage_Metrics
 except ImportError as e:
     sys.exit(f"ERROR: Python module not installed. {e}")
 
-def rsID_Extract(input_file1, input_file2, output_file1, output_file2):
+# at most MAX_RSID_DIGITS digits like ClinVar_Store.rsid_to_int, the longer IDs are malformed ("other")
+RSID_PATTERN = rf"rs\d{{1,{MAX_RSID_DIGITS}}}"
+# the file next to the annotation file with the inputs of the outputs
+RUN_SUFFIX = ".run.json"
+# the reasons why an ID of the .map file is not a valid rsID, in the order they are checked
+MALFORMED_REASONS = {"missing": 'missing (".")', "merged": "merged (several rsIDs)", "no_rs": 'without the prefix "rs"', "other": "other"}
+
+
+def parse_rsIDs(ids):
+    """
+    Function:
+        parse the IDs of the .map file like "rs5082" to 64-bit integers and find the reason why an ID is not a valid rsID
+    Input:
+        ids: pandas Series of the IDs
+    Output:
+        numpy int64 array, -1 for the IDs that are not a valid rsID
+        numpy array with the reason of every invalid ID (a key of MALFORMED_REASONS), "" for the valid rsIDs
+    """
+    ids = ids.fillna(".").astype(str).str.strip()
+    valid = ids.str.fullmatch(RSID_PATTERN).to_numpy()
+    rsIDs = np.full(len(ids), -1, dtype=np.int64)
+    rsIDs[valid] = ids[valid].str[2:].astype(np.int64).to_numpy()
+    # the first matching condition gives the reason, for example "rs12;rs34" is merged and "kgp123" has no prefix "rs"
+    reasons = np.select([valid, ids.isin([".", ""]).to_numpy(), (ids.str.count(r"rs\d+") > 1).to_numpy(), ~ids.str.startswith("rs").to_numpy()],
+                        ["", "missing", "merged", "no_rs"], default="other")
+    return rsIDs, reasons
+
+
+def run_file(output_file2):
+    """
+    Function:
+        the file next to the annotation file with the inputs and the parameters its outputs were made from
+    Input:
+        output_file2: the annotation file
+    Output:
+        the path of the JSON file
+    """
+    return f"{output_file2}{RUN_SUFFIX}"
+
+
+def run_parameters(input_file1, ClinVar_store):
+    """
+    Function:
+        the inputs and the parameters of one run: the hash of the .map file, the hash of ClinVar_to_SNP.txt and the rsID pattern
+    Input:
+        input_file1: the .map or .bim file
+        ClinVar_store: the opened ClinVar store, it keeps the hash of its ClinVar_to_SNP.txt
+    Output:
+        dictionary
+    """
+    # a store built without the hash is identified by its directory
+    clinvar = ClinVar_store.description.get("source_hash") or os.path.abspath(ClinVar_store.store_dir)
+    return {"map": ClinVar_Cache.file_hash(input_file1), "clinvar": clinvar, "rsid_pattern": RSID_PATTERN}
+
+
+def is_done(run, output_file1, output_file2, malformed_file=None):
+    """
+    Function:
+        check if the outputs exist and were made from the same inputs and parameters as this run
+    Input:
+        run: the inputs and the parameters of this run, see run_parameters
+        output_file1, output_file2, malformed_file: the output files
+    Output:
+        True if the input file can be skipped
+    """
+    outputs = [output_file1, output_file2, run_file(output_file2)] + ([malformed_file] if malformed_file else [])
+    if not all(os.path.isfile(path) for path in outputs):
+        return False
+    try:
+        with open(run_file(output_file2)) as f:
+            return json.load(f) == run
+    except (OSError, ValueError):
+        return False
+
+
+@Stage_Metrics.timed(rows=lambda result: result.get("common") if result else None)
+def rsID_Extract(input_file1, input_file2, output_file1, output_file2, malformed_file=None):
     """
     Function:
         extract the common rsID between the .map file and the filtered variant_summary.txt file
     Input: 
-       input_file1 is the .map file
-       input_file2 is the filtered variant_summary file, ClinVar_to_SNP.txt
+       input_file1 is the .map file, or the .bim file (the rsID is the second column of both)
+       input_file2 is the filtered variant_summary file, ClinVar_to_SNP.txt, or the directory of its ClinVar store
+       malformed_file (optional) is the file to write the malformed IDs and their reason
     Raise error:
        check if the input file exists or not
        check if the input file is empty or not
-       check if output file already exists   
+       skip the input file if both output files already exist and were made from the same .map file and the same ClinVar release
     Output: 
        output_file1 is the extracted commmon rsIDs betweent two input_files
        output_file2 is the annotation file of output_file1
        output_file2 contains the genetic information and clinical significance of the rsIDs in the output_file1.
+       return a dictionary with the status ("done" or "skipped"), the counts of the IDs, the malformed IDs by reason and the common rsIDs
     """
    # Step 1: perform error checks before continuing next steps
    # check if the input file exist or not
     if not os.path.isfile(input_file1):
         print(f"Error: The input file {input_file1} is NOT FOUND !")
         return
-    if not os.path.isfile(input_file2):
+    if not os.path.exists(input_file2):
         print(f"Error: The input file {input_file2} is NOT FOUND !")
         return
     print(f"Both input files {input_file1} and {input_file2} are found. Proceeding with processing.")
-    # check if output file already exist
-    if os.path.isfile(output_file1):
-        print(f"Error: The output {output_file1} already exists !. Please remove or rename existing output file")
-        return
-    if os.path.isfile(output_file2):
-            print(f"Error: The output {output_file2} already exists !. Please remove or rename existing output file")
-            return
     
     # read input_file1 and input_file2, and use pandas to perform error checks
   
     try:
-        # the inputfile1 should be separated by tab, assign the column_names to the map file
-        column_names = ["Chromosome", "rsID", "Genetic distance", "Position"]
-        map_df = pd.read_csv(input_file1, sep="\t", header=None, names=column_names)
         # the inputfile2 should be separated by tab, assign the first row as header or column name
-        ClinVar_SNP_df = pd.read_csv(input_file2, sep="\t", header=0)
+        # it is opened as an indexed store keyed by rsID, the store is only built the first time the file is seen
+        ClinVar_store = open_store(input_file2)
+        # skip the input file if its outputs were made from the same .map file and the same ClinVar release
+        run = run_parameters(input_file1, ClinVar_store)
+        if is_done(run, output_file1, output_file2, malformed_file):
+            print(f"The outputs {output_file1} and {output_file2} already exist for the same inputs, {input_file1} is skipped. Remove them to process it again.")
+            with open(output_file1) as f:
+                return {"status": "skipped", "common": sum(1 for _ in f)}
+        # the inputfile1 should be separated by tab, the rsID is the second column of the .map and the .bim file
+        # only the rsID column is needed, it is read as text and parsed to integers below
+        map_df = pd.read_csv(input_file1, sep="\t", header=None, usecols=[1], dtype=str)
+        map_df.columns = ["rsID"]
     except pd.errors.EmptyDataError:
         sys.exit("Error: The input file exists but is EMPTY. Exiting the program.")
     except pd.errors.ParserError as parser_errors:
@@ -95,32 +190,35 @@ def rsID_Extract(input_file1, input_file2, output_file1, output_file2):
         return 
 
 
-    # extract the valid rsID from the map file. the valid rsID should start with rs and create a copy
-    # str.startswith("rs") will return the True (if the rsID startwith "rs") / False
-    valid_map = map_df[map_df["rsID"].str.startswith("rs")].copy()
-    # remove the prefix "rs" and space from rsId and only keep the digital numbers
-    valid_map["rsID"] = valid_map["rsID"].str[2:].str.strip()
-    # convert the rsID to string
-    valid_map["rsID"] = valid_map["rsID"].astype(str)
-    # using "fropna() function to remove invalid values, nonnumeric values from the rsID column, then extract the valid rsID and convert them to a set 
-    valid_rsID = set(valid_map["rsID"].dropna())
-    # extract the rsID from the input_file2 and convert the rsID to string
-    ClinVar_SNP_df["rsID"] = ClinVar_SNP_df["rsID"].astype(str) 
-       # using "fropna() function to remove invalid values, nonnumeric values from the rsID column, then extract the valid rsID and convert them to a set 
-    CliniVar_rsID=set(ClinVar_SNP_df["rsID"].dropna())
-    # "&" set funtion to extract the common rsID from  valid_rsID and CliniVar_rsID
-    Common_rsID = valid_rsID & CliniVar_rsID  
+    # parse the rsIDs of the map file as integers, the malformed IDs become -1
+    map_rsID, reasons = parse_rsIDs(map_df["rsID"])
+    malformed = reasons != ""
+    malformed_counts = {reason: int((reasons == reason).sum()) for reason in MALFORMED_REASONS}
+    print(f"Malformed IDs in {input_file1}: {int(malformed.sum())} of {len(map_df)} "
+          f"({', '.join(f'{label}: {malformed_counts[reason]}' for reason, label in MALFORMED_REASONS.items())})")
+    if malformed_file:
+        pd.DataFrame({"ID": map_df["rsID"][malformed], "Reason": reasons[malformed]}).to_csv(malformed_file, sep="\t", index=False)
+    # the sorted unique rsIDs of the map file
+    valid_rsID = np.unique(map_rsID[~malformed])
+    # look up the rsIDs of the map file in the rsID-sorted ClinVar store to extract the common rsID
+    Common_rsID = valid_rsID[ClinVar_store.contains(valid_rsID)]
     print(f"Common rsID count: {len(Common_rsID)}")
-    rs_rsid = []
-    for rsid in Common_rsID:
-        # using the F-string to change the format
-        rs_rsid.append(f"rs{rsid}")
-    # build a Datafram and save the dataframe as a CSV file
-    pd.DataFrame({"rsID": rs_rsid}).to_csv(output_file1, index=False, header=False)
-    # based on the Common_rsID to filter the input_file2 to generate the annotation file for Common_rsID
-    Annotation_df = ClinVar_SNP_df[ClinVar_SNP_df["rsID"].isin(Common_rsID)]
+    # add the prefix "rs" back and save the common rsIDs as a CSV file
+    pd.DataFrame({"rsID": "rs" + pd.Series(Common_rsID, dtype=str)}).to_csv(f"{output_file1}.tmp", index=False, header=False)
+    # based on the Common_rsID to look up the rows of the input_file2 to generate the annotation file for Common_rsID
+    _, rows = ClinVar_store.lookup_rsids(Common_rsID)
+    # keep the rows in the order of the input_file2
+    Annotation_df = ClinVar_store.take(rows[np.argsort(ClinVar_store.file_row[rows])])
     # write the annotation information into the output_file2
-    Annotation_df.to_csv(output_file2, sep="\t", index=False)
+    Annotation_df.to_csv(f"{output_file2}.tmp", sep="\t", index=False)
+    # rename the complete output files, output_file2 is renamed last so that both files exist only when the input file is done
+    os.replace(f"{output_file1}.tmp", output_file1)
+    os.replace(f"{output_file2}.tmp", output_file2)
+    # the inputs of the outputs are saved last, an output without them is made again by the next run
+    with open(f"{run_file(output_file2)}.tmp", "w") as f:
+        json.dump(run, f)
+    os.replace(f"{run_file(output_file2)}.tmp", run_file(output_file2))
+    return {"status": "done", "variants": len(map_df), "malformed": int(malformed.sum()), **malformed_counts, "common": len(Common_rsID)}
 
 def main():
     parser = argparse.ArgumentParser(prog='rsID_Parser.py', description=" extract the common rsID between the .map file and the filtered variant_summary.txt file")
@@ -128,6 +226,7 @@ def main():
     parser.add_argument("ClinVar_to_SNP", type=str, help="Path to the input_file2 ClinVar_to_SNP.txt file")                   
     parser.add_argument("Common_rsID", type=str, nargs='?', default ="Ancient_rsID_Filtered.txt", help="the output should consist of tab-delimited columns (fields)")     
     parser.add_argument("Annotation_rsID", type=str, nargs='?', default ="Ancient_rsID_Filtered_Annotation.txt", help="the output should consist of tab-delimited columns (fields)")               
+    parser.add_argument("--malformed", type=str, default=None, help="write the malformed IDs of the map file and the reason to this tab-delimited file")
     args = parser.parse_args()
     # assign all arguments to their respective variables.
     in_1=args.map_file
@@ -135,7 +234,7 @@ def main():
     out_1=args.Common_rsID
     out_2=args.Annotation_rsID
     # call the Clinvar_Parser function to process the file
-    rsID_Extract(in_1,in_2,out_1,out_2)
+    rsID_Extract(in_1,in_2,out_1,out_2,args.malformed)
     
 if __name__ == "__main__":
     main()